@@ -2,84 +2,126 @@
 Chat and messaging endpoints for real-time communication.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from typing import Dict, Any, List, Annotated
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from typing import Dict, Any, List, Annotated, Optional
 from datetime import datetime, timedelta
 import uuid
 import logging
 
 from app.core.database import get_database
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, get_language_preference
+from app.core.security import verify_token_and_get_user_id
+from app.models.auth import TokenType
 from app.models.user import UserResponse
-from app.services.translation_service import translation_service
 from app.services.ai_service import ai_service
+from app.services.chat_broker import chat_broker
+from app.services.chat_translation import chat_translation
+from app.services.message_log import message_log
+from app.services.negotiation_advisor import negotiation_advisor
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, conversation_id: str):
-        await websocket.accept()
-        if conversation_id not in self.active_connections:
-            self.active_connections[conversation_id] = []
-        self.active_connections[conversation_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, conversation_id: str):
-        if conversation_id in self.active_connections:
-            if websocket in self.active_connections[conversation_id]:
-                self.active_connections[conversation_id].remove(websocket)
-            if not self.active_connections[conversation_id]:
-                del self.active_connections[conversation_id]
+async def _get_participants(conversation_id: str) -> List[str]:
+    """Look up conversation participants for access checks and unread counts."""
+    try:
+        db = await get_database()
+        conversation = await db.conversations.find_one(
+            {"_id": conversation_id}, {"participant_1": 1, "participant_2": 1}
+        )
+    except Exception as e:
+        logger.warning(f"Could not load participants for conversation {conversation_id}: {e}")
+        return []
     
-    async def broadcast(self, message: Dict[str, Any], conversation_id: str):
-        if conversation_id in self.active_connections:
-            for connection in self.active_connections[conversation_id]:
-                await connection.send_json(message)
+    if not conversation:
+        return []
+    return [conversation.get("participant_1"), conversation.get("participant_2")]
 
 
-manager = ConnectionManager()
+async def _get_user_language(conversation_id: str, user_id: str) -> Optional[str]:
+    """Look up a participant's preferred language for translated delivery."""
+    try:
+        languages = await chat_translation.conversation_languages(conversation_id)
+    except Exception as e:
+        logger.warning(f"Could not load languages for conversation {conversation_id}: {e}")
+        return None
+    return languages.get(user_id)
 
 
 @router.websocket("/ws/{conversation_id}")
-async def websocket_chat(websocket: WebSocket, conversation_id: str):
-    """WebSocket endpoint for real-time chat."""
-    await manager.connect(websocket, conversation_id)
+async def websocket_chat(
+    websocket: WebSocket,
+    conversation_id: str,
+    token: Optional[str] = None,
+    language: Optional[str] = None
+):
+    """
+    WebSocket endpoint for real-time chat.
+    
+    Browsers cannot set headers on WebSocket requests, so the access token is
+    passed in the token query parameter. Only the conversation's participants
+    may connect, and messages are always sent as the authenticated user.
+    """
+    user_id = verify_token_and_get_user_id(token, TokenType.ACCESS) if token else None
+    participants = await _get_participants(conversation_id)
+    if user_id is None or user_id not in participants:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    if language is None:
+        language = await _get_user_language(conversation_id, user_id)
+    
+    await chat_broker.connect(websocket, conversation_id, user_id, language)
     try:
         while True:
             data = await websocket.receive_json()
+            created_at = datetime.utcnow()
             message = {
                 "id": str(uuid.uuid4()),
                 "conversation_id": conversation_id,
-                "sender_id": data.get("sender_id"),
+                "sender_id": user_id,
                 "content": data.get("content"),
                 "type": data.get("type", "text"),
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": created_at.isoformat(),
                 "translated": False
             }
             
-            # Auto-translate if requested
-            if data.get("translate") and data.get("target_language"):
-                try:
-                    result = await translation_service.translate_text(
-                        text=data.get("content"),
-                        source_language=data.get("source_language", "en"),
-                        target_language=data.get("target_language")
-                    )
-                    message["translated_content"] = result.translated_text
-                    message["translated"] = True
-                except Exception:
-                    pass
+            await chat_broker.publish(conversation_id, message)
+            
+            # Persist through the write-behind log
+            document = {
+                "_id": message["id"],
+                "conversation_id": conversation_id,
+                "sender_id": message["sender_id"],
+                "content": message["content"],
+                "type": message["type"],
+                "created_at": created_at
+            }
             
-            await manager.broadcast(message, conversation_id)
+            recipient_id = next((p for p in participants if p != user_id), None)
+            message_log.append(document, recipient_id)
+            
+            # Translations are delivered as follow-up events in each language
+            extra_languages = set()
+            if data.get("translate") and data.get("target_language"):
+                extra_languages.add(data["target_language"])
+            chat_translation.submit(document, data.get("source_language", "en"), extra_languages)
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket, conversation_id)
+        pass
+    finally:
+        # Also on errors, so the user does not stay online and the sender and subscription are released
+        await chat_broker.disconnect(websocket, conversation_id, user_id)
+
+
+@router.get("/metrics")
+async def get_chat_metrics(
+    current_user: Annotated[UserResponse, Depends(get_current_user)]
+) -> Dict[str, Any]:
+    """Get WebSocket queue depth and send latency for this worker."""
+    return chat_broker.stats()
 
 
 @router.get("/conversations")
@@ -92,6 +134,9 @@ async def get_conversations(
         user_id = current_user.user_id
         logger.info(f"Getting conversations for user_id: {user_id}")
         
+        if message_log.has_pending():
+            await message_log.flush()
+        
         conversations = await db.conversations.find({
             "$or": [
                 {"participant_1": user_id},
@@ -227,6 +272,7 @@ async def create_conversation(
 @router.get("/conversations/{conversation_id}/messages")
 async def get_messages(
     conversation_id: str,
+    request: Request,
     current_user: Annotated[UserResponse, Depends(get_current_user)],
     db: Annotated[Any, Depends(get_database)],
     limit: int = 50,
@@ -242,19 +288,29 @@ async def get_messages(
         if user_id not in [conversation.get("participant_1"), conversation.get("participant_2")]:
             raise HTTPException(status_code=403, detail="Not a participant")
         
+        # Write buffered messages first so the listing includes them
+        if message_log.has_pending(conversation_id):
+            await message_log.flush()
+        
         messages = await db.messages.find(
             {"conversation_id": conversation_id}
         ).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
         
         await db.conversations.update_one({"_id": conversation_id}, {"$set": {f"unread_count.{user_id}": 0}})
         
+        # Translations in the reader's preferred language
+        language = await get_language_preference(request, current_user)
+        translations = await chat_translation.get_translations(
+            [str(msg["_id"]) for msg in messages], language
+        )
+        
         formatted_messages = []
         for msg in reversed(messages):
             formatted_messages.append({
                 "id": str(msg["_id"]),
                 "sender_id": msg.get("sender_id"),
                 "content": msg.get("content"),
-                "translated_content": msg.get("translated_content"),
+                "translated_content": translations.get(str(msg["_id"]), msg.get("translated_content")),
                 "type": msg.get("type", "text"),
                 "created_at": msg.get("created_at").isoformat() if msg.get("created_at") else None
             })
@@ -299,30 +355,32 @@ async def send_message(
             "created_at": datetime.utcnow()
         }
         
-        translate_to = message_data.get("translate_to")
-        if translate_to:
-            try:
-                result = await translation_service.translate_text(
-                    text=content,
-                    source_language=message_data.get("source_language", "en"),
-                    target_language=translate_to
-                )
-                message["translated_content"] = result.translated_text
-            except Exception:
-                pass
+        other_participant = conversation.get("participant_2") if conversation.get("participant_1") == user_id else conversation.get("participant_1")
+        message_log.append(message, other_participant)
         
-        await db.messages.insert_one(message)
+        # Push to connected WebSockets on every worker
+        await chat_broker.publish(conversation_id, {
+            "id": message_id,
+            "conversation_id": conversation_id,
+            "sender_id": user_id,
+            "content": content,
+            "type": message["type"],
+            "timestamp": message["created_at"].isoformat(),
+            "translated": False
+        })
         
-        other_participant = conversation.get("participant_2") if conversation.get("participant_1") == user_id else conversation.get("participant_1")
-        await db.conversations.update_one(
-            {"_id": conversation_id},
-            {"$set": {"updated_at": datetime.utcnow()}, "$inc": {f"unread_count.{other_participant}": 1}}
+        # Translate off the request path into every conversation language
+        translate_to = message_data.get("translate_to")
+        chat_translation.submit(
+            message,
+            message_data.get("source_language", "en"),
+            {translate_to} if translate_to else set()
         )
         
         return {
             "id": message_id,
             "content": content,
-            "translated_content": message.get("translated_content"),
+            "translated_content": None,  # Delivered later as a translation event
             "type": message.get("type"),
             "sender_id": user_id,
             "created_at": message["created_at"].isoformat()
@@ -334,6 +392,31 @@ async def send_message(
         raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
 
 
+@router.get("/conversations/{conversation_id}/presence")
+async def get_presence(
+    conversation_id: str,
+    current_user: Annotated[UserResponse, Depends(get_current_user)],
+    db: Annotated[Any, Depends(get_database)]
+) -> Dict[str, Any]:
+    """Get the participants currently connected to a conversation."""
+    try:
+        conversation = await db.conversations.find_one({"_id": conversation_id})
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        
+        user_id = current_user.user_id
+        if user_id not in [conversation.get("participant_1"), conversation.get("participant_2")]:
+            raise HTTPException(status_code=403, detail="Not a participant")
+        
+        online = await chat_broker.get_presence(conversation_id)
+        return {"conversation_id": conversation_id, "online": online}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch presence: {str(e)}")
+
+
 @router.post("/conversations/{conversation_id}/offers")
 async def make_offer(
     conversation_id: str,
@@ -448,15 +531,56 @@ async def respond_to_offer(
         raise HTTPException(status_code=500, detail=f"Failed to respond to offer: {str(e)}")
 
 
+@router.get("/offers/ai-suggestions")
+async def get_pending_offer_suggestions(
+    current_user: Annotated[UserResponse, Depends(get_current_user)]
+) -> Dict[str, Any]:
+    """Get AI-powered suggestions for all of the vendor's pending offers."""
+    try:
+        suggestions = await negotiation_advisor.suggest_for_vendor(current_user.user_id)
+        return {"suggestions": suggestions, "count": len(suggestions)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get suggestions: {str(e)}")
+
+
 @router.post("/conversations/{conversation_id}/ai-suggestion")
 async def get_negotiation_suggestion(
     conversation_id: str,
     context_data: Dict[str, Any],
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: Annotated[UserResponse, Depends(get_current_user)],
+    db: Annotated[Any, Depends(get_database)]
 ) -> Dict[str, Any]:
-    """Get AI-powered negotiation suggestions."""
+    """
+    Get AI-powered negotiation suggestions.
+    
+    With an offer_id the offer is priced against its product's market; with
+    a commodity and current_price against that commodity's market. A
+    caller-supplied market_average is only used when there is no market data.
+    """
     try:
+        offer_id = context_data.get("offer_id")
+        if offer_id:
+            offer = await db.offers.find_one({"_id": offer_id, "conversation_id": conversation_id})
+            if not offer:
+                raise HTTPException(status_code=404, detail="Offer not found")
+            if current_user.user_id not in [offer.get("buyer_id"), offer.get("seller_id")]:
+                raise HTTPException(status_code=403, detail="Not a participant in this offer")
+            suggestions = await negotiation_advisor.suggest_for_offers([offer])
+            return suggestions[0]
+        
+        commodity = context_data.get("commodity")
+        if commodity and context_data.get("current_price") is not None:
+            return await negotiation_advisor.suggest(
+                float(context_data["current_price"]),
+                commodity,
+                state=context_data.get("state"),
+                market=context_data.get("market"),
+                fallback_average=context_data.get("market_average")
+            )
+        
         suggestion = await ai_service.generate_negotiation_suggestion(context_data)
         return suggestion
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get suggestion: {str(e)}")
@@ -3,20 +3,64 @@ Orders management endpoints for buyer and vendor order handling.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import Dict, Any, List, Annotated, Optional
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Annotated, Callable, Optional
 from datetime import datetime
 from enum import Enum
+import asyncio
 import uuid
 import logging
 
 from app.core.database import get_database
 from app.core.dependencies import get_current_user
+from app.core.exceptions import InsufficientInventoryException, NotFoundException, ValidationException
 from app.models.user import UserResponse
+from app.services.inventory_service import inventory_service
+from app.services.record_export import MEDIA_TYPES, build_export_query, stream_export
+from app.services.user_summary_cache import user_summary_cache
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Product fields copied into new orders
+ORDER_PRODUCT_FIELDS = {
+    "_id": 0,
+    "vendor_id": 1,
+    "name": 1,
+    "images": 1,
+    "availability.unit": 1,
+    "price_info.base_price": 1,
+}
+
+
+# Order fields shared by buyer and vendor listings, in export column order
+ORDER_COLUMNS = [
+    "id", "product_id", "product_name", "product_image", "quantity", "unit",
+    "original_price", "offered_price", "total_amount", "message", "status",
+    "tracking_number", "estimated_delivery", "created_at", "updated_at",
+]
+BUYER_ORDER_COLUMNS = ORDER_COLUMNS[:4] + ["vendor_id", "vendor_name"] + ORDER_COLUMNS[4:]
+VENDOR_ORDER_COLUMNS = ORDER_COLUMNS[:4] + ["buyer_id", "buyer_name", "buyer_email"] + ORDER_COLUMNS[4:]
+
+
+def _format_order(order: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    formatted = {column: order.get(column) for column in columns}
+    formatted["id"] = str(order["_id"])
+    formatted["created_at"] = order.get("created_at").isoformat() if order.get("created_at") else None
+    formatted["updated_at"] = order.get("updated_at").isoformat() if order.get("updated_at") else None
+    return formatted
+
+
+def _format_buyer_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    """Format an order for the buyer who placed it."""
+    return _format_order(order, BUYER_ORDER_COLUMNS)
+
+
+def _format_vendor_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    """Format an order for the vendor who received it."""
+    return _format_order(order, VENDOR_ORDER_COLUMNS)
+
 
 class OrderStatus(str, Enum):
     PENDING = "pending"
@@ -34,6 +78,10 @@ async def create_order(
 ) -> Dict[str, Any]:
     """
     Create a new order (buyer makes an offer/order to a vendor).
+    
+    The ordered quantity is reserved until reservation_expires_at, which is
+    INVENTORY_RESERVATION_TTL_MINUTES after creation. If the vendor has not
+    confirmed the order by then it is cancelled and the stock returned.
     """
     try:
         buyer_id = current_user.user_id
@@ -53,27 +101,45 @@ async def create_order(
             raise HTTPException(status_code=400, detail="Vendor ID is required")
         if not offered_price:
             raise HTTPException(status_code=400, detail="Offered price is required")
+        if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be greater than 0")
         
-        # Get product details - products use 'product_id' field
-        product = await db.products.find_one({"product_id": product_id})
-        logger.info(f"Product lookup result: {product is not None}")
-        if not product:
+        # One round-trip: take the stock while reading the product, and look
+        # up the vendor alongside it (usually from the summary cache)
+        order_id = str(uuid.uuid4())
+        reservation, vendor = await asyncio.gather(
+            inventory_service.take(product_id, quantity, order_id, ORDER_PRODUCT_FIELDS),
+            user_summary_cache.get(vendor_id),
+            return_exceptions=True
+        )
+        if isinstance(reservation, NotFoundException):
             logger.error(f"Product not found with product_id: {product_id}")
             raise HTTPException(status_code=404, detail="Product not found")
+        if isinstance(reservation, InsufficientInventoryException):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Insufficient stock: {reservation.details.get('available', 0)} available"
+            )
+        if isinstance(reservation, ValidationException):
+            raise HTTPException(status_code=400, detail=str(reservation))
+        if isinstance(reservation, Exception):
+            raise reservation
+        if isinstance(vendor, Exception):
+            await inventory_service.abandon(reservation)
+            raise vendor
+        
+        product = reservation["product"]
         
         # Verify vendor owns the product
         if product.get("vendor_id") != vendor_id:
             logger.error(f"Vendor mismatch: product.vendor_id={product.get('vendor_id')}, provided vendor_id={vendor_id}")
+            await inventory_service.abandon(reservation)
             raise HTTPException(status_code=400, detail="Product does not belong to specified vendor")
         
-        # Get buyer profile - users use 'user_id' field
-        buyer = await db.users.find_one({"user_id": buyer_id})
-        buyer_name = buyer.get("profile", {}).get("full_name", "Unknown Buyer") if buyer else "Unknown Buyer"
-        buyer_email = buyer.get("email", "") if buyer else ""
-        
-        # Get vendor profile
-        vendor = await db.users.find_one({"user_id": vendor_id})
-        vendor_name = vendor.get("profile", {}).get("business_name") or vendor.get("profile", {}).get("full_name", "Unknown Vendor") if vendor else "Unknown Vendor"
+        # The buyer is the authenticated user, already loaded for this request
+        buyer_name = current_user.full_name or "Unknown Buyer"
+        buyer_email = current_user.email
+        vendor_name = (vendor.get("business_name") or vendor.get("full_name") or "Unknown Vendor") if vendor else "Unknown Vendor"
         
         # Get product name
         product_name = product.get("name", {})
@@ -81,7 +147,6 @@ async def create_order(
             product_name = product_name.get("original_text", "Unknown Product")
         
         # Create order
-        order_id = str(uuid.uuid4())
         order = {
             "_id": order_id,
             "buyer_id": buyer_id,
@@ -103,9 +168,22 @@ async def create_order(
             "updated_at": datetime.utcnow(),
             "tracking_number": None,
             "estimated_delivery": None,
+            "reservation_expires_at": reservation["expires_at"],
         }
         
-        await db.orders.insert_one(order)
+        # Second round-trip: the order and its reservation are written together
+        inserted, recorded = await asyncio.gather(
+            db.orders.insert_one(order),
+            inventory_service.record(reservation),
+            return_exceptions=True
+        )
+        if isinstance(inserted, Exception) or isinstance(recorded, Exception):
+            # A failed record() has already handed the stock back
+            if not isinstance(recorded, Exception):
+                await inventory_service.release(order_id)
+            if not isinstance(inserted, Exception):
+                await db.orders.delete_one({"_id": order_id})
+            raise inserted if isinstance(inserted, Exception) else recorded
         
         return {
             "id": order_id,
@@ -115,6 +193,7 @@ async def create_order(
                 "_id": order_id,
                 "created_at": order["created_at"].isoformat(),
                 "updated_at": order["updated_at"].isoformat(),
+                "reservation_expires_at": order["reservation_expires_at"].isoformat(),
             }
         }
         
@@ -145,27 +224,7 @@ async def get_buyer_orders(
         orders = await db.orders.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
         total = await db.orders.count_documents(query)
         
-        formatted_orders = []
-        for order in orders:
-            formatted_orders.append({
-                "id": str(order["_id"]),
-                "product_id": order.get("product_id"),
-                "product_name": order.get("product_name"),
-                "product_image": order.get("product_image"),
-                "vendor_id": order.get("vendor_id"),
-                "vendor_name": order.get("vendor_name"),
-                "quantity": order.get("quantity"),
-                "unit": order.get("unit"),
-                "original_price": order.get("original_price"),
-                "offered_price": order.get("offered_price"),
-                "total_amount": order.get("total_amount"),
-                "message": order.get("message"),
-                "status": order.get("status"),
-                "tracking_number": order.get("tracking_number"),
-                "estimated_delivery": order.get("estimated_delivery"),
-                "created_at": order.get("created_at").isoformat() if order.get("created_at") else None,
-                "updated_at": order.get("updated_at").isoformat() if order.get("updated_at") else None,
-            })
+        formatted_orders = [_format_buyer_order(order) for order in orders]
         
         return {
             "orders": formatted_orders,
@@ -198,28 +257,7 @@ async def get_vendor_orders(
         orders = await db.orders.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(length=limit)
         total = await db.orders.count_documents(query)
         
-        formatted_orders = []
-        for order in orders:
-            formatted_orders.append({
-                "id": str(order["_id"]),
-                "product_id": order.get("product_id"),
-                "product_name": order.get("product_name"),
-                "product_image": order.get("product_image"),
-                "buyer_id": order.get("buyer_id"),
-                "buyer_name": order.get("buyer_name"),
-                "buyer_email": order.get("buyer_email"),
-                "quantity": order.get("quantity"),
-                "unit": order.get("unit"),
-                "original_price": order.get("original_price"),
-                "offered_price": order.get("offered_price"),
-                "total_amount": order.get("total_amount"),
-                "message": order.get("message"),
-                "status": order.get("status"),
-                "tracking_number": order.get("tracking_number"),
-                "estimated_delivery": order.get("estimated_delivery"),
-                "created_at": order.get("created_at").isoformat() if order.get("created_at") else None,
-                "updated_at": order.get("updated_at").isoformat() if order.get("updated_at") else None,
-            })
+        formatted_orders = [_format_vendor_order(order) for order in orders]
         
         return {
             "orders": formatted_orders,
@@ -231,6 +269,75 @@ async def get_vendor_orders(
         raise HTTPException(status_code=500, detail=f"Failed to fetch orders: {str(e)}")
 
 
+async def _export_orders(
+    db: Any,
+    query: Dict[str, Any],
+    format_row: Callable[[Dict[str, Any]], Dict[str, Any]],
+    columns: List[str],
+    export_format: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[str],
+    filename: str
+) -> StreamingResponse:
+    try:
+        export_query = build_export_query(query, "created_at", start, end, after)
+    except ValidationException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        stream_export(db.orders, export_query, "created_at", format_row, columns, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+
+@router.get("/buyer/export")
+async def export_buyer_orders(
+    current_user: Annotated[UserResponse, Depends(get_current_user)],
+    db: Annotated[Any, Depends(get_database)],
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, description="Orders created on or after"),
+    end: Optional[datetime] = Query(None, description="Orders created on or before"),
+    status: Optional[str] = Query(None, description="Filter by status"),
+    after: Optional[str] = Query(None, description="Resume after this row cursor")
+) -> StreamingResponse:
+    """
+    Export all of the current buyer's orders, oldest first, as NDJSON or CSV.
+    """
+    query = {"buyer_id": current_user.user_id}
+    if status:
+        query["status"] = status
+    
+    return await _export_orders(
+        db, query, _format_buyer_order, BUYER_ORDER_COLUMNS,
+        export_format, start, end, after, "orders"
+    )
+
+
+@router.get("/vendor/export")
+async def export_vendor_orders(
+    current_user: Annotated[UserResponse, Depends(get_current_user)],
+    db: Annotated[Any, Depends(get_database)],
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, description="Orders created on or after"),
+    end: Optional[datetime] = Query(None, description="Orders created on or before"),
+    status: Optional[str] = Query(None, description="Filter by status"),
+    after: Optional[str] = Query(None, description="Resume after this row cursor")
+) -> StreamingResponse:
+    """
+    Export all of the current vendor's orders, oldest first, as NDJSON or CSV.
+    """
+    query = {"vendor_id": current_user.user_id}
+    if status:
+        query["status"] = status
+    
+    return await _export_orders(
+        db, query, _format_vendor_order, VENDOR_ORDER_COLUMNS,
+        export_format, start, end, after, "sales"
+    )
+
+
 @router.get("/{order_id}")
 async def get_order(
     order_id: str,
@@ -314,6 +421,13 @@ async def update_order_status(
             if order.get("status") != OrderStatus.PENDING.value:
                 raise HTTPException(status_code=400, detail="Can only cancel pending orders")
         
+        # Keep or return reserved stock
+        if new_status == OrderStatus.CONFIRMED.value and order.get("reservation_expires_at"):
+            if not await inventory_service.commit(order_id) and order.get("status") == OrderStatus.PENDING.value:
+                raise HTTPException(status_code=409, detail="Order reservation has expired")
+        elif new_status == OrderStatus.CANCELLED.value:
+            await inventory_service.release(order_id)
+        
         # Update order
         update_data = {
             "status": new_status,
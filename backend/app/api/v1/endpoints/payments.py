@@ -2,7 +2,8 @@
 Payment processing endpoints for secure transactions with mock payment gateway.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import random
@@ -11,22 +12,32 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.core.database import get_database
 from app.core.dependencies import get_current_user
+from app.core.exceptions import ConflictException, NotFoundException, ValidationException
 from app.models.user import UserProfile
+from app.services.payment_service import generate_transaction_id, payment_service
+from app.services.record_export import MEDIA_TYPES, build_export_query, stream_export
 
 router = APIRouter()
 
+# Transaction history fields, in export column order
+TRANSACTION_COLUMNS = [
+    "transaction_id", "amount", "currency", "payment_method",
+    "payment_reference", "description", "status", "completed_at",
+]
 
-def generate_transaction_id() -> str:
-    """Generate a unique transaction ID."""
-    timestamp = datetime.utcnow().isoformat()
-    random_part = str(random.randint(1000, 9999))
-    hash_input = f"{timestamp}-{random_part}".encode()
-    return f"TXN{hashlib.md5(hash_input).hexdigest()[:12].upper()}"
 
-
-def generate_payment_reference() -> str:
-    """Generate a payment reference number."""
-    return f"PAY{random.randint(100000, 999999)}"
+def _format_transaction(txn: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a transaction for the user's history."""
+    return {
+        "transaction_id": txn["_id"],
+        "amount": txn["amount"],
+        "currency": txn["currency"],
+        "payment_method": txn["payment_method"],
+        "payment_reference": txn.get("payment_reference"),
+        "description": txn.get("description"),
+        "status": txn["status"],
+        "completed_at": txn["completed_at"].isoformat() if txn.get("completed_at") else None
+    }
 
 
 @router.post("/create-payment-intent")
@@ -64,7 +75,7 @@ async def create_payment_intent(
         # Store payment intent in database
         payment_intent = {
             "_id": intent_id,
-            "user_id": str(current_user.id),
+            "user_id": current_user.user_id,
             "amount": amount,
             "currency": currency,
             "payment_method": payment_method,
@@ -100,15 +111,19 @@ async def create_payment_intent(
 async def confirm_payment(
     payment_confirmation: Dict[str, Any],
     current_user: UserProfile = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ) -> Dict[str, Any]:
     """
     Confirm and process a payment (Mock Implementation).
     
+    Retries with the same Idempotency-Key header, or of an intent that was
+    already confirmed, get the stored result instead of a new charge.
+    
     Args:
         payment_confirmation: Payment confirmation data with:
             - intent_id: str
             - payment_details: Dict (method-specific details)
+            - idempotency_key: str (optional, instead of the header)
             
     Returns:
         Payment confirmation result
@@ -118,85 +133,25 @@ async def confirm_payment(
         if not intent_id:
             raise HTTPException(status_code=400, detail="Payment intent ID required")
         
-        # Retrieve payment intent
-        intent = await db.payment_intents.find_one({"_id": intent_id})
-        if not intent:
-            raise HTTPException(status_code=404, detail="Payment intent not found")
-        
-        if intent["status"] != "pending":
-            raise HTTPException(status_code=400, detail=f"Payment already {intent['status']}")
-        
-        # Check expiration
-        if datetime.utcnow() > intent["expires_at"]:
-            await db.payment_intents.update_one(
-                {"_id": intent_id},
-                {"$set": {"status": "expired"}}
+        try:
+            outcome = await payment_service.confirm(
+                intent_id,
+                current_user.user_id,
+                payment_confirmation.get("payment_details", {}),
+                idempotency_key or payment_confirmation.get("idempotency_key")
             )
-            raise HTTPException(status_code=400, detail="Payment intent expired")
-        
-        # Mock payment processing - 95% success rate
-        payment_successful = random.random() < 0.95
-        
-        if payment_successful:
-            transaction_id = generate_transaction_id()
-            payment_reference = generate_payment_reference()
-            
-            # Create transaction record
-            transaction = {
-                "_id": transaction_id,
-                "user_id": str(current_user.id),
-                "intent_id": intent_id,
-                "amount": intent["amount"],
-                "currency": intent["currency"],
-                "payment_method": intent["payment_method"],
-                "payment_reference": payment_reference,
-                "description": intent["description"],
-                "status": "completed",
-                "completed_at": datetime.utcnow(),
-                "metadata": payment_confirmation.get("payment_details", {})
-            }
-            
-            await db.transactions.insert_one(transaction)
-            
-            # Update payment intent
-            await db.payment_intents.update_one(
-                {"_id": intent_id},
-                {
-                    "$set": {
-                        "status": "succeeded",
-                        "transaction_id": transaction_id,
-                        "completed_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            return {
-                "status": "succeeded",
-                "transaction_id": transaction_id,
-                "payment_reference": payment_reference,
-                "amount": intent["amount"],
-                "currency": intent["currency"],
-                "payment_method": intent["payment_method"],
-                "message": "Payment processed successfully (Mock)",
-                "receipt_url": f"/api/v1/payments/receipt/{transaction_id}"
-            }
-        else:
+        except NotFoundException as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValidationException as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ConflictException as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        if outcome["status"] == "failed":
             # Mock payment failure
-            await db.payment_intents.update_one(
-                {"_id": intent_id},
-                {
-                    "$set": {
-                        "status": "failed",
-                        "error": "Payment declined by mock gateway",
-                        "failed_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            raise HTTPException(
-                status_code=402,
-                detail="Payment declined - insufficient funds or authentication failure (Mock)"
-            )
+            raise HTTPException(status_code=402, detail=outcome["error"])
+        
+        return outcome
         
     except HTTPException:
         raise
@@ -227,25 +182,14 @@ async def get_transactions(
     try:
         # Query transactions
         transactions_cursor = db.transactions.find(
-            {"user_id": str(current_user.id)}
+            {"user_id": current_user.user_id}
         ).sort("completed_at", -1).skip(offset).limit(limit)
         
         transactions = await transactions_cursor.to_list(length=limit)
-        total_count = await db.transactions.count_documents({"user_id": str(current_user.id)})
+        total_count = await db.transactions.count_documents({"user_id": current_user.user_id})
         
         # Format transactions
-        formatted_transactions = []
-        for txn in transactions:
-            formatted_transactions.append({
-                "transaction_id": txn["_id"],
-                "amount": txn["amount"],
-                "currency": txn["currency"],
-                "payment_method": txn["payment_method"],
-                "payment_reference": txn.get("payment_reference"),
-                "description": txn.get("description"),
-                "status": txn["status"],
-                "completed_at": txn["completed_at"].isoformat() if txn.get("completed_at") else None
-            })
+        formatted_transactions = [_format_transaction(txn) for txn in transactions]
         
         return {
             "transactions": formatted_transactions,
@@ -262,6 +206,39 @@ async def get_transactions(
         )
 
 
+@router.get("/transactions/export")
+async def export_transactions(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, description="Transactions completed on or after"),
+    end: Optional[datetime] = Query(None, description="Transactions completed on or before"),
+    after: Optional[str] = Query(None, description="Resume after this row cursor"),
+    current_user: UserProfile = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> StreamingResponse:
+    """
+    Export the user's full transaction history, oldest first, as NDJSON or CSV.
+    
+    Args:
+        export_format: "ndjson" or "csv"
+        start: Earliest completion date
+        end: Latest completion date
+        after: Cursor of the last row received by an interrupted export
+    
+    Returns:
+        Streamed transactions, each with its resume cursor
+    """
+    try:
+        query = build_export_query({"user_id": current_user.user_id}, "completed_at", start, end, after)
+    except ValidationException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        stream_export(db.transactions, query, "completed_at", _format_transaction, TRANSACTION_COLUMNS, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{export_format}"'}
+    )
+
+
 @router.get("/transactions/{transaction_id}")
 async def get_transaction_detail(
     transaction_id: str,
@@ -283,7 +260,7 @@ async def get_transaction_detail(
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        if transaction["user_id"] != str(current_user.id):
+        if transaction["user_id"] != current_user.user_id:
             raise HTTPException(status_code=403, detail="Unauthorized access to transaction")
         
         return {
@@ -341,7 +318,7 @@ async def process_refund(
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        if transaction["user_id"] != str(current_user.id):
+        if transaction["user_id"] != current_user.user_id:
             raise HTTPException(status_code=403, detail="Unauthorized")
         
         if transaction["status"] != "completed":
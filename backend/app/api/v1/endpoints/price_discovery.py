@@ -12,7 +12,7 @@ from app.services.market_data_service import MarketDataService
 from app.models.market_data import (
     MarketPriceRequest, MarketPriceResponse,
     PriceHistoryRequest, PriceHistoryResponse,
-    DataSyncStatus
+    DataSyncStatus, BatchForecastRequest, BatchForecastResponse
 )
 
 router = APIRouter()
@@ -156,6 +156,36 @@ async def sync_external_data(
         )
 
 
+@router.get("/market-summary/{commodity}")
+async def get_market_summary(
+    commodity: str,
+    state: Optional[str] = Query(None, description="State name filter"),
+    market: Optional[str] = Query(None, description="Market name filter"),
+    service: MarketDataService = Depends(get_market_data_service)
+) -> Dict[str, Any]:
+    """
+    Get price summary statistics for a commodity.
+    
+    Args:
+        commodity: Commodity name
+        state: State name filter (optional)
+        market: Market name filter (optional)
+        service: Market data service dependency
+        
+    Returns:
+        Price summary statistics over the last 30 days
+    """
+    try:
+        summary = await service.get_market_summary(commodity, state=state, market=market)
+        return {"commodity": commodity, "summary": summary}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get market summary: {str(e)}"
+        )
+
+
 @router.get("/data-quality/{commodity}")
 async def get_data_quality(
     commodity: str,
@@ -172,46 +202,7 @@ async def get_data_quality(
         Data quality metrics and validation results
     """
     try:
-        # Get recent market data
-        request = MarketPriceRequest(commodity=commodity)
-        response = await service.get_market_price(request)
-        
-        if not response.prices:
-            return {
-                "commodity": commodity,
-                "data_quality": "no_data",
-                "quality_score": 0.0,
-                "total_records": 0,
-                "validation_summary": "No data available"
-            }
-        
-        # Calculate quality metrics
-        quality_counts = {}
-        total_records = len(response.prices)
-        validated_records = sum(1 for price in response.prices if price.is_validated)
-        
-        for price in response.prices:
-            quality = price.data_quality.value
-            quality_counts[quality] = quality_counts.get(quality, 0) + 1
-        
-        # Calculate overall quality score
-        quality_weights = {"high": 1.0, "medium": 0.7, "low": 0.4, "unverified": 0.0}
-        weighted_score = sum(
-            quality_counts.get(quality, 0) * weight 
-            for quality, weight in quality_weights.items()
-        )
-        overall_score = weighted_score / total_records if total_records > 0 else 0.0
-        
-        return {
-            "commodity": commodity,
-            "data_quality": response.data_quality.value,
-            "quality_score": round(overall_score, 2),
-            "total_records": total_records,
-            "validated_records": validated_records,
-            "quality_distribution": quality_counts,
-            "last_updated": response.last_updated.isoformat(),
-            "validation_summary": f"{validated_records}/{total_records} records validated"
-        }
+        return await service.get_data_quality(commodity)
         
     except Exception as e:
         raise HTTPException(
@@ -225,12 +216,15 @@ async def get_price_prediction(
     commodity: str,
     state: Optional[str] = None,
     market: Optional[str] = None,
-    days_ahead: int = 7,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    days_ahead: int = Query(7, ge=1, le=30, description="Number of days to predict ahead"),
+    service: MarketDataService = Depends(get_market_data_service)
 ) -> Dict[str, Any]:
     """
     Get AI-powered price prediction for a commodity.
     
+    Serves the latest precomputed forecast when one is fresh, otherwise
+    computes the forecast on demand.
+    
     Args:
         commodity: Commodity name
         state: State name (optional)
@@ -241,12 +235,7 @@ async def get_price_prediction(
         Price prediction information
     """
     try:
-        from app.services.market_data_service import MarketDataService
-        
-        market_service = MarketDataService(db)
-        await market_service.initialize()
-        
-        prediction = await market_service.predict_price(
+        prediction = await service.get_price_forecast(
             commodity=commodity,
             state=state,
             market=market,
@@ -262,6 +251,43 @@ async def get_price_prediction(
         )
 
 
+@router.post("/price-prediction/batch", response_model=BatchForecastResponse)
+async def get_price_predictions_batch(
+    batch_request: BatchForecastRequest,
+    service: MarketDataService = Depends(get_market_data_service)
+) -> BatchForecastResponse:
+    """
+    Get price predictions for many (commodity, state, market) keys at once.
+    
+    Args:
+        batch_request: Forecast keys and number of days to predict ahead
+        service: Market data service dependency
+        
+    Returns:
+        Forecasts in request order with precomputed/on-demand counts
+    """
+    try:
+        forecasts = await service.get_price_forecasts_batch(
+            batch_request.keys,
+            batch_request.days_ahead
+        )
+        precomputed_count = sum(
+            1 for forecast in forecasts if forecast.get("forecast_source") == "precomputed"
+        )
+        
+        return BatchForecastResponse(
+            forecasts=forecasts,
+            precomputed_count=precomputed_count,
+            computed_count=len(forecasts) - precomputed_count
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate batch price predictions: {str(e)}"
+        )
+
+
 @router.post("/suggest-price")
 async def suggest_price(
     price_request: Dict[str, Any],
@@ -3,6 +3,7 @@ Product management endpoints for marketplace operations.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi.responses import Response
 from typing import Dict, Any, List, Optional
 from decimal import Decimal
 from datetime import datetime
@@ -10,8 +11,8 @@ import logging
 
 from app.core.dependencies import get_current_user
 from app.core.database import get_database
-from app.core.exceptions import NotFoundException, ValidationException, AuthorizationException
-from app.models.user import UserResponse
+from app.core.exceptions import NotFoundException, ValidationException, AuthorizationException, RateLimitException
+from app.models.user import UserResponse, UserRole
 from app.models.product import (
     ProductCreateRequest,
     ProductUpdateRequest,
@@ -28,6 +29,7 @@ from app.models.product import (
 )
 from app.services.product_service import ProductService
 from app.services.image_service import ImageService
+from app.services.search_planner import search_planner
 
 logger = logging.getLogger(__name__)
 
@@ -109,6 +111,34 @@ async def initialize_search_index(
         )
 
 
+@router.get("/search/index-report")
+async def get_search_index_report(
+    min_queries: int = Query(1, ge=1),
+    current_user: UserResponse = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Recommend indexes for product search shapes this worker has served poorly.
+    
+    Args:
+        min_queries: Ignore query shapes seen fewer times
+        current_user: Current authenticated user (admin only)
+        
+    Returns:
+        Observed query shapes without a fully serving index, most frequent
+        first, with the recommended index for each
+        
+    Raises:
+        HTTPException: If user not authorized
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view the search index report"
+        )
+    
+    return {"recommendations": search_planner.index_report(min_queries)}
+
+
 @router.post("/", response_model=ProductResponse)
 async def create_product(
     product_data: ProductCreateRequest,
@@ -153,7 +183,8 @@ async def create_product(
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product_detail(
     product_id: str,
-    language: SupportedLanguage = SupportedLanguage.ENGLISH
+    language: SupportedLanguage = SupportedLanguage.ENGLISH,
+    language_only: bool = False
 ) -> ProductResponse:
     """
     Get detailed information about a specific product.
@@ -161,6 +192,7 @@ async def get_product_detail(
     Args:
         product_id: Product identifier
         language: Preferred language for response
+        language_only: Return only the preferred language's translations
         
     Returns:
         Detailed product information
@@ -172,7 +204,8 @@ async def get_product_detail(
         product = await product_service.get_product_by_id(
             product_id=product_id,
             language=language,
-            increment_views=True
+            increment_views=True,
+            language_only=language_only
         )
         
         if not product:
@@ -284,6 +317,7 @@ async def delete_product(
 async def search_products(
     query: Optional[str] = None,
     language: SupportedLanguage = SupportedLanguage.ENGLISH,
+    language_only: bool = False,
     category: Optional[ProductCategory] = None,
     subcategory: Optional[str] = None,
     min_price: Optional[Decimal] = None,
@@ -300,13 +334,17 @@ async def search_products(
     sort_order: str = "desc",
     limit: int = 20,
     skip: int = 0
-) -> ProductSearchResponse:
+) -> Response:
     """
     Search products with filtering and multilingual support.
     
+    The response is serialized by ProductService.search_products_json, so
+    it is returned as-is rather than validated against response_model again.
+    
     Args:
         query: Search text
         language: Search language
+        language_only: Return only the search language's translations
         category: Filter by category
         subcategory: Filter by subcategory
         min_price: Minimum price filter
@@ -336,6 +374,7 @@ async def search_products(
         search_query = ProductSearchQuery(
             query=query,
             language=language,
+            language_only=language_only,
             category=category,
             subcategory=subcategory,
             min_price=min_price,
@@ -353,7 +392,8 @@ async def search_products(
             skip=max(skip, 0)  # Ensure non-negative
         )
         
-        return await product_service.search_products(search_query)
+        content = await product_service.search_products_json(search_query)
+        return Response(content=content, media_type="application/json")
         
     except ValidationException as e:
         raise HTTPException(
@@ -372,7 +412,9 @@ async def get_vendor_products(
     vendor_id: str,
     status_filter: Optional[ProductStatus] = None,
     limit: int = 20,
-    skip: int = 0
+    skip: int = 0,
+    language: SupportedLanguage = SupportedLanguage.ENGLISH,
+    language_only: bool = False
 ) -> List[ProductResponse]:
     """
     Get products for a specific vendor.
@@ -382,6 +424,8 @@ async def get_vendor_products(
         status_filter: Filter by product status
         limit: Maximum results to return
         skip: Number of results to skip
+        language: Preferred language for response
+        language_only: Return only the preferred language's translations
         
     Returns:
         List of vendor's products
@@ -391,7 +435,9 @@ async def get_vendor_products(
             vendor_id=vendor_id,
             status=status_filter,
             limit=min(limit, 100),
-            skip=max(skip, 0)
+            skip=max(skip, 0),
+            language=language,
+            language_only=language_only
         )
     except Exception as e:
         raise HTTPException(
@@ -487,16 +533,14 @@ async def upload_product_image(
                 detail="You can only upload images to your own products"
             )
         
-        # Read file data
-        file_data = await file.read()
-        
-        # Upload image
-        image_ref = await image_service.upload_product_image(
-            image_data=file_data,
-            filename=file.filename or "image.jpg",
-            product_id=product_id,
-            content_type=file.content_type or "image/jpeg"
-        )
+        # Spool the upload to a temporary file and upload it from there
+        async with image_service.spool_upload(file) as spooled:
+            image_ref = await image_service.upload_product_image(
+                image_data=spooled,
+                filename=spooled.filename,
+                product_id=product_id,
+                content_type=file.content_type or "image/jpeg"
+            )
         
         # Update product with new image reference
         db = await get_database()
@@ -508,7 +552,11 @@ async def upload_product_image(
             "thumbnail_url": image_ref.thumbnail_url or image_ref.image_url,
             "alt_text": alt_text,
             "is_primary": is_primary,
-            "uploaded_at": datetime.utcnow()
+            "uploaded_at": datetime.utcnow(),
+            "file_size": image_ref.file_size,
+            "dimensions": image_ref.dimensions,
+            "content_hash": image_ref.content_hash,
+            "renditions": [rendition.model_dump() for rendition in image_ref.renditions]
         }
         
         # Get current images
@@ -544,6 +592,11 @@ async def upload_product_image(
             image_id=image_ref.image_id,
             image_url=image_ref.image_url,
             thumbnail_url=image_ref.thumbnail_url or image_ref.image_url,
+            renditions=image_ref.renditions,
+            srcset={
+                image_format: image_ref.srcset(image_format)
+                for image_format in dict.fromkeys(rendition.format for rendition in image_ref.renditions)
+            },
             upload_status="success",
             message="Image uploaded successfully"
         )
@@ -553,6 +606,12 @@ async def upload_product_image(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except RateLimitException as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except HTTPException:
         raise
     except Exception as e:
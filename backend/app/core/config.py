@@ -46,6 +46,9 @@ class Settings(BaseSettings):
     AWS_REGION: str = "ap-south-1"
     AWS_TRANSLATE_REGION: str = "ap-south-1"
     AWS_SAGEMAKER_REGION: str = "ap-south-1"
+    AWS_S3_BUCKET: str = "mandi-marketplace-images"
+    AWS_S3_ENDPOINT_URL: str = ""  # S3-compatible store such as MinIO
+    AWS_S3_PUBLIC_URL: str = ""  # base URL images are served from, e.g. a CDN
     
     # Google OAuth settings
     GOOGLE_CLIENT_ID: str = ""
@@ -54,11 +57,14 @@ class Settings(BaseSettings):
     # External API settings
     AGMARKNET_API_KEY: str
     AGMARKNET_BASE_URL: str = "https://api.data.gov.in/resource"
+    AGMARKNET_INGEST_BATCH_SIZE: int = 500
     
     # Payment gateway settings
     RAZORPAY_KEY_ID: str
     RAZORPAY_KEY_SECRET: str
     UPI_MERCHANT_ID: str
+    PAYMENT_IDEMPOTENCY_TTL_HOURS: int = 24
+    PAYMENT_PROCESSING_TIMEOUT_SECONDS: int = 120  # after this a stuck claim can be taken over
     
     # File upload settings
     MAX_FILE_SIZE_MB: int = 10
@@ -69,6 +75,74 @@ class Settings(BaseSettings):
     REDIS_CACHE_TTL: int = 3600  # 1 hour
     TRANSLATION_CACHE_TTL: int = 86400  # 24 hours
     PRICE_CACHE_TTL: int = 1800  # 30 minutes
+    USER_SUMMARY_CACHE_TTL: int = 300  # 5 minutes
+    USER_SUMMARY_CACHE_SIZE: int = 10000
+    
+    # Price forecast settings
+    FORECAST_DAYS_AHEAD: int = 7
+    FORECAST_MAX_AGE_HOURS: int = 36
+    FORECAST_RETENTION_DAYS: int = 30
+    FORECAST_REQUEST_WINDOW_DAYS: int = 7  # keys requested this recently are precomputed
+    
+    # In-memory price store settings
+    PRICE_STORE_MAX_COMMODITIES: int = 50
+    PRICE_STORE_RETENTION_DAYS: int = 365
+    
+    # Price anomaly detection settings
+    ANOMALY_EWMA_ALPHA: float = 0.2
+    ANOMALY_THRESHOLD: float = 5.0
+    ANOMALY_MAX_JUMP_RATIO: float = 3.0
+    ANOMALY_WARMUP: int = 5
+    ANOMALY_RESET_AFTER: int = 3
+    
+    # Chat settings
+    CHAT_PRESENCE_TTL_SECONDS: int = 60
+    CHAT_SEND_QUEUE_SIZE: int = 100
+    CHAT_SEND_TIMEOUT_SECONDS: float = 10.0
+    CHAT_SLOW_CONSUMER_POLICY: str = "disconnect"  # "disconnect" or "drop"
+    MESSAGE_LOG_FLUSH_INTERVAL_MS: int = 200
+    MESSAGE_LOG_BATCH_SIZE: int = 500
+    MESSAGE_LOG_MAX_BUFFER: int = 50000
+    CHAT_TRANSLATION_WORKERS: int = 4
+    CHAT_TRANSLATION_QUEUE_SIZE: int = 1000
+    CHAT_LANGUAGES_TTL_SECONDS: int = 300
+    
+    # Negotiation advisor settings
+    NEGOTIATION_SUMMARY_TTL_SECONDS: int = 300
+    NEGOTIATION_MEMO_SIZE: int = 10000
+    
+    # Inventory reservation settings
+    # Time a vendor has to confirm a new order. Stock stays held until then;
+    # pending orders left unconfirmed are cancelled and their stock returned.
+    # Payments are not linked to orders, so this applies to paid orders too.
+    INVENTORY_RESERVATION_TTL_MINUTES: int = 60
+    INVENTORY_HOT_KEY_THRESHOLD: int = 100  # reservations per minute per worker
+    INVENTORY_SHARD_COUNT: int = 8
+    
+    # Export settings
+    EXPORT_BATCH_SIZE: int = 500
+    
+    # Geo search settings
+    GEO_DEFAULT_RADIUS_KM: float = 25.0
+    GEO_CELL_CACHE_TTL_SECONDS: int = 60  # per worker; staleness bound across workers
+    GEO_CELL_CACHE_SIZE: int = 500
+    GEO_CELL_MAX_CANDIDATES: int = 2000
+    
+    # Search planner settings
+    SEARCH_PLANNER_MAX_SHAPES: int = 1000
+    
+    # View counter settings
+    VIEW_COUNTER_BACKEND: str = "memory"  # "memory" or "redis"
+    VIEW_COUNT_FLUSH_INTERVAL_SECONDS: int = 30
+    VIEW_COUNT_FLUSH_BATCH_SIZE: int = 500
+    
+    # Image processing settings
+    IMAGE_PROCESS_WORKERS: int = 2
+    IMAGE_PROCESS_QUEUE_SIZE: int = 8  # images waiting for a worker before uploads get 429
+    IMAGE_PROCESS_RETRY_AFTER_SECONDS: int = 2
+    IMAGE_RENDITION_WIDTHS: str = "320,640,1200"
+    IMAGE_RENDITION_FORMATS: str = "webp,jpeg"  # "avif" needs Pillow built with AVIF
+    IMAGE_MULTIPART_THRESHOLD_MB: int = 8
     
     # Feature flags
     ENABLE_VOICE_MESSAGES: bool = True
@@ -117,6 +191,14 @@ class Settings(BaseSettings):
             return [i.strip() for i in self.ALLOWED_IMAGE_TYPES.split(",")]
         return self.ALLOWED_IMAGE_TYPES
     
+    def get_image_rendition_widths(self) -> List[int]:
+        """Get responsive image rendition widths as a list."""
+        return [int(i) for i in self.IMAGE_RENDITION_WIDTHS.split(",") if i.strip()]
+    
+    def get_image_rendition_formats(self) -> List[str]:
+        """Get responsive image rendition formats as a list."""
+        return [i.strip().lower() for i in self.IMAGE_RENDITION_FORMATS.split(",") if i.strip()]
+    
     @validator("MAX_FILE_SIZE_MB")
     def validate_file_size(cls, v):
         if v <= 0 or v > 100:
@@ -135,6 +217,12 @@ class Settings(BaseSettings):
             raise ValueError("JWT_REFRESH_TOKEN_EXPIRE_DAYS must be positive")
         return v
     
+    @validator("CHAT_SLOW_CONSUMER_POLICY")
+    def validate_slow_consumer_policy(cls, v):
+        if v not in ("disconnect", "drop"):
+            raise ValueError("CHAT_SLOW_CONSUMER_POLICY must be 'disconnect' or 'drop'")
+        return v
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
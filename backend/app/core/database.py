@@ -6,7 +6,7 @@ and provides database access utilities for the application.
 """
 
 import logging
-from typing import Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
@@ -19,6 +19,40 @@ mongo_client: Optional[AsyncIOMotorClient] = None
 database: Optional[AsyncIOMotorDatabase] = None
 
 
+class IndexSpec(NamedTuple):
+    """A named index, optionally partial."""
+    name: str
+    keys: List[Tuple[str, int]]
+    partial: Optional[Dict[str, Any]] = None
+
+
+# Listings buyers can order: most searches set available_only, so the partial
+# indexes below hold only these and stay a fraction of the collection's size
+AVAILABLE_PRODUCTS = {"status": "active", "availability.quantity_available": {"$gt": 0}}
+
+# Indexes for product search filter combinations, chosen per query by the
+# search planner
+PRODUCT_SEARCH_INDEXES = [
+    IndexSpec("status_1_category_1_price_info.base_price_paise_1", [
+        ("status", 1), ("category", 1), ("price_info.base_price_paise", 1)
+    ]),
+    IndexSpec("status_1_price_info.base_price_paise_1", [
+        ("status", 1), ("price_info.base_price_paise", 1)
+    ]),
+    IndexSpec("status_1_category_1_created_at_-1", [
+        ("status", 1), ("category", 1), ("created_at", -1)
+    ]),
+    IndexSpec("available_category_price", [
+        ("category", 1), ("price_info.base_price_paise", 1)
+    ], AVAILABLE_PRODUCTS),
+    IndexSpec("available_price", [("price_info.base_price_paise", 1)], AVAILABLE_PRODUCTS),
+    IndexSpec("available_category_created", [("category", 1), ("created_at", -1)], AVAILABLE_PRODUCTS),
+    IndexSpec("available_created", [("created_at", -1)], AVAILABLE_PRODUCTS),
+    # views_count changes once per view counter flush, so it can be indexed
+    IndexSpec("available_popularity", [("views_count", -1), ("favorites_count", -1)], AVAILABLE_PRODUCTS),
+]
+
+
 async def connect_to_mongo() -> None:
     """
     Create database connection and initialize MongoDB.
@@ -117,11 +151,15 @@ async def create_indexes() -> None:
         await products_collection.create_index("category")
         await products_collection.create_index("status")
         await products_collection.create_index([("location.coordinates", "2dsphere")])
+        # Prefix lookups of the geohash cells around a search location
+        await products_collection.create_index([("location.geohash", 1)])
         await products_collection.create_index([
             ("name.original_text", "text"),
             ("description.original_text", "text")
         ])
-        await products_collection.create_index("base_price")
+        for spec in PRODUCT_SEARCH_INDEXES:
+            options = {"partialFilterExpression": spec.partial} if spec.partial else {}
+            await products_collection.create_index(spec.keys, name=spec.name, **options)
         await products_collection.create_index([("created_at", -1)])
         
         # Conversation collection indexes
@@ -144,6 +182,13 @@ async def create_indexes() -> None:
         await transactions_collection.create_index("product_id")
         await transactions_collection.create_index([("created_at", -1)])
         await transactions_collection.create_index("payment_status")
+        # Keyset order of transaction history exports
+        await transactions_collection.create_index([("user_id", 1), ("completed_at", 1), ("_id", 1)])
+        
+        # Order collection indexes, in the keyset order of order history exports
+        orders_collection = database.orders
+        await orders_collection.create_index([("buyer_id", 1), ("created_at", 1), ("_id", 1)])
+        await orders_collection.create_index([("vendor_id", 1), ("created_at", 1), ("_id", 1)])
         
         # Market price collection indexes
         market_prices_collection = database.market_prices
@@ -42,6 +42,11 @@ class ConflictException(MandiMarketplaceException):
     pass
 
 
+class InsufficientInventoryException(ConflictException):
+    """Exception raised when a product does not have enough stock to reserve."""
+    pass
+
+
 class ExternalServiceException(MandiMarketplaceException):
     """Exception raised for external service failures."""
     
@@ -22,6 +22,16 @@ from app.core.redis import connect_to_redis, close_redis_connection
 from app.core.logging import setup_logging
 from app.api.v1.api import api_router
 from app.services.elasticsearch_service import elasticsearch_service
+from app.services.price_store import price_store
+from app.services.chat_broker import chat_broker
+from app.services.message_log import message_log
+from app.services.chat_translation import chat_translation
+from app.services.inventory_service import inventory_service
+from app.services.payment_service import payment_service
+from app.services.view_counter import view_counter
+from app.services.background_tasks import background_task_service
+from app.services.image_pipeline import image_pipeline
+from app.services.image_storage import ImageFiles
 from app.core.exceptions import (
     ValidationException,
     AuthenticationException,
@@ -45,10 +55,19 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     
     # Connect to databases
     await connect_to_mongo()
+    await message_log.start()
+    await chat_translation.start()
+    await inventory_service.initialize()
+    await inventory_service.start()
+    await view_counter.start()
+    await payment_service.initialize()
+    await image_pipeline.start()
     
     # Try to connect to Redis (optional)
     try:
         await connect_to_redis()
+        await price_store.start_listener()
+        await chat_broker.start_listener()
     except Exception as e:
         logger.warning(f"Failed to connect to Redis: {e}")
         logger.info("Application will continue without Redis caching")
@@ -61,6 +80,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.warning(f"Failed to initialize Elasticsearch: {e}")
         logger.info("Application will continue with MongoDB fallback for search")
     
+    # Precompute price forecasts now and then nightly
+    try:
+        await background_task_service.start_forecast_precompute()
+    except Exception as e:
+        logger.warning(f"Failed to start forecast precompute: {e}")
+    
     logger.info("Database connections established")
     
     yield
@@ -68,6 +93,20 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Shutdown
     logger.info("Shutting down Multilingual Mandi Marketplace API")
     
+    # Stop pub/sub listeners before closing Redis
+    await price_store.stop_listener()
+    await chat_broker.stop_listener()
+    
+    # Stop the forecast precompute before closing the database
+    await background_task_service.stop_forecast_precompute()
+    
+    # Write buffered chat messages and view counts before closing the database
+    await chat_translation.stop()
+    await message_log.stop()
+    await inventory_service.stop()
+    await view_counter.stop()
+    await image_pipeline.stop()
+    
     # Close database connections
     await close_mongo_connection()
     await close_redis_connection()
@@ -188,11 +227,11 @@ if settings.DEBUG:
         os.makedirs(static_dir)
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
     
-    # Serve uploads directory for product images
-    uploads_dir = "uploads"
+    # Serve uploads directory for product images, cached as immutable
+    uploads_dir = settings.UPLOAD_DIRECTORY
     if not os.path.exists(uploads_dir):
         os.makedirs(uploads_dir)
-    app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+    app.mount("/uploads", ImageFiles(directory=uploads_dir), name="uploads")
 
 
 # Request logging middleware
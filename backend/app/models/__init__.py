@@ -58,6 +58,7 @@ from .market_data import (
     MarketPrice,
     PriceHistory,
     DataValidationResult,
+    BatchValidationResult,
     MarketDataCache,
     MarketPriceRequest,
     MarketPriceResponse,
@@ -65,6 +66,10 @@ from .market_data import (
     PriceHistoryResponse,
     DataSyncStatus,
     AgmarknetApiResponse,
+    ForecastKey,
+    BatchForecastRequest,
+    BatchForecastResponse,
+    PriceForecast,
     DataSource,
     DataQuality,
     PriceUnit,
@@ -121,6 +126,7 @@ __all__ = [
     "MarketPrice",
     "PriceHistory",
     "DataValidationResult",
+    "BatchValidationResult",
     "MarketDataCache",
     "MarketPriceRequest",
     "MarketPriceResponse",
@@ -128,6 +134,10 @@ __all__ = [
     "PriceHistoryResponse",
     "DataSyncStatus",
     "AgmarknetApiResponse",
+    "ForecastKey",
+    "BatchForecastRequest",
+    "BatchForecastResponse",
+    "PriceForecast",
     "DataSource",
     "DataQuality",
     "PriceUnit",
@@ -135,6 +135,27 @@ class DataValidationResult(BaseModel):
     validated_at: datetime = Field(default_factory=datetime.utcnow, description="Validation timestamp")
 
 
+class BatchValidationResult(BaseModel):
+    """Result of validating a page of market price records in one pass."""
+    checks: List[str] = Field(..., description="Validation check names in flag bit order")
+    total_records: int = Field(..., ge=0, description="Number of records validated")
+    valid_records: int = Field(..., ge=0, description="Number of records that passed validation")
+    invalid_records: int = Field(..., ge=0, description="Number of records that failed validation")
+    valid_flags: List[bool] = Field(..., description="Per-record validity")
+    check_flags: List[int] = Field(..., description="Per-record bitmask of failed checks")
+    quality_scores: List[float] = Field(..., description="Per-record quality score (0-1)")
+    data_qualities: List[DataQuality] = Field(..., description="Per-record data quality")
+    check_failures: Dict[str, int] = Field(..., description="Number of records failing each check")
+    quality_distribution: Dict[str, int] = Field(..., description="Number of records per data quality")
+    average_quality_score: float = Field(..., ge=0, le=1, description="Mean quality score")
+    validated_at: datetime = Field(default_factory=datetime.utcnow, description="Validation timestamp")
+    
+    def failed_checks(self, index: int) -> List[str]:
+        """Get the names of the checks a record failed."""
+        mask = self.check_flags[index]
+        return [name for bit, name in enumerate(self.checks) if mask & (1 << bit)]
+
+
 class MarketDataCache(BaseModel):
     """Cached market data with expiration."""
     cache_key: str = Field(..., description="Cache key")
@@ -223,6 +244,43 @@ class DataSyncStatus(BaseModel):
         }
 
 
+class ForecastKey(BaseModel):
+    """Lookup key for a commodity price forecast."""
+    commodity: str = Field(..., min_length=2, max_length=100, description="Commodity name")
+    state: Optional[str] = Field(None, max_length=50, description="State name")
+    market: Optional[str] = Field(None, max_length=100, description="Market name")
+
+
+class BatchForecastRequest(BaseModel):
+    """Request model for batch price forecasts."""
+    keys: List[ForecastKey] = Field(..., min_items=1, max_items=100, description="Forecast keys")
+    days_ahead: int = Field(default=7, ge=1, le=30, description="Number of days to forecast")
+
+
+class BatchForecastResponse(BaseModel):
+    """Response model for batch price forecasts."""
+    forecasts: List[Dict[str, Any]] = Field(..., description="Forecasts in request order")
+    precomputed_count: int = Field(default=0, description="Forecasts served from precomputed results")
+    computed_count: int = Field(default=0, description="Forecasts computed on demand")
+
+
+class PriceForecast(BaseModel):
+    """Precomputed price forecast stored in the price_forecasts collection."""
+    forecast_key: str = Field(..., description="Normalized commodity|state|market key")
+    commodity: str = Field(..., description="Commodity name")
+    state: str = Field(default="all", description="State name")
+    market: str = Field(default="all", description="Market name")
+    version: int = Field(..., description="Forecast run version")
+    days_ahead: int = Field(..., ge=1, description="Number of forecasted days")
+    forecast: Dict[str, Any] = Field(..., description="Forecast payload")
+    generated_at: datetime = Field(default_factory=datetime.utcnow, description="Generation timestamp")
+    
+    class Config:
+        json_encoders = {
+            datetime: lambda v: v.isoformat(),
+        }
+
+
 class AgmarknetApiResponse(BaseModel):
     """Response model for Agmarknet API data."""
     status: str = Field(..., description="API response status")
@@ -235,27 +293,33 @@ class AgmarknetApiResponse(BaseModel):
         market_prices = []
         
         for record in self.records:
-            try:
-                # Parse Agmarknet record format
-                market_price = MarketPrice(
-                    commodity=record.get("commodity", "").strip(),
-                    variety=record.get("variety", "").strip() or None,
-                    market=record.get("market", "").strip(),
-                    state=record.get("state", "").strip(),
-                    district=record.get("district", "").strip() or None,
-                    min_price=Decimal(str(record.get("min_price", 0))),
-                    max_price=Decimal(str(record.get("max_price", 0))),
-                    modal_price=Decimal(str(record.get("modal_price", 0))),
-                    unit=PriceUnit.PER_QUINTAL,  # Agmarknet typically uses quintal
-                    arrivals=int(record.get("arrivals", 0)) if record.get("arrivals") else None,
-                    arrivals_unit="quintal",
-                    date=datetime.strptime(record.get("date", ""), "%Y-%m-%d").date(),
-                    source=DataSource.AGMARKNET,
-                    data_quality=DataQuality.MEDIUM,  # Default quality for Agmarknet
-                )
+            market_price = self.record_to_market_price(record)
+            if market_price is not None:
                 market_prices.append(market_price)
-            except (ValueError, KeyError, TypeError) as e:
-                # Skip invalid records but log the error
-                continue
         
-        return market_prices
\ No newline at end of file
+        return market_prices
+    
+    @staticmethod
+    def record_to_market_price(record: Dict[str, Any]) -> Optional[MarketPrice]:
+        """Convert a single raw Agmarknet record, or return None if it is invalid."""
+        try:
+            # Parse Agmarknet record format
+            return MarketPrice(
+                commodity=record.get("commodity", "").strip(),
+                variety=record.get("variety", "").strip() or None,
+                market=record.get("market", "").strip(),
+                state=record.get("state", "").strip(),
+                district=record.get("district", "").strip() or None,
+                min_price=Decimal(str(record.get("min_price", 0))),
+                max_price=Decimal(str(record.get("max_price", 0))),
+                modal_price=Decimal(str(record.get("modal_price", 0))),
+                unit=PriceUnit.PER_QUINTAL,  # Agmarknet typically uses quintal
+                arrivals=int(record.get("arrivals", 0)) if record.get("arrivals") else None,
+                arrivals_unit="quintal",
+                price_date=datetime.strptime(record.get("date", ""), "%Y-%m-%d").date(),
+                source=DataSource.AGMARKNET,
+                data_quality=DataQuality.MEDIUM,  # Default quality for Agmarknet
+            )
+        except (ValueError, KeyError, TypeError, ArithmeticError, AttributeError):
+            # Skip invalid records
+            return None
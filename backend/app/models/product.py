@@ -46,6 +46,15 @@ class MeasurementUnit(str, Enum):
     BOX = "box"
 
 
+class ImageRendition(BaseModel):
+    """One width and format of a product image."""
+    format: str = Field(..., description="Image format (jpeg, webp or avif)")
+    width: int = Field(..., description="Width in pixels")
+    height: int = Field(..., description="Height in pixels")
+    url: str = Field(..., description="URL to the rendition")
+    file_size: Optional[int] = Field(None, description="File size in bytes")
+
+
 class ImageReference(BaseModel):
     """Reference to uploaded product images."""
     image_id: str = Field(..., description="Unique image identifier")
@@ -56,6 +65,24 @@ class ImageReference(BaseModel):
     uploaded_at: datetime = Field(default_factory=datetime.utcnow, description="Upload timestamp")
     file_size: Optional[int] = Field(None, description="File size in bytes")
     dimensions: Optional[Dict[str, int]] = Field(None, description="Image dimensions (width, height)")
+    content_hash: Optional[str] = Field(None, description="SHA-256 of the uploaded image")
+    renditions: List[ImageRendition] = Field(default_factory=list, description="Responsive renditions")
+    
+    def srcset(self, image_format: str = "webp") -> str:
+        """
+        Build an HTML srcset of the renditions in one format.
+        
+        Args:
+            image_format: Rendition format
+            
+        Returns:
+            Comma-separated "url widthw" candidates, narrowest first
+        """
+        renditions = sorted(
+            (rendition for rendition in self.renditions if rendition.format == image_format),
+            key=lambda rendition: rendition.width
+        )
+        return ", ".join(f"{rendition.url} {rendition.width}w" for rendition in renditions)
 
 
 class MultilingualText(BaseModel):
@@ -364,6 +391,9 @@ class ProductResponse(BaseModel):
     vendor_rating: Optional[float] = Field(None, description="Vendor rating")
     vendor_location: Optional[str] = Field(None, description="Vendor location")
     
+    # Distance from the search centre, for distance-sorted searches
+    distance_km: Optional[float] = Field(None, description="Distance from the search location in km")
+    
     class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat(),
@@ -376,6 +406,7 @@ class ProductSearchQuery(BaseModel):
     """Search query parameters for products."""
     query: Optional[str] = Field(None, description="Search text")
     language: SupportedLanguage = Field(default=SupportedLanguage.ENGLISH, description="Search language")
+    language_only: bool = Field(default=False, description="Return only the search language's translations")
     category: Optional[ProductCategory] = Field(None, description="Filter by category")
     subcategory: Optional[str] = Field(None, description="Filter by subcategory")
     
@@ -447,5 +478,7 @@ class ImageUploadResponse(BaseModel):
     image_id: str = Field(..., description="Image ID")
     image_url: str = Field(..., description="Image URL")
     thumbnail_url: str = Field(..., description="Thumbnail URL")
+    renditions: List[ImageRendition] = Field(default_factory=list, description="Responsive renditions")
+    srcset: Dict[str, str] = Field(default_factory=dict, description="srcset for each rendition format")
     upload_status: str = Field(..., description="Upload status")
     message: str = Field(..., description="Upload message")
\ No newline at end of file
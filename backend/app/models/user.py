@@ -351,6 +351,7 @@ class UserResponse(BaseModel):
     created_at: datetime = Field(..., description="Creation timestamp")
     updated_at: datetime = Field(..., description="Last update timestamp")
     last_login: Optional[datetime] = Field(None, description="Last login timestamp")
+    full_name: Optional[str] = Field(None, description="Full name")
     
     # Role-specific fields (populated based on role)
     business_name: Optional[str] = Field(None, description="Business name (vendors only)")
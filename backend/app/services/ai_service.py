@@ -9,6 +9,8 @@ import random
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+from .moderation_engine import ModerationEngine
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,6 +56,22 @@ class AIService:
             "spam": ["repeated messages", "promotional content"],
             "harassment": ["threatening", "bullying", "harassment"]
         }
+        
+        # Regional keywords in Indic scripts and common transliterations
+        self.regional_keywords = [
+            # Hindi
+            "धोखा", "धोखाधड़ी", "ठगी", "नकली", "फर्जी", "गाली",
+            # Tamil, Telugu, Bengali, Marathi
+            "மோசடி", "போலி", "మోసం", "నకిలీ", "প্রতারণা", "জাল", "फसवणूक",
+            # Transliterated (Hinglish)
+            "dhokha", "dhokhebaaz", "thagi", "nakli", "farzi", "fraudi", "chor"
+        ]
+        
+        # All rules compiled once for single-pass matching
+        self.moderation_engine = ModerationEngine.from_keywords(
+            self.inappropriate_keywords + self.regional_keywords,
+            self.community_rules
+        )
     
     async def generate_negotiation_suggestion(
         self,
@@ -181,67 +199,70 @@ class AIService:
             Moderation result
         """
         try:
-            content_lower = content.lower()
-            
-            # Check for inappropriate keywords
-            issues_found = []
-            confidence_scores = []
-            
-            for keyword in self.inappropriate_keywords:
-                if keyword in content_lower:
-                    issues_found.append({
-                        "type": "inappropriate_content",
-                        "keyword": keyword,
-                        "severity": "high"
-                    })
-                    confidence_scores.append(0.8)
-            
-            # Check for community rule violations
-            for rule_type, indicators in self.community_rules.items():
-                for indicator in indicators:
-                    if indicator in content_lower:
-                        issues_found.append({
-                            "type": rule_type,
-                            "indicator": indicator,
-                            "severity": "medium"
-                        })
-                        confidence_scores.append(0.6)
-            
-            # Check for excessive caps (shouting)
-            caps_ratio = sum(1 for c in content if c.isupper()) / len(content) if content else 0
-            if caps_ratio > 0.5 and len(content) > 10:
-                issues_found.append({
-                    "type": "excessive_caps",
-                    "indicator": "shouting",
-                    "severity": "low"
-                })
-                confidence_scores.append(0.5)
-            
-            # Determine overall status
-            if issues_found:
-                high_severity = any(issue["severity"] == "high" for issue in issues_found)
-                status = "rejected" if high_severity else "flagged"
-                avg_confidence = sum(confidence_scores) / len(confidence_scores)
-            else:
-                status = "approved"
-                avg_confidence = 0.9
-            
-            return {
-                "status": status,
-                "content_type": content_type,
-                "issues_found": issues_found,
-                "confidence": round(avg_confidence, 2),
-                "recommendations": self._generate_moderation_recommendations(issues_found),
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            issues_found, confidence_scores = self.moderation_engine.scan(content)
+            return self._build_moderation_result(issues_found, confidence_scores, content_type)
             
         except Exception as e:
             logger.error(f"Error moderating content: {e}")
-            return {
-                "status": "error",
-                "message": "Unable to moderate content at this time",
-                "confidence": 0.0
-            }
+            return self._moderation_error()
+    
+    async def moderate_content_batch(
+        self,
+        contents: List[str],
+        content_type: str = "listing"
+    ) -> List[Dict[str, Any]]:
+        """
+        Moderate many pieces of content, e.g. for bulk listing imports.
+        
+        Args:
+            contents: Text contents to moderate
+            content_type: Type of content (message, review, listing)
+        
+        Returns:
+            Moderation results in input order
+        """
+        results = []
+        for content in contents:
+            try:
+                issues_found, confidence_scores = self.moderation_engine.scan(content)
+                results.append(self._build_moderation_result(issues_found, confidence_scores, content_type))
+            except Exception as e:
+                logger.error(f"Error moderating content: {e}")
+                results.append(self._moderation_error())
+        return results
+    
+    def _build_moderation_result(
+        self,
+        issues_found: List[Dict],
+        confidence_scores: List[float],
+        content_type: str
+    ) -> Dict[str, Any]:
+        """Build a moderation result from the issues found."""
+        # Determine overall status
+        if issues_found:
+            high_severity = any(issue["severity"] == "high" for issue in issues_found)
+            status = "rejected" if high_severity else "flagged"
+            avg_confidence = sum(confidence_scores) / len(confidence_scores)
+        else:
+            status = "approved"
+            avg_confidence = 0.9
+        
+        return {
+            "status": status,
+            "content_type": content_type,
+            "issues_found": issues_found,
+            "confidence": round(avg_confidence, 2),
+            "recommendations": self._generate_moderation_recommendations(issues_found),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    @staticmethod
+    def _moderation_error() -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "message": "Unable to moderate content at this time",
+            "confidence": 0.0
+        }
     
     def _generate_moderation_recommendations(self, issues: List[Dict]) -> List[str]:
         """Generate recommendations based on moderation issues."""
@@ -0,0 +1,275 @@
+"""
+Streaming outlier detection for ingested market prices.
+
+Keeps an exponentially weighted mean and mean absolute deviation of the modal
+price per (commodity, market), updated in O(1) per record as data is stored.
+Records that jump too far from the running state are flagged so they can be
+quarantined instead of cached. State is shared between workers through a
+Redis hash so detection survives restarts.
+"""
+
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.redis import get_redis
+from ..models.market_data import MarketPrice
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_STATE_KEY = "market_anomaly:state"
+
+
+class SeriesState:
+    """Running price state for a single (commodity, market)."""
+    
+    __slots__ = (
+        "mean", "deviation", "last_price", "last_date", "observed",
+        "flagged", "consecutive_flags", "last_seen", "last_flag_date",
+    )
+    
+    def __init__(self):
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.last_price = 0.0
+        self.last_date: Optional[str] = None
+        self.observed = 0
+        self.flagged = 0
+        self.consecutive_flags = 0
+        self.last_seen = datetime.utcnow()
+        self.last_flag_date: Optional[str] = None
+    
+    def accepted(self) -> int:
+        return self.observed - self.flagged
+    
+    def to_json(self) -> str:
+        return json.dumps([
+            self.mean, self.deviation, self.last_price, self.last_date, self.observed,
+            self.flagged, self.consecutive_flags, self.last_seen.isoformat(), self.last_flag_date,
+        ])
+    
+    @classmethod
+    def from_json(cls, data: str) -> "SeriesState":
+        state = cls()
+        values = json.loads(data)
+        (
+            state.mean, state.deviation, state.last_price, state.last_date, state.observed,
+            state.flagged, state.consecutive_flags, last_seen,
+        ) = values[:8]
+        state.last_seen = datetime.fromisoformat(last_seen)
+        # States saved before flag dates were kept have no last_flag_date
+        state.last_flag_date = values[8] if len(values) > 8 else None
+        return state
+
+
+class PriceAnomalyDetector:
+    """EWMA-based streaming outlier detector for modal prices."""
+    
+    def __init__(
+        self,
+        alpha: Optional[float] = None,
+        threshold: Optional[float] = None,
+        max_jump_ratio: Optional[float] = None,
+        warmup: Optional[int] = None,
+        reset_after: Optional[int] = None
+    ):
+        self.alpha = alpha or settings.ANOMALY_EWMA_ALPHA
+        self.threshold = threshold or settings.ANOMALY_THRESHOLD
+        self.max_jump_ratio = max_jump_ratio or settings.ANOMALY_MAX_JUMP_RATIO
+        self.warmup = warmup or settings.ANOMALY_WARMUP
+        self.reset_after = reset_after or settings.ANOMALY_RESET_AFTER
+        
+        # Deviation never drops below this fraction of the mean, so a run of
+        # identical prices does not make every small move an outlier
+        self.min_relative_deviation = 0.1
+        
+        self._states: Dict[str, SeriesState] = {}
+    
+    @staticmethod
+    def series_key(commodity: str, market: str) -> str:
+        """Build the normalized commodity|market key."""
+        return f"{commodity.strip().lower()}|{market.strip().lower()}"
+    
+    def get_state(self, key: str) -> Optional[SeriesState]:
+        """Get the running state for a series key."""
+        return self._states.get(key)
+    
+    def observe(self, key: str, modal_price: float, price_date: Optional[date] = None) -> Optional[str]:
+        """
+        Update a series with one observation.
+        
+        Args:
+            key: Series key from series_key
+            modal_price: Observed modal price
+            price_date: Price date (optional)
+        
+        Returns:
+            Reason the observation is an outlier, or None if it was accepted
+        """
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = SeriesState()
+        
+        state.observed += 1
+        state.last_seen = datetime.utcnow()
+        reason = None
+        
+        # Flagged dates count as screened too, so later syncs do not observe them again
+        iso_date = price_date.isoformat() if price_date is not None else None
+        if iso_date is not None and (state.last_date is None or iso_date > state.last_date):
+            state.last_date = iso_date
+        
+        if state.accepted() > self.warmup and state.mean > 0 and modal_price > 0:
+            jump = modal_price / state.last_price if state.last_price else 1.0
+            spread = max(state.deviation, state.mean * self.min_relative_deviation)
+            score = abs(modal_price - state.mean) / spread
+            
+            if jump >= self.max_jump_ratio or jump <= 1 / self.max_jump_ratio:
+                reason = f"Modal price {modal_price:.2f} is {jump:.1f}x the previous {state.last_price:.2f}"
+            elif score > self.threshold:
+                reason = f"Modal price {modal_price:.2f} deviates from running mean {state.mean:.2f}"
+        
+        if reason is not None:
+            # A level change is sustained over distinct dates, not several records on one date
+            if iso_date is None or iso_date != state.last_flag_date:
+                state.consecutive_flags += 1
+                state.last_flag_date = iso_date
+            if state.consecutive_flags < self.reset_after:
+                state.flagged += 1
+                return reason
+            
+            # A sustained level change: re-baseline on the new level
+            logger.info(f"Re-baselining price series {key} at {modal_price:.2f}")
+            state.mean = modal_price
+            state.deviation = modal_price * self.min_relative_deviation
+        elif state.accepted() <= 1:
+            state.mean = modal_price
+            state.deviation = 0.0
+        else:
+            state.deviation = (
+                self.alpha * abs(modal_price - state.mean) + (1 - self.alpha) * state.deviation
+            )
+            state.mean = self.alpha * modal_price + (1 - self.alpha) * state.mean
+        
+        state.consecutive_flags = 0
+        state.last_flag_date = None
+        state.last_price = modal_price
+        return None
+    
+    def screen(self, market_prices: List[MarketPrice]) -> Tuple[List[MarketPrice], List[Tuple[MarketPrice, str]]]:
+        """
+        Run a page of prices through the detector in date order.
+        
+        Syncs overlap, so records dated on or before a series' last observed
+        date were screened by an earlier sync. They are left out of both
+        lists rather than observed again, which would count them twice and
+        pull the running mean towards repeated prices.
+        
+        Args:
+            market_prices: MarketPrice objects being stored
+        
+        Returns:
+            Accepted prices and (price, reason) pairs for flagged prices
+        """
+        accepted = []
+        flagged = []
+        # Last dates before this page, so several varieties on one date are all observed
+        seen_through: Dict[str, Optional[str]] = {}
+        
+        for price in sorted(market_prices, key=lambda p: p.price_date):
+            key = self.series_key(price.commodity, price.market)
+            if key not in seen_through:
+                state = self._states.get(key)
+                seen_through[key] = state.last_date if state is not None else None
+            if seen_through[key] is not None and price.price_date.isoformat() <= seen_through[key]:
+                continue
+            
+            reason = self.observe(key, float(price.modal_price), price.price_date)
+            if reason is None:
+                accepted.append(price)
+            else:
+                flagged.append((price, reason))
+        
+        return accepted, flagged
+    
+    async def load(self, keys: Iterable[str]) -> None:
+        """
+        Load shared state for the given series.
+        
+        Copies already held by this worker are replaced too, so updates saved
+        by other workers since are screened against and not overwritten by
+        the next save.
+        """
+        keys = list(set(keys))
+        if not keys:
+            return
+        
+        try:
+            client = await get_redis()
+            values = await client.hmget(ANOMALY_STATE_KEY, keys)
+            for key, value in zip(keys, values):
+                if value:
+                    self._states[key] = SeriesState.from_json(value)
+        except Exception as e:
+            logger.warning(f"Error loading anomaly detector state: {e}")
+    
+    async def load_all(self) -> None:
+        """Load shared state for every series."""
+        try:
+            client = await get_redis()
+            values = await client.hgetall(ANOMALY_STATE_KEY)
+            for key, value in values.items():
+                self._states[key] = SeriesState.from_json(value)
+        except Exception as e:
+            logger.warning(f"Error loading anomaly detector state: {e}")
+    
+    async def save(self, keys: Iterable[str]) -> None:
+        """Persist state for the given series so other workers see it."""
+        mapping = {key: self._states[key].to_json() for key in set(keys) if key in self._states}
+        if not mapping:
+            return
+        
+        try:
+            client = await get_redis()
+            await client.hset(ANOMALY_STATE_KEY, mapping=mapping)
+        except Exception as e:
+            logger.warning(f"Error saving anomaly detector state: {e}")
+    
+    def report(self, days: int = 7) -> Dict[str, Any]:
+        """
+        Summarize detection state for series seen recently.
+        
+        Args:
+            days: Only include series observed within this many days
+        
+        Returns:
+            Observation, flag and quarantine rate totals with the most flagged series
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        recent = {key: s for key, s in self._states.items() if s.last_seen >= cutoff}
+        
+        observed = sum(s.observed for s in recent.values())
+        flagged = sum(s.flagged for s in recent.values())
+        most_flagged = sorted(
+            ((key, s.flagged) for key, s in recent.items() if s.flagged),
+            key=lambda item: item[1],
+            reverse=True
+        )[:10]
+        
+        return {
+            "series": len(recent),
+            "observed": observed,
+            "flagged": flagged,
+            "quarantine_rate": flagged / observed if observed else 0.0,
+            "most_flagged": [{"series": key, "flagged": count} for key, count in most_flagged],
+        }
+    
+    def clear(self) -> None:
+        """Forget all in-memory state."""
+        self._states.clear()
+
+
+# Global anomaly detector instance
+price_anomaly_detector = PriceAnomalyDetector()
@@ -8,11 +8,13 @@ cache management, and data quality monitoring.
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 from ..core.config import settings
 from ..core.database import get_database
+from .anomaly_detector import price_anomaly_detector
 from .market_data_service import MarketDataService
+from .view_counter import view_counter
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,7 @@ class BackgroundTaskService:
     def __init__(self):
         self.market_data_service = None
         self.is_running = False
+        self._forecast_task: Optional[asyncio.Task] = None
         
         # Common commodities to sync
         self.default_commodities = [
@@ -133,34 +136,93 @@ class BackgroundTaskService:
                 logger.error(f"Error in cache cleanup task: {e}")
                 await asyncio.sleep(1800)  # Wait 30 minutes before retrying
     
+    async def start_forecast_precompute(self):
+        """Start the nightly forecast precompute, which first runs right away."""
+        if self._forecast_task is None or self._forecast_task.done():
+            if not self.market_data_service:
+                await self.initialize()
+            self._forecast_task = asyncio.create_task(self._forecast_precompute_task())
+    
+    async def stop_forecast_precompute(self):
+        """Stop the nightly forecast precompute."""
+        if self._forecast_task is not None:
+            self._forecast_task.cancel()
+            try:
+                await self._forecast_task
+            except asyncio.CancelledError:
+                pass
+            self._forecast_task = None
+    
+    async def _forecast_precompute_task(self):
+        """Nightly task to precompute price forecasts, starting with a run at startup."""
+        logger.info("Starting forecast precompute task")
+        
+        while True:
+            try:
+                logger.info("Starting scheduled forecast precompute")
+                await self.precompute_forecasts()
+                
+                # Precompute forecasts every night
+                await asyncio.sleep(24 * 3600)  # 24 hours
+                
+            except Exception as e:
+                logger.error(f"Error in forecast precompute task: {e}")
+                await asyncio.sleep(3600)  # Wait 1 hour before retrying
+    
+    async def flush_view_counts(self) -> dict:
+        """
+        Write buffered product view counts to MongoDB.
+        
+        Returns:
+            Number of products and views written
+        """
+        result = await view_counter.flush()
+        if result["views"]:
+            logger.info(f"View counts flushed: {result['views']} views for {result['products']} products")
+        return result
+    
+    async def precompute_forecasts(self) -> dict:
+        """
+        Precompute next-N-day forecasts for all active commodities and for the
+        (commodity, state, market) keys requested recently.
+        
+        Returns:
+            Summary of the precompute run
+        """
+        commodities = await self.market_data_service.get_active_commodities(
+            self.default_commodities
+        )
+        requested = await self.market_data_service.get_requested_forecast_keys(
+            settings.FORECAST_REQUEST_WINDOW_DAYS
+        )
+        result = await self.market_data_service.precompute_forecasts(
+            commodities, settings.FORECAST_DAYS_AHEAD, requested
+        )
+        logger.info(
+            f"Forecast precompute completed: {result['stored']} forecasts stored for "
+            f"{len(commodities)} commodities and {len(requested)} requested keys (version {result['version']})"
+        )
+        return result
+    
     async def _check_data_quality(self):
-        """Check and report data quality issues."""
+        """Check and report data quality issues from the anomaly detector state."""
         try:
-            # Get recent market data for quality analysis
-            cutoff_date = datetime.utcnow() - timedelta(days=7)
-            
-            cursor = self.market_data_service.market_prices_collection.find({
-                "last_updated": {"$gte": cutoff_date}
-            })
-            
-            total_records = 0
-            quality_issues = 0
-            
-            async for record in cursor:
-                total_records += 1
-                
-                # Check for quality issues
-                if not record.get("is_validated", False):
-                    quality_issues += 1
-                elif record.get("data_quality") == "unverified":
-                    quality_issues += 1
+            await price_anomaly_detector.load_all()
+            report = price_anomaly_detector.report(days=7)
             
+            total_records = report["observed"]
             if total_records > 0:
-                quality_percentage = ((total_records - quality_issues) / total_records) * 100
-                logger.info(f"Data quality check: {quality_percentage:.1f}% of {total_records} records are high quality")
+                quality_percentage = (1 - report["quarantine_rate"]) * 100
+                logger.info(
+                    f"Data quality check: {quality_percentage:.1f}% of {total_records} records "
+                    f"across {report['series']} series passed anomaly detection"
+                )
                 
                 if quality_percentage < 80:
                     logger.warning(f"Data quality below threshold: {quality_percentage:.1f}%")
+                
+                if report["most_flagged"]:
+                    logger.warning(f"Most quarantined series: {report['most_flagged']}")
             else:
                 logger.warning("No recent market data found for quality analysis")
                 
@@ -187,6 +249,15 @@ class BackgroundTaskService:
             
             if result.deleted_count > 0:
                 logger.info(f"Cleaned up {result.deleted_count} old price history records")
+            
+            # Remove superseded forecast versions
+            forecast_cutoff = datetime.utcnow() - timedelta(days=settings.FORECAST_RETENTION_DAYS)
+            result = await self.market_data_service.price_forecasts_collection.delete_many({
+                "generated_at": {"$lt": forecast_cutoff}
+            })
+            
+            if result.deleted_count > 0:
+                logger.info(f"Cleaned up {result.deleted_count} old price forecast records")
                 
         except Exception as e:
             logger.error(f"Error cleaning up old data: {e}")
@@ -289,6 +360,8 @@ class BackgroundTaskService:
     async def cleanup(self):
         """Cleanup resources."""
         self.is_running = False
+        await self.stop_forecast_precompute()
+        await self.flush_view_counts()
         if self.market_data_service:
             await self.market_data_service.cleanup()
 
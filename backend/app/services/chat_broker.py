@@ -0,0 +1,511 @@
+"""
+Distributed chat broker for WebSocket fan-out across workers.
+
+Each worker keeps its own WebSocket connections and subscribes to a Redis
+channel per conversation it holds sockets for. Messages are delivered to local
+sockets directly and published once to the conversation channel, so sockets
+on any other worker receive them through that worker's single subscriber.
+Presence is tracked in a Redis hash per conversation and refreshed by a
+heartbeat, so entries from a crashed worker expire on their own.
+
+Every socket has a bounded outbound queue drained by its own writer task, so
+a slow client never holds up delivery to the rest of the conversation.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+from uuid import uuid4
+
+from fastapi import WebSocket, status
+
+from ..core.config import settings
+from ..core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHAT_CHANNEL_PREFIX = "chat:conversation:"
+CHAT_PRESENCE_PREFIX = "chat:presence:"
+
+SLOW_CONSUMER_DROP = "drop"
+SLOW_CONSUMER_DISCONNECT = "disconnect"
+
+
+class ConnectionSender:
+    """Bounded outbound queue and writer task for one WebSocket."""
+    
+    def __init__(
+        self,
+        broker: "ChatBroker",
+        websocket: WebSocket,
+        conversation_id: str,
+        language: Optional[str] = None
+    ):
+        self.broker = broker
+        self.websocket = websocket
+        self.conversation_id = conversation_id
+        self.language = language
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=broker.queue_size)
+        self.closed = False
+        self.task = asyncio.create_task(self._run())
+    
+    def enqueue(self, text: str) -> bool:
+        """
+        Queue a serialized message without waiting on the socket.
+        
+        Returns:
+            True if the message was queued
+        """
+        if self.closed:
+            return False
+        
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        if self.broker.slow_consumer_policy == SLOW_CONSUMER_DROP:
+            # Keep the newest messages; the client can reload history over REST
+            self.queue.get_nowait()
+            self.queue.put_nowait(text)
+            self.broker.metrics["dropped"] += 1
+            return True
+        
+        logger.info(f"Disconnecting slow chat consumer in conversation {self.conversation_id}")
+        self.broker.metrics["slow_consumer_disconnects"] += 1
+        self.close(status.WS_1013_TRY_AGAIN_LATER)
+        return False
+    
+    def close(self, code: Optional[int] = None) -> None:
+        """Stop the writer and remove the socket, closing it with code if given."""
+        if self.closed:
+            return
+        self.closed = True
+        self.broker._remove_sender(self)
+        
+        if asyncio.current_task() is not self.task:
+            self.task.cancel()
+        if code is not None:
+            self.task = asyncio.create_task(self._close(code))
+    
+    async def _close(self, code: int) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=self.broker.send_timeout)
+        except Exception:
+            pass
+    
+    async def _run(self) -> None:
+        metrics = self.broker.metrics
+        while True:
+            text = await self.queue.get()
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=self.broker.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Dropping chat socket after failed send: {e}")
+                metrics["send_failures"] += 1
+                self.close()
+                return
+            
+            latency = time.perf_counter() - started
+            metrics["sent"] += 1
+            metrics["send_latency_total"] += latency
+            if latency > metrics["send_latency_max"]:
+                metrics["send_latency_max"] = latency
+
+
+class ChatBroker:
+    """Routes chat messages between local WebSockets and other workers."""
+    
+    def __init__(
+        self,
+        presence_ttl: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        send_timeout: Optional[float] = None,
+        slow_consumer_policy: Optional[str] = None
+    ):
+        self.presence_ttl = presence_ttl or settings.CHAT_PRESENCE_TTL_SECONDS
+        self.queue_size = queue_size or settings.CHAT_SEND_QUEUE_SIZE
+        self.send_timeout = send_timeout or settings.CHAT_SEND_TIMEOUT_SECONDS
+        self.slow_consumer_policy = slow_consumer_policy or settings.CHAT_SLOW_CONSUMER_POLICY
+        self.worker_id = uuid4().hex
+        
+        self.active_connections: Dict[str, Dict[WebSocket, ConnectionSender]] = {}
+        # conversation_id -> user_id -> number of local sockets
+        self._presence: Dict[str, Dict[str, int]] = {}
+        
+        self._pubsub = None
+        self._subscribed = asyncio.Event()
+        self._listener_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        self.metrics: Dict[str, float] = {
+            "sent": 0,
+            "dropped": 0,
+            "slow_consumer_disconnects": 0,
+            "send_failures": 0,
+            "send_latency_total": 0.0,
+            "send_latency_max": 0.0,
+        }
+    
+    @staticmethod
+    def channel(conversation_id: str) -> str:
+        """Redis channel for a conversation."""
+        return f"{CHAT_CHANNEL_PREFIX}{conversation_id}"
+    
+    @staticmethod
+    def presence_key(conversation_id: str) -> str:
+        """Redis hash holding presence for a conversation."""
+        return f"{CHAT_PRESENCE_PREFIX}{conversation_id}"
+    
+    def _presence_field(self, user_id: str) -> str:
+        return f"{self.worker_id}:{user_id}"
+    
+    def local_connection_count(self) -> int:
+        """Number of WebSockets connected to this worker."""
+        return sum(len(sockets) for sockets in self.active_connections.values())
+    
+    async def connect(
+        self,
+        websocket: WebSocket,
+        conversation_id: str,
+        user_id: Optional[str] = None,
+        language: Optional[str] = None
+    ) -> None:
+        """
+        Accept a WebSocket and join it to a conversation.
+        
+        Args:
+            websocket: WebSocket to accept
+            conversation_id: Conversation to join
+            user_id: Connected user, used for presence (optional)
+            language: Language the socket receives translations in (optional)
+        """
+        await websocket.accept()
+        await self.join(websocket, conversation_id, user_id, language)
+    
+    async def join(
+        self,
+        websocket: WebSocket,
+        conversation_id: str,
+        user_id: Optional[str] = None,
+        language: Optional[str] = None
+    ) -> None:
+        """Register an accepted WebSocket for a conversation."""
+        senders = self.active_connections.get(conversation_id)
+        if senders is None:
+            senders = self.active_connections[conversation_id] = {}
+            await self._subscribe(conversation_id)
+        if websocket not in senders:
+            senders[websocket] = ConnectionSender(self, websocket, conversation_id, language)
+        
+        if user_id:
+            users = self._presence.setdefault(conversation_id, {})
+            users[user_id] = users.get(user_id, 0) + 1
+            if users[user_id] == 1:
+                await self._set_presence(conversation_id, user_id)
+                await self.publish(conversation_id, self._presence_event(conversation_id, user_id, "online"))
+    
+    async def disconnect(self, websocket: WebSocket, conversation_id: str, user_id: Optional[str] = None) -> None:
+        """
+        Remove a WebSocket from a conversation.
+        
+        Args:
+            websocket: WebSocket that disconnected
+            conversation_id: Conversation it was joined to
+            user_id: Connected user (optional)
+        """
+        sender = self.active_connections.get(conversation_id, {}).get(websocket)
+        if sender is not None:
+            sender.close()
+        
+        users = self._presence.get(conversation_id)
+        if user_id and users and user_id in users:
+            users[user_id] -= 1
+            if users[user_id] <= 0:
+                del users[user_id]
+                if not users:
+                    del self._presence[conversation_id]
+                await self._clear_presence(conversation_id, user_id)
+                
+                # The user may still be connected through another worker
+                if user_id not in await self.get_presence(conversation_id):
+                    await self.publish(conversation_id, self._presence_event(conversation_id, user_id, "offline"))
+    
+    async def publish(self, conversation_id: str, message: Dict[str, Any], language: Optional[str] = None) -> int:
+        """
+        Deliver a message to every socket in a conversation on all workers.
+        
+        The message is serialized once, queued for local sockets and published
+        once for the other workers. Without Redis, delivery falls back to this
+        worker.
+        
+        Args:
+            conversation_id: Conversation to deliver to
+            message: JSON-serializable message
+            language: Only deliver to sockets in this language (optional)
+        
+        Returns:
+            Number of local sockets the message was queued for
+        """
+        text = json.dumps(message, default=str, separators=(",", ":"), ensure_ascii=False)
+        delivered = self.broadcast_local(text, conversation_id, language)
+        
+        try:
+            client = await get_redis()
+            await client.publish(self.channel(conversation_id), f"{self.worker_id}|{language or ''}|{text}")
+        except Exception as e:
+            logger.warning(f"Error publishing chat message: {e}")
+        
+        return delivered
+    
+    def broadcast_local(self, text: str, conversation_id: str, language: Optional[str] = None) -> int:
+        """Queue a serialized message for this worker's sockets without waiting on them."""
+        senders = self.active_connections.get(conversation_id)
+        if not senders:
+            return 0
+        
+        return sum(
+            sender.enqueue(text)
+            for sender in list(senders.values())
+            if language is None or sender.language == language
+        )
+    
+    def handle_message(self, channel: str, data: str) -> int:
+        """
+        Route a message received from another worker to local sockets.
+        
+        Args:
+            channel: Redis channel the message arrived on
+            data: Published payload: origin worker ID, target language and the serialized message
+        
+        Returns:
+            Number of local sockets the message was queued for
+        """
+        origin, language, text = data.split("|", 2)
+        if origin == self.worker_id:
+            return 0
+        
+        conversation_id = channel[len(CHAT_CHANNEL_PREFIX):]
+        return self.broadcast_local(text, conversation_id, language or None)
+    
+    def _remove_sender(self, sender: ConnectionSender) -> None:
+        senders = self.active_connections.get(sender.conversation_id)
+        if senders is None or senders.get(sender.websocket) is not sender:
+            return
+        
+        del senders[sender.websocket]
+        if not senders:
+            del self.active_connections[sender.conversation_id]
+            if self._pubsub is not None:
+                task = asyncio.create_task(self._unsubscribe(sender.conversation_id))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report outbound queue depth and send latency for this worker.
+        
+        Returns:
+            Connection, queue, drop and latency figures
+        """
+        depths = [
+            sender.queue.qsize()
+            for senders in self.active_connections.values()
+            for sender in senders.values()
+        ]
+        sent = self.metrics["sent"]
+        
+        return {
+            "worker_id": self.worker_id,
+            "conversations": len(self.active_connections),
+            "connections": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_size": self.queue_size,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "sent": sent,
+            "dropped": self.metrics["dropped"],
+            "slow_consumer_disconnects": self.metrics["slow_consumer_disconnects"],
+            "send_failures": self.metrics["send_failures"],
+            "avg_send_latency_ms": round(self.metrics["send_latency_total"] / sent * 1000, 3) if sent else 0.0,
+            "max_send_latency_ms": round(self.metrics["send_latency_max"] * 1000, 3),
+        }
+    
+    async def get_presence(self, conversation_id: str) -> List[str]:
+        """
+        Get the users connected to a conversation on any worker.
+        
+        Args:
+            conversation_id: Conversation ID
+        
+        Returns:
+            Sorted list of online user IDs
+        """
+        online = set(self._presence.get(conversation_id, {}))
+        
+        try:
+            client = await get_redis()
+            key = self.presence_key(conversation_id)
+            entries = await client.hgetall(key)
+            cutoff = time.time() - self.presence_ttl
+            
+            stale = []
+            for field, seen_at in entries.items():
+                if float(seen_at) >= cutoff:
+                    online.add(field.split(":", 1)[1])
+                else:
+                    stale.append(field)
+            
+            if stale:
+                await client.hdel(key, *stale)
+        except Exception as e:
+            logger.warning(f"Error reading chat presence: {e}")
+        
+        return sorted(online)
+    
+    def _presence_event(self, conversation_id: str, user_id: str, status: str) -> Dict[str, Any]:
+        return {
+            "type": "presence",
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "status": status,
+        }
+    
+    async def _set_presence(self, conversation_id: str, user_id: str) -> None:
+        try:
+            client = await get_redis()
+            key = self.presence_key(conversation_id)
+            await client.hset(key, self._presence_field(user_id), time.time())
+            await client.expire(key, self.presence_ttl * 2)
+        except Exception as e:
+            logger.warning(f"Error updating chat presence: {e}")
+    
+    async def _clear_presence(self, conversation_id: str, user_id: str) -> None:
+        try:
+            client = await get_redis()
+            await client.hdel(self.presence_key(conversation_id), self._presence_field(user_id))
+        except Exception as e:
+            logger.warning(f"Error clearing chat presence: {e}")
+    
+    async def refresh_presence(self) -> None:
+        """Refresh this worker's presence entries so they do not expire."""
+        if not self._presence:
+            return
+        
+        try:
+            client = await get_redis()
+            now = time.time()
+            pipe = client.pipeline(transaction=False)
+            for conversation_id, users in self._presence.items():
+                key = self.presence_key(conversation_id)
+                pipe.hset(key, mapping={self._presence_field(user_id): now for user_id in users})
+                pipe.expire(key, self.presence_ttl * 2)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Error refreshing chat presence: {e}")
+    
+    async def _subscribe(self, conversation_id: str) -> None:
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.subscribe(self.channel(conversation_id))
+            self._subscribed.set()
+        except Exception as e:
+            logger.warning(f"Error subscribing to chat conversation {conversation_id}: {e}")
+    
+    async def _unsubscribe(self, conversation_id: str) -> None:
+        # A socket may have rejoined since the last one left
+        if self._pubsub is None or conversation_id in self.active_connections:
+            return
+        try:
+            await self._pubsub.unsubscribe(self.channel(conversation_id))
+        except Exception as e:
+            logger.warning(f"Error unsubscribing from chat conversation {conversation_id}: {e}")
+    
+    async def start_listener(self) -> None:
+        """Start the pub/sub subscriber and presence heartbeat for this worker."""
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+            logger.info("Chat broker listener started")
+    
+    async def stop_listener(self) -> None:
+        """Stop the pub/sub subscriber, presence heartbeat and socket writers."""
+        for task in (self._listener_task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        
+        writers = []
+        for senders in list(self.active_connections.values()):
+            for sender in list(senders.values()):
+                writers.append(sender.task)
+                sender.close()
+        await asyncio.gather(*writers, return_exceptions=True)
+        
+        if self._listener_task is not None:
+            self._listener_task = None
+            self._heartbeat_task = None
+            logger.info("Chat broker listener stopped")
+    
+    async def _listen(self) -> None:
+        """Receive messages for local conversations, resubscribing after errors."""
+        while True:
+            pubsub = None
+            try:
+                client = await get_redis()
+                pubsub = client.pubsub()
+                self._pubsub = pubsub
+                
+                channels = [self.channel(conversation_id) for conversation_id in self.active_connections]
+                if channels:
+                    await pubsub.subscribe(*channels)
+                    self._subscribed.set()
+                
+                # The pub/sub connection only exists after the first subscribe
+                await self._subscribed.wait()
+                
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message and message.get("type") == "message":
+                        try:
+                            self.handle_message(message["channel"], message["data"])
+                        except Exception as e:
+                            logger.warning(f"Error routing chat message: {e}")
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Chat broker listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                self._pubsub = None
+                self._subscribed.clear()
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe()
+                        await pubsub.close()
+                    except Exception:
+                        pass
+    
+    async def _heartbeat(self) -> None:
+        """Periodically refresh presence for local connections."""
+        while True:
+            await asyncio.sleep(max(self.presence_ttl / 3, 1))
+            await self.refresh_presence()
+
+
+# Global chat broker instance (one per worker process)
+chat_broker = ChatBroker()
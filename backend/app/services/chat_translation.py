@@ -0,0 +1,255 @@
+"""
+Translate-once pipeline for chat messages.
+
+Sent messages are queued and translated off the request path, once into each
+language spoken in the conversation. Translations are stored per message and
+language and pushed over the chat broker only to sockets in that language.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from ..core.config import settings
+from ..core.database import get_database
+from .chat_broker import chat_broker
+from .translation_service import translation_service
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTranslationPipeline:
+    """Background translation of chat messages into every conversation language."""
+    
+    def __init__(
+        self,
+        database=None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        languages_ttl: Optional[int] = None
+    ):
+        self.database = database
+        self.workers = workers or settings.CHAT_TRANSLATION_WORKERS
+        self.languages_ttl = languages_ttl or settings.CHAT_LANGUAGES_TTL_SECONDS
+        
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.CHAT_TRANSLATION_QUEUE_SIZE)
+        # conversation_id -> (expires_at, {user_id: language})
+        self._languages: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._worker_tasks: List[asyncio.Task] = []
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    def submit(
+        self,
+        message: Dict[str, Any],
+        source_language: str = "en",
+        extra_languages: Iterable[str] = ()
+    ) -> bool:
+        """
+        Queue a message for translation without waiting for it.
+        
+        Args:
+            message: Stored message document with _id, conversation_id and content
+            source_language: Language the message was written in
+            extra_languages: Languages requested by the sender in addition to
+                the conversation languages
+        
+        Returns:
+            True if the message was queued
+        """
+        if not message.get("content"):
+            return False
+        
+        try:
+            self.queue.put_nowait((message, source_language, set(extra_languages)))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Chat translation queue full, not translating message {message['_id']}")
+            return False
+    
+    async def conversation_languages(self, conversation_id: str) -> Dict[str, str]:
+        """
+        Get the preferred language of each conversation participant.
+        
+        Args:
+            conversation_id: Conversation ID
+        
+        Returns:
+            Mapping of user ID to language code
+        """
+        cached = self._languages.get(conversation_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        database = await self._get_database()
+        conversation = await database.conversations.find_one(
+            {"_id": conversation_id}, {"participant_1": 1, "participant_2": 1}
+        )
+        languages: Dict[str, str] = {}
+        if conversation:
+            participant_ids = [
+                conversation.get("participant_1"), conversation.get("participant_2")
+            ]
+            users = await database.users.find(
+                {"user_id": {"$in": [p for p in participant_ids if p]}},
+                {"user_id": 1, "preferred_languages": 1}
+            ).to_list(length=None)
+            for user in users:
+                preferred = user.get("preferred_languages") or ["en"]
+                languages[user["user_id"]] = preferred[0]
+        
+        self._languages[conversation_id] = (time.monotonic() + self.languages_ttl, languages)
+        return languages
+    
+    def invalidate_languages(self, conversation_id: Optional[str] = None) -> None:
+        """Forget cached participant languages, for one or all conversations."""
+        if conversation_id is None:
+            self._languages.clear()
+        else:
+            self._languages.pop(conversation_id, None)
+    
+    async def translate_message(
+        self,
+        message: Dict[str, Any],
+        source_language: str = "en",
+        extra_languages: Optional[Set[str]] = None
+    ) -> Dict[str, str]:
+        """
+        Translate a message once into each language of its conversation.
+        
+        Translations are stored keyed by message and language, then pushed to
+        the conversation's sockets in each language.
+        
+        Args:
+            message: Stored message document
+            source_language: Language the message was written in
+            extra_languages: Additional target languages (optional)
+        
+        Returns:
+            Mapping of language code to translated text
+        """
+        conversation_id = message["conversation_id"]
+        languages = await self.conversation_languages(conversation_id)
+        targets = (set(languages.values()) | (extra_languages or set())) - {source_language}
+        if not targets:
+            return {}
+        
+        targets = sorted(targets)
+        results = await asyncio.gather(
+            *(
+                translation_service.translate_text(message["content"], source_language, language)
+                for language in targets
+            ),
+            return_exceptions=True
+        )
+        
+        translations = {}
+        for language, result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to translate message {message['_id']} to {language}: {result}")
+            elif result.confidence_score == 0.0:
+                # The fallback returned the original text untranslated
+                continue
+            else:
+                translations[language] = result.translated_text
+        if not translations:
+            return {}
+        
+        await self._store_translations(message, source_language, translations)
+        
+        for language, translated_text in translations.items():
+            await chat_broker.publish(conversation_id, {
+                "type": "translation",
+                "conversation_id": conversation_id,
+                "message_id": message["_id"],
+                "language": language,
+                "translated_content": translated_text
+            }, language=language)
+        
+        return translations
+    
+    async def _store_translations(
+        self,
+        message: Dict[str, Any],
+        source_language: str,
+        translations: Dict[str, str]
+    ) -> None:
+        created_at = datetime.utcnow()
+        documents = [
+            {
+                "_id": f"{message['_id']}:{language}",
+                "message_id": message["_id"],
+                "conversation_id": message["conversation_id"],
+                "source_language": source_language,
+                "language": language,
+                "translated_content": translated_text,
+                "created_at": created_at
+            }
+            for language, translated_text in translations.items()
+        ]
+        
+        try:
+            database = await self._get_database()
+            await database.message_translations.insert_many(documents, ordered=False)
+        except BulkWriteError:
+            # Already stored by an earlier attempt
+            pass
+        except Exception as e:
+            logger.error(f"Error storing translations for message {message['_id']}: {e}")
+    
+    async def get_translations(self, message_ids: List[str], language: str) -> Dict[str, str]:
+        """
+        Get stored translations of messages in one language.
+        
+        Args:
+            message_ids: Message IDs
+            language: Language code
+        
+        Returns:
+            Mapping of message ID to translated text
+        """
+        if not message_ids:
+            return {}
+        
+        database = await self._get_database()
+        documents = await database.message_translations.find(
+            {"_id": {"$in": [f"{message_id}:{language}" for message_id in message_ids]}},
+            {"message_id": 1, "translated_content": 1}
+        ).to_list(length=None)
+        return {doc["message_id"]: doc["translated_content"] for doc in documents}
+    
+    async def start(self) -> None:
+        """Start the translation workers."""
+        self._worker_tasks = [task for task in self._worker_tasks if not task.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._run()))
+        logger.info(f"Chat translation pipeline started with {self.workers} workers")
+    
+    async def stop(self) -> None:
+        """Stop the translation workers; queued messages keep their original text."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        
+        if not self.queue.empty():
+            logger.info(f"Chat translation pipeline stopped with {self.queue.qsize()} messages untranslated")
+    
+    async def _run(self) -> None:
+        while True:
+            message, source_language, extra_languages = await self.queue.get()
+            try:
+                await self.translate_message(message, source_language, extra_languages)
+            except Exception as e:
+                logger.error(f"Error translating chat message {message.get('_id')}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+# Global chat translation pipeline instance
+chat_translation = ChatTranslationPipeline()
@@ -24,6 +24,9 @@ from app.models.product import (
     QualityGrade,
     ProductStatus
 )
+from app.services.geo_search import within_radius_filter
+from app.services.product_pricing import PRICE_PAISE_FIELD, price_range_filter
+from app.services.product_serializer import translation_exclusions
 
 logger = logging.getLogger(__name__)
 
@@ -174,13 +177,16 @@ class ElasticsearchService:
             # Build sort criteria
             sort_criteria = self._build_mongo_sort(query)
             
+            # Leave out other languages' translations if only one is wanted
+            projection = translation_exclusions(query.language.value) if query.language_only else {}
+            
             # Execute search with text search if query provided
             if query.query:
                 # Use text search
                 mongo_filter["$text"] = {"$search": query.query}
                 
                 # Add text score for sorting
-                projection = {"score": {"$meta": "textScore"}}
+                projection["score"] = {"$meta": "textScore"}
                 
                 # Execute query with projection
                 cursor = self.products_collection.find(
@@ -189,7 +195,7 @@ class ElasticsearchService:
                 ).sort([("score", {"$meta": "textScore"})] + sort_criteria)
             else:
                 # Regular query without text search
-                cursor = self.products_collection.find(mongo_filter).sort(sort_criteria)
+                cursor = self.products_collection.find(mongo_filter, projection or None).sort(sort_criteria)
             
             # Apply pagination
             cursor = cursor.skip(query.skip).limit(query.limit)
@@ -240,14 +246,9 @@ class ElasticsearchService:
         if query.subcategory:
             mongo_filter["subcategory"] = {"$regex": query.subcategory, "$options": "i"}
         
-        # Price range filter
+        # Price range filter, on integer paise so it compares numerically
         if query.min_price is not None or query.max_price is not None:
-            price_filter = {}
-            if query.min_price is not None:
-                price_filter["$gte"] = float(query.min_price)
-            if query.max_price is not None:
-                price_filter["$lte"] = float(query.max_price)
-            mongo_filter["price_info.base_price"] = price_filter
+            mongo_filter[PRICE_PAISE_FIELD] = price_range_filter(query.min_price, query.max_price)
         
         # Location filters
         if query.city:
@@ -256,17 +257,9 @@ class ElasticsearchService:
         if query.state:
             mongo_filter["location.state"] = {"$regex": query.state, "$options": "i"}
         
-        # Geospatial search
+        # Geospatial search; $geoWithin, unlike $nearSphere, combines with $text and count_documents
         if query.coordinates and query.radius_km:
-            mongo_filter["location.coordinates"] = {
-                "$nearSphere": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [query.coordinates[0], query.coordinates[1]]
-                    },
-                    "$maxDistance": query.radius_km * 1000  # Convert km to meters
-                }
-            }
+            mongo_filter["location.coordinates"] = within_radius_filter(query.coordinates, query.radius_km)
         
         # Quality grades filter
         if query.quality_grades:
@@ -294,7 +287,7 @@ class ElasticsearchService:
         # Text score sorting is handled separately in search_products
         
         if query.sort_by == "price":
-            sort_criteria.append(("price_info.base_price", 1 if query.sort_order == "asc" else -1))
+            sort_criteria.append((PRICE_PAISE_FIELD, 1 if query.sort_order == "asc" else -1))
         elif query.sort_by == "date":
             sort_criteria.append(("created_at", -1 if query.sort_order == "desc" else 1))
         elif query.sort_by == "popularity":
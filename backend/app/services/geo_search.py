@@ -0,0 +1,385 @@
+"""
+Distance-sorted product search around a point.
+
+$near cannot be combined with count_documents and returns no distances, so
+"near my mandi" searches are answered in one of two ways:
+
+- Every product stores the geohash of its coordinates in location.geohash.
+  A search covers its centre's geohash cell and the eight around it, at the
+  precision where a cell is at least as large as the search radius, and
+  loads the ids and coordinates of the matching products in those cells
+  with an indexed prefix query. That candidate list is cached per cell
+  block and filter, so the many buyers searching around the same mandi
+  share one query; exact distances, the radius cut, sorting and paging are
+  then done in memory for each caller's own position. Each page is reloaded
+  with the filter, and products that no longer match are dropped from the
+  cached candidates and the total.
+- When a block holds too many candidates to cache, a $geoNear aggregation
+  returns the page, with distances, and the total in a single round-trip.
+
+The candidate cache is per process and is only invalidated by writes made
+in that process, so across workers GEO_CELL_CACHE_TTL_SECONDS bounds how
+long a new or moved product can be missing from results.
+"""
+
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from ..core.config import settings
+from ..core.database import get_database
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_FIELD = "location.geohash"
+COORDINATES_FIELD = "location.coordinates"
+GEOHASH_PRECISION = 7  # cells of about 150 m
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+MIGRATION_BATCH_SIZE = 1000
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(longitude: float, latitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a point as a geohash of the given length."""
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    
+    return "".join(chars)
+
+
+def _cell_degrees(precision: int) -> Tuple[float, float]:
+    """Width and height in degrees of a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def cell_precision(radius_km: float, latitude: float) -> int:
+    """
+    Finest geohash precision whose cells are at least radius_km across.
+    
+    A circle of that radius then always lies inside the 3x3 block of cells
+    around its centre's cell.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        width, height = _cell_degrees(precision)
+        width_km = width * KM_PER_DEGREE * math.cos(math.radians(latitude))
+        if min(width_km, height * KM_PER_DEGREE) >= radius_km:
+            return precision
+    return 1
+
+
+def covering_cells(longitude: float, latitude: float, radius_km: float) -> List[str]:
+    """Geohash cells that together cover a circle around a point."""
+    precision = cell_precision(radius_km, latitude)
+    width, height = _cell_degrees(precision)
+    
+    # Step from the centre of the point's own cell so neighbours are exact
+    center_lon = (math.floor((longitude + 180) / width) + 0.5) * width - 180
+    center_lat = (math.floor((latitude + 90) / height) + 0.5) * height - 90
+    
+    cells = set()
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            lat = center_lat + dy * height
+            if not -90 <= lat <= 90:
+                continue
+            lon = (center_lon + dx * width + 180) % 360 - 180
+            cells.add(encode_geohash(lon, lat, precision))
+    return sorted(cells)
+
+
+def distance_km(origin: List[float], point: List[float]) -> float:
+    """Great-circle distance between two [longitude, latitude] points."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (*origin, *point))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within_radius_filter(coordinates: List[float], radius_km: float) -> Dict[str, Any]:
+    """Condition on location.coordinates for points within a radius, usable with count_documents."""
+    return {"$geoWithin": {"$centerSphere": [coordinates, radius_km / EARTH_RADIUS_KM]}}
+
+
+def location_for_db(location: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the geohash of a location's coordinates next to them."""
+    coordinates = location.get("coordinates")
+    if coordinates:
+        location["geohash"] = encode_geohash(*coordinates)
+    else:
+        location.pop("geohash", None)
+    return location
+
+
+async def backfill_geohash(database, batch_size: int = MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Add location.geohash to products stored before it existed.
+    
+    Products are processed in _id order, one batch per bulk write, so the
+    job can be stopped and rerun at any point.
+    
+    Args:
+        database: Database holding the products collection
+        batch_size: Products per batch
+    
+    Returns:
+        Counts of updated and skipped (no coordinates) products
+    """
+    updated = skipped = 0
+    last_id = None
+    
+    while True:
+        query: Dict[str, Any] = {GEOHASH_FIELD: {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        
+        products = await database.products.find(
+            query, {COORDINATES_FIELD: 1}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not products:
+            break
+        last_id = products[-1]["_id"]
+        
+        requests = []
+        for product in products:
+            coordinates = (product.get("location") or {}).get("coordinates")
+            if not coordinates:
+                skipped += 1
+                continue
+            requests.append(UpdateOne(
+                {"_id": product["_id"], GEOHASH_FIELD: {"$exists": False}},
+                {"$set": {GEOHASH_FIELD: encode_geohash(*coordinates)}}
+            ))
+        
+        if requests:
+            await database.products.bulk_write(requests, ordered=False)
+            updated += len(requests)
+    
+    logger.info(f"Geohash backfill finished: {updated} products updated, {skipped} skipped")
+    return {"updated": updated, "skipped": skipped}
+
+
+class GeoSearch:
+    """Distance-sorted product search with a per-cell candidate cache."""
+    
+    def __init__(
+        self,
+        database=None,
+        cache_ttl: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        max_candidates: Optional[int] = None
+    ):
+        self.database = database
+        self.cache_ttl = cache_ttl or settings.GEO_CELL_CACHE_TTL_SECONDS
+        self.cache_size = cache_size or settings.GEO_CELL_CACHE_SIZE
+        self.max_candidates = max_candidates or settings.GEO_CELL_MAX_CANDIDATES
+        
+        # (cells, filter) -> (expires_at, [(_id, coordinates)]), least recently used first
+        self._entries: "OrderedDict[Tuple[Tuple[str, ...], str], Tuple[float, List[Tuple[Any, List[float]]]]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "geo_near": 0}
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def search(
+        self,
+        search_filter: Dict[str, Any],
+        coordinates: List[float],
+        radius_km: Optional[float] = None,
+        skip: int = 0,
+        limit: int = 20,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Find products near a point, nearest first.
+        
+        Args:
+            search_filter: Product filter; any condition on location.coordinates
+                is replaced by the radius
+            coordinates: Search centre as [longitude, latitude]
+            radius_km: Search radius, GEO_DEFAULT_RADIUS_KM if not given
+            skip: Results to skip
+            limit: Maximum results to return
+            projection: Product fields to return, all if not given
+        
+        Returns:
+            Page of product documents with a distance_km field, and the
+            number of products within the radius
+        """
+        radius_km = radius_km or settings.GEO_DEFAULT_RADIUS_KM
+        longitude, latitude = coordinates
+        base_filter = {k: v for k, v in search_filter.items() if k != COORDINATES_FIELD}
+        db = await self._get_database()
+        
+        cells = covering_cells(longitude, latitude, radius_km)
+        key = (tuple(cells), json.dumps(base_filter, sort_keys=True, default=str))
+        candidates = self._cached(key)
+        if candidates is None:
+            candidates = await self._load_candidates(db, base_filter, cells)
+            if candidates is None:
+                self.stats["geo_near"] += 1
+                return await self._geo_near(db, base_filter, coordinates, radius_km, skip, limit, projection)
+            self._store(key, candidates)
+        
+        nearby = []
+        for product_id, point in candidates:
+            distance = distance_km(coordinates, point)
+            if distance <= radius_km:
+                nearby.append((distance, product_id))
+        nearby.sort(key=lambda item: item[0])
+        
+        if projection and projection.get("_id") == 0:
+            projection = {**projection, "_id": 1}
+        by_id: Dict[Any, Dict[str, Any]] = {}
+        while True:
+            page = nearby[skip:skip + limit]
+            if not page:
+                return [], len(nearby)
+            
+            # Re-apply the filter so products changed since caching drop out
+            wanted = [product_id for _, product_id in page if product_id not in by_id]
+            products = await db.products.find(
+                {**base_filter, "_id": {"$in": wanted}}, projection
+            ).to_list(length=len(wanted))
+            by_id.update((product["_id"], product) for product in products)
+            
+            dropped = {product_id for product_id in wanted if product_id not in by_id}
+            if not dropped:
+                break
+            # Forget them for the total and later searches, and refill the page
+            nearby = [item for item in nearby if item[1] not in dropped]
+            self._discard(key, dropped)
+        
+        results = []
+        for distance, product_id in page:
+            product = by_id[product_id]
+            product["distance_km"] = round(distance, 3)
+            results.append(product)
+        return results, len(nearby)
+    
+    async def _load_candidates(
+        self,
+        db,
+        base_filter: Dict[str, Any],
+        cells: List[str]
+    ) -> Optional[List[Tuple[Any, List[float]]]]:
+        """Ids and coordinates of matching products in the cells, or None if there are too many."""
+        query = {"$and": [
+            base_filter,
+            {"$or": [{GEOHASH_FIELD: {"$regex": f"^{cell}"}} for cell in cells]},
+        ]}
+        limit = self.max_candidates + 1
+        products = await db.products.find(
+            query, {COORDINATES_FIELD: 1}
+        ).limit(limit).to_list(length=limit)
+        
+        if len(products) > self.max_candidates:
+            return None
+        return [
+            (product["_id"], product["location"]["coordinates"])
+            for product in products
+            if (product.get("location") or {}).get("coordinates")
+        ]
+    
+    async def _geo_near(
+        self,
+        db,
+        base_filter: Dict[str, Any],
+        coordinates: List[float],
+        radius_km: float,
+        skip: int,
+        limit: int,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Page and total of products near a point from one $geoNear aggregation."""
+        page = [{"$skip": skip}, {"$limit": limit}]
+        if projection:
+            page.append({"$project": projection})
+        pipeline = [
+            {"$geoNear": {
+                "near": {"type": "Point", "coordinates": coordinates},
+                "key": COORDINATES_FIELD,
+                "distanceField": "distance_km",
+                "distanceMultiplier": 0.001,
+                "maxDistance": radius_km * 1000,
+                "query": base_filter,
+                "spherical": True,
+            }},
+            {"$facet": {
+                "products": page,
+                "total": [{"$count": "count"}],
+            }},
+        ]
+        result = await db.products.aggregate(pipeline).to_list(length=1)
+        if not result:
+            return [], 0
+        
+        total = result[0]["total"][0]["count"] if result[0]["total"] else 0
+        return result[0]["products"], total
+    
+    def _cached(self, key) -> Optional[List[Tuple[Any, List[float]]]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        
+        self.stats["misses"] += 1
+        return None
+    
+    def _store(self, key, candidates: List[Tuple[Any, List[float]]]) -> None:
+        self._entries[key] = (time.monotonic() + self.cache_ttl, candidates)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.cache_size:
+            self._entries.popitem(last=False)
+    
+    def _discard(self, key, product_ids: Set[Any]) -> None:
+        """Remove products from a cached candidate list, keeping its expiry."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (entry[0], [c for c in entry[1] if c[0] not in product_ids])
+    
+    def invalidate(self, geohash: Optional[str] = None) -> None:
+        """Drop cached candidates, for the cells containing a geohash or all of them."""
+        if geohash is None:
+            self._entries.clear()
+            return
+        
+        stale = [key for key in self._entries if any(geohash.startswith(cell) for cell in key[0])]
+        for key in stale:
+            del self._entries[key]
+
+
+# Global geo search instance
+geo_search = GeoSearch()
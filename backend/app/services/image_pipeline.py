@@ -0,0 +1,228 @@
+"""
+Process pool for product image renditions.
+
+Decoding, resizing and re-encoding a large upload with Pillow takes hundreds
+of milliseconds of CPU. Done inside an async def it stalled every other
+request on the worker, so renditions are rendered in a small pool of worker
+processes. Uploads beyond the busy workers and a bounded queue are refused
+with RateLimitException (429 with Retry-After) instead of piling up.
+
+All renditions come from one decode. JPEGs are decoded with draft(), which
+lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding, to the smallest size
+that is still at least as large as the main rendition.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+from PIL import Image
+
+from ..core.config import settings
+from ..core.exceptions import RateLimitException
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_SIZE = 1200
+THUMBNAIL_SIZE = (300, 300)
+
+RENDITION_CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+_SAVE_OPTIONS = {
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60, "speed": 8},
+}
+
+
+def _fit(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """Scale a size down so its longest side is at most max_size."""
+    if max(width, height) <= max_size:
+        return width, height
+    if width > height:
+        return max_size, int((height * max_size) / width)
+    return int((width * max_size) / height), max_size
+
+
+def _encode(img: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, **_SAVE_OPTIONS[image_format])
+    return buffer.getvalue()
+
+
+def render_image(
+    image_source: Union[bytes, str],
+    widths: Iterable[int] = (),
+    formats: Iterable[str] = ("jpeg",)
+) -> Dict[str, Any]:
+    """
+    Render the main image, thumbnail and responsive renditions of an upload from one decode.
+    
+    Runs in the pool's worker processes. Renditions are made for each width
+    below the main image's width and for the main width itself, in each
+    format; images are never enlarged.
+    
+    Args:
+        image_source: Uploaded image binary data, or the path of a spooled upload
+        widths: Rendition widths in pixels
+        formats: Rendition formats ("jpeg", "webp" or "avif")
+    
+    Returns:
+        Dictionary with the main JPEG ("image"), "thumbnail", "dimensions" and
+        "renditions", each rendition a dict with format, width, height and data
+    """
+    with Image.open(io.BytesIO(image_source) if isinstance(image_source, bytes) else image_source) as img:
+        size = _fit(img.width, img.height, MAX_IMAGE_SIZE)
+        if img.format == "JPEG":
+            img.draft(None, size)
+        
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        dimensions = {"width": img.width, "height": img.height}
+        image = _encode(img, "jpeg")
+        
+        renditions = []
+        for width in sorted({width for width in widths if width < img.width} | {img.width}):
+            if width == img.width:
+                scaled = img
+            else:
+                height = max(1, round(img.height * width / img.width))
+                scaled = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            for image_format in formats:
+                # The full-width JPEG rendition is the main image
+                data = image if scaled is img and image_format == "jpeg" else _encode(scaled, image_format)
+                renditions.append({
+                    "format": image_format, "width": scaled.width, "height": scaled.height, "data": data
+                })
+        
+        # The main rendition is written, so the thumbnail can reuse its pixels
+        img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        thumbnail_buffer = io.BytesIO()
+        img.save(thumbnail_buffer, format='JPEG', quality=80, optimize=True)
+        
+        return {
+            "image": image,
+            "thumbnail": thumbnail_buffer.getvalue(),
+            "dimensions": dimensions,
+            "renditions": renditions,
+        }
+
+
+def _warm_up() -> None:
+    """Give a worker process something to start on."""
+
+
+class ImagePipeline:
+    """Renders product images in a bounded pool of worker processes."""
+    
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        retry_after: Optional[int] = None
+    ):
+        self.workers = workers or settings.IMAGE_PROCESS_WORKERS
+        self.queue_size = settings.IMAGE_PROCESS_QUEUE_SIZE if queue_size is None else queue_size
+        self.retry_after = retry_after or settings.IMAGE_PROCESS_RETRY_AFTER_SECONDS
+        
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Images submitted to the pool and not finished, running or queued
+        self._in_flight = 0
+        self.stats = {"processed": 0, "rejected": 0, "failed": 0}
+    
+    @property
+    def capacity(self) -> int:
+        """Images that can be running or waiting for a worker at once."""
+        return self.workers + self.queue_size
+    
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn rather than fork: the server process runs an event loop and driver threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+    
+    async def start(self) -> None:
+        """Start the worker processes so the first uploads do not wait for them."""
+        executor = self._get_executor()
+        await asyncio.gather(*[
+            asyncio.wrap_future(executor.submit(_warm_up)) for _ in range(self.workers)
+        ])
+        logger.info(f"Image pipeline started with {self.workers} worker processes")
+    
+    async def stop(self) -> None:
+        """Stop the worker processes, dropping images still waiting for one."""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+    
+    async def render(
+        self,
+        image_source: Union[bytes, str],
+        widths: Iterable[int] = (),
+        formats: Iterable[str] = ("jpeg",)
+    ) -> Dict[str, Any]:
+        """
+        Render the main image, thumbnail and renditions of an upload in a worker process.
+        
+        Args:
+            image_source: Uploaded image binary data, or the path of a spooled
+                upload, which the worker reads itself
+            widths: Rendition widths in pixels
+            formats: Rendition formats
+        
+        Returns:
+            Rendered images as returned by render_image
+        
+        Raises:
+            RateLimitException: If every worker is busy and the queue is full
+        """
+        if self._in_flight >= self.capacity:
+            self.stats["rejected"] += 1
+            raise RateLimitException(
+                "Too many images are being processed, please retry shortly",
+                retry_after=self.retry_after
+            )
+        
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(render_image, image_source, tuple(widths), tuple(formats))
+            self._in_flight += 1
+            # Released when the worker finishes, even if the upload request is cancelled first
+            future.add_done_callback(lambda done: self._finished(loop, done))
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A worker died, e.g. out of memory; the next upload gets a new pool
+            # unless another one has already replaced this one
+            if self._executor is executor:
+                self._executor = None
+            raise
+    
+    def _finished(self, loop: asyncio.AbstractEventLoop, future: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release, future)
+        except RuntimeError:
+            # Event loop already closed on shutdown
+            pass
+    
+    def _release(self, future: Future) -> None:
+        self._in_flight -= 1
+        if future.cancelled() or future.exception() is not None:
+            self.stats["failed"] += 1
+        else:
+            self.stats["processed"] += 1
+
+
+# Global image pipeline instance
+image_pipeline = ImagePipeline()
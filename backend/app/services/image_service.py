@@ -4,22 +4,55 @@ Image upload and management service for the Multilingual Mandi Marketplace Platf
 This service handles image uploads, processing, and cloud storage integration.
 """
 
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import tempfile
 import uuid
-from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, NamedTuple, Union
 from datetime import datetime
 from PIL import Image
 import io
 import boto3
-from botocore.exceptions import ClientError
 
 from app.core.config import settings
-from app.core.exceptions import ValidationException
-from app.models.product import ImageReference
+from app.core.database import get_database
+from app.core.exceptions import RateLimitException, ValidationException
+from app.models.product import ImageReference, ImageRendition
+from app.services.image_pipeline import RENDITION_CONTENT_TYPES, image_pipeline
+from app.services.image_storage import ImageStorage, LocalImageStorage, S3ImageStorage
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledUpload(NamedTuple):
+    """An upload copied to a temporary file."""
+    path: str
+    filename: str
+    size: int
+    content_hash: str
+
+
+def _is_image_signature(head: bytes) -> bool:
+    """Check the leading bytes of a file for a JPEG, PNG or WebP signature."""
+    return (
+        head.startswith(b"\xff\xd8\xff")
+        or head.startswith(b"\x89PNG\r\n\x1a\n")
+        or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+    )
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 
 class ImageService:
     """Image service for handling uploads and processing."""
@@ -36,17 +69,80 @@ class ImageService:
                     's3',
                     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=getattr(settings, 'AWS_REGION', 'ap-south-1')
+                    region_name=getattr(settings, 'AWS_REGION', 'ap-south-1'),
+                    endpoint_url=settings.AWS_S3_ENDPOINT_URL or None
                 )
             else:
                 logger.warning("AWS credentials not configured, using local file storage")
         except Exception as e:
             logger.error(f"Failed to initialize S3 client: {e}")
             self.s3_client = None
+        
+        self.storage: ImageStorage
+        if self.s3_client:
+            self.storage = S3ImageStorage(
+                self.s3_client,
+                self.bucket_name,
+                region=getattr(settings, 'AWS_REGION', 'ap-south-1'),
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL or None,
+                public_url=settings.AWS_S3_PUBLIC_URL or None,
+                multipart_threshold=settings.IMAGE_MULTIPART_THRESHOLD_MB * 1024 * 1024
+            )
+        else:
+            self.storage = LocalImageStorage(settings.UPLOAD_DIRECTORY)
+    
+    @asynccontextmanager
+    async def spool_upload(self, upload: Any) -> AsyncIterator[SpooledUpload]:
+        """
+        Copy an upload to a temporary file, checking it on the way.
+        
+        The upload is read one chunk at a time, so it is never held in memory
+        whole. Uploads larger than MAX_FILE_SIZE_MB or not starting with a
+        JPEG, PNG or WebP signature are rejected as soon as that is known.
+        The temporary file is removed on exit.
+        
+        Args:
+            upload: Uploaded file with an async read(size), e.g. UploadFile
+            
+        Yields:
+            SpooledUpload with the temporary file's path, size and SHA-256
+            
+        Raises:
+            ValidationException: If the upload is too large, empty or not an image
+        """
+        max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+        too_large = f"Image file size cannot exceed {settings.MAX_FILE_SIZE_MB}MB"
+        # Parsed multipart files know their size, so these are not read at all
+        if getattr(upload, "size", None) and upload.size > max_bytes:
+            raise ValidationException(too_large)
+        
+        filename = upload.filename or "image.jpg"
+        spool = await asyncio.to_thread(
+            tempfile.NamedTemporaryFile, suffix=self._get_file_extension(filename), delete=False
+        )
+        try:
+            size = 0
+            digest = hashlib.sha256()
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                if size == 0 and not _is_image_signature(chunk):
+                    raise ValidationException("Uploaded file is not a JPEG, PNG or WebP image")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValidationException(too_large)
+                digest.update(chunk)
+                await asyncio.to_thread(spool.write, chunk)
+            await asyncio.to_thread(spool.close)
+            
+            if size == 0:
+                raise ValidationException("Uploaded file is empty")
+            yield SpooledUpload(spool.name, filename, size, digest.hexdigest())
+        finally:
+            spool.close()
+            await asyncio.to_thread(_remove_file, spool.name)
     
     async def upload_product_image(
         self,
-        image_data: bytes,
+        image_data: Union[bytes, SpooledUpload],
         filename: str,
         product_id: str,
         content_type: str = "image/jpeg"
@@ -54,60 +150,67 @@ class ImageService:
         """
         Upload a product image to cloud storage.
         
+        Images are stored content-addressed under the SHA-256 of the upload,
+        with a manifest of their renditions written last. An image uploaded
+        before, to any product, reuses the stored renditions without being
+        rendered or stored again.
+        
         Args:
-            image_data: Image binary data
+            image_data: Image binary data, or an upload spooled by spool_upload,
+                which is decoded from its file
             filename: Original filename
             product_id: Product ID
             content_type: Image content type
             
         Returns:
-            ImageReference with URLs and metadata
+            ImageReference with URLs, renditions and metadata
             
         Raises:
             ValidationException: If image is invalid or upload fails
+            RateLimitException: If the image pipeline is full
         """
         try:
-            # Validate image
-            self._validate_image(image_data, filename)
-            
-            # Generate unique image ID and filename
-            image_id = str(uuid.uuid4())
-            file_extension = self._get_file_extension(filename)
-            s3_key = f"products/{product_id}/{image_id}{file_extension}"
+            if isinstance(image_data, SpooledUpload):
+                image_source, content_hash = image_data.path, image_data.content_hash
+            else:
+                image_source, content_hash = image_data, hashlib.sha256(image_data).hexdigest()
             
-            # Process image (resize, optimize)
-            processed_image, thumbnail_image, dimensions = await self._process_image(image_data)
+            # Validate image
+            self._validate_image(image_source, filename)
             
-            # Upload to cloud storage
-            if self.s3_client:
-                image_url = await self._upload_to_s3(processed_image, s3_key, content_type)
-                thumbnail_url = await self._upload_to_s3(
-                    thumbnail_image, 
-                    f"products/{product_id}/thumbnails/{image_id}{file_extension}",
-                    content_type
-                )
+            manifest = await self._load_manifest(content_hash)
+            if manifest is None:
+                # Process image (resize, optimize, renditions)
+                rendered = await self._process_image(image_source)
+                manifest = await self._store_renditions(content_hash, rendered)
             else:
-                # Fallback to local storage for development
-                image_url = await self._upload_to_local(processed_image, s3_key)
-                thumbnail_url = await self._upload_to_local(
-                    thumbnail_image,
-                    f"products/{product_id}/thumbnails/{image_id}{file_extension}"
-                )
+                logger.info(f"Image {content_hash} already stored, reusing its renditions for product {product_id}")
             
             # Create image reference
-            image_ref = ImageReference(
-                image_id=image_id,
-                image_url=image_url,
-                thumbnail_url=thumbnail_url,
+            return ImageReference(
+                image_id=str(uuid.uuid4()),
+                image_url=self.storage.url(manifest["image"]["key"]),
+                thumbnail_url=self.storage.url(manifest["thumbnail"]["key"]),
                 alt_text=None,
                 is_primary=False,
                 uploaded_at=datetime.utcnow(),
-                file_size=len(processed_image),
-                dimensions=dimensions
+                file_size=manifest["image"]["file_size"],
+                dimensions=manifest["dimensions"],
+                content_hash=content_hash,
+                renditions=[
+                    ImageRendition(
+                        format=rendition["format"],
+                        width=rendition["width"],
+                        height=rendition["height"],
+                        url=self.storage.url(rendition["key"]),
+                        file_size=rendition["file_size"]
+                    )
+                    for rendition in manifest["renditions"]
+                ]
             )
             
-            return image_ref
-            
+        except RateLimitException:
+            raise
         except Exception as e:
             logger.error(f"Failed to upload product image: {e}")
             raise ValidationException(f"Image upload failed: {str(e)}")
@@ -115,35 +218,42 @@ class ImageService:
     async def delete_product_image(
         self,
         image_id: str,
-        product_id: str
+        content_hash: str
     ) -> bool:
         """
-        Delete a product image from cloud storage.
+        Delete the stored renditions of a product image that is no longer used.
+        
+        Renditions are shared by every image with the same content hash, so
+        they are only deleted when no other image in products.images refers
+        to that hash. The manifest is deleted first, so an upload of the same
+        image meanwhile renders and stores it again rather than reusing
+        renditions that are being removed.
         
         Args:
-            image_id: Image ID to delete
-            product_id: Product ID
+            image_id: ID of the image being removed
+            content_hash: Content hash of the image
             
         Returns:
-            True if deletion was successful
+            True if the image's files were deleted or are still in use
         """
         try:
-            # Construct S3 keys
-            s3_key = f"products/{product_id}/{image_id}"
-            thumbnail_key = f"products/{product_id}/thumbnails/{image_id}"
+            db = await get_database()
+            in_use = await db.products.find_one(
+                {"images": {"$elemMatch": {"content_hash": content_hash, "image_id": {"$ne": image_id}}}},
+                {"_id": 1}
+            )
+            if in_use is not None:
+                logger.info(f"Image {content_hash} is still used by product {in_use['_id']}, keeping its renditions")
+                return True
             
-            if self.s3_client:
-                # Delete from S3
-                try:
-                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
-                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=thumbnail_key)
-                except ClientError as e:
-                    logger.warning(f"Failed to delete image from S3: {e}")
-            else:
-                # Delete from local storage
-                await self._delete_from_local(s3_key)
-                await self._delete_from_local(thumbnail_key)
+            manifest = await self._load_manifest(content_hash)
+            if manifest is None:
+                return True
             
+            keys = {manifest["image"]["key"], manifest["thumbnail"]["key"]}
+            keys.update(rendition["key"] for rendition in manifest["renditions"])
+            await self.storage.delete(self._content_key(content_hash, "manifest.json"))
+            await asyncio.gather(*(self.storage.delete(key) for key in keys))
             return True
             
         except Exception as e:
@@ -204,11 +314,12 @@ class ImageService:
     
     # Private helper methods
     
-    def _validate_image(self, image_data: bytes, filename: str) -> None:
-        """Validate image data and format."""
-        # Check file size (max 10MB)
-        if len(image_data) > 10 * 1024 * 1024:
-            raise ValidationException("Image file size cannot exceed 10MB")
+    def _validate_image(self, image_data: Union[bytes, str], filename: str) -> None:
+        """Validate image data, or the image file at a path, and format."""
+        # Check file size
+        size = len(image_data) if isinstance(image_data, bytes) else os.path.getsize(image_data)
+        if size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise ValidationException(f"Image file size cannot exceed {settings.MAX_FILE_SIZE_MB}MB")
         
         # Check file extension
         valid_extensions = ['.jpg', '.jpeg', '.png', '.webp']
@@ -218,7 +329,7 @@ class ImageService:
         
         # Validate image can be opened
         try:
-            with Image.open(io.BytesIO(image_data)) as img:
+            with Image.open(io.BytesIO(image_data) if isinstance(image_data, bytes) else image_data) as img:
                 # Check image dimensions
                 width, height = img.size
                 if width < 100 or height < 100:
@@ -232,108 +343,95 @@ class ImageService:
         """Get file extension from filename."""
         return os.path.splitext(filename)[1].lower()
     
-    async def _process_image(self, image_data: bytes) -> tuple[bytes, bytes, Dict[str, int]]:
+    async def _process_image(self, image_data: Union[bytes, str]) -> Dict[str, Any]:
         """
-        Process image: resize, optimize, and create thumbnail.
+        Process image: resize, optimize, and create thumbnail and renditions.
+        
+        Pillow work runs in the image pipeline's worker processes.
         
         Returns:
-            Tuple of (processed_image_data, thumbnail_data, dimensions)
+            Rendered images as returned by render_image
+            
+        Raises:
+            RateLimitException: If the image pipeline is full
         """
         try:
-            with Image.open(io.BytesIO(image_data)) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                original_width, original_height = img.size
-                
-                # Resize main image if too large (max 1200px on longest side)
-                max_size = 1200
-                if max(original_width, original_height) > max_size:
-                    if original_width > original_height:
-                        new_width = max_size
-                        new_height = int((original_height * max_size) / original_width)
-                    else:
-                        new_height = max_size
-                        new_width = int((original_width * max_size) / original_height)
-                    
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Save processed image
-                processed_buffer = io.BytesIO()
-                img.save(processed_buffer, format='JPEG', quality=85, optimize=True)
-                processed_data = processed_buffer.getvalue()
-                
-                # Create thumbnail (300x300)
-                thumbnail_size = (300, 300)
-                thumbnail_img = img.copy()
-                thumbnail_img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-                
-                # Save thumbnail
-                thumbnail_buffer = io.BytesIO()
-                thumbnail_img.save(thumbnail_buffer, format='JPEG', quality=80, optimize=True)
-                thumbnail_data = thumbnail_buffer.getvalue()
-                
-                dimensions = {"width": img.width, "height": img.height}
-                
-                return processed_data, thumbnail_data, dimensions
-                
+            return await image_pipeline.render(
+                image_data,
+                widths=settings.get_image_rendition_widths(),
+                formats=settings.get_image_rendition_formats()
+            )
+        except RateLimitException:
+            raise
         except Exception as e:
             logger.error(f"Failed to process image: {e}")
             raise ValidationException(f"Image processing failed: {str(e)}")
     
-    async def _upload_to_s3(self, image_data: bytes, s3_key: str, content_type: str) -> str:
-        """Upload image data to S3."""
-        try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=image_data,
-                ContentType=content_type,
-                CacheControl='max-age=31536000',  # 1 year cache
-                Metadata={
-                    'uploaded_at': datetime.utcnow().isoformat(),
-                    'service': 'mandi-marketplace'
-                }
-            )
-            
-            # Return public URL
-            return f"https://{self.bucket_name}.s3.{getattr(settings, 'AWS_REGION', 'ap-south-1')}.amazonaws.com/{s3_key}"
-            
-        except ClientError as e:
-            logger.error(f"Failed to upload to S3: {e}")
-            raise ValidationException(f"Cloud upload failed: {str(e)}")
+    def _content_key(self, content_hash: str, name: str) -> str:
+        """Storage key of a file stored under an image's content hash."""
+        return f"images/{content_hash[:2]}/{content_hash}/{name}"
     
-    async def _upload_to_local(self, image_data: bytes, file_path: str) -> str:
-        """Upload image data to local storage (development fallback)."""
+    async def _store_object(self, data: Union[bytes, str], key: str, content_type: str) -> None:
         try:
-            # Create local uploads directory
-            local_dir = "uploads"
-            os.makedirs(local_dir, exist_ok=True)
-            
-            # Create subdirectories
-            full_path = os.path.join(local_dir, file_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            # Write file
-            with open(full_path, 'wb') as f:
-                f.write(image_data)
-            
-            # Return local URL (assuming served by static file server)
-            return f"/uploads/{file_path}"
-            
+            await self.storage.put(key, data, content_type)
         except Exception as e:
-            logger.error(f"Failed to upload to local storage: {e}")
-            raise ValidationException(f"Local upload failed: {str(e)}")
+            logger.error(f"Failed to store image {key}: {e}")
+            raise ValidationException(f"Image storage failed: {str(e)}")
     
-    async def _delete_from_local(self, file_path: str) -> None:
-        """Delete file from local storage."""
+    async def _load_manifest(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Read the rendition manifest of an image stored before, if any."""
+        key = self._content_key(content_hash, "manifest.json")
         try:
-            full_path = os.path.join("uploads", file_path)
-            if os.path.exists(full_path):
-                os.remove(full_path)
+            data = await self.storage.get(key)
+            return json.loads(data) if data is not None else None
         except Exception as e:
-            logger.warning(f"Failed to delete local file {file_path}: {e}")
+            logger.warning(f"Failed to read image manifest {key}: {e}")
+            return None
+    
+    async def _store_renditions(self, content_hash: str, rendered: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store an image's renditions under its content hash.
+        
+        The manifest is written after every rendition, so an image with a
+        manifest is completely stored.
+        
+        Returns:
+            Manifest of the stored files
+        """
+        uploads = []
+        
+        def add(data: bytes, name: str, image_format: str) -> Dict[str, Any]:
+            key = self._content_key(content_hash, name)
+            uploads.append(self._store_object(data, key, RENDITION_CONTENT_TYPES[image_format]))
+            return {"key": key, "file_size": len(data)}
+        
+        manifest = {
+            "content_hash": content_hash,
+            "dimensions": rendered["dimensions"],
+            "image": add(rendered["image"], "image.jpg", "jpeg"),
+            "thumbnail": add(rendered["thumbnail"], "thumbnail.jpg", "jpeg"),
+            "renditions": [],
+        }
+        for rendition in rendered["renditions"]:
+            if rendition["format"] == "jpeg" and rendition["data"] is rendered["image"]:
+                stored = manifest["image"]
+            else:
+                extension = "jpg" if rendition["format"] == "jpeg" else rendition["format"]
+                stored = add(rendition["data"], f"{rendition['width']}w.{extension}", rendition["format"])
+            manifest["renditions"].append({
+                "format": rendition["format"],
+                "width": rendition["width"],
+                "height": rendition["height"],
+                **stored,
+            })
+        
+        await asyncio.gather(*uploads)
+        await self._store_object(
+            json.dumps(manifest).encode(),
+            self._content_key(content_hash, "manifest.json"),
+            "application/json"
+        )
+        return manifest
     
     def get_image_info(self, image_data: bytes) -> Dict[str, Any]:
         """
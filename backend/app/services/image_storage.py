@@ -0,0 +1,185 @@
+"""
+Storage backends for product images.
+
+ImageService stores renditions and manifests through an ImageStorage, so
+where images live is chosen in one place. LocalImageStorage writes under the
+uploads directory with file I/O in threads, so the event loop never waits on
+the disk. S3ImageStorage writes to S3 or any S3-compatible store such as
+MinIO (AWS_S3_ENDPOINT_URL).
+
+Stored objects are never rewritten with different content under the same
+key, so they are served with immutable caching: ImageFiles for the local
+uploads directory, and Cache-Control on the objects themselves for S3.
+"""
+
+import asyncio
+import io
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import Optional, Union
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from fastapi.staticfiles import StaticFiles
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageStorage(ABC):
+    """Where product images are stored."""
+    
+    @abstractmethod
+    async def put(self, key: str, data: Union[bytes, str], content_type: str) -> None:
+        """
+        Store an object.
+        
+        Args:
+            key: Object key, a relative path
+            data: Object content, or the path of a file to store
+            content_type: Content type served with the object
+        """
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Read an object, or None if it does not exist."""
+    
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Delete an object if it exists."""
+    
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """Public URL of an object."""
+
+
+def _write_file(data: Union[bytes, str], full_path: str) -> None:
+    """Write bytes or copy a file, replacing full_path only once complete."""
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    partial_path = f"{full_path}.{uuid.uuid4().hex}.partial"
+    if isinstance(data, bytes):
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+    else:
+        shutil.copyfile(data, partial_path)
+    os.replace(partial_path, full_path)
+
+
+def _read_file(full_path: str) -> Optional[bytes]:
+    try:
+        with open(full_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_file(full_path: str) -> None:
+    try:
+        os.remove(full_path)
+    except FileNotFoundError:
+        pass
+
+
+class LocalImageStorage(ImageStorage):
+    """Images in a local directory served under base_url (development)."""
+    
+    def __init__(self, root: str = "uploads", base_url: str = "/uploads"):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+    
+    def _path(self, key: str) -> str:
+        full_path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([full_path, os.path.normpath(self.root)]) != os.path.normpath(self.root):
+            raise ValueError(f"Storage key escapes the uploads directory: {key}")
+        return full_path
+    
+    async def put(self, key: str, data: Union[bytes, str], content_type: str) -> None:
+        await asyncio.to_thread(_write_file, data, self._path(key))
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(_read_file, self._path(key))
+    
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(_remove_file, self._path(key))
+    
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class S3ImageStorage(ImageStorage):
+    """Images in an S3 bucket, on AWS or an S3-compatible store."""
+    
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        region: str = "ap-south-1",
+        endpoint_url: Optional[str] = None,
+        public_url: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024
+    ):
+        self.client = client
+        self.bucket = bucket
+        if public_url:
+            self.public_url = public_url.rstrip("/")
+        elif endpoint_url:
+            # S3-compatible stores are addressed path-style
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.{region}.amazonaws.com"
+        # Objects above the threshold are uploaded in parts, several at a time
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_threshold
+        )
+    
+    async def put(self, key: str, data: Union[bytes, str], content_type: str) -> None:
+        extra_args = {
+            'ContentType': content_type,
+            'CacheControl': IMMUTABLE_CACHE_CONTROL,
+            'Metadata': {'service': 'mandi-marketplace'}
+        }
+        
+        def upload() -> None:
+            body = io.BytesIO(data) if isinstance(data, bytes) else open(data, 'rb')
+            with body:
+                self.client.upload_fileobj(
+                    body, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config
+                )
+        
+        await asyncio.to_thread(upload)
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        def download() -> Optional[bytes]:
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=key)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                    return None
+                raise
+            with response["Body"] as body:
+                return body.read()
+        
+        return await asyncio.to_thread(download)
+    
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+    
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+
+class ImageFiles(StaticFiles):
+    """
+    Serves locally stored images with immutable caching.
+    
+    StaticFiles answers If-None-Match and If-Modified-Since from the ETag
+    and Last-Modified headers and serves byte ranges. The file itself goes
+    to the server with the http.response.pathsend extension (sendfile) when
+    the server supports it.
+    """
+    
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,547 @@
+"""
+Inventory reservations for orders.
+
+Stock is reserved with a single conditional $inc that only matches while
+enough quantity is available, so concurrent orders can never take a product
+below zero. Each reservation is recorded with an expiry and is either
+committed when the vendor confirms the order, or released back to stock when
+the order is cancelled or the reservation expires.
+
+Very popular products are split into shard documents in inventory_shards so
+reservations spread their writes over several documents instead of queuing
+on one. For a sharded product the shards hold the sellable quantity and
+availability.quantity_available is refreshed from them for display.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from ..core.config import settings
+from ..core.database import get_database
+from ..core.exceptions import InsufficientInventoryException, NotFoundException, ValidationException
+
+logger = logging.getLogger(__name__)
+
+# Reservation statuses
+HELD = "held"
+COMMITTED = "committed"
+RELEASED = "released"
+EXPIRED = "expired"
+
+SWEEP_INTERVAL_SECONDS = 60
+SWEEP_BATCH_SIZE = 500
+
+
+def _shard_id(product_id: str, shard: int) -> str:
+    return f"{product_id}:{shard}"
+
+
+class InventoryService:
+    """Atomic stock reservations with expiry and hot-product sharding."""
+    
+    def __init__(
+        self,
+        database=None,
+        reservation_ttl_minutes: Optional[int] = None,
+        hot_key_threshold: Optional[int] = None,
+        shard_count: Optional[int] = None
+    ):
+        self.database = database
+        self.reservation_ttl = timedelta(
+            minutes=reservation_ttl_minutes or settings.INVENTORY_RESERVATION_TTL_MINUTES
+        )
+        self.hot_key_threshold = hot_key_threshold or settings.INVENTORY_HOT_KEY_THRESHOLD
+        self.shard_count = shard_count or settings.INVENTORY_SHARD_COUNT
+        
+        # product_id -> shard count, for products known to be sharded
+        self._sharded: Dict[str, int] = {}
+        # product_id -> (minute, reservations in that minute)
+        self._rates: Dict[str, Tuple[int, int]] = {}
+        self._sharding: Set[str] = set()
+        self._sweeper_task: Optional[asyncio.Task] = None
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def initialize(self) -> None:
+        """Create indexes for reservations and shards."""
+        try:
+            db = await self._get_database()
+            await db.inventory_reservations.create_index([("status", 1), ("expires_at", 1)])
+            await db.inventory_reservations.create_index([("product_id", 1), ("status", 1)])
+            await db.inventory_shards.create_index([("product_id", 1)])
+        except Exception as e:
+            logger.error(f"Error creating inventory indexes: {e}")
+    
+    async def reserve(self, product_id: str, quantity: int, reservation_id: str) -> Dict[str, Any]:
+        """
+        Reserve stock for an order.
+        
+        Args:
+            product_id: Product ID
+            quantity: Quantity to reserve
+            reservation_id: Reservation ID, normally the order ID
+        
+        Returns:
+            Stored reservation document
+        
+        Raises:
+            ValidationException: If quantity is not positive
+            NotFoundException: If the product does not exist
+            InsufficientInventoryException: If not enough stock is available
+        """
+        reservation = await self.take(product_id, quantity, reservation_id)
+        await self.record(reservation)
+        return reservation
+    
+    async def take(
+        self,
+        product_id: str,
+        quantity: int,
+        reservation_id: str,
+        product_fields: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Take stock for a reservation that is saved later with record().
+        
+        Splitting the two lets callers write the reservation alongside
+        their own documents. Until it is recorded, a failed caller must
+        hand the stock back with abandon().
+        
+        Args:
+            product_id: Product ID
+            quantity: Quantity to reserve
+            reservation_id: Reservation ID, normally the order ID
+            product_fields: Projection of product fields to return under
+                "product", read in the same round-trip as the stock
+        
+        Returns:
+            Unsaved reservation document
+        
+        Raises:
+            ValidationException: If quantity is not positive
+            NotFoundException: If the product does not exist
+            InsufficientInventoryException: If not enough stock is available
+        """
+        if quantity <= 0:
+            raise ValidationException("Quantity must be greater than 0")
+        
+        db = await self._get_database()
+        allocations = None
+        product = None
+        
+        shards = self._sharded.get(product_id)
+        if shards is None:
+            # One round-trip: the filter only matches while enough stock is left
+            product = await db.products.find_one_and_update(
+                {
+                    "product_id": product_id,
+                    "availability.inventory_shards": {"$exists": False},
+                    "availability.quantity_available": {"$gte": quantity}
+                },
+                {
+                    "$inc": {"availability.quantity_available": -quantity},
+                    "$set": {"updated_at": datetime.utcnow()}
+                },
+                projection=product_fields or {"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if product is not None:
+                allocations = [{"shard": None, "quantity": quantity}]
+            else:
+                shards, product = await self._shards_or_raise(db, product_id, quantity, product_fields)
+        
+        if allocations is None:
+            if product is None and product_fields:
+                # Read the product while taking stock from the shards
+                allocations, product = await asyncio.gather(
+                    self._reserve_from_shards(db, product_id, quantity, shards),
+                    db.products.find_one({"product_id": product_id}, product_fields)
+                )
+            else:
+                allocations = await self._reserve_from_shards(db, product_id, quantity, shards)
+        
+        now = datetime.utcnow()
+        reservation = {
+            "_id": reservation_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "allocations": allocations,
+            "status": HELD,
+            "created_at": now,
+            "expires_at": now + self.reservation_ttl
+        }
+        if product_fields:
+            reservation["product"] = product
+        return reservation
+    
+    async def record(self, reservation: Dict[str, Any]) -> None:
+        """
+        Save a reservation from take(), handing its stock back if that fails.
+        """
+        db = await self._get_database()
+        document = {key: value for key, value in reservation.items() if key != "product"}
+        try:
+            await db.inventory_reservations.insert_one(document)
+        except Exception:
+            await self._restore(db, reservation["product_id"], reservation["allocations"])
+            raise
+        
+        self._record_reservation(reservation["product_id"])
+    
+    async def abandon(self, reservation: Dict[str, Any]) -> None:
+        """Hand back the stock of a reservation from take() that will not be recorded."""
+        db = await self._get_database()
+        await self._restore(db, reservation["product_id"], reservation["allocations"])
+    
+    async def _shards_or_raise(
+        self,
+        db,
+        product_id: str,
+        quantity: int,
+        product_fields: Optional[Dict[str, int]] = None
+    ) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """After a failed reservation, find out whether the product is sharded."""
+        projection = {"availability.quantity_available": 1, "availability.inventory_shards": 1}
+        if product_fields:
+            projection.update(product_fields)
+        product = await db.products.find_one({"product_id": product_id}, projection)
+        if product is None:
+            raise NotFoundException("Product not found")
+        
+        availability = product.get("availability") or {}
+        shards = availability.get("inventory_shards")
+        if not shards:
+            raise InsufficientInventoryException(
+                "Not enough stock available",
+                details={"requested": quantity, "available": availability.get("quantity_available", 0)}
+            )
+        
+        self._sharded[product_id] = shards
+        return shards, product
+    
+    async def _reserve_from_shards(
+        self,
+        db,
+        product_id: str,
+        quantity: int,
+        shards: int
+    ) -> List[Dict[str, Any]]:
+        """Take stock from one random shard, or from several if none has enough alone."""
+        order = list(range(shards))
+        random.shuffle(order)
+        for shard in order:
+            result = await db.inventory_shards.update_one(
+                {"_id": _shard_id(product_id, shard), "quantity": {"$gte": quantity}},
+                {"$inc": {"quantity": -quantity}}
+            )
+            if result.modified_count:
+                return [{"shard": shard, "quantity": quantity}]
+        
+        # Stock is spread thin: gather it from several shards, undoing on shortfall
+        allocations = []
+        remaining = quantity
+        documents = await db.inventory_shards.find(
+            {"product_id": product_id, "quantity": {"$gt": 0}}
+        ).to_list(length=None)
+        for document in documents:
+            take = min(remaining, document["quantity"])
+            result = await db.inventory_shards.update_one(
+                {"_id": document["_id"], "quantity": {"$gte": take}},
+                {"$inc": {"quantity": -take}}
+            )
+            if result.modified_count:
+                allocations.append({"shard": document["shard"], "quantity": take})
+                remaining -= take
+                if not remaining:
+                    return allocations
+        
+        await self._restore(db, product_id, allocations)
+        raise InsufficientInventoryException(
+            "Not enough stock available",
+            details={"requested": quantity, "available": quantity - remaining}
+        )
+    
+    async def _restore(self, db, product_id: str, allocations: List[Dict[str, Any]]) -> None:
+        """Return allocated stock to the product or its shards."""
+        for allocation in allocations:
+            if allocation["shard"] is not None:
+                await db.inventory_shards.update_one(
+                    {"_id": _shard_id(product_id, allocation["shard"])},
+                    {"$inc": {"quantity": allocation["quantity"]}}
+                )
+                continue
+            
+            result = await db.products.update_one(
+                {"product_id": product_id, "availability.inventory_shards": {"$exists": False}},
+                {"$inc": {"availability.quantity_available": allocation["quantity"]}}
+            )
+            if not result.matched_count:
+                # Sharded since the reservation was made
+                await db.inventory_shards.update_one(
+                    {"_id": _shard_id(product_id, 0)},
+                    {"$inc": {"quantity": allocation["quantity"]}}
+                )
+    
+    async def commit(self, reservation_id: str) -> bool:
+        """
+        Keep reserved stock sold, e.g. when the vendor confirms the order.
+        
+        Returns:
+            True if a held reservation was committed
+        """
+        db = await self._get_database()
+        result = await db.inventory_reservations.update_one(
+            {"_id": reservation_id, "status": HELD},
+            {"$set": {"status": COMMITTED, "committed_at": datetime.utcnow()}}
+        )
+        return bool(result.modified_count)
+    
+    async def release(self, reservation_id: str, status: str = RELEASED) -> bool:
+        """
+        Return a reservation's stock, e.g. when its order is cancelled.
+        
+        Cancelled orders return held and committed stock; expiry only
+        applies to held reservations.
+        
+        Args:
+            reservation_id: Reservation ID
+            status: Final status to record (released or expired)
+        
+        Returns:
+            True if the reservation's stock was returned
+        """
+        releasable = [HELD] if status == EXPIRED else [HELD, COMMITTED]
+        db = await self._get_database()
+        reservation = await db.inventory_reservations.find_one_and_update(
+            {"_id": reservation_id, "status": {"$in": releasable}},
+            {"$set": {"status": status, "released_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if reservation is None:
+            return False
+        
+        await self._restore(db, reservation["product_id"], reservation["allocations"])
+        return True
+    
+    async def release_expired(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Release expired reservations and cancel their pending orders.
+        
+        Orders hold stock for INVENTORY_RESERVATION_TTL_MINUTES; one the
+        vendor has not confirmed by then is cancelled with reason
+        "reservation_expired". Orders confirmed in time are committed and
+        never expire.
+        
+        Returns:
+            IDs of the released reservations
+        """
+        db = await self._get_database()
+        now = now or datetime.utcnow()
+        expired = await db.inventory_reservations.find(
+            {"status": HELD, "expires_at": {"$lte": now}},
+            {"_id": 1}
+        ).limit(SWEEP_BATCH_SIZE).to_list(length=SWEEP_BATCH_SIZE)
+        
+        released = [
+            reservation["_id"] for reservation in expired
+            if await self.release(reservation["_id"], EXPIRED)
+        ]
+        if released:
+            await db.orders.update_many(
+                {"_id": {"$in": released}, "status": "pending"},
+                {"$set": {"status": "cancelled", "cancellation_reason": "reservation_expired", "updated_at": now}}
+            )
+            logger.info(f"Released {len(released)} expired inventory reservations")
+        
+        return released
+    
+    async def set_available(self, product_id: str, quantity: int) -> bool:
+        """
+        Set a product's stock, spreading it over its shards if sharded.
+        
+        The quantity is the vendor's stock including units held by pending
+        orders. Held units have already been taken from the sellable
+        quantity and are handed back when their reservation is released, so
+        only the rest is made sellable.
+        
+        Args:
+            product_id: Product ID
+            quantity: Stock on hand, including held units
+        
+        Returns:
+            True if the product exists
+        
+        Raises:
+            ValidationException: If quantity is below the held units
+        """
+        db = await self._get_database()
+        held = await self.held_quantity(product_id)
+        if quantity < held:
+            raise ValidationException(
+                f"Quantity cannot be below the {held} units held by pending orders",
+                details={"requested": quantity, "held": held}
+            )
+        
+        available = quantity - held
+        result = await db.products.update_one(
+            {"product_id": product_id},
+            {"$set": {"availability.quantity_available": available, "updated_at": datetime.utcnow()}}
+        )
+        if not result.matched_count:
+            return False
+        
+        product = await db.products.find_one({"product_id": product_id}, {"availability.inventory_shards": 1})
+        shards = ((product or {}).get("availability") or {}).get("inventory_shards")
+        if shards:
+            await db.inventory_shards.bulk_write([
+                UpdateOne(
+                    {"_id": _shard_id(product_id, shard)},
+                    {"$set": {"product_id": product_id, "shard": shard, "quantity": share}},
+                    upsert=True
+                )
+                for shard, share in enumerate(self._split(available, shards))
+            ])
+        return True
+    
+    async def held_quantity(self, product_id: str) -> int:
+        """Units of a product held by reservations that are not yet committed or released."""
+        db = await self._get_database()
+        totals = await db.inventory_reservations.aggregate([
+            {"$match": {"product_id": product_id, "status": HELD}},
+            {"$group": {"_id": None, "quantity": {"$sum": "$quantity"}}}
+        ]).to_list(length=1)
+        return totals[0]["quantity"] if totals else 0
+    
+    @staticmethod
+    def _split(quantity: int, shards: int) -> List[int]:
+        base, extra = divmod(quantity, shards)
+        return [base + (1 if shard < extra else 0) for shard in range(shards)]
+    
+    def _record_reservation(self, product_id: str) -> None:
+        """Count reservations per minute and shard products that get too hot."""
+        if product_id in self._sharded or product_id in self._sharding:
+            return
+        
+        minute = int(time.monotonic() // 60)
+        window, count = self._rates.get(product_id, (minute, 0))
+        count = count + 1 if window == minute else 1
+        self._rates[product_id] = (minute, count)
+        
+        if count >= self.hot_key_threshold:
+            self._sharding.add(product_id)
+            self._rates.pop(product_id, None)
+            task = asyncio.create_task(self.shard_product(product_id))
+            task.add_done_callback(lambda _: self._sharding.discard(product_id))
+    
+    async def shard_product(self, product_id: str, shards: Optional[int] = None) -> int:
+        """
+        Split a product's stock over shard documents.
+        
+        The product is marked sharded and its quantity read in one atomic
+        update, then moved into the shards. Reservations arriving in between
+        see empty shards and fail rather than oversell.
+        
+        Args:
+            product_id: Product ID
+            shards: Number of shards (defaults to INVENTORY_SHARD_COUNT)
+        
+        Returns:
+            Number of shards the product has
+        """
+        shards = shards or self.shard_count
+        db = await self._get_database()
+        
+        # Create empty shards first so stock is never returned to a missing one
+        await db.inventory_shards.bulk_write([
+            UpdateOne(
+                {"_id": _shard_id(product_id, shard)},
+                {"$setOnInsert": {"product_id": product_id, "shard": shard, "quantity": 0}},
+                upsert=True
+            )
+            for shard in range(shards)
+        ])
+        
+        product = await db.products.find_one_and_update(
+            {"product_id": product_id, "availability.inventory_shards": {"$exists": False}},
+            {"$set": {"availability.inventory_shards": shards}},
+            projection={"availability.quantity_available": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if product is None:
+            existing = await db.products.find_one({"product_id": product_id}, {"availability.inventory_shards": 1})
+            current = ((existing or {}).get("availability") or {}).get("inventory_shards")
+            if current:
+                self._sharded[product_id] = current
+            return current or 0
+        
+        quantity = (product.get("availability") or {}).get("quantity_available", 0)
+        operations = [
+            UpdateOne({"_id": _shard_id(product_id, shard)}, {"$inc": {"quantity": share}})
+            for shard, share in enumerate(self._split(quantity, shards)) if share
+        ]
+        if operations:
+            await db.inventory_shards.bulk_write(operations)
+        
+        self._sharded[product_id] = shards
+        logger.info(f"Sharded inventory of product {product_id} over {shards} shards ({quantity} units)")
+        return shards
+    
+    async def sync_sharded_quantities(self) -> int:
+        """
+        Refresh availability.quantity_available of sharded products from their shards.
+        
+        Returns:
+            Number of products updated
+        """
+        db = await self._get_database()
+        totals = await db.inventory_shards.aggregate([
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}}
+        ]).to_list(length=None)
+        if not totals:
+            return 0
+        
+        await db.products.bulk_write([
+            UpdateOne(
+                {"product_id": total["_id"], "availability.inventory_shards": {"$exists": True}},
+                {"$set": {"availability.quantity_available": total["quantity"]}}
+            )
+            for total in totals
+        ], ordered=False)
+        return len(totals)
+    
+    async def start(self) -> None:
+        """Start the background sweeper for expired reservations."""
+        if self._sweeper_task is None or self._sweeper_task.done():
+            self._sweeper_task = asyncio.create_task(self._run())
+            logger.info("Inventory reservation sweeper started")
+    
+    async def stop(self) -> None:
+        """Stop the background sweeper."""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+            logger.info("Inventory reservation sweeper stopped")
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+            try:
+                await self.release_expired()
+                await self.sync_sharded_quantities()
+            except Exception as e:
+                logger.error(f"Error sweeping inventory reservations: {e}")
+
+
+# Global inventory service instance
+inventory_service = InventoryService()
@@ -0,0 +1,131 @@
+"""
+Incremental JSON parsing for large API responses.
+
+Extracts the objects of one top-level array field (e.g. Agmarknet "records")
+from a byte stream as they arrive, so a response never has to be held in
+memory or decoded as a whole.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Characters that change nesting or start a string
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+
+_QUOTE = ord('"')
+_BACKSLASH = ord("\\")
+_OPEN_OBJECT = ord("{")
+_OPEN_ARRAY = ord("[")
+_CLOSE_OBJECT = ord("}")
+_CLOSE_ARRAY = ord("]")
+
+
+class JsonArrayItemParser:
+    """
+    Incrementally parse the objects of a top-level array field.
+
+    Bytes are fed in arbitrary chunks; each call to feed returns the objects
+    completed so far. Only the current partial object is buffered.
+    """
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.done = False
+
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self._last_string: Optional[bytes] = None
+
+    @property
+    def buffered_bytes(self) -> int:
+        """Number of bytes currently held in the buffer."""
+        return len(self._buffer)
+
+    @staticmethod
+    def _string_end(buffer: bytearray, start: int) -> Optional[int]:
+        """Find the closing quote of a string starting at start, if buffered."""
+        while True:
+            end = buffer.find(b'"', start)
+            if end == -1:
+                return None
+
+            backslashes = 0
+            i = end - 1
+            while i >= start and buffer[i] == _BACKSLASH:
+                backslashes += 1
+                i -= 1
+            if backslashes % 2 == 0:
+                return end
+            start = end + 1
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        """
+        Feed the next chunk of the response body.
+
+        Args:
+            chunk: Raw bytes from the stream
+
+        Returns:
+            Objects of the array field completed by this chunk
+        """
+        if self.done:
+            return []
+
+        buffer = self._buffer
+        buffer += chunk
+        pos = self._pos
+        items = []
+
+        while not self.done:
+            match = _STRUCTURAL.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+
+            i = match.start()
+            char = buffer[i]
+
+            if char == _QUOTE:
+                end = self._string_end(buffer, i + 1)
+                if end is None:
+                    pos = i  # Rescan the string once more bytes arrive
+                    break
+                if not self._in_array and self._depth == 1:
+                    self._last_string = bytes(buffer[i + 1:end])
+                pos = end + 1
+                continue
+
+            if char == _OPEN_OBJECT or char == _OPEN_ARRAY:
+                if self._in_array and self._depth == 2 and char == _OPEN_OBJECT:
+                    self._item_start = i
+                elif (
+                    not self._in_array and self._depth == 1 and
+                    char == _OPEN_ARRAY and self._last_string == self.field
+                ):
+                    self._in_array = True
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._in_array:
+                    if self._depth == 2 and char == _CLOSE_OBJECT and self._item_start is not None:
+                        items.append(json.loads(buffer[self._item_start:i + 1]))
+                        self._item_start = None
+                    elif self._depth == 1 and char == _CLOSE_ARRAY:
+                        self.done = True
+
+            pos = i + 1
+
+        # Drop everything before the current partial object or token
+        keep_from = self._item_start if self._item_start is not None else pos
+        if keep_from:
+            del buffer[:keep_from]
+            pos -= keep_from
+            if self._item_start is not None:
+                self._item_start = 0
+        self._pos = pos
+
+        return items
@@ -10,25 +10,76 @@ import json
 import logging
 import math
 import random
+import re
+import time
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from typing import List, Optional, Dict, Any, Tuple
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from urllib.parse import urlencode
 
 import httpx
+from bson import Decimal128
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
 
 from ..core.config import settings
 from ..core.redis import get_redis
+from .anomaly_detector import price_anomaly_detector
+from .json_stream import JsonArrayItemParser
+from .price_store import price_store
 from ..models.market_data import (
-    MarketPrice, PriceHistory, DataValidationResult, MarketDataCache,
+    MarketPrice, PriceHistory, DataValidationResult, BatchValidationResult, MarketDataCache,
     DataSource, DataQuality, PriceUnit, AgmarknetApiResponse,
     MarketPriceRequest, MarketPriceResponse, PriceHistoryRequest, PriceHistoryResponse,
-    DataSyncStatus
+    DataSyncStatus, ForecastKey, PriceForecast
 )
 
 logger = logging.getLogger(__name__)
 
+# Validation checks in the bit order used by batch validation flags
+# Forecast keys whose request was recorded by this process, with the time
+FORECAST_REQUEST_RECORD_INTERVAL_SECONDS = 3600
+_recorded_forecast_requests: Dict[str, float] = {}
+
+def price_date_for_db(value: date) -> datetime:
+    """Store a price date as midnight UTC, since BSON has no date-only type."""
+    return datetime.combine(value, datetime.min.time())
+
+
+_PRICE_FIELDS = ("min_price", "max_price", "modal_price")
+
+
+def _market_price_doc(price: MarketPrice) -> Dict[str, Any]:
+    """Build the stored document for a market price, in types BSON can encode."""
+    doc = price.dict()
+    doc["_id"] = f"{price.commodity}_{price.market}_{price.price_date}_{price.source}"
+    doc["price_date"] = price_date_for_db(price.price_date)
+    for field in _PRICE_FIELDS:
+        doc[field] = Decimal128(doc[field])
+    return doc
+
+
+def _market_price_from_doc(record: Dict[str, Any]) -> MarketPrice:
+    """Read a market price stored by _market_price_doc."""
+    record = {key: value for key, value in record.items() if key != "_id"}
+    for field in _PRICE_FIELDS:
+        if isinstance(record.get(field), Decimal128):
+            record[field] = record[field].to_decimal()
+    if isinstance(record.get("price_date"), datetime):
+        record["price_date"] = record["price_date"].date()
+    return MarketPrice(**record)
+
+
+VALIDATION_CHECKS = (
+    "has_commodity",
+    "has_market",
+    "has_state",
+    "valid_prices",
+    "reasonable_price_range",
+    "valid_date",
+    "valid_arrivals",
+)
+
 
 class MarketDataService:
     """Service for managing external market data integration."""
@@ -38,6 +89,9 @@ class MarketDataService:
         self.market_prices_collection = database.market_prices
         self.price_history_collection = database.price_history
         self.data_sync_status_collection = database.data_sync_status
+        self.price_forecasts_collection = database.price_forecasts
+        self.forecast_requests_collection = database.forecast_requests
+        self.market_prices_quarantine_collection = database.market_prices_quarantine
         self.redis_client = None
         
         # API configuration
@@ -76,10 +130,118 @@ class MarketDataService:
                 ("commodity", 1), ("market", 1), ("period_start", -1)
             ])
             
+            # Precomputed forecast indexes (latest version per key)
+            await self.price_forecasts_collection.create_index([
+                ("forecast_key", 1), ("version", -1)
+            ])
+            await self.price_forecasts_collection.create_index([("generated_at", -1)])
+            await self.forecast_requests_collection.create_index([("last_requested_at", -1)])
+            
+            # Quarantined anomalous prices
+            await self.market_prices_quarantine_collection.create_index([
+                ("commodity", 1), ("market", 1), ("quarantined_at", -1)
+            ])
+            
             logger.info("Market data indexes created successfully")
         except Exception as e:
             logger.error(f"Error creating market data indexes: {e}")
     
+    def _agmarknet_request(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """Build the Agmarknet resource URL and query parameters."""
+        params = {
+            "api-key": self.agmarknet_api_key,
+            "format": "json",
+            "filters[commodity]": commodity.lower()
+        }
+        
+        if state:
+            params["filters[state]"] = state.lower()
+        if market:
+            params["filters[market]"] = market.lower()
+        if date_from:
+            params["filters[date][from]"] = date_from.strftime("%Y-%m-%d")
+        if date_to:
+            params["filters[date][to]"] = date_to.strftime("%Y-%m-%d")
+        
+        url = f"{self.agmarknet_base_url}/9ef84268-d588-465a-a308-a864a43d0070"
+        return url, params
+    
+    async def stream_agmarknet_data(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[List[MarketPrice]]:
+        """
+        Stream validated market data from the Agmarknet API in bounded batches.
+        
+        Records are parsed incrementally from the HTTP body, so memory stays
+        proportional to the batch size rather than the response size.
+        
+        Args:
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+            date_from: Start date (optional)
+            date_to: End date (optional)
+            batch_size: Records per batch (defaults to AGMARKNET_INGEST_BATCH_SIZE)
+            
+        Yields:
+            Lists of validated MarketPrice objects
+        """
+        batch_size = batch_size or settings.AGMARKNET_INGEST_BATCH_SIZE
+        url, params = self._agmarknet_request(commodity, state, market, date_from, date_to)
+        parser = JsonArrayItemParser("records")
+        batch: List[MarketPrice] = []
+        
+        logger.info(f"Streaming Agmarknet data for commodity: {commodity}")
+        async with self.http_client.stream("GET", url, params=params) as response:
+            response.raise_for_status()
+            
+            async for chunk in response.aiter_bytes():
+                for record in parser.feed(chunk):
+                    price = AgmarknetApiResponse.record_to_market_price(record)
+                    if price is not None:
+                        batch.append(price)
+                    
+                    if len(batch) >= batch_size:
+                        yield self._filter_valid_prices(batch, commodity)
+                        batch = []
+        
+        if batch:
+            yield self._filter_valid_prices(batch, commodity)
+    
+    def _filter_valid_prices(self, market_prices: List[MarketPrice], commodity: str) -> List[MarketPrice]:
+        """Validate a batch in a single pass and keep the valid records."""
+        batch_result = self.validate_market_data_batch(market_prices)
+        validated_prices = []
+        for price, is_valid, quality in zip(
+            market_prices, batch_result.valid_flags, batch_result.data_qualities
+        ):
+            if is_valid:
+                price.data_quality = quality
+                price.is_validated = True
+                validated_prices.append(price)
+        
+        if batch_result.invalid_records:
+            failures = {k: v for k, v in batch_result.check_failures.items() if v}
+            logger.warning(
+                f"Dropped {batch_result.invalid_records} invalid market data records "
+                f"for {commodity}: {failures}"
+            )
+        
+        return validated_prices
+    
     async def fetch_agmarknet_data(
         self,
         commodity: str,
@@ -102,46 +264,11 @@ class MarketDataService:
             List of MarketPrice objects
         """
         try:
-            # Build API parameters
-            params = {
-                "api-key": self.agmarknet_api_key,
-                "format": "json",
-                "filters[commodity]": commodity.lower()
-            }
-            
-            if state:
-                params["filters[state]"] = state.lower()
-            if market:
-                params["filters[market]"] = market.lower()
-            if date_from:
-                params["filters[date][from]"] = date_from.strftime("%Y-%m-%d")
-            if date_to:
-                params["filters[date][to]"] = date_to.strftime("%Y-%m-%d")
-            
-            # Make API request
-            url = f"{self.agmarknet_base_url}/9ef84268-d588-465a-a308-a864a43d0070"
-            
-            logger.info(f"Fetching Agmarknet data for commodity: {commodity}")
-            response = await self.http_client.get(url, params=params)
-            response.raise_for_status()
-            
-            # Parse response
-            data = response.json()
-            api_response = AgmarknetApiResponse(**data)
-            
-            # Convert to MarketPrice objects
-            market_prices = api_response.to_market_prices()
-            
-            # Validate and filter data
             validated_prices = []
-            for price in market_prices:
-                validation_result = await self.validate_market_data(price)
-                if validation_result.is_valid:
-                    price.data_quality = self._determine_data_quality(validation_result)
-                    price.is_validated = True
-                    validated_prices.append(price)
-                else:
-                    logger.warning(f"Invalid market data for {commodity}: {validation_result.issues}")
+            async for batch in self.stream_agmarknet_data(
+                commodity, state, market, date_from, date_to
+            ):
+                validated_prices.extend(batch)
             
             logger.info(f"Fetched {len(validated_prices)} valid price records for {commodity}")
             return validated_prices
@@ -153,6 +280,49 @@ class MarketDataService:
             logger.error(f"Error fetching Agmarknet data: {e}")
             raise Exception(f"Failed to fetch market data: {e}")
     
+    async def ingest_agmarknet_data(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        batch_size: Optional[int] = None
+    ) -> int:
+        """
+        Stream Agmarknet data straight into the database batch by batch.
+        
+        Each validated batch is written with bulk_write as soon as it is
+        parsed, so peak memory stays flat regardless of the response size.
+        
+        Args:
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+            date_from: Start date (optional)
+            date_to: End date (optional)
+            batch_size: Records per batch (defaults to AGMARKNET_INGEST_BATCH_SIZE)
+            
+        Returns:
+            Number of records stored
+        """
+        try:
+            stored_count = 0
+            async for batch in self.stream_agmarknet_data(
+                commodity, state, market, date_from, date_to, batch_size
+            ):
+                stored_count += await self.store_market_data(batch)
+            
+            logger.info(f"Ingested {stored_count} price records for {commodity}")
+            return stored_count
+            
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error ingesting Agmarknet data: {e}")
+            raise Exception(f"Failed to ingest market data: {e}")
+        except Exception as e:
+            logger.error(f"Error ingesting Agmarknet data: {e}")
+            raise Exception(f"Failed to ingest market data: {e}")
+    
     async def validate_market_data(self, market_price: MarketPrice) -> DataValidationResult:
         """
         Validate market price data for quality and consistency.
@@ -233,13 +403,105 @@ class MarketDataService:
             recommendations=recommendations
         )
     
+    def validate_market_data_batch(self, market_prices: List[MarketPrice]) -> BatchValidationResult:
+        """
+        Validate a page of market price records in a single pass.
+        
+        Applies the same checks as validate_market_data, but records failures
+        as a bitmask per record instead of building issue lists and a result
+        model for every record.
+        
+        Args:
+            market_prices: MarketPrice objects to validate
+            
+        Returns:
+            BatchValidationResult with per-record flags and aggregate statistics
+        """
+        today = date.today()
+        oldest = today - timedelta(days=365)
+        all_checks = len(VALIDATION_CHECKS)
+        
+        valid_flags = []
+        check_flags = []
+        quality_scores = []
+        data_qualities = []
+        failure_counts = [0] * all_checks
+        
+        for price in market_prices:
+            mask = 0
+            total_checks = all_checks
+            
+            if not (price.commodity and price.commodity.strip()):
+                mask |= 1
+            if not (price.market and price.market.strip()):
+                mask |= 2
+            if not (price.state and price.state.strip()):
+                mask |= 4
+            
+            min_price = price.min_price
+            max_price = price.max_price
+            modal_price = price.modal_price
+            if not (
+                min_price > 0 and max_price > 0 and modal_price > 0 and
+                min_price <= modal_price <= max_price
+            ):
+                mask |= 8
+            
+            # max/min ratio <= 10; only checked when a max price is present
+            if max_price > 0:
+                if min_price <= 0 or max_price > min_price * 10:
+                    mask |= 16
+            else:
+                total_checks -= 1
+            
+            if not (oldest <= price.price_date <= today):
+                mask |= 32
+            if price.arrivals is not None and price.arrivals < 0:
+                mask |= 64
+            
+            if mask:
+                for bit in range(all_checks):
+                    if mask & (1 << bit):
+                        failure_counts[bit] += 1
+            
+            quality_score = (total_checks - mask.bit_count()) / total_checks
+            valid_flags.append(mask == 0)
+            check_flags.append(mask)
+            quality_scores.append(quality_score)
+            data_qualities.append(self._quality_for_score(quality_score))
+        
+        total_records = len(market_prices)
+        valid_records = sum(valid_flags)
+        quality_distribution = {quality.value: 0 for quality in DataQuality}
+        for quality in data_qualities:
+            quality_distribution[quality.value] += 1
+        
+        return BatchValidationResult(
+            checks=list(VALIDATION_CHECKS),
+            total_records=total_records,
+            valid_records=valid_records,
+            invalid_records=total_records - valid_records,
+            valid_flags=valid_flags,
+            check_flags=check_flags,
+            quality_scores=quality_scores,
+            data_qualities=data_qualities,
+            check_failures=dict(zip(VALIDATION_CHECKS, failure_counts)),
+            quality_distribution=quality_distribution,
+            average_quality_score=sum(quality_scores) / total_records if total_records else 0.0
+        )
+    
     def _determine_data_quality(self, validation_result: DataValidationResult) -> DataQuality:
         """Determine data quality based on validation result."""
-        if validation_result.quality_score >= 0.95:
+        return self._quality_for_score(validation_result.quality_score)
+    
+    @staticmethod
+    def _quality_for_score(quality_score: float) -> DataQuality:
+        """Map a validation quality score to a data quality level."""
+        if quality_score >= 0.95:
             return DataQuality.HIGH
-        elif validation_result.quality_score >= 0.8:
+        elif quality_score >= 0.8:
             return DataQuality.MEDIUM
-        elif validation_result.quality_score >= 0.6:
+        elif quality_score >= 0.6:
             return DataQuality.LOW
         else:
             return DataQuality.UNVERIFIED
@@ -248,6 +510,11 @@ class MarketDataService:
         """
         Store market price data in the database.
         
+        Every record first goes through the streaming anomaly detector.
+        Flagged records are written to the quarantine collection instead and
+        marked as not validated, so callers must not cache or serve them.
+        Records already screened by an earlier, overlapping sync are skipped.
+        
         Args:
             market_prices: List of MarketPrice objects to store
             
@@ -258,28 +525,23 @@ class MarketDataService:
             return 0
         
         try:
-            # Prepare documents for insertion
-            documents = []
-            for price in market_prices:
-                doc = price.dict()
-                doc["_id"] = f"{price.commodity}_{price.market}_{price.price_date}_{price.source}"
-                documents.append(doc)
+            accepted_prices = await self.screen_market_data(market_prices)
             
             # Use upsert to avoid duplicates
             operations = []
-            for doc in documents:
-                operations.append({
-                    "replaceOne": {
-                        "filter": {"_id": doc["_id"]},
-                        "replacement": doc,
-                        "upsert": True
-                    }
-                })
+            for price in accepted_prices:
+                doc = _market_price_doc(price)
+                operations.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
             
             if operations:
                 result = await self.market_prices_collection.bulk_write(operations)
                 stored_count = result.upserted_count + result.modified_count
                 logger.info(f"Stored {stored_count} market price records")
+                
+                # Refresh this worker's price store and notify the others
+                updates = price_store.ingest(accepted_prices)
+                await price_store.publish(updates)
+                
                 return stored_count
             
             return 0
@@ -288,6 +550,49 @@ class MarketDataService:
             logger.error(f"Error storing market data: {e}")
             raise Exception(f"Failed to store market data: {e}")
     
+    async def screen_market_data(self, market_prices: List[MarketPrice]) -> List[MarketPrice]:
+        """
+        Run prices through the anomaly detector and quarantine outliers.
+        
+        Args:
+            market_prices: MarketPrice objects to screen
+            
+        Returns:
+            Prices that were not flagged
+        """
+        keys = {
+            price_anomaly_detector.series_key(price.commodity, price.market)
+            for price in market_prices
+        }
+        await price_anomaly_detector.load(keys)
+        accepted, flagged = price_anomaly_detector.screen(market_prices)
+        await price_anomaly_detector.save(keys)
+        
+        if flagged:
+            await self._quarantine_market_data(flagged)
+        
+        return accepted
+    
+    async def _quarantine_market_data(self, flagged: List[Tuple[MarketPrice, str]]) -> None:
+        """Write flagged prices to the quarantine collection."""
+        operations = []
+        for price, reason in flagged:
+            price.is_validated = False
+            price.data_quality = DataQuality.UNVERIFIED
+            price.validation_notes = f"Quarantined: {reason}"
+            
+            doc = _market_price_doc(price)
+            doc["quarantine_reason"] = reason
+            doc["quarantined_at"] = datetime.utcnow()
+            operations.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        
+        logger.warning(f"Quarantined {len(operations)} anomalous market price records")
+        
+        try:
+            await self.market_prices_quarantine_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Error quarantining market data: {e}")
+    
     async def get_cached_market_data(self, cache_key: str) -> Optional[Dict[str, Any]]:
         """Get cached market data from Redis."""
         if not self.redis_client:
@@ -360,9 +665,7 @@ class MarketDataService:
         market_prices = []
         for record in db_records:
             try:
-                # Remove MongoDB _id field
-                record.pop("_id", None)
-                market_prices.append(MarketPrice(**record))
+                market_prices.append(_market_price_from_doc(record))
             except Exception as e:
                 logger.warning(f"Error parsing market price record: {e}")
                 continue
@@ -380,9 +683,9 @@ class MarketDataService:
                 )
                 
                 if external_prices:
-                    # Store the fetched data
+                    # Store the fetched data, leaving out quarantined records
                     await self.store_market_data(external_prices)
-                    market_prices = external_prices
+                    market_prices = [p for p in external_prices if p.is_validated]
                 
             except Exception as e:
                 logger.error(f"Error fetching external market data: {e}")
@@ -417,6 +720,136 @@ class MarketDataService:
         
         return response
     
+    async def get_market_summary(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get price summary statistics for a commodity.
+        
+        Hot commodities are summarized straight from the in-memory price store;
+        others fall back to get_market_price.
+        
+        Args:
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+            
+        Returns:
+            Price summary statistics
+        """
+        await self._backfill_price_store(commodity)
+        summary = price_store.summarize(commodity, state=state, market=market)
+        if summary is not None:
+            return summary
+        
+        response = await self.get_market_price(
+            MarketPriceRequest(commodity=commodity, state=state, market=market)
+        )
+        return response.summary
+    
+    async def _backfill_price_store(self, commodity: str, days: int = 30) -> None:
+        """
+        Load a held commodity's stored prices into the price store.
+        
+        Syncs only bring in the last few days, so after a restart or a new
+        admission the store would summarize a partial window. Until the
+        backfill succeeds the store declines the lookup and callers read
+        from MongoDB instead.
+        """
+        if not price_store.has_commodity(commodity) or price_store.covers(commodity, days):
+            return
+        
+        since = date.today() - timedelta(days=days)
+        query = {
+            "commodity": {"$regex": f"^{re.escape(commodity.strip())}$", "$options": "i"},
+            "price_date": {"$gte": price_date_for_db(since)}
+        }
+        
+        try:
+            records = await self.market_prices_collection.find(query).to_list(length=None)
+        except Exception as e:
+            logger.warning(f"Error backfilling price store for {commodity}: {e}")
+            return
+        
+        prices = []
+        for record in records:
+            try:
+                prices.append(_market_price_from_doc(record))
+            except Exception as e:
+                logger.warning(f"Error parsing market price record: {e}")
+        
+        rows = price_store.backfill(commodity, prices, since)
+        logger.info(f"Backfilled {rows} price store rows for {commodity}")
+    
+    async def get_data_quality(self, commodity: str) -> Dict[str, Any]:
+        """
+        Get data quality metrics for a commodity.
+        
+        Args:
+            commodity: Commodity name
+            
+        Returns:
+            Data quality metrics and validation results
+        """
+        await self._backfill_price_store(commodity)
+        counts = price_store.quality_counts(commodity)
+        
+        if counts is None:
+            response = await self.get_market_price(MarketPriceRequest(commodity=commodity))
+            quality_counts: Dict[str, int] = {}
+            for price in response.prices:
+                quality = price.data_quality.value
+                quality_counts[quality] = quality_counts.get(quality, 0) + 1
+            
+            counts = {
+                "total_records": len(response.prices),
+                "validated_records": sum(1 for price in response.prices if price.is_validated),
+                "quality_distribution": quality_counts,
+                "last_updated": response.last_updated,
+            }
+        
+        total_records = counts["total_records"]
+        if not total_records:
+            return {
+                "commodity": commodity,
+                "data_quality": "no_data",
+                "quality_score": 0.0,
+                "total_records": 0,
+                "validation_summary": "No data available"
+            }
+        
+        quality_counts = counts["quality_distribution"]
+        validated_records = counts["validated_records"]
+        
+        # Calculate overall quality score
+        quality_weights = {"high": 1.0, "medium": 0.7, "low": 0.4, "unverified": 0.0}
+        weighted_score = sum(
+            quality_counts.get(quality, 0) * weight
+            for quality, weight in quality_weights.items()
+        )
+        overall_score = weighted_score / total_records
+        
+        if quality_counts.get(DataQuality.HIGH.value):
+            overall_quality = DataQuality.HIGH
+        elif quality_counts.get(DataQuality.MEDIUM.value):
+            overall_quality = DataQuality.MEDIUM
+        else:
+            overall_quality = DataQuality.LOW
+        
+        return {
+            "commodity": commodity,
+            "data_quality": overall_quality.value,
+            "quality_score": round(overall_score, 2),
+            "total_records": total_records,
+            "validated_records": validated_records,
+            "quality_distribution": quality_counts,
+            "last_updated": counts["last_updated"].isoformat(),
+            "validation_summary": f"{validated_records}/{total_records} records validated"
+        }
+    
     def _calculate_price_summary(self, prices: List[MarketPrice]) -> Dict[str, Any]:
         """Calculate summary statistics for price data."""
         if not prices:
@@ -489,8 +922,7 @@ class MarketDataService:
         prices = []
         for record in records:
             try:
-                record.pop("_id", None)
-                prices.append(MarketPrice(**record))
+                prices.append(_market_price_from_doc(record))
             except Exception as e:
                 logger.warning(f"Error parsing price history record: {e}")
                 continue
@@ -512,7 +944,7 @@ class MarketDataService:
                     existing_keys = {f"{p.commodity}_{p.market}_{p.price_date}" for p in prices}
                     for price in external_prices:
                         key = f"{price.commodity}_{price.market}_{price.price_date}"
-                        if key not in existing_keys:
+                        if key not in existing_keys and price.is_validated:
                             prices.append(price)
                 
             except Exception as e:
@@ -644,13 +1076,12 @@ class MarketDataService:
                 try:
                     # Fetch recent data (last 7 days)
                     date_from = date.today() - timedelta(days=7)
-                    prices = await self.fetch_agmarknet_data(
+                    synced_count = await self.ingest_agmarknet_data(
                         commodity=commodity,
                         date_from=date_from
                     )
                     
-                    if prices:
-                        synced_count = await self.store_market_data(prices)
+                    if synced_count:
                         total_synced += synced_count
                         logger.info(f"Synced {synced_count} records for {commodity}")
                     
@@ -943,6 +1374,320 @@ class MarketDataService:
             "note": "Limited historical data - using estimated prices"
         }
     
+    @staticmethod
+    def _forecast_key(commodity: str, state: Optional[str] = None, market: Optional[str] = None) -> str:
+        """Build the normalized commodity|state|market key for forecast lookups."""
+        return "|".join(
+            (part or "all").strip().lower() for part in (commodity, state, market)
+        )
+    
+    async def get_price_forecast(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        days_ahead: int = 7
+    ) -> Dict[str, Any]:
+        """
+        Get a price forecast, preferring the latest precomputed version.
+        
+        Args:
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+            days_ahead: Number of days to forecast
+            
+        Returns:
+            Price prediction with forecast version and source
+        """
+        forecasts = await self.get_price_forecasts_batch(
+            [ForecastKey(commodity=commodity, state=state, market=market)],
+            days_ahead
+        )
+        return forecasts[0]
+    
+    async def get_price_forecasts_batch(
+        self,
+        keys: List[ForecastKey],
+        days_ahead: int = 7
+    ) -> List[Dict[str, Any]]:
+        """
+        Get price forecasts for many (commodity, state, market) keys at once.
+        
+        All precomputed forecasts are loaded with a single indexed read. Keys
+        without a fresh precomputed forecast are computed on demand and
+        written back so the next request is served from the collection.
+        
+        Args:
+            keys: Forecast keys to look up
+            days_ahead: Number of days to forecast
+            
+        Returns:
+            Forecasts in the same order as the requested keys
+        """
+        forecast_keys = [self._forecast_key(k.commodity, k.state, k.market) for k in keys]
+        await self._record_forecast_requests(dict(zip(forecast_keys, keys)))
+        forecasts = await self._load_precomputed_forecasts(set(forecast_keys), days_ahead)
+        
+        missing: Dict[str, ForecastKey] = {}
+        for key, forecast_key in zip(keys, forecast_keys):
+            if forecast_key not in forecasts:
+                missing.setdefault(forecast_key, key)
+        
+        if missing:
+            semaphore = asyncio.Semaphore(5)
+            
+            async def compute(key: ForecastKey) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.predict_price(
+                        commodity=key.commodity,
+                        state=key.state,
+                        market=key.market,
+                        days_ahead=days_ahead
+                    )
+            
+            computed = await asyncio.gather(*(compute(key) for key in missing.values()))
+            version = int(datetime.utcnow().timestamp())
+            
+            to_store = []
+            for (forecast_key, key), prediction in zip(missing.items(), computed):
+                prediction["forecast_version"] = None
+                prediction["forecast_source"] = "on_demand"
+                forecasts[forecast_key] = prediction
+                
+                if prediction.get("model_type") != "mock_forecast":
+                    to_store.append(self._build_price_forecast(key, prediction, version, days_ahead))
+            
+            await self._store_price_forecasts(to_store)
+        
+        return [forecasts[forecast_key] for forecast_key in forecast_keys]
+    
+    async def _record_forecast_requests(self, keys: Dict[str, ForecastKey]) -> None:
+        """
+        Record which forecast keys are requested, so the nightly run precomputes them.
+        
+        Each process writes a key at most once per
+        FORECAST_REQUEST_RECORD_INTERVAL_SECONDS, in one bulk write per batch.
+        """
+        now = time.monotonic()
+        due = {
+            forecast_key: key for forecast_key, key in keys.items()
+            if now - _recorded_forecast_requests.get(forecast_key, float("-inf"))
+            >= FORECAST_REQUEST_RECORD_INTERVAL_SECONDS
+        }
+        if not due:
+            return
+        
+        requested_at = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": forecast_key},
+                {"$set": {
+                    "commodity": key.commodity,
+                    "state": key.state,
+                    "market": key.market,
+                    "last_requested_at": requested_at
+                }},
+                upsert=True
+            )
+            for forecast_key, key in due.items()
+        ]
+        try:
+            await self.forecast_requests_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.warning(f"Error recording forecast requests: {e}")
+            return
+        
+        if len(_recorded_forecast_requests) > 10000:
+            _recorded_forecast_requests.clear()
+        _recorded_forecast_requests.update(dict.fromkeys(due, now))
+    
+    async def get_requested_forecast_keys(self, days: int = 7) -> List[ForecastKey]:
+        """
+        Get the forecast keys requested in the last days.
+        
+        Args:
+            days: Look-back window for requests
+            
+        Returns:
+            Requested (commodity, state, market) keys
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        try:
+            cursor = self.forecast_requests_collection.find({"last_requested_at": {"$gte": cutoff}})
+            return [
+                ForecastKey(commodity=doc["commodity"], state=doc.get("state"), market=doc.get("market"))
+                async for doc in cursor
+            ]
+        except Exception as e:
+            logger.warning(f"Error loading requested forecast keys: {e}")
+            return []
+    
+    async def _load_precomputed_forecasts(
+        self,
+        forecast_keys: set,
+        days_ahead: int
+    ) -> Dict[str, Dict[str, Any]]:
+        """Load the latest fresh precomputed forecast for each key."""
+        if not forecast_keys:
+            return {}
+        
+        cutoff = datetime.utcnow() - timedelta(hours=settings.FORECAST_MAX_AGE_HOURS)
+        query = {
+            "forecast_key": {"$in": list(forecast_keys)},
+            "days_ahead": {"$gte": days_ahead},
+            "generated_at": {"$gte": cutoff}
+        }
+        
+        today = date.today().isoformat()
+        forecasts: Dict[str, Dict[str, Any]] = {}
+        try:
+            cursor = self.price_forecasts_collection.find(query).sort(
+                [("forecast_key", 1), ("version", -1)]
+            )
+            async for doc in cursor:
+                forecast_key = doc["forecast_key"]
+                if forecast_key in forecasts:
+                    continue  # Older version of a key already served
+                
+                # Drop days that have already passed since the forecast was generated
+                upcoming = [
+                    p for p in doc["forecast"].get("predictions", [])
+                    if p.get("date", "") > today
+                ]
+                if len(upcoming) < days_ahead:
+                    continue
+                
+                prediction = dict(doc["forecast"])
+                prediction["predictions"] = upcoming[:days_ahead]
+                prediction["forecast_days"] = days_ahead
+                prediction["forecast_version"] = doc["version"]
+                prediction["forecast_source"] = "precomputed"
+                prediction["generated_at"] = doc["generated_at"].isoformat()
+                forecasts[forecast_key] = prediction
+        except Exception as e:
+            logger.warning(f"Error loading precomputed forecasts: {e}")
+        
+        return forecasts
+    
+    def _build_price_forecast(
+        self,
+        key: ForecastKey,
+        prediction: Dict[str, Any],
+        version: int,
+        days_ahead: int
+    ) -> PriceForecast:
+        """Wrap a prediction payload into a versioned forecast record."""
+        payload = {
+            k: v for k, v in prediction.items()
+            if k not in ("forecast_version", "forecast_source", "generated_at")
+        }
+        return PriceForecast(
+            forecast_key=self._forecast_key(key.commodity, key.state, key.market),
+            commodity=key.commodity,
+            state=key.state or "all",
+            market=key.market or "all",
+            version=version,
+            days_ahead=days_ahead,
+            forecast=payload
+        )
+    
+    async def _store_price_forecasts(self, forecasts: List[PriceForecast]) -> int:
+        """Upsert versioned forecast records."""
+        if not forecasts:
+            return 0
+        
+        operations = []
+        for forecast in forecasts:
+            doc = forecast.dict()
+            doc["_id"] = f"{forecast.forecast_key}:{forecast.version}"
+            operations.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        
+        try:
+            result = await self.price_forecasts_collection.bulk_write(operations, ordered=False)
+            return result.upserted_count + result.modified_count
+        except Exception as e:
+            logger.error(f"Error storing price forecasts: {e}")
+            return 0
+    
+    async def get_active_commodities(self, default_commodities: List[str], days: int = 7) -> List[str]:
+        """
+        Get commodities with recently updated market data.
+        
+        Args:
+            default_commodities: Commodities that are always included
+            days: Look-back window for recent updates
+            
+        Returns:
+            Sorted list of active commodity names
+        """
+        commodities = {c.strip().lower() for c in default_commodities}
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        
+        try:
+            recent = await self.market_prices_collection.distinct(
+                "commodity", {"last_updated": {"$gte": cutoff}}
+            )
+            commodities.update(c.strip().lower() for c in recent if c)
+        except Exception as e:
+            logger.warning(f"Error loading active commodities: {e}")
+        
+        return sorted(commodities)
+    
+    async def precompute_forecasts(
+        self,
+        commodities: List[str],
+        days_ahead: Optional[int] = None,
+        keys: Optional[List[ForecastKey]] = None
+    ) -> Dict[str, Any]:
+        """
+        Precompute next-N-day forecasts for commodities under a new version.
+        
+        One extra day is forecast so a nightly run still covers the full
+        horizon after the date rolls over.
+        
+        Args:
+            commodities: Commodity names to forecast across all markets
+            days_ahead: Number of days to forecast (defaults to FORECAST_DAYS_AHEAD)
+            keys: Further (commodity, state, market) keys to forecast, such as
+                the requested ones from get_requested_forecast_keys
+            
+        Returns:
+            Summary of the precompute run
+        """
+        days_ahead = days_ahead or settings.FORECAST_DAYS_AHEAD
+        horizon = days_ahead + 1
+        version = int(datetime.utcnow().timestamp())
+        forecasts = []
+        skipped = []
+        
+        unique_keys: Dict[str, ForecastKey] = {}
+        for key in [ForecastKey(commodity=commodity) for commodity in commodities] + list(keys or []):
+            unique_keys.setdefault(self._forecast_key(key.commodity, key.state, key.market), key)
+        
+        for forecast_key, key in unique_keys.items():
+            prediction = await self.predict_price(
+                commodity=key.commodity, state=key.state, market=key.market, days_ahead=horizon
+            )
+            
+            if prediction.get("model_type") == "mock_forecast":
+                skipped.append(forecast_key)
+            else:
+                forecasts.append(self._build_price_forecast(key, prediction, version, horizon))
+            
+            # Small delay to avoid overwhelming the API
+            await asyncio.sleep(1)
+        
+        stored = await self._store_price_forecasts(forecasts)
+        logger.info(f"Precomputed {stored} forecasts (version {version}), skipped {len(skipped)}")
+        
+        return {
+            "version": version,
+            "stored": stored,
+            "skipped": skipped,
+            "days_ahead": days_ahead
+        }
+    
     async def suggest_price_for_product(
         self,
         commodity: str,
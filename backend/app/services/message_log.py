@@ -0,0 +1,212 @@
+"""
+Write-behind log for chat messages.
+
+Messages from the WebSocket and REST chat paths are appended to an in-memory
+buffer and written in batches: one ordered insert_many for the messages and
+one bulk_write of merged conversation updates per flush. A flush runs every
+MESSAGE_LOG_FLUSH_INTERVAL_MS or as soon as MESSAGE_LOG_BATCH_SIZE messages
+are waiting, and once more on shutdown.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from ..core.config import settings
+from ..core.database import get_database
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class MessageLog:
+    """Buffers chat messages and flushes them to MongoDB in batches."""
+    
+    def __init__(
+        self,
+        database=None,
+        flush_interval_ms: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_buffer: Optional[int] = None
+    ):
+        self.database = database
+        self.flush_interval = (flush_interval_ms or settings.MESSAGE_LOG_FLUSH_INTERVAL_MS) / 1000
+        self.batch_size = batch_size or settings.MESSAGE_LOG_BATCH_SIZE
+        self.max_buffer = max_buffer or settings.MESSAGE_LOG_MAX_BUFFER
+        
+        self._messages: List[Dict[str, Any]] = []
+        # conversation_id -> {"updated_at": datetime, "unread": {user_id: count}}
+        self._conversations: Dict[str, Dict[str, Any]] = {}
+        # Conversations in the batch currently being written
+        self._flushing: Dict[str, Dict[str, Any]] = {}
+        
+        self._flush_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+        self._flusher_task: Optional[asyncio.Task] = None
+    
+    @property
+    def pending(self) -> int:
+        """Number of messages waiting to be written."""
+        return len(self._messages)
+    
+    def has_pending(self, conversation_id: Optional[str] = None) -> bool:
+        """
+        Check for unwritten messages, optionally for one conversation.
+        
+        Messages in a batch that is still being written count as unwritten,
+        so a reader that calls flush() waits for that write to finish.
+        """
+        if conversation_id is None:
+            return bool(self._messages) or bool(self._flushing)
+        return conversation_id in self._conversations or conversation_id in self._flushing
+    
+    def append(self, message: Dict[str, Any], recipient_id: Optional[str] = None) -> None:
+        """
+        Queue a message document for writing.
+        
+        Args:
+            message: Message document with _id, conversation_id and created_at
+            recipient_id: Participant whose unread count is incremented (optional)
+        """
+        if len(self._messages) >= self.max_buffer:
+            dropped = self._messages.pop(0)
+            logger.error(
+                f"Message log buffer full, dropping message {dropped['_id']} "
+                f"in conversation {dropped['conversation_id']}"
+            )
+        
+        self._messages.append(message)
+        
+        update = self._conversations.get(message["conversation_id"])
+        if update is None:
+            update = self._conversations[message["conversation_id"]] = {
+                "updated_at": message["created_at"],
+                "unread": {},
+            }
+        update["updated_at"] = max(update["updated_at"], message["created_at"])
+        if recipient_id:
+            update["unread"][recipient_id] = update["unread"].get(recipient_id, 0) + 1
+        
+        if len(self._messages) >= self.batch_size:
+            self._batch_ready.set()
+    
+    async def flush(self) -> int:
+        """
+        Write all buffered messages and conversation updates.
+        
+        Flushes run one at a time and messages keep their append order, so
+        each conversation is written in order. A failed batch is put back at
+        the front of the buffer for the next flush.
+        
+        Returns:
+            Number of messages written
+        """
+        async with self._flush_lock:
+            if not self._messages and not self._conversations:
+                return 0
+            
+            messages, self._messages = self._messages, []
+            conversations, self._conversations = self._conversations, {}
+            self._flushing = conversations
+            self._batch_ready.clear()
+            
+            try:
+                database = self.database if self.database is not None else await get_database()
+                written = await self._insert_messages(database, messages)
+                messages = []
+                
+                operations = []
+                for conversation_id, update in conversations.items():
+                    change: Dict[str, Any] = {"$set": {"updated_at": update["updated_at"]}}
+                    if update["unread"]:
+                        change["$inc"] = {
+                            f"unread_count.{user_id}": count
+                            for user_id, count in update["unread"].items()
+                        }
+                    operations.append(UpdateOne({"_id": conversation_id}, change))
+                
+                if operations:
+                    await database.conversations.bulk_write(operations, ordered=False)
+                
+                logger.debug(f"Flushed {written} chat messages for {len(conversations)} conversations")
+                return written
+            
+            except Exception as e:
+                logger.error(f"Error flushing chat messages: {e}")
+                self._requeue(messages, conversations)
+                return 0
+            
+            finally:
+                self._flushing = {}
+    
+    async def _insert_messages(self, database, messages: List[Dict[str, Any]]) -> int:
+        """Insert messages in order, skipping ones written by an earlier attempt."""
+        written = 0
+        while messages:
+            try:
+                await database.messages.insert_many(messages, ordered=True)
+                return written + len(messages)
+            except BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0)
+                errors = e.details.get("writeErrors", [])
+                if not errors or errors[0].get("code") != DUPLICATE_KEY_ERROR:
+                    # Rows already inserted are skipped as duplicates on retry
+                    raise
+                
+                # Ordered inserts stop at the duplicate; continue after it
+                written += inserted
+                messages = messages[errors[0]["index"] + 1:]
+        return written
+    
+    def _requeue(self, messages: List[Dict[str, Any]], conversations: Dict[str, Dict[str, Any]]) -> None:
+        """Put an unwritten batch back in front of anything appended since."""
+        self._messages = messages + self._messages
+        if len(self._messages) > self.max_buffer:
+            overflow = len(self._messages) - self.max_buffer
+            logger.error(f"Message log buffer full, dropping {overflow} oldest messages")
+            del self._messages[:overflow]
+        
+        for conversation_id, update in conversations.items():
+            current = self._conversations.get(conversation_id)
+            if current is None:
+                self._conversations[conversation_id] = update
+                continue
+            current["updated_at"] = max(current["updated_at"], update["updated_at"])
+            for user_id, count in update["unread"].items():
+                current["unread"][user_id] = current["unread"].get(user_id, 0) + count
+    
+    async def start(self) -> None:
+        """Start the background flusher."""
+        if self._flusher_task is None or self._flusher_task.done():
+            self._flusher_task = asyncio.create_task(self._run())
+            logger.info("Message log flusher started")
+    
+    async def stop(self) -> None:
+        """Stop the background flusher and write everything still buffered."""
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        
+        written = await self.flush()
+        logger.info(f"Message log flusher stopped after writing {written} buffered messages")
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            
+            await self.flush()
+
+
+# Global message log instance
+message_log = MessageLog()
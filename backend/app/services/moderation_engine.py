@@ -0,0 +1,173 @@
+"""
+Compiled keyword moderation engine.
+
+All moderation terms are compiled into one character trie. A single regular
+expression finds the word starts that can begin a term, with word boundaries
+that also hold for Indic scripts, and the trie is walked from each of them,
+so a piece of content is checked against every rule in one scan instead of
+one substring search per keyword. Every term ending on a word boundary is
+reported, including terms nested in or overlapping longer ones. Content and
+terms are Unicode-normalized so Devanagari spelled with precomposed or
+combining nukta characters match the same way.
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Letters, digits and the letters, vowel signs, viramas and digits of the Indic
+# script blocks (Devanagari to Malayalam), some of which \w does not match.
+# Punctuation such as the danda (U+0964) and double danda (U+0965) that end
+# Hindi sentences, and symbols, are left out so they end a word.
+_WORD_CHARS = r"\w" + "".join(
+    chr(code) for code in range(0x0900, 0x0D80)
+    if unicodedata.category(chr(code))[0] in "LMN"
+)
+_WORD_CHAR = re.compile(rf"[{_WORD_CHARS}]")
+
+
+class ModerationRule(NamedTuple):
+    """A moderation term and the issue it raises."""
+    term: str
+    issue_type: str
+    severity: str
+    confidence: float
+    field: str = "indicator"
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for matching: NFC and case-folded."""
+    return unicodedata.normalize("NFC", text).casefold()
+
+
+def _build_trie(terms: Iterable[str]) -> Dict[str, Any]:
+    """
+    Build a character trie of terms.
+    
+    Each node maps a character to its child; a node that ends a term also
+    maps "" to that term.
+    """
+    trie: Dict[str, Any] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = term
+    return trie
+
+
+class ModerationEngine:
+    """Matches content against all moderation rules in a single pass."""
+    
+    def __init__(self, rules: Iterable[ModerationRule], caps_ratio: float = 0.5, caps_min_length: int = 10):
+        self.caps_ratio = caps_ratio
+        self.caps_min_length = caps_min_length
+        
+        # term -> [(rule order, rule)], so one match can raise several issues
+        self._rules: Dict[str, List[Tuple[int, ModerationRule]]] = {}
+        for order, rule in enumerate(rules):
+            term = normalize_text(rule.term).strip()
+            if term:
+                self._rules.setdefault(term, []).append((order, rule))
+        
+        self._trie = _build_trie(self._rules)
+        
+        # Zero-width matches at each word start where some term can begin,
+        # so terms starting inside another match are still found
+        self._starts: Optional[re.Pattern] = None
+        if self._rules:
+            first_chars = "".join(re.escape(char) for char in sorted(self._trie))
+            self._starts = re.compile(rf"(?<![{_WORD_CHARS}])(?=[{first_chars}])")
+    
+    @classmethod
+    def from_keywords(
+        cls,
+        keywords: Iterable[str],
+        community_rules: Dict[str, Iterable[str]],
+        **kwargs: Any
+    ) -> "ModerationEngine":
+        """
+        Build an engine from keyword lists in the AIService format.
+        
+        Args:
+            keywords: Inappropriate keywords, raised as high severity issues
+            community_rules: Rule type to indicator phrases, raised as medium severity
+        
+        Returns:
+            Compiled ModerationEngine
+        """
+        rules = [
+            ModerationRule(keyword, "inappropriate_content", "high", 0.8, "keyword")
+            for keyword in keywords
+        ]
+        for rule_type, indicators in community_rules.items():
+            rules.extend(
+                ModerationRule(indicator, rule_type, "medium", 0.6)
+                for indicator in indicators
+            )
+        return cls(rules, **kwargs)
+    
+    @property
+    def rule_count(self) -> int:
+        """Number of distinct compiled terms."""
+        return len(self._rules)
+    
+    def scan(self, content: str) -> Tuple[List[Dict[str, Any]], List[float]]:
+        """
+        Find every rule violation in content.
+        
+        Args:
+            content: Text to check
+        
+        Returns:
+            Issues in rule order, each reported once, and their confidence scores
+        """
+        issues: List[Dict[str, Any]] = []
+        confidences: List[float] = []
+        
+        found: Dict[int, ModerationRule] = {}
+        if self._starts is not None and content:
+            for term in self._find_terms(normalize_text(content)):
+                for order, rule in self._rules[term]:
+                    found[order] = rule
+        
+        for order in sorted(found):
+            rule = found[order]
+            issues.append({"type": rule.issue_type, rule.field: rule.term, "severity": rule.severity})
+            confidences.append(rule.confidence)
+        
+        # Shouting: mostly capital letters
+        if len(content) > self.caps_min_length:
+            capitals = sum(map(str.isupper, content))
+            if capitals / len(content) > self.caps_ratio:
+                issues.append({"type": "excessive_caps", "indicator": "shouting", "severity": "low"})
+                confidences.append(0.5)
+        
+        return issues, confidences
+    
+    def _find_terms(self, text: str) -> Iterator[str]:
+        """Yield every term in text that starts and ends on a word boundary."""
+        end = len(text)
+        for start in self._starts.finditer(text):
+            node = self._trie
+            position = start.start()
+            while position < end:
+                node = node.get(text[position])
+                if node is None:
+                    break
+                position += 1
+                # Shorter terms along the way count too, not only the longest
+                if "" in node and (position == end or not _WORD_CHAR.match(text, position)):
+                    yield node[""]
+    
+    def scan_batch(self, contents: Iterable[str]) -> List[Tuple[List[Dict[str, Any]], List[float]]]:
+        """
+        Scan many pieces of content with the compiled rules.
+        
+        Args:
+            contents: Texts to check
+        
+        Returns:
+            Issues and confidence scores per text, in input order
+        """
+        return [self.scan(content) for content in contents]
@@ -0,0 +1,363 @@
+"""
+Market-aware negotiation suggestions for price offers.
+
+Offers are priced against the commodity's market summary from
+MarketDataService. Summaries are held in a cache shared by all requests on
+the worker, and concurrent lookups of the same commodity wait on a single
+fetch. Each cached summary is a price snapshot with its own version, and
+suggestions are memoized per (offer, snapshot version), so open offers are
+only re-evaluated when the market moves or the summary expires.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.database import get_database
+from .ai_service import ai_service
+from .market_data_service import MarketDataService
+from .price_store import price_store
+
+logger = logging.getLogger(__name__)
+
+# (commodity, state, market), normalized
+MarketKey = Tuple[str, str, str]
+
+# (category, subcategory) -> market commodity name, as synced from Agmarknet.
+# Product names are free text in any language, so offers are priced by the
+# product's category and subcategory instead.
+COMMODITY_BY_SUBCATEGORY: Dict[Tuple[str, str], str] = {
+    ("vegetables", "onion"): "onion",
+    ("vegetables", "onions"): "onion",
+    ("vegetables", "potato"): "potato",
+    ("vegetables", "potatoes"): "potato",
+    ("vegetables", "tomato"): "tomato",
+    ("vegetables", "tomatoes"): "tomato",
+    ("grains", "rice"): "rice",
+    ("grains", "paddy"): "rice",
+    ("grains", "wheat"): "wheat",
+    ("grains", "maize"): "maize",
+    ("grains", "corn"): "maize",
+    ("fruits", "apple"): "apple",
+    ("fruits", "apples"): "apple",
+    ("fruits", "banana"): "banana",
+    ("fruits", "bananas"): "banana",
+    ("fruits", "mango"): "mango",
+    ("fruits", "mangoes"): "mango",
+    ("fruits", "orange"): "orange",
+    ("fruits", "oranges"): "orange",
+    ("fruits", "grapes"): "grapes",
+    ("spices", "turmeric"): "turmeric",
+    ("spices", "haldi"): "turmeric",
+    ("spices", "coriander"): "coriander",
+    ("spices", "dhania"): "coriander",
+    ("spices", "cumin"): "cumin",
+    ("spices", "jeera"): "cumin",
+    ("spices", "chilli"): "chilli",
+    ("spices", "chillies"): "chilli",
+    ("spices", "mirchi"): "chilli",
+    ("dairy", "milk"): "milk",
+    ("dairy", "ghee"): "ghee",
+    ("dairy", "paneer"): "paneer",
+}
+
+
+def commodity_for_product(product: Dict[str, Any]) -> Optional[str]:
+    """
+    Get the market commodity a product is priced against.
+    
+    Args:
+        product: Product document with category and subcategory
+    
+    Returns:
+        Commodity name, or None if the product has no market commodity
+    """
+    category = (product.get("category") or "").strip().lower()
+    subcategory = (product.get("subcategory") or "").strip().lower()
+    return COMMODITY_BY_SUBCATEGORY.get((category, subcategory))
+
+
+class PriceSnapshot:
+    """A cached market summary and the version suggestions are memoized against."""
+    
+    __slots__ = ("version", "summary", "store_version", "expires_at")
+    
+    def __init__(self, version: int, summary: Dict[str, Any], store_version: int, expires_at: float):
+        self.version = version
+        self.summary = summary
+        self.store_version = store_version
+        self.expires_at = expires_at
+    
+    @property
+    def market_average(self) -> Optional[float]:
+        """Average market price, or None without market data."""
+        if not self.summary.get("count"):
+            return None
+        return float(self.summary["avg_price"])
+
+
+# Snapshot for products without a market commodity; versions otherwise start at 1
+NO_MARKET_DATA = PriceSnapshot(0, {}, 0, 0.0)
+
+
+class NegotiationAdvisor:
+    """Suggests responses to price offers using stored market data."""
+    
+    def __init__(
+        self,
+        database=None,
+        market_service: Optional[MarketDataService] = None,
+        summary_ttl: Optional[int] = None,
+        memo_size: Optional[int] = None
+    ):
+        self.database = database
+        self.market_service = market_service
+        self.summary_ttl = summary_ttl or settings.NEGOTIATION_SUMMARY_TTL_SECONDS
+        self.memo_size = memo_size or settings.NEGOTIATION_MEMO_SIZE
+        
+        self._snapshots: Dict[MarketKey, PriceSnapshot] = {}
+        self._pending: Dict[MarketKey, asyncio.Task] = {}
+        self._snapshot_version = 0
+        # (offer_id, snapshot version) -> suggestion, least recently used first
+        self._memo: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self.stats = {"snapshot_hits": 0, "snapshot_fetches": 0, "memo_hits": 0, "computed": 0}
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def _get_market_service(self) -> MarketDataService:
+        if self.market_service is None:
+            service = MarketDataService(await self._get_database())
+            await service.initialize()
+            self.market_service = service
+        return self.market_service
+    
+    @staticmethod
+    def _market_key(commodity: str, state: Optional[str] = None, market: Optional[str] = None) -> MarketKey:
+        return tuple((part or "").strip().lower() for part in (commodity, state, market))
+    
+    async def get_snapshot(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None
+    ) -> PriceSnapshot:
+        """
+        Get the cached market summary for a commodity, fetching it if needed.
+        
+        A snapshot is refetched once it expires or the in-memory price store
+        has newer rows for the commodity.
+        
+        Args:
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+        
+        Returns:
+            Current price snapshot
+        """
+        key = self._market_key(commodity, state, market)
+        snapshot = self._snapshots.get(key)
+        if (
+            snapshot is not None
+            and snapshot.expires_at > time.monotonic()
+            and snapshot.store_version == price_store.version(key[0])
+        ):
+            self.stats["snapshot_hits"] += 1
+            return snapshot
+        
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(
+                self._fetch_snapshot(key, commodity, state, market)
+            )
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _fetch_snapshot(
+        self,
+        key: MarketKey,
+        commodity: str,
+        state: Optional[str],
+        market: Optional[str]
+    ) -> PriceSnapshot:
+        store_version = price_store.version(key[0])
+        self.stats["snapshot_fetches"] += 1
+        
+        try:
+            service = await self._get_market_service()
+            summary = await service.get_market_summary(commodity, state=state, market=market)
+        except Exception as e:
+            # Not cached, so the next lookup tries again
+            logger.error(f"Error fetching market summary for {commodity}: {e}")
+            self._snapshot_version += 1
+            return PriceSnapshot(self._snapshot_version, {}, store_version, time.monotonic())
+        
+        previous = self._snapshots.get(key)
+        if previous is not None and previous.summary == summary and previous.store_version == store_version:
+            # Unchanged market: keep the version so memoized suggestions stay valid
+            version = previous.version
+        else:
+            self._snapshot_version += 1
+            version = self._snapshot_version
+        
+        snapshot = PriceSnapshot(version, summary, store_version, time.monotonic() + self.summary_ttl)
+        self._snapshots[key] = snapshot
+        return snapshot
+    
+    def invalidate(self, commodity: Optional[str] = None) -> None:
+        """Drop cached snapshots, for one commodity or all of them."""
+        if commodity is None:
+            self._snapshots.clear()
+            return
+        
+        name = self._market_key(commodity)[0]
+        for key in [k for k in self._snapshots if k[0] == name]:
+            del self._snapshots[key]
+    
+    async def suggest(
+        self,
+        current_price: float,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        fallback_average: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Suggest a response to a price using the commodity's market summary.
+        
+        Args:
+            current_price: Offered price
+            commodity: Commodity name
+            state: State name (optional)
+            market: Market name (optional)
+            fallback_average: Market average to use when there is no market data
+        
+        Returns:
+            Negotiation suggestion with the market data it is based on
+        """
+        snapshot = await self.get_snapshot(commodity, state, market)
+        return await self._build_suggestion(current_price, commodity, snapshot, fallback_average)
+    
+    async def _build_suggestion(
+        self,
+        current_price: float,
+        commodity: str,
+        snapshot: PriceSnapshot,
+        fallback_average: Optional[float] = None
+    ) -> Dict[str, Any]:
+        market_average = snapshot.market_average
+        context = {"current_price": current_price, "commodity": commodity}
+        if market_average is not None:
+            context["market_average"] = market_average
+        elif fallback_average is not None:
+            context["market_average"] = fallback_average
+        
+        suggestion = await ai_service.generate_negotiation_suggestion(context)
+        suggestion["market_data_points"] = snapshot.summary.get("count", 0)
+        suggestion["price_trend"] = snapshot.summary.get("price_trend", "no_data")
+        suggestion["snapshot_version"] = snapshot.version
+        self.stats["computed"] += 1
+        return suggestion
+    
+    async def suggest_for_offers(self, offers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Suggest responses to many offers at once.
+        
+        Products are loaded in one query, each distinct commodity and market
+        is summarized once, and suggestions are memoized per offer and price
+        snapshot. Products whose category and subcategory map to no market
+        commodity are suggested without market data.
+        
+        Args:
+            offers: Offer documents with _id, product_id and price
+        
+        Returns:
+            Suggestions in the same order as the offers, each with its offer_id
+        """
+        if not offers:
+            return []
+        
+        product_ids = list({offer["product_id"] for offer in offers if offer.get("product_id")})
+        products: Dict[str, Dict[str, Any]] = {}
+        if product_ids:
+            database = await self._get_database()
+            documents = await database.products.find(
+                {"product_id": {"$in": product_ids}},
+                {"product_id": 1, "name": 1, "category": 1, "subcategory": 1, "location": 1}
+            ).to_list(length=None)
+            products = {doc["product_id"]: doc for doc in documents}
+        
+        # (commodity or None, state, market) per offer, None without a product
+        targets: List[Optional[Tuple[Optional[str], Optional[str], Optional[str]]]] = []
+        for offer in offers:
+            product = products.get(offer.get("product_id"))
+            if product is None:
+                targets.append(None)
+                continue
+            location = product.get("location") or {}
+            targets.append((commodity_for_product(product), location.get("state"), location.get("market_name")))
+        
+        # Products without a market commodity are not looked up
+        distinct = {self._market_key(*target): target for target in targets if target and target[0]}
+        snapshots = dict(zip(
+            distinct,
+            await asyncio.gather(*(self.get_snapshot(*target) for target in distinct.values()))
+        ))
+        
+        suggestions = []
+        for offer, target in zip(offers, targets):
+            if target is None:
+                suggestions.append({
+                    "offer_id": offer["_id"],
+                    "suggestion_type": "error",
+                    "message": "Product not found for offer",
+                    "confidence": 0.0
+                })
+                continue
+            
+            if target[0]:
+                commodity = target[0]
+                snapshot = snapshots[self._market_key(*target)]
+            else:
+                product = products[offer["product_id"]]
+                commodity = (product.get("name") or {}).get("original_text") or "product"
+                snapshot = NO_MARKET_DATA
+            
+            memo_key = (offer["_id"], snapshot.version)
+            suggestion = self._memo.get(memo_key)
+            if suggestion is not None:
+                self._memo.move_to_end(memo_key)
+                self.stats["memo_hits"] += 1
+            else:
+                suggestion = await self._build_suggestion(float(offer["price"]), commodity, snapshot)
+                suggestion["offer_id"] = offer["_id"]
+                self._memo[memo_key] = suggestion
+                if len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+            suggestions.append(suggestion)
+        
+        return suggestions
+    
+    async def suggest_for_vendor(self, vendor_id: str) -> List[Dict[str, Any]]:
+        """
+        Suggest responses to all of a vendor's pending offers.
+        
+        Args:
+            vendor_id: Seller user ID
+        
+        Returns:
+            Suggestions for each pending offer, newest first
+        """
+        database = await self._get_database()
+        offers = await database.offers.find(
+            {"seller_id": vendor_id, "status": "pending"}
+        ).sort("created_at", -1).to_list(length=None)
+        return await self.suggest_for_offers(offers)
+
+
+# Global negotiation advisor instance
+negotiation_advisor = NegotiationAdvisor()
@@ -0,0 +1,324 @@
+"""
+Payment confirmation with idempotency keys (mock gateway).
+
+Confirming a payment intent first claims it with one conditional update from
+"pending" to "processing", and only the confirmation that wins the claim
+calls the gateway. The outcome is then stored on the intent together with
+the transaction and the result returned to the client, so retries never
+charge twice and are answered from the stored result. The transactions
+collection is written from the stored copy and has a unique index on
+intent_id. A claim left in "processing" for longer than
+PAYMENT_PROCESSING_TIMEOUT_SECONDS, e.g. by a crashed worker, may be taken
+over by a later confirmation, and only the current claim stores a result.
+Intents can only be confirmed by the user they belong to.
+
+Clients may also send an idempotency key. Keys are stored per user in
+payment_idempotency, where the _id is the unique index, and finished
+results are kept in Redis so repeated retries skip the database.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from ..core.config import settings
+from ..core.database import get_database
+from ..core.exceptions import ConflictException, NotFoundException, ValidationException
+from ..core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_CACHE_PREFIX = "payment:idempotency:"
+
+# Share of mock payments the gateway approves
+MOCK_APPROVAL_RATE = 0.95
+
+
+def generate_transaction_id() -> str:
+    """Generate a unique transaction ID."""
+    timestamp = datetime.utcnow().isoformat()
+    random_part = str(random.randint(1000, 9999))
+    hash_input = f"{timestamp}-{random_part}".encode()
+    return f"TXN{hashlib.md5(hash_input).hexdigest()[:12].upper()}"
+
+
+def generate_payment_reference() -> str:
+    """Generate a payment reference number."""
+    return f"PAY{random.randint(100000, 999999)}"
+
+
+class PaymentService:
+    """Exactly-once confirmation of payment intents."""
+    
+    def __init__(
+        self,
+        database=None,
+        idempotency_ttl_hours: Optional[int] = None,
+        processing_timeout_seconds: Optional[int] = None,
+        approve: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ):
+        self.database = database
+        self.idempotency_ttl = timedelta(
+            hours=idempotency_ttl_hours or settings.PAYMENT_IDEMPOTENCY_TTL_HOURS
+        )
+        self.processing_timeout = timedelta(
+            seconds=processing_timeout_seconds or settings.PAYMENT_PROCESSING_TIMEOUT_SECONDS
+        )
+        self.approve = approve or (lambda intent: random.random() < MOCK_APPROVAL_RATE)
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def initialize(self) -> None:
+        """Create indexes for transactions and idempotency keys."""
+        try:
+            db = await self._get_database()
+            await db.transactions.create_index(
+                "intent_id",
+                unique=True,
+                partialFilterExpression={"intent_id": {"$exists": True}}
+            )
+            await db.payment_idempotency.create_index(
+                "created_at",
+                expireAfterSeconds=int(self.idempotency_ttl.total_seconds())
+            )
+        except Exception as e:
+            logger.error(f"Error creating payment indexes: {e}")
+    
+    async def confirm(
+        self,
+        intent_id: str,
+        user_id: str,
+        payment_details: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Confirm a payment intent at most once.
+        
+        Args:
+            intent_id: Payment intent ID
+            user_id: ID of the paying user
+            payment_details: Method-specific details stored with the transaction
+            idempotency_key: Client key identifying retries of the same request
+        
+        Returns:
+            Outcome with status "succeeded" and the transaction details, or
+            status "failed" and the decline error
+        
+        Raises:
+            NotFoundException: If the intent does not exist or belongs to
+                another user
+            ValidationException: If the intent expired or was already closed
+                without a result
+            ConflictException: If the key is in use by another request
+        """
+        if not idempotency_key:
+            return await self._confirm_intent(intent_id, user_id, payment_details or {})
+        
+        scope = f"{user_id}:{idempotency_key}"
+        cached = await self._get_cached(scope, intent_id)
+        if cached is not None:
+            return cached
+        
+        db = await self._get_database()
+        try:
+            await db.payment_idempotency.insert_one({
+                "_id": scope,
+                "intent_id": intent_id,
+                "outcome": None,
+                "created_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            return await self._replay(db, scope, intent_id)
+        
+        try:
+            outcome = await self._confirm_intent(intent_id, user_id, payment_details or {})
+        except Exception:
+            # Nothing was stored, so the key may be retried
+            await db.payment_idempotency.delete_one({"_id": scope})
+            raise
+        
+        await db.payment_idempotency.update_one({"_id": scope}, {"$set": {"outcome": outcome}})
+        await self._set_cached(scope, intent_id, outcome)
+        return outcome
+    
+    async def _replay(self, db, scope: str, intent_id: str) -> Dict[str, Any]:
+        """Answer a retried idempotency key from its stored outcome."""
+        record = await db.payment_idempotency.find_one({"_id": scope})
+        if record is None:
+            raise ConflictException("Idempotency key is being released, retry the request")
+        if record["intent_id"] != intent_id:
+            raise ConflictException(
+                "Idempotency key was used for another payment intent",
+                details={"intent_id": record["intent_id"]}
+            )
+        if record.get("outcome") is None:
+            raise ConflictException("A request with this idempotency key is in progress")
+        
+        await self._set_cached(scope, intent_id, record["outcome"])
+        return record["outcome"]
+    
+    async def _confirm_intent(
+        self,
+        intent_id: str,
+        user_id: str,
+        payment_details: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        db = await self._get_database()
+        # Other users' intents are reported as missing
+        owned = {"_id": intent_id, "user_id": user_id}
+        intent = await db.payment_intents.find_one(owned)
+        if not intent:
+            raise NotFoundException("Payment intent not found")
+        
+        now = datetime.utcnow()
+        stale_before = now - self.processing_timeout
+        claimable = {
+            **owned,
+            "$or": [
+                {"status": "pending"},
+                # A claim whose confirmation never finished
+                {"status": "processing", "processing_at": {"$lt": stale_before}}
+            ]
+        }
+        stale = intent["status"] == "processing" and intent["processing_at"] < stale_before
+        if intent["status"] != "pending" and not stale:
+            return await self._stored_outcome(db, intent)
+        
+        if now > intent["expires_at"]:
+            await db.payment_intents.update_one(claimable, {"$set": {"status": "expired"}})
+            raise ValidationException("Payment intent expired")
+        
+        # Only one confirmation can claim the intent and call the gateway
+        claim_id = uuid.uuid4().hex
+        claimed = await db.payment_intents.find_one_and_update(
+            claimable,
+            {"$set": {"status": "processing", "processing_at": now, "claim_id": claim_id}}
+        )
+        if claimed is None:
+            # A concurrent confirmation won; answer with its result
+            return await self._stored_outcome(db, await db.payment_intents.find_one(owned))
+        
+        # Writes below only apply while this confirmation still holds the claim
+        claim = {"_id": intent_id, "status": "processing", "claim_id": claim_id}
+        try:
+            approved = self.approve(intent)
+        except Exception:
+            # The gateway was not reached, so the intent may be confirmed again
+            await db.payment_intents.update_one(claim, {"$set": {"status": "pending"}})
+            raise
+        
+        if approved:
+            transaction_id = generate_transaction_id()
+            payment_reference = generate_payment_reference()
+            transaction = {
+                "_id": transaction_id,
+                "user_id": user_id,
+                "intent_id": intent_id,
+                "amount": intent["amount"],
+                "currency": intent["currency"],
+                "payment_method": intent["payment_method"],
+                "payment_reference": payment_reference,
+                "description": intent["description"],
+                "status": "completed",
+                "completed_at": now,
+                "metadata": payment_details
+            }
+            outcome = {
+                "status": "succeeded",
+                "transaction_id": transaction_id,
+                "payment_reference": payment_reference,
+                "amount": intent["amount"],
+                "currency": intent["currency"],
+                "payment_method": intent["payment_method"],
+                "message": "Payment processed successfully (Mock)",
+                "receipt_url": f"/api/v1/payments/receipt/{transaction_id}"
+            }
+            update = {
+                "status": "succeeded",
+                "transaction_id": transaction_id,
+                "transaction": transaction,
+                "outcome": outcome,
+                "completed_at": now
+            }
+        else:
+            outcome = {
+                "status": "failed",
+                "error": "Payment declined - insufficient funds or authentication failure (Mock)"
+            }
+            update = {
+                "status": "failed",
+                "error": "Payment declined by mock gateway",
+                "outcome": outcome,
+                "failed_at": now
+            }
+        
+        result = await db.payment_intents.update_one(claim, {"$set": update})
+        if not result.modified_count:
+            # Taken over after the timeout; the new claim's result stands
+            return await self._stored_outcome(db, await db.payment_intents.find_one(owned))
+        
+        if "transaction" in update:
+            await self._write_transaction(db, update["transaction"])
+        return outcome
+    
+    async def _stored_outcome(self, db, intent: Dict[str, Any]) -> Dict[str, Any]:
+        """Result of an intent that is no longer pending."""
+        outcome = intent.get("outcome")
+        if outcome is None:
+            if intent["status"] == "processing":
+                raise ConflictException("Payment is being processed, retry the request")
+            raise ValidationException(f"Payment already {intent['status']}")
+        
+        # Finish a confirmation that stopped before writing its transaction
+        if intent.get("transaction"):
+            await self._write_transaction(db, intent["transaction"])
+        return outcome
+    
+    @staticmethod
+    async def _write_transaction(db, transaction: Dict[str, Any]) -> None:
+        fields = {key: value for key, value in transaction.items() if key != "_id"}
+        await db.transactions.update_one(
+            {"_id": transaction["_id"]},
+            {"$setOnInsert": fields},
+            upsert=True
+        )
+    
+    async def _get_cached(self, scope: str, intent_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            client = await get_redis()
+            value = await client.get(IDEMPOTENCY_CACHE_PREFIX + scope)
+            cached = json.loads(value) if value else None
+        except Exception as e:
+            logger.warning(f"Error reading idempotency cache: {e}")
+            return None
+        
+        if cached is None:
+            return None
+        if cached["intent_id"] != intent_id:
+            raise ConflictException(
+                "Idempotency key was used for another payment intent",
+                details={"intent_id": cached["intent_id"]}
+            )
+        return cached["outcome"]
+    
+    async def _set_cached(self, scope: str, intent_id: str, outcome: Dict[str, Any]) -> None:
+        try:
+            client = await get_redis()
+            await client.setex(
+                IDEMPOTENCY_CACHE_PREFIX + scope,
+                int(self.idempotency_ttl.total_seconds()),
+                json.dumps({"intent_id": intent_id, "outcome": outcome}, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"Error caching idempotency result: {e}")
+
+
+# Global payment service instance
+payment_service = PaymentService()
@@ -0,0 +1,529 @@
+"""
+Columnar in-memory price store for hot commodities.
+
+Each worker keeps recent market prices for the most requested commodities as
+typed arrays per (commodity, market), so price summaries and data quality
+reports can be computed without MongoDB reads or MarketPrice construction.
+The store is filled when market data is stored during sync and kept
+consistent across workers through Redis pub/sub. A sync only brings in the
+last few days, so a commodity's earlier rows are backfilled from MongoDB
+before the store answers for a window it does not yet cover.
+
+Every row costs 38 bytes (4-byte date ordinal, three 8-byte prices, 8-byte
+arrivals, 1-byte quality code and 1-byte validated flag), which is about
+36 MiB per million rows plus a small fixed overhead per series.
+"""
+
+import asyncio
+import json
+import logging
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from ..core.config import settings
+from ..core.redis import get_redis
+from ..models.market_data import DataQuality, MarketPrice
+
+logger = logging.getLogger(__name__)
+
+PRICE_STORE_CHANNEL = "market_prices:updates"
+
+# Quality codes stored in the quality column, indexed by enum position
+QUALITY_CODES: List[DataQuality] = list(DataQuality)
+NO_ARRIVALS = -1
+
+# (date ordinal, min, max, modal, arrivals, quality code, validated)
+PriceRow = Tuple[int, float, float, float, int, int, int]
+
+
+class PriceSeries:
+    """Date-sorted price columns for a single (commodity, market)."""
+    
+    __slots__ = (
+        "state", "dates", "min_prices", "max_prices", "modal_prices",
+        "arrivals", "quality", "validated", "last_updated",
+    )
+    
+    def __init__(self, state: str):
+        self.state = state
+        self.dates = array("I")
+        self.min_prices = array("d")
+        self.max_prices = array("d")
+        self.modal_prices = array("d")
+        self.arrivals = array("q")
+        self.quality = array("b")
+        self.validated = array("b")
+        self.last_updated = datetime.utcnow()
+    
+    def __len__(self) -> int:
+        return len(self.dates)
+    
+    def _columns(self) -> Tuple[array, ...]:
+        return (
+            self.dates, self.min_prices, self.max_prices, self.modal_prices,
+            self.arrivals, self.quality, self.validated,
+        )
+    
+    def upsert(self, row: PriceRow) -> None:
+        """Insert a row in date order, replacing any row for the same date."""
+        index = bisect_left(self.dates, row[0])
+        columns = self._columns()
+        
+        if index < len(self.dates) and self.dates[index] == row[0]:
+            for column, value in zip(columns, row):
+                column[index] = value
+        else:
+            for column, value in zip(columns, row):
+                column.insert(index, value)
+        
+        self.last_updated = datetime.utcnow()
+    
+    def trim(self, min_ordinal: int) -> None:
+        """Drop rows older than the given date ordinal."""
+        cut = bisect_left(self.dates, min_ordinal)
+        if cut:
+            for column in self._columns():
+                del column[:cut]
+    
+    def start_index(self, min_ordinal: int) -> int:
+        """Index of the first row on or after the given date ordinal."""
+        return bisect_left(self.dates, min_ordinal)
+    
+    def nbytes(self) -> int:
+        """Bytes used by the column buffers."""
+        return sum(len(column) * column.itemsize for column in self._columns())
+
+
+class ColumnarPriceStore:
+    """Per-worker columnar store of recent prices for hot commodities."""
+    
+    def __init__(
+        self,
+        max_commodities: Optional[int] = None,
+        retention_days: Optional[int] = None
+    ):
+        self.max_commodities = max_commodities or settings.PRICE_STORE_MAX_COMMODITIES
+        self.retention_days = retention_days or settings.PRICE_STORE_RETENTION_DAYS
+        self.worker_id = uuid4().hex
+        
+        self._series: Dict[str, Dict[str, PriceSeries]] = {}
+        self._hits: Dict[str, int] = defaultdict(int)
+        # Bumped whenever a commodity's rows change, so readers can tell a
+        # cached summary is stale
+        self._versions: Dict[str, int] = defaultdict(int)
+        # Date ordinal from which a commodity's rows are complete
+        self._covered_from: Dict[str, int] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def _normalize(name: Optional[str]) -> str:
+        return (name or "").strip().lower()
+    
+    def has_commodity(self, commodity: str) -> bool:
+        """Check whether a commodity is held in the store."""
+        return self._normalize(commodity) in self._series
+    
+    def version(self, commodity: str) -> int:
+        """Version of a commodity's rows, increased on every change."""
+        return self._versions.get(self._normalize(commodity), 0)
+    
+    def covers(self, commodity: str, days: int) -> bool:
+        """Check whether a commodity's rows are complete for the last days."""
+        covered_from = self._covered_from.get(self._normalize(commodity))
+        min_ordinal = (date.today() - timedelta(days=days)).toordinal()
+        return covered_from is not None and covered_from <= min_ordinal
+    
+    def record_hit(self, commodity: str) -> None:
+        """Record a lookup so popular commodities are admitted on the next sync."""
+        self._hits[self._normalize(commodity)] += 1
+        
+        # Keep hit tracking bounded when many distinct names are requested
+        if len(self._hits) > self.max_commodities * 20:
+            hottest = sorted(self._hits.items(), key=lambda item: item[1], reverse=True)
+            self._hits = defaultdict(int, hottest[:self.max_commodities * 10])
+    
+    def _admit(self, commodity: str) -> bool:
+        """Make room for a commodity, evicting the coldest one if it is hotter."""
+        if commodity in self._series:
+            return True
+        
+        if len(self._series) < self.max_commodities:
+            self._series[commodity] = {}
+            return True
+        
+        coldest = min(self._series, key=lambda c: self._hits.get(c, 0))
+        if self._hits.get(commodity, 0) <= self._hits.get(coldest, 0):
+            return False
+        
+        del self._series[coldest]
+        self._covered_from.pop(coldest, None)
+        self._versions[coldest] += 1
+        self._series[commodity] = {}
+        logger.debug(f"Evicted {coldest} from price store in favour of {commodity}")
+        return True
+    
+    def ingest_rows(
+        self,
+        commodity: str,
+        market: str,
+        state: str,
+        rows: Iterable[PriceRow]
+    ) -> int:
+        """
+        Add rows for a (commodity, market) series.
+        
+        Args:
+            commodity: Commodity name
+            market: Market name
+            state: State name
+            rows: Price rows to upsert
+        
+        Returns:
+            Number of rows ingested (0 if the commodity is not admitted)
+        """
+        commodity = self._normalize(commodity)
+        market = self._normalize(market)
+        if not commodity or not market or not self._admit(commodity):
+            return 0
+        
+        series = self._series[commodity].get(market)
+        if series is None:
+            series = self._series[commodity][market] = PriceSeries(self._normalize(state))
+        
+        count = 0
+        for row in rows:
+            series.upsert(tuple(row))
+            count += 1
+        
+        min_ordinal = (date.today() - timedelta(days=self.retention_days)).toordinal()
+        series.trim(min_ordinal)
+        if count:
+            self._versions[commodity] += 1
+        return count
+    
+    def _group(self, market_prices: List[MarketPrice]) -> List[Dict[str, Any]]:
+        """Group market prices into per-series rows."""
+        grouped: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        
+        for price in market_prices:
+            key = (self._normalize(price.commodity), self._normalize(price.market))
+            update = grouped.setdefault(key, {
+                "commodity": key[0],
+                "market": key[1],
+                "state": self._normalize(price.state),
+                "rows": [],
+            })
+            update["rows"].append((
+                price.price_date.toordinal(),
+                float(price.min_price),
+                float(price.max_price),
+                float(price.modal_price),
+                price.arrivals if price.arrivals is not None else NO_ARRIVALS,
+                QUALITY_CODES.index(price.data_quality),
+                int(price.is_validated),
+            ))
+        
+        return list(grouped.values())
+    
+    def ingest(self, market_prices: List[MarketPrice]) -> List[Dict[str, Any]]:
+        """
+        Add validated market prices to the store.
+        
+        Args:
+            market_prices: MarketPrice objects being stored
+        
+        Returns:
+            Per-series update payloads suitable for publishing to other workers
+        """
+        updates = []
+        for update in self._group(market_prices):
+            if self.ingest_rows(update["commodity"], update["market"], update["state"], update["rows"]):
+                updates.append(update)
+        
+        return updates
+    
+    def backfill(self, commodity: str, market_prices: List[MarketPrice], since: date) -> int:
+        """
+        Add a held commodity's stored history and mark it complete from a date.
+        
+        Args:
+            commodity: Commodity name
+            market_prices: The commodity's stored prices on or after since
+            since: Date from which market_prices is the complete history
+        
+        Returns:
+            Number of rows ingested
+        """
+        commodity = self._normalize(commodity)
+        if commodity not in self._series:
+            return 0
+        
+        count = sum(
+            self.ingest_rows(update["commodity"], update["market"], update["state"], update["rows"])
+            for update in self._group(market_prices)
+            if update["commodity"] == commodity
+        )
+        covered_from = self._covered_from.get(commodity)
+        if covered_from is None or since.toordinal() < covered_from:
+            self._covered_from[commodity] = since.toordinal()
+        return count
+    
+    def _select(
+        self,
+        commodity: str,
+        state: Optional[str],
+        market: Optional[str],
+        days: int
+    ) -> Optional[List[PriceSeries]]:
+        """Select series for a lookup, or None if the window is not held."""
+        commodity = self._normalize(commodity)
+        self.record_hit(commodity)
+        
+        markets = self._series.get(commodity)
+        if markets is None or not self.covers(commodity, days):
+            return None
+        
+        state = self._normalize(state)
+        market = self._normalize(market)
+        return [
+            series for name, series in markets.items()
+            if (not market or name == market) and (not state or series.state == state)
+        ]
+    
+    def summarize(
+        self,
+        commodity: str,
+        state: Optional[str] = None,
+        market: Optional[str] = None,
+        days: int = 30
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Compute price summary statistics from the columns.
+        
+        Returns the same fields as MarketDataService._calculate_price_summary,
+        or None when the commodity is not held or not backfilled for the window.
+        """
+        selected = self._select(commodity, state, market, days)
+        if selected is None:
+            return None
+        
+        min_ordinal = (date.today() - timedelta(days=days)).toordinal()
+        count = 0
+        total = 0.0
+        low = float("inf")
+        high = float("-inf")
+        first: Optional[Tuple[int, float]] = None
+        last: Optional[Tuple[int, float]] = None
+        markets_count = 0
+        states = set()
+        
+        for series in selected:
+            start = series.start_index(min_ordinal)
+            if start >= len(series):
+                continue
+            
+            modal = series.modal_prices[start:]
+            count += len(modal)
+            total += sum(modal)
+            low = min(low, min(modal))
+            high = max(high, max(modal))
+            markets_count += 1
+            states.add(series.state)
+            
+            head = (series.dates[start], series.modal_prices[start])
+            tail = (series.dates[-1], series.modal_prices[-1])
+            if first is None or head[0] < first[0]:
+                first = head
+            if last is None or tail[0] > last[0]:
+                last = tail
+        
+        if not count:
+            return {
+                "count": 0,
+                "avg_price": 0,
+                "min_price": 0,
+                "max_price": 0,
+                "price_trend": "no_data"
+            }
+        
+        summary = {
+            "count": count,
+            "avg_price": total / count,
+            "min_price": low,
+            "max_price": high,
+            "latest_date": date.fromordinal(last[0]).isoformat(),
+            "markets_count": markets_count,
+            "states_count": len(states)
+        }
+        
+        if count >= 2:
+            if last[1] > first[1] * 1.05:
+                summary["price_trend"] = "increasing"
+            elif last[1] < first[1] * 0.95:
+                summary["price_trend"] = "decreasing"
+            else:
+                summary["price_trend"] = "stable"
+        else:
+            summary["price_trend"] = "insufficient_data"
+        
+        return summary
+    
+    def quality_counts(
+        self,
+        commodity: str,
+        days: int = 30
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Count records per data quality level from the columns.
+        
+        Returns:
+            Dictionary with total, validated and per-quality counts plus the
+            latest update time, or None when the commodity is not held or not
+            backfilled for the window
+        """
+        selected = self._select(commodity, None, None, days)
+        if selected is None:
+            return None
+        
+        min_ordinal = (date.today() - timedelta(days=days)).toordinal()
+        counts = [0] * len(QUALITY_CODES)
+        validated = 0
+        last_updated: Optional[datetime] = None
+        
+        for series in selected:
+            start = series.start_index(min_ordinal)
+            if start >= len(series):
+                continue
+            
+            for code in series.quality[start:]:
+                counts[code] += 1
+            validated += sum(series.validated[start:])
+            if last_updated is None or series.last_updated > last_updated:
+                last_updated = series.last_updated
+        
+        return {
+            "total_records": sum(counts),
+            "validated_records": validated,
+            "quality_distribution": {
+                QUALITY_CODES[code].value: n for code, n in enumerate(counts) if n
+            },
+            "last_updated": last_updated or datetime.utcnow(),
+        }
+    
+    def memory_usage(self) -> Dict[str, Any]:
+        """
+        Report memory used by the column buffers.
+        
+        Returns:
+            Commodity, series and row counts with total and per-million-row bytes
+        """
+        series_list = [s for markets in self._series.values() for s in markets.values()]
+        rows = sum(len(s) for s in series_list)
+        column_bytes = sum(s.nbytes() for s in series_list)
+        row_bytes = sum(column.itemsize for column in PriceSeries("")._columns())
+        
+        return {
+            "commodities": len(self._series),
+            "series": len(series_list),
+            "rows": rows,
+            "bytes": column_bytes,
+            "bytes_per_row": row_bytes,
+            "bytes_per_million_rows": row_bytes * 1_000_000,
+        }
+    
+    def clear(self) -> None:
+        """Remove all series and hit counts."""
+        for commodity in self._series:
+            self._versions[commodity] += 1
+        self._series.clear()
+        self._covered_from.clear()
+        self._hits.clear()
+    
+    async def publish(self, updates: List[Dict[str, Any]]) -> None:
+        """Publish series updates so other workers refresh their stores."""
+        if not updates:
+            return
+        
+        try:
+            client = await get_redis()
+            await client.publish(
+                PRICE_STORE_CHANNEL,
+                json.dumps({"origin": self.worker_id, "series": updates})
+            )
+        except Exception as e:
+            logger.warning(f"Error publishing price store update: {e}")
+    
+    def apply_message(self, data: str) -> int:
+        """
+        Apply an update published by another worker.
+        
+        Returns:
+            Number of rows ingested
+        """
+        try:
+            message = json.loads(data)
+        except (TypeError, json.JSONDecodeError):
+            logger.warning("Ignoring malformed price store update")
+            return 0
+        
+        if message.get("origin") == self.worker_id:
+            return 0
+        
+        return sum(
+            self.ingest_rows(u["commodity"], u["market"], u["state"], u["rows"])
+            for u in message.get("series", [])
+        )
+    
+    async def start_listener(self) -> None:
+        """Start the pub/sub listener for this worker."""
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+            logger.info("Price store listener started")
+    
+    async def stop_listener(self) -> None:
+        """Stop the pub/sub listener."""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+            logger.info("Price store listener stopped")
+    
+    async def _listen(self) -> None:
+        """Receive updates from other workers, resubscribing after errors."""
+        while True:
+            pubsub = None
+            try:
+                client = await get_redis()
+                pubsub = client.pubsub()
+                await pubsub.subscribe(PRICE_STORE_CHANNEL)
+                
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message and message.get("type") == "message":
+                        self.apply_message(message["data"])
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Price store listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(PRICE_STORE_CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+# Global price store instance (one per worker process)
+price_store = ColumnarPriceStore()
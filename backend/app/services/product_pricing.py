@@ -0,0 +1,126 @@
+"""
+Exact, indexable product prices.
+
+Product prices are stored as strings in price_info.base_price so Decimal
+values survive the round-trip, but strings compare lexicographically
+("100" < "25"). Every product therefore also carries its price as integer
+paise in price_info.base_price_paise, which MongoDB compares and sorts
+numerically and which the (status, category, price) indexes cover.
+"""
+
+import logging
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PRICE_PAISE_FIELD = "price_info.base_price_paise"
+
+MIGRATION_BATCH_SIZE = 1000
+
+_PAISE = Decimal("0.01")
+
+
+def to_paise(amount: Any, rounding: str = ROUND_HALF_UP) -> int:
+    """
+    Convert a rupee amount to integer paise.
+    
+    Args:
+        amount: Decimal, number or numeric string in rupees
+        rounding: Decimal rounding mode for fractions of a paisa
+    
+    Returns:
+        Amount in paise
+    
+    Raises:
+        ValueError: If the amount is not a finite number
+    """
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation as e:
+        raise ValueError(f"Invalid price: {amount!r}") from e
+    if not value.is_finite():
+        raise ValueError(f"Invalid price: {amount!r}")
+    return int(value.quantize(_PAISE, rounding=rounding) * 100)
+
+
+def from_paise(paise: int) -> Decimal:
+    """Convert integer paise back to a rupee Decimal."""
+    return (Decimal(paise) / 100).quantize(_PAISE)
+
+
+def price_range_filter(
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None
+) -> Dict[str, int]:
+    """
+    Build a paise range condition for a rupee price range.
+    
+    Bounds are rounded inwards, so a product matches only if its exact price
+    is inside the range.
+    """
+    price_filter = {}
+    if min_price is not None:
+        price_filter["$gte"] = to_paise(min_price, ROUND_CEILING)
+    if max_price is not None:
+        price_filter["$lte"] = to_paise(max_price, ROUND_FLOOR)
+    return price_filter
+
+
+def price_info_for_db(price_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the price as an exact string and as indexable paise."""
+    price_info["base_price_paise"] = to_paise(price_info["base_price"])
+    price_info["base_price"] = str(price_info["base_price"])
+    return price_info
+
+
+async def backfill_price_paise(database, batch_size: int = MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Add base_price_paise to products stored before it existed.
+    
+    Products are processed in _id order, one batch per bulk write, so the
+    job can be stopped and rerun at any point.
+    
+    Args:
+        database: Database holding the products collection
+        batch_size: Products per batch
+    
+    Returns:
+        Counts of updated and skipped (unparseable) products
+    """
+    updated = skipped = 0
+    last_id = None
+    
+    while True:
+        query: Dict[str, Any] = {PRICE_PAISE_FIELD: {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        
+        products = await database.products.find(
+            query, {"price_info.base_price": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not products:
+            break
+        last_id = products[-1]["_id"]
+        
+        requests = []
+        for product in products:
+            try:
+                paise = to_paise((product.get("price_info") or {}).get("base_price"))
+            except ValueError:
+                logger.warning(f"Skipping product {product['_id']} with unparseable price")
+                skipped += 1
+                continue
+            requests.append(UpdateOne(
+                {"_id": product["_id"], PRICE_PAISE_FIELD: {"$exists": False}},
+                {"$set": {PRICE_PAISE_FIELD: paise}}
+            ))
+        
+        if requests:
+            await database.products.bulk_write(requests, ordered=False)
+            updated += len(requests)
+    
+    logger.info(f"Price backfill finished: {updated} products updated, {skipped} skipped")
+    return {"updated": updated, "skipped": skipped}
@@ -0,0 +1,443 @@
+"""
+Fast JSON serialization of product search pages.
+
+The model path builds a ProductResponse, with six nested models, for every
+product on a page, and FastAPI validates and serializes the response model
+again. Here the response models are compiled once into plain converter
+functions that walk the raw MongoDB documents and produce JSON-ready values
+in the same field order, with the same defaults and the same formatting,
+which orjson then encodes. The output is byte-for-byte what FastAPI returns
+for the equivalent ProductSearchResponse.
+
+Converters only accept what the models would accept without coercion
+surprises; anything else (a wrong type, a missing required field, a failed
+constraint, a timezone-aware date, a float pydantic formats differently)
+raises SchemaMismatch so the caller can fall back to the model path. Custom
+model validators are not re-run: product documents are written through the
+same models, so stored data already satisfies them.
+"""
+
+import math
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Union, get_args, get_origin
+
+import annotated_types
+import orjson
+from pydantic import BaseModel, TypeAdapter
+
+from ..models.product import MultilingualText, ProductResponse, ProductSearchResponse
+from ..models.user import SupportedLanguage
+
+Converter = Callable[[Any], Any]
+
+# Fields a product search page reads from each product document
+PRODUCT_RESPONSE_FIELDS = {
+    "_id": 0,
+    **{
+        field: 1 for field in ProductResponse.model_fields
+        if field not in ("vendor_name", "vendor_rating", "vendor_location")
+    },
+}
+
+# Vendor fields shown with each product
+VENDOR_SUMMARY_FIELDS = {"_id": 1, "user_id": 1, "role": 1, "business_name": 1, "market_location": 1, "rating": 1}
+
+# Product fields holding MultilingualText
+MULTILINGUAL_FIELDS = ("name", "description")
+
+# Floats at or above this magnitude are written with an exponent, which
+# pydantic and orjson format differently
+_MAX_PLAIN_FLOAT = 1e16
+
+_search_response_adapter = TypeAdapter(ProductSearchResponse)
+
+
+class SchemaMismatch(Exception):
+    """A document does not fit the response schema."""
+
+
+def _mismatch(value: Any, expected: str):
+    raise SchemaMismatch(f"Expected {expected}, got {type(value).__name__}")
+
+
+def _convert_str(value: Any) -> str:
+    if type(value) is not str:
+        _mismatch(value, "str")
+    return value
+
+
+def _convert_int(value: Any) -> int:
+    if type(value) is not int:
+        _mismatch(value, "int")
+    return value
+
+
+def _convert_bool(value: Any) -> bool:
+    if type(value) is not bool:
+        _mismatch(value, "bool")
+    return value
+
+
+def _convert_float(value: Any) -> float:
+    if type(value) is int:
+        value = float(value)
+    elif type(value) is not float:
+        _mismatch(value, "float")
+    if not math.isfinite(value) or abs(value) >= _MAX_PLAIN_FLOAT:
+        _mismatch(value, "plain float")
+    return value
+
+
+def _convert_decimal(value: Any) -> str:
+    if type(value) not in (str, int, float, Decimal):
+        _mismatch(value, "decimal")
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        _mismatch(value, "decimal")
+    if not value.is_finite():
+        _mismatch(value, "finite decimal")
+    return str(value)
+
+
+def _convert_datetime(value: Any) -> str:
+    if type(value) is str:
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            _mismatch(value, "ISO datetime")
+    elif type(value) is not datetime:
+        _mismatch(value, "datetime")
+    if value.tzinfo is not None:
+        _mismatch(value, "naive datetime")
+    return value.isoformat()
+
+
+def _convert_date(value: Any) -> str:
+    if type(value) is str and len(value) == 10:
+        try:
+            return date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    elif type(value) is date:
+        return value.isoformat()
+    _mismatch(value, "date")
+
+
+def _convert_any(value: Any) -> Any:
+    """Convert a schemaless value the way pydantic serializes Any."""
+    kind = type(value)
+    if value is None or kind in (str, int, bool):
+        return value
+    if kind is float:
+        return _convert_float(value)
+    if kind is dict:
+        return {_convert_str(key): _convert_any(item) for key, item in value.items()}
+    if kind in (list, tuple):
+        return [_convert_any(item) for item in value]
+    if kind is datetime:
+        return _convert_datetime(value)
+    if kind is date:
+        return value.isoformat()
+    if kind is Decimal:
+        return _convert_decimal(value)
+    if isinstance(value, Enum):
+        return _convert_any(value.value)
+    _mismatch(value, "JSON value")
+
+
+_SCALARS: Dict[Any, Converter] = {
+    str: _convert_str,
+    int: _convert_int,
+    bool: _convert_bool,
+    float: _convert_float,
+    Decimal: _convert_decimal,
+    datetime: _convert_datetime,
+    date: _convert_date,
+    Any: _convert_any,
+}
+
+# Converters whose valid values are encoded unchanged
+_PLAIN_TYPES: Dict[Any, type] = {_convert_str: str, _convert_int: int, _convert_bool: bool}
+
+_MISSING = object()
+
+
+def _optional(convert: Converter) -> Converter:
+    def convert_optional(value):
+        return None if value is None else convert(value)
+    convert_optional.optional_of = convert
+    return convert_optional
+
+
+def _list_of(convert: Converter) -> Converter:
+    plain = _PLAIN_TYPES.get(convert)
+    
+    def convert_list(value):
+        if type(value) is not list:
+            _mismatch(value, "list")
+        # Lists of plain values are encoded as stored
+        if plain is not None and all(type(item) is plain for item in value):
+            return value
+        return [convert(item) for item in value]
+    return convert_list
+
+
+def _dict_of(convert: Converter) -> Converter:
+    plain = _PLAIN_TYPES.get(convert)
+    
+    def convert_dict(value):
+        if type(value) is not dict:
+            _mismatch(value, "dict")
+        if plain is not None and all(type(key) is str and type(item) is plain for key, item in value.items()):
+            return value
+        return {_convert_str(key): convert(item) for key, item in value.items()}
+    return convert_dict
+
+
+def _enum(enum_type) -> Converter:
+    values = {member.value: member.value for member in enum_type}
+    
+    def convert_enum(value):
+        if isinstance(value, enum_type):
+            return value.value
+        if type(value) is not str or value not in values:
+            _mismatch(value, enum_type.__name__)
+        return value
+    return convert_enum
+
+
+def _number(value: Any) -> Any:
+    # Decimal fields are stored as strings
+    return Decimal(value) if type(value) is str else value
+
+
+def _constrained(convert: Converter, constraints: List[Any]) -> Converter:
+    checks = []
+    for constraint in constraints:
+        if isinstance(constraint, annotated_types.Ge):
+            checks.append(lambda v, bound=constraint.ge: _number(v) >= bound)
+        elif isinstance(constraint, annotated_types.Gt):
+            checks.append(lambda v, bound=constraint.gt: _number(v) > bound)
+        elif isinstance(constraint, annotated_types.Le):
+            checks.append(lambda v, bound=constraint.le: _number(v) <= bound)
+        elif isinstance(constraint, annotated_types.Lt):
+            checks.append(lambda v, bound=constraint.lt: _number(v) < bound)
+        elif isinstance(constraint, annotated_types.MinLen):
+            checks.append(lambda v, bound=constraint.min_length: len(v) >= bound)
+        elif isinstance(constraint, annotated_types.MaxLen):
+            checks.append(lambda v, bound=constraint.max_length: len(v) <= bound)
+    if not checks:
+        return convert
+    
+    def convert_constrained(value):
+        converted = convert(value)
+        if value is not None and not all(check(value) for check in checks):
+            raise SchemaMismatch(f"Constraint failed for {value!r}")
+        return converted
+    return convert_constrained
+
+
+def compile_type(annotation: Any) -> Converter:
+    """Compile a field annotation into a converter to a JSON-ready value."""
+    if annotation in _SCALARS:
+        return _SCALARS[annotation]
+    
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin is Union:
+        inner = [arg for arg in args if arg is not type(None)]
+        if len(inner) == 1 and len(args) == 2:
+            return _optional(compile_type(inner[0]))
+    elif origin in (list, List):
+        return _list_of(compile_type(args[0] if args else Any))
+    elif origin in (dict, Dict):
+        return _dict_of(compile_type(args[1] if args else Any))
+    elif isinstance(annotation, type) and issubclass(annotation, Enum):
+        return _enum(annotation)
+    elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compile_model(annotation)
+    
+    raise TypeError(f"Cannot compile response type {annotation!r}")
+
+
+def _inline(convert: Converter, var: str, name: str) -> str:
+    """Expression converting var, with the type check of plain values inlined."""
+    plain = _PLAIN_TYPES.get(convert)
+    if plain is not None:
+        return f"{var} if type({var}) is _{plain.__name__} else {name}({var})"
+    plain = _PLAIN_TYPES.get(getattr(convert, "optional_of", None))
+    if plain is not None:
+        return f"{var} if {var} is None or type({var}) is _{plain.__name__} else {name}({var})"
+    return f"{name}({var})"
+
+
+def compile_model(model: type, defaults: Optional[Dict[str, Callable[[], Any]]] = None) -> Converter:
+    """
+    Compile a pydantic model into a converter from a raw document.
+    
+    The converter is generated as a single function with one statement per
+    field, so a document is converted without looping over a field list.
+    It keeps the model's field order, fills defaults for missing fields,
+    drops unknown keys and applies field constraints.
+    
+    Args:
+        model: Response model
+        defaults: Factories for missing fields, converted like stored values;
+            these take the place of the model's own defaults
+    """
+    defaults = defaults or {}
+    namespace = {
+        "_missing": _MISSING, "_mismatch": _mismatch, "_any": _convert_any, "SchemaMismatch": SchemaMismatch,
+        "_str": str, "_int": int, "_bool": bool,
+    }
+    lines = [
+        "def convert_model(document):",
+        "    if type(document) is not dict:",
+        f"        _mismatch(document, {model.__name__!r})",
+        "    get = document.get",
+    ]
+    for i, (name, field) in enumerate(model.model_fields.items()):
+        namespace[f"convert_{i}"] = _constrained(compile_type(field.annotation), field.metadata)
+        expression = _inline(namespace[f"convert_{i}"], f"v{i}", f"convert_{i}")
+        lines.append(f"    v{i} = get({name!r}, _missing)")
+        
+        if name in defaults:
+            namespace[f"default_{i}"] = defaults[name]
+            lines.append(f"    if v{i} is _missing:")
+            lines.append(f"        v{i} = default_{i}()")
+            lines.append(f"    v{i} = {expression}")
+        elif field.is_required():
+            lines.append(f"    if v{i} is _missing:")
+            lines.append(f"        raise SchemaMismatch({f'{model.__name__}.{name} is required'!r})")
+            lines.append(f"    v{i} = {expression}")
+        else:
+            # Model defaults are not validated, only serialized
+            namespace[f"default_{i}"] = field.default_factory or (lambda value: lambda: value)(field.default)
+            lines.append(f"    v{i} = _any(default_{i}()) if v{i} is _missing else {expression}")
+    
+    fields = ", ".join(f"{name!r}: v{i}" for i, name in enumerate(model.model_fields))
+    lines.append(f"    return {{{fields}}}")
+    exec("\n".join(lines), namespace)
+    return namespace["convert_model"]
+
+
+# ProductService._convert_product_to_response fills these when missing
+_convert_product = compile_model(ProductResponse, defaults={
+    "tags": list,
+    "images": list,
+    "metadata": dict,
+    "created_at": datetime.utcnow,
+    "updated_at": datetime.utcnow,
+    "views_count": int,
+    "favorites_count": int,
+    "featured": bool,
+})
+
+
+def product_to_json_value(product: Dict[str, Any], vendor: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert a product document to the JSON value of its ProductResponse.
+    
+    Mirrors ProductService._convert_product_to_response: the same fields
+    fall back to empty or current values and metadata dates stored as
+    ISO datetimes are cut to dates, in place.
+    
+    Args:
+        product: Product document, at least PRODUCT_RESPONSE_FIELDS
+        vendor: Vendor summary from vendor_summary(), or None
+    
+    Raises:
+        SchemaMismatch: If the document does not fit the response schema
+    """
+    metadata = product.get("metadata")
+    if type(metadata) is dict:
+        for field in ("harvest_date", "expiry_date"):
+            if isinstance(metadata.get(field), str):
+                try:
+                    metadata[field] = datetime.fromisoformat(metadata[field]).date()
+                except ValueError:
+                    _mismatch(metadata[field], "ISO date")
+    
+    value = _convert_product(product)
+    value["vendor_name"] = vendor["business_name"] if vendor else None
+    value["vendor_rating"] = vendor["rating"] if vendor else None
+    value["vendor_location"] = vendor["market_location"] if vendor else None
+    return value
+
+
+def translation_exclusions(language: str) -> Dict[str, int]:
+    """Projection leaving out the name and description translations other than one language."""
+    return {
+        f"{field}.translations.{other.value}": 0
+        for field in MULTILINGUAL_FIELDS
+        for other in SupportedLanguage
+        if other.value != language
+    }
+
+
+def response_fields(language: Optional[str] = None) -> Dict[str, int]:
+    """PRODUCT_RESPONSE_FIELDS, with only one language's translations if given."""
+    if language is None:
+        return PRODUCT_RESPONSE_FIELDS
+    
+    fields = dict(PRODUCT_RESPONSE_FIELDS)
+    for field in MULTILINGUAL_FIELDS:
+        del fields[field]
+        for name in MultilingualText.model_fields:
+            fields[f"{field}.{name}"] = 1
+        fields[f"{field}.translations.{language}"] = fields.pop(f"{field}.translations")
+    return fields
+
+
+def vendor_summary(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Vendor fields of a ProductResponse, as UserService would report them."""
+    if user.get("role") != "vendor":
+        return {"business_name": None, "rating": None, "market_location": None}
+    return {
+        "business_name": user.get("business_name"),
+        "rating": user.get("rating", 0.0),
+        "market_location": user.get("market_location"),
+    }
+
+
+def search_response_json(
+    products: List[Dict[str, Any]],
+    vendors: Dict[str, Optional[Dict[str, Any]]],
+    total_count: int,
+    page_info: Dict[str, Any],
+    search_metadata: Dict[str, Any]
+) -> bytes:
+    """
+    Encode a search page straight from product documents.
+    
+    Args:
+        products: Product documents, in page order
+        vendors: Vendor summaries by vendor ID
+        total_count: Total number of matching products
+        page_info: Pagination information
+        search_metadata: Search metadata
+    
+    Returns:
+        JSON bytes identical to the serialized ProductSearchResponse
+    
+    Raises:
+        SchemaMismatch: If a document does not fit the response schema
+    """
+    value = {
+        "products": [product_to_json_value(p, vendors.get(p.get("vendor_id"))) for p in products],
+        "total_count": _convert_int(total_count),
+        "page_info": _convert_any(page_info),
+        "search_metadata": _convert_any(search_metadata),
+    }
+    try:
+        return orjson.dumps(value)
+    except TypeError as e:
+        raise SchemaMismatch(str(e)) from e
+
+
+def dump_search_response(response: ProductSearchResponse) -> bytes:
+    """Serialize a ProductSearchResponse the way FastAPI does for the response model."""
+    return _search_response_adapter.dump_json(response)
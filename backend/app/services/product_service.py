@@ -11,6 +11,7 @@ from decimal import Decimal
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 import math
+import time
 
 from app.core.config import settings
 from app.core.database import get_database
@@ -40,6 +41,20 @@ from app.models.user import UserRole, SupportedLanguage
 from app.services.user_service import UserService
 from app.services.translation_service import TranslationService
 from app.services.elasticsearch_service import elasticsearch_service
+from app.services.inventory_service import inventory_service
+from app.services.product_pricing import PRICE_PAISE_FIELD, price_info_for_db, price_range_filter
+from app.services.geo_search import geo_search, location_for_db, within_radius_filter
+from app.services.search_planner import search_planner
+from app.services.view_counter import view_counter
+from app.services.product_serializer import (
+    VENDOR_SUMMARY_FIELDS,
+    SchemaMismatch,
+    dump_search_response,
+    response_fields,
+    search_response_json,
+    translation_exclusions,
+    vendor_summary,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -252,6 +267,10 @@ class ProductService:
             if not result.inserted_id:
                 raise ValidationException("Failed to create product")
             
+            # Let nearby searches see the new product before their cache expires
+            if product_dict["location"].get("geohash"):
+                geo_search.invalidate(product_dict["location"]["geohash"])
+            
             # Auto-translate product name and description
             await self._auto_translate_product(product_id, name_ml, description_ml)
             
@@ -280,7 +299,8 @@ class ProductService:
         self,
         product_id: str,
         language: SupportedLanguage = SupportedLanguage.ENGLISH,
-        increment_views: bool = True
+        increment_views: bool = True,
+        language_only: bool = False
     ) -> Optional[ProductResponse]:
         """
         Get product by ID.
@@ -289,24 +309,23 @@ class ProductService:
             product_id: Product ID
             language: Preferred language for response
             increment_views: Whether to increment view count
+            language_only: Return only the preferred language's translations
             
         Returns:
             Product response or None if not found
         """
         try:
             db = await get_database()
-            product = await db.products.find_one({"product_id": product_id})
+            projection = translation_exclusions(language.value) if language_only else None
+            product = await db.products.find_one({"product_id": product_id}, projection)
             
             if not product:
                 return None
             
-            # Increment view count if requested
+            # Count the view; the view counter writes views_count in batches
             if increment_views:
-                await db.products.update_one(
-                    {"product_id": product_id},
-                    {"$inc": {"views_count": 1}}
-                )
-                product["views_count"] = product.get("views_count", 0) + 1
+                pending = await view_counter.record_view(product_id)
+                product["views_count"] = product.get("views_count", 0) + pending
             
             return await self._convert_product_to_response(product, language)
             
@@ -382,7 +401,7 @@ class ProductService:
                     price_info.base_price = updates.base_price
                 if updates.negotiable is not None:
                     price_info.negotiable = updates.negotiable
-                update_data["price_info"] = price_info.model_dump()
+                update_data["price_info"] = price_info_for_db(price_info.model_dump())
             
             # Update availability
             availability_fields = [
@@ -431,7 +450,7 @@ class ProductService:
                     location.address = updates.location_address
                 if updates.market_name is not None:
                     location.market_name = updates.market_name
-                update_data["location"] = location.model_dump()
+                update_data["location"] = location_for_db(location.model_dump())
             
             # Update product in database
             result = await db.products.update_one(
@@ -442,6 +461,8 @@ class ProductService:
             if result.modified_count == 0:
                 raise ValidationException("No changes were made")
             
+            self._invalidate_geo_cells(product, update_data)
+            
             # Get updated product
             updated_product = await db.products.find_one({"product_id": product_id})
             
@@ -533,7 +554,9 @@ class ProductService:
         vendor_id: str,
         status: Optional[ProductStatus] = None,
         limit: int = 20,
-        skip: int = 0
+        skip: int = 0,
+        language: SupportedLanguage = SupportedLanguage.ENGLISH,
+        language_only: bool = False
     ) -> List[ProductResponse]:
         """
         Get products for a specific vendor.
@@ -543,6 +566,8 @@ class ProductService:
             status: Filter by product status
             limit: Maximum results to return
             skip: Number of results to skip
+            language: Preferred language for response
+            language_only: Return only the preferred language's translations
             
         Returns:
             List of vendor's products
@@ -556,13 +581,14 @@ class ProductService:
                 filter_query["status"] = status.value
             
             # Get products
-            cursor = db.products.find(filter_query).skip(skip).limit(limit).sort("created_at", -1)
+            projection = translation_exclusions(language.value) if language_only else None
+            cursor = db.products.find(filter_query, projection).skip(skip).limit(limit).sort("created_at", -1)
             products = await cursor.to_list(length=limit)
             
             # Convert to responses
             responses = []
             for product in products:
-                response = await self._convert_product_to_response(product)
+                response = await self._convert_product_to_response(product, language)
                 responses.append(response)
             
             return responses
@@ -576,112 +602,263 @@ class ProductService:
         query: ProductSearchQuery
     ) -> ProductSearchResponse:
         """
-        Search products with multilingual support and filtering using Elasticsearch.
+        Search products with multilingual support and filtering.
+        
+        Free text searches use the Elasticsearch text search; other searches,
+        and text searches it cannot answer, use the planned MongoDB search.
         
         Args:
             query: Search query parameters
-            
+        
         Returns:
             Search results with products and metadata
         """
         try:
-            # Try Elasticsearch first
-            try:
-                es_results, total_count, search_metadata = await elasticsearch_service.search_products(query)
+            # Text searches try Elasticsearch first
+            if self._uses_text_search(query):
+                try:
+                    response = await self._search_elasticsearch(query)
+                    if response is not None:
+                        return response
                 
-                if es_results:
-                    # Convert Elasticsearch results to ProductResponse objects
-                    product_responses = []
-                    for es_product in es_results:
-                        # Convert ES document back to ProductResponse
-                        product_response = await self._convert_es_to_product_response(es_product, query.language)
-                        product_responses.append(product_response)
-                    
-                    # Build pagination info
-                    page_info = {
-                        "current_page": (query.skip // query.limit) + 1,
-                        "total_pages": math.ceil(total_count / query.limit),
-                        "page_size": query.limit,
-                        "has_next": (query.skip + query.limit) < total_count,
-                        "has_previous": query.skip > 0
-                    }
-                    
-                    # Add filters applied to metadata
-                    search_metadata["filters_applied"] = self._get_applied_filters(query)
-                    
-                    return ProductSearchResponse(
-                        products=product_responses,
-                        total_count=total_count,
-                        page_info=page_info,
-                        search_metadata=search_metadata
-                    )
+                except Exception as e:
+                    logger.warning(f"Elasticsearch search failed, falling back to MongoDB: {e}")
             
-            except Exception as e:
-                logger.warning(f"Elasticsearch search failed, falling back to MongoDB: {e}")
+            # Planned MongoDB search, or the fallback for text searches
+            projection = translation_exclusions(query.language.value) if query.language_only else None
+            products, total_count, search_metadata = await self._search_mongodb(query, projection)
             
-            # Fallback to MongoDB search
-            db = await get_database()
+            # Convert to responses
+            product_responses = []
+            for product in products:
+                response = await self._convert_product_to_response(product, query.language)
+                product_responses.append(response)
             
-            # Build search filter
-            search_filter = await self._build_search_filter(query)
+            return ProductSearchResponse(
+                products=product_responses,
+                total_count=total_count,
+                page_info=self._build_page_info(query, total_count),
+                search_metadata=search_metadata
+            )
+        
+        except Exception as e:
+            logger.error(f"Product search failed: {e}")
+            return self._empty_search_response(query, e)
+    
+    async def search_products_json(self, query: ProductSearchQuery) -> bytes:
+        """
+        Search products and return the response already serialized to JSON.
+        
+        MongoDB results, which serve every search without free text, are read
+        with only the response fields (and with language_only, only the search
+        language's translations), their vendors are fetched in one query, and
+        the documents are encoded directly by the compiled product serializer
+        instead of being built into ProductResponse models first. The bytes are
+        the same as the serialized search_products() response; pages the
+        serializer cannot encode exactly go through the response models.
+        
+        Args:
+            query: Search query parameters
+        
+        Returns:
+            JSON encoded ProductSearchResponse
+        """
+        try:
+            # Text searches try Elasticsearch first
+            if self._uses_text_search(query):
+                try:
+                    response = await self._search_elasticsearch(query)
+                    if response is not None:
+                        return dump_search_response(response)
+                
+                except Exception as e:
+                    logger.warning(f"Elasticsearch search failed, falling back to MongoDB: {e}")
+            
+            # Planned MongoDB search, or the fallback for text searches, reading only the response fields
+            language = query.language.value if query.language_only else None
+            products, total_count, search_metadata = await self._search_mongodb(query, response_fields(language))
+            page_info = self._build_page_info(query, total_count)
             
+            vendors = await self._get_vendor_summaries({product.get("vendor_id") for product in products})
+            try:
+                return search_response_json(products, vendors, total_count, page_info, search_metadata)
+            except SchemaMismatch as e:
+                logger.warning(f"Fast product serialization not possible, using response models: {e}")
+            
+            product_responses = []
+            for product in products:
+                response = await self._convert_product_to_response(product, query.language)
+                product_responses.append(response)
+            
+            return dump_search_response(ProductSearchResponse(
+                products=product_responses,
+                total_count=total_count,
+                page_info=page_info,
+                search_metadata=search_metadata
+            ))
+        
+        except Exception as e:
+            logger.error(f"Product search failed: {e}")
+            return dump_search_response(self._empty_search_response(query, e))
+    
+    @staticmethod
+    def _invalidate_geo_cells(product: Dict[str, Any], update_data: Dict[str, Any]) -> None:
+        """Drop cached geo cells around a product's old and, if it moved, new location."""
+        geohashes = {
+            (product.get("location") or {}).get("geohash"),
+            (update_data.get("location") or {}).get("geohash"),
+        }
+        for geohash in geohashes - {None}:
+            geo_search.invalidate(geohash)
+    
+    @staticmethod
+    def _uses_text_search(query: ProductSearchQuery) -> bool:
+        """
+        Whether a search tries the Elasticsearch text search first.
+        
+        Only searches with free text do. Searches without text go straight to
+        _search_mongodb, where search_planner routes them to their compound
+        index. Distance sorts and radius filters go there too, where
+        geo_search orders by distance; the text search would return a page in
+        its own order that hides the distance results.
+        """
+        if query.coordinates and (query.sort_by == "distance" or query.radius_km):
+            return False
+        return bool(query.query)
+    
+    async def _search_elasticsearch(self, query: ProductSearchQuery) -> Optional[ProductSearchResponse]:
+        """Search products in Elasticsearch, None if it finds nothing."""
+        es_results, total_count, search_metadata = await elasticsearch_service.search_products(query)
+        
+        if not es_results:
+            return None
+        
+        # Convert Elasticsearch results to ProductResponse objects
+        product_responses = []
+        for es_product in es_results:
+            # Convert ES document back to ProductResponse
+            product_response = await self._convert_es_to_product_response(es_product, query.language)
+            product_responses.append(product_response)
+        
+        # Add filters applied to metadata
+        search_metadata["filters_applied"] = self._get_applied_filters(query)
+        
+        return ProductSearchResponse(
+            products=product_responses,
+            total_count=total_count,
+            page_info=self._build_page_info(query, total_count),
+            search_metadata=search_metadata
+        )
+    
+    async def _search_mongodb(
+        self,
+        query: ProductSearchQuery,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], int, Dict[str, Any]]:
+        """
+        Search products in MongoDB.
+        
+        Args:
+            query: Search query parameters
+            projection: Product fields to read, all if not given
+        
+        Returns:
+            Page of product documents, total matches and search metadata
+        """
+        db = await get_database()
+        
+        # Build search filter
+        search_filter = await self._build_search_filter(query)
+        
+        started = time.perf_counter()
+        if query.sort_by == "distance" and query.coordinates:
+            # Nearest first, with distances, from the geo cell cache or $geoNear
+            query_plan = {"index": None, "strategy": "geo_search"}
+            products, total_count = await geo_search.search(
+                search_filter, query.coordinates, query.radius_km, query.skip, query.limit, projection
+            )
+        else:
             # Build sort criteria
             sort_criteria = self._build_sort_criteria(query.sort_by, query.sort_order)
             
+            # Route the filter combination to its compound or partial index
+            query_plan = search_planner.plan(search_filter, sort_criteria)
+            hint = {"hint": query_plan["index"]} if query_plan["index"] else {}
+            
             # Execute search
-            cursor = db.products.find(search_filter)
+            cursor = db.products.find(search_filter, projection)
+            if hint:
+                cursor = cursor.hint(hint["hint"])
             
             # Apply sorting
             if sort_criteria:
                 cursor = cursor.sort(sort_criteria)
             
             # Get total count
-            total_count = await db.products.count_documents(search_filter)
+            total_count = await db.products.count_documents(search_filter, **hint)
             
             # Apply pagination
             cursor = cursor.skip(query.skip).limit(query.limit)
             products = await cursor.to_list(length=query.limit)
             
-            # Convert to responses
-            product_responses = []
-            for product in products:
-                response = await self._convert_product_to_response(product, query.language)
-                product_responses.append(response)
-            
-            # Build pagination info
-            page_info = {
-                "current_page": (query.skip // query.limit) + 1,
-                "total_pages": math.ceil(total_count / query.limit),
-                "page_size": query.limit,
-                "has_next": (query.skip + query.limit) < total_count,
-                "has_previous": query.skip > 0
-            }
-            
-            # Build search metadata
-            search_metadata = {
-                "query": query.query,
-                "language": query.language.value,
-                "filters_applied": self._get_applied_filters(query),
-                "search_time_ms": 0,  # TODO: Implement timing
-                "suggestions": [],  # TODO: Implement search suggestions
-                "fallback_used": True
-            }
-            
-            return ProductSearchResponse(
-                products=product_responses,
-                total_count=total_count,
-                page_info=page_info,
-                search_metadata=search_metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"Product search failed: {e}")
-            return ProductSearchResponse(
-                products=[],
-                total_count=0,
-                page_info={"current_page": 1, "total_pages": 0, "page_size": query.limit, "has_next": False, "has_previous": False},
-                search_metadata={"query": query.query, "language": query.language.value, "filters_applied": [], "search_time_ms": 0, "suggestions": [], "error": str(e)}
+            search_planner.observe(
+                search_filter, sort_criteria, query_plan, (time.perf_counter() - started) * 1000
             )
+        search_time_ms = round((time.perf_counter() - started) * 1000, 2)
+        
+        # Build search metadata
+        search_metadata = {
+            "query": query.query,
+            "language": query.language.value,
+            "filters_applied": self._get_applied_filters(query),
+            "search_time_ms": search_time_ms,
+            "suggestions": [],  # TODO: Implement search suggestions
+            "fallback_used": self._uses_text_search(query),
+            "query_plan": query_plan
+        }
+        
+        return products, total_count, search_metadata
+    
+    async def _get_vendor_summaries(self, vendor_ids) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Vendor fields for a page of products, looked up like UserService.get_user_by_id in one query."""
+        vendor_ids = [vendor_id for vendor_id in vendor_ids if isinstance(vendor_id, str)]
+        if not vendor_ids:
+            return {}
+        
+        db = await get_database()
+        users = await db.users.find(
+            {"user_id": {"$in": vendor_ids}}, VENDOR_SUMMARY_FIELDS
+        ).to_list(length=len(vendor_ids))
+        vendors = {user["user_id"]: vendor_summary(user) for user in users}
+        
+        # Fall back to _id for vendors stored without a user_id match
+        object_ids = [ObjectId(v) for v in vendor_ids if v not in vendors and ObjectId.is_valid(v)]
+        if object_ids:
+            users = await db.users.find(
+                {"_id": {"$in": object_ids}}, VENDOR_SUMMARY_FIELDS
+            ).to_list(length=len(object_ids))
+            vendors.update({str(user["_id"]): vendor_summary(user) for user in users})
+        
+        return vendors
+    
+    def _build_page_info(self, query: ProductSearchQuery, total_count: int) -> Dict[str, Any]:
+        """Build pagination info for a search page."""
+        return {
+            "current_page": (query.skip // query.limit) + 1,
+            "total_pages": math.ceil(total_count / query.limit),
+            "page_size": query.limit,
+            "has_next": (query.skip + query.limit) < total_count,
+            "has_previous": query.skip > 0
+        }
+    
+    def _empty_search_response(self, query: ProductSearchQuery, error: Exception) -> ProductSearchResponse:
+        """Empty search response reporting an error."""
+        return ProductSearchResponse(
+            products=[],
+            total_count=0,
+            page_info={"current_page": 1, "total_pages": 0, "page_size": query.limit, "has_next": False, "has_previous": False},
+            search_metadata={"query": query.query, "language": query.language.value, "filters_applied": [], "search_time_ms": 0, "suggestions": [], "error": str(error)}
+        )
     
     async def update_product_availability(
         self,
@@ -719,16 +896,8 @@ class ProductService:
             if quantity_available < 0:
                 raise ValidationException("Quantity cannot be negative")
             
-            # Update availability
-            result = await db.products.update_one(
-                {"product_id": product_id},
-                {"$set": {
-                    "availability.quantity_available": quantity_available,
-                    "updated_at": datetime.utcnow()
-                }}
-            )
-            
-            if result.modified_count == 0:
+            # Update availability, including the shards of hot products
+            if not await inventory_service.set_available(product_id, quantity_available):
                 raise ValidationException("Failed to update availability")
             
             # Get updated product
@@ -900,9 +1069,13 @@ class ProductService:
         if "updated_at" in product_dict and isinstance(product_dict["updated_at"], datetime):
             product_dict["updated_at"] = product_dict["updated_at"]
         
-        # Convert Decimal to string
+        # Store the price as an exact string plus integer paise for filtering
         if "price_info" in product_dict and "base_price" in product_dict["price_info"]:
-            product_dict["price_info"]["base_price"] = str(product_dict["price_info"]["base_price"])
+            price_info_for_db(product_dict["price_info"])
+        
+        # Store the geohash cell used for proximity search
+        if product_dict.get("location"):
+            location_for_db(product_dict["location"])
         
         # Convert date objects to ISO strings
         if "metadata" in product_dict:
@@ -974,12 +1147,14 @@ class ProductService:
             featured=product.get("featured", False),
             vendor_name=vendor.business_name if vendor and hasattr(vendor, 'business_name') else None,
             vendor_rating=vendor.rating if vendor and hasattr(vendor, 'rating') else None,
-            vendor_location=vendor.market_location if vendor and hasattr(vendor, 'market_location') else None
+            vendor_location=vendor.market_location if vendor and hasattr(vendor, 'market_location') else None,
+            distance_km=product.get("distance_km")
         )
     
     async def _build_search_filter(self, query: ProductSearchQuery) -> Dict[str, Any]:
         """Build MongoDB filter for product search."""
-        search_filter = {"status": {"$in": [ProductStatus.ACTIVE.value]}}
+        # Plain equality so the partial search indexes can be used
+        search_filter = {"status": ProductStatus.ACTIVE.value}
         
         # Text search
         if query.query:
@@ -1005,14 +1180,9 @@ class ProductService:
         if query.subcategory:
             search_filter["subcategory"] = {"$regex": query.subcategory, "$options": "i"}
         
-        # Price filters
+        # Price filters, on integer paise so they compare numerically
         if query.min_price is not None or query.max_price is not None:
-            price_filter = {}
-            if query.min_price is not None:
-                price_filter["$gte"] = str(query.min_price)
-            if query.max_price is not None:
-                price_filter["$lte"] = str(query.max_price)
-            search_filter["price_info.base_price"] = price_filter
+            search_filter[PRICE_PAISE_FIELD] = price_range_filter(query.min_price, query.max_price)
         
         # Location filters
         if query.city:
@@ -1021,17 +1191,9 @@ class ProductService:
         if query.state:
             search_filter["location.state"] = {"$regex": query.state, "$options": "i"}
         
-        # Geospatial search
+        # Geospatial search; $geoWithin, unlike $near, works with count_documents
         if query.coordinates and query.radius_km:
-            search_filter["location.coordinates"] = {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": query.coordinates
-                    },
-                    "$maxDistance": query.radius_km * 1000  # Convert km to meters
-                }
-            }
+            search_filter["location.coordinates"] = within_radius_filter(query.coordinates, query.radius_km)
         
         # Quality filters
         if query.quality_grades:
@@ -1056,11 +1218,11 @@ class ProductService:
         
         sort_mapping = {
             "relevance": [("featured", -1), ("views_count", -1), ("created_at", -1)],
-            "price": [("price_info.base_price", sort_direction)],
+            "price": [(PRICE_PAISE_FIELD, sort_direction)],
             "date": [("created_at", sort_direction)],
             "rating": [("vendor_rating", sort_direction)],
             "popularity": [("views_count", sort_direction), ("favorites_count", sort_direction)],
-            "distance": []  # TODO: Implement distance sorting
+            "distance": []  # Handled by geo_search, falls back to default order without coordinates
         }
         
         return sort_mapping.get(sort_by, [("created_at", -1)])
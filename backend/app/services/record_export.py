@@ -0,0 +1,148 @@
+"""
+Streaming exports of order and transaction history.
+
+Rows are read from a cursor in batches, oldest first by (date, _id), and
+written out as NDJSON or CSV one batch at a time, so an export of any size
+uses the memory of a single batch. Every row carries an opaque cursor; a
+client whose download was interrupted passes the last cursor it received
+as `after` to resume from the next row.
+"""
+
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.exceptions import ValidationException
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def encode_cursor(sort_value: datetime, document_id: Any) -> str:
+    """Encode a row position as a URL-safe resume cursor."""
+    payload = json.dumps([sort_value.isoformat(), str(document_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Decode a resume cursor.
+    
+    Raises:
+        ValidationException: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, document_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), document_id
+    except (ValueError, TypeError) as e:
+        raise ValidationException("Invalid export cursor", details={"cursor": cursor}) from e
+
+
+def build_export_query(
+    query: Dict[str, Any],
+    date_field: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Add the date range and resume position to an export query.
+    
+    Args:
+        query: Base filter, e.g. the user's orders
+        date_field: Date field the export is ordered by
+        start: Earliest date to include
+        end: Latest date to include
+        after: Cursor of the last row already received
+    
+    Returns:
+        Filter for the export cursor
+    
+    Raises:
+        ValidationException: If the range or cursor is invalid
+    """
+    if start and end and start > end:
+        raise ValidationException("Export start date must not be after the end date")
+    
+    date_range: Dict[str, Any] = {"$exists": True}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lte"] = end
+    
+    clauses = [query, {date_field: date_range}]
+    if after:
+        sort_value, document_id = decode_cursor(after)
+        clauses.append({"$or": [
+            {date_field: {"$gt": sort_value}},
+            {date_field: sort_value, "_id": {"$gt": document_id}},
+        ]})
+    return {"$and": clauses}
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+async def stream_export(
+    collection,
+    query: Dict[str, Any],
+    date_field: str,
+    format_row: Callable[[Dict[str, Any]], Dict[str, Any]],
+    columns: List[str],
+    export_format: str = "ndjson",
+    batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Stream the documents matching a query as NDJSON or CSV.
+    
+    Args:
+        collection: Collection to export from
+        query: Filter from build_export_query
+        date_field: Date field the export is ordered by
+        format_row: Converts a document to an output row
+        columns: Row fields, in CSV column order
+        export_format: "ndjson" or "csv"
+        batch_size: Documents per cursor batch and per written chunk
+    
+    Yields:
+        Encoded chunks of at most one batch of rows
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    cursor = collection.find(query).sort([(date_field, 1), ("_id", 1)]).batch_size(batch_size)
+    
+    buffer = io.StringIO()
+    writer = None
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns + ["cursor"])
+    
+    rows = 0
+    async for document in cursor:
+        row = format_row(document)
+        row_cursor = encode_cursor(document[date_field], document["_id"])
+        if writer is not None:
+            writer.writerow([_csv_value(row.get(column)) for column in columns] + [row_cursor])
+        else:
+            buffer.write(json.dumps({**row, "cursor": row_cursor}, default=str))
+            buffer.write("\n")
+        
+        rows += 1
+        if rows % batch_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode()
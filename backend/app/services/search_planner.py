@@ -0,0 +1,230 @@
+"""
+Index selection for product searches.
+
+Product searches combine category, subcategory, price, location, quality,
+availability and organic filters in any combination. The planner reduces a
+search filter to its shape (which fields are compared how, and the sort),
+picks the index from PRODUCT_SEARCH_INDEXES that serves the most of it
+(equality fields first, then the sort, then a range, and partial indexes
+only when the query implies their filter) and records how often each shape
+runs and how long it takes. Shapes that no index serves well are listed in
+an index report with the index that would.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from ..core.database import AVAILABLE_PRODUCTS, PRODUCT_SEARCH_INDEXES, IndexSpec
+
+logger = logging.getLogger(__name__)
+
+_RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def _field_kind(value: Any) -> str:
+    """How a filter compares a field: eq, in, range, regex, geo or other."""
+    if not isinstance(value, dict):
+        return "eq"
+    operators = set(value)
+    if operators == {"$in"}:
+        return "eq" if len(value["$in"]) == 1 else "in"
+    if operators and operators <= _RANGE_OPERATORS:
+        return "range"
+    if "$regex" in operators:
+        return "regex"
+    if operators & {"$geoWithin", "$near", "$nearSphere", "$geoIntersects"}:
+        return "geo"
+    return "other"
+
+
+def query_shape(search_filter: Dict[str, Any], sort: List[Tuple[str, int]]) -> Dict[str, Any]:
+    """
+    Reduce a search filter and sort to the parts that matter for indexing.
+    
+    Returns:
+        Dict with the field kinds, the sort and a canonical key
+    """
+    fields = {
+        field: "logical" if field.startswith("$") else _field_kind(value)
+        for field, value in search_filter.items()
+    }
+    parts = [f"{field}:{kind}" for field, kind in sorted(fields.items())]
+    parts += [f"sort:{field}:{direction}" for field, direction in sort]
+    return {"fields": fields, "sort": list(sort), "key": ",".join(parts)}
+
+
+def _implies(search_filter: Dict[str, Any], partial: Optional[Dict[str, Any]]) -> bool:
+    """Whether every document matching the filter is in a partial index."""
+    if not partial:
+        return True
+    return all(search_filter.get(field) == condition for field, condition in partial.items())
+
+
+def _score(spec: IndexSpec, shape: Dict[str, Any]) -> Tuple[int, bool, List[str]]:
+    """
+    Fields of a query an index serves, following equality, sort, range.
+    
+    Returns:
+        Number of filter fields served, whether the sort is served, and the
+        fields served
+    """
+    fields = shape["fields"]
+    served = list(spec.partial or {})
+    keys = list(spec.keys)
+    position = 0
+    sort_possible = True
+    
+    while position < len(keys) and fields.get(keys[position][0]) in ("eq", "in"):
+        if fields[keys[position][0]] == "in":
+            sort_possible = False
+        served.append(keys[position][0])
+        position += 1
+    
+    sort = shape["sort"]
+    sort_served = False
+    if sort and sort_possible and len(keys) - position >= len(sort):
+        index_sort = keys[position:position + len(sort)]
+        forward = [(field, direction) for field, direction in sort]
+        reverse = [(field, -direction) for field, direction in sort]
+        if index_sort in (forward, reverse):
+            sort_served = True
+            for field, _ in sort:
+                if fields.get(field) == "range":
+                    served.append(field)
+            position += len(sort)
+    
+    if not sort_served and position < len(keys) and fields.get(keys[position][0]) == "range":
+        served.append(keys[position][0])
+    
+    served = [field for field in dict.fromkeys(served) if field in fields]
+    return len(served), sort_served, served
+
+
+class SearchPlanner:
+    """Chooses product search indexes and reports poorly served query shapes."""
+    
+    def __init__(self, indexes: Optional[List[IndexSpec]] = None, max_shapes: Optional[int] = None):
+        self.indexes = indexes if indexes is not None else PRODUCT_SEARCH_INDEXES
+        self.max_shapes = max_shapes or settings.SEARCH_PLANNER_MAX_SHAPES
+        
+        # shape key -> shape, plan, query count and total time
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+    
+    def plan(self, search_filter: Dict[str, Any], sort: List[Tuple[str, int]]) -> Dict[str, Any]:
+        """
+        Choose the index for a product search.
+        
+        Args:
+            search_filter: Filter from ProductService._build_search_filter
+            sort: Sort criteria
+        
+        Returns:
+            Plan with the index to hint (None to leave the choice to MongoDB),
+            the query shape, the filter fields the index serves and whether
+            it returns results in sort order
+        """
+        shape = query_shape(search_filter, sort)
+        best = None
+        best_score = (0, False, 0, 0)
+        best_served: List[str] = []
+        
+        for spec in self.indexes:
+            if not _implies(search_filter, spec.partial):
+                continue
+            used, sort_served, served = _score(spec, shape)
+            # Most fields served, then sort order, then the smaller (partial, shorter) index
+            score = (used, sort_served, 1 if spec.partial else 0, -len(spec.keys))
+            if (used or sort_served) and score > best_score:
+                best, best_score, best_served = spec, score, served
+        
+        if best is None:
+            return {
+                "index": None,
+                "strategy": "auto",
+                "shape": shape["key"],
+                "fields_served": [],
+                "sort_served": False,
+            }
+        return {
+            "index": best.name,
+            "strategy": "partial_index" if best.partial else "compound_index",
+            "shape": shape["key"],
+            "fields_served": best_served,
+            "sort_served": best_score[1],
+        }
+    
+    def observe(self, search_filter: Dict[str, Any], sort: List[Tuple[str, int]], plan: Dict[str, Any], elapsed_ms: float) -> None:
+        """Record a search that ran with a plan."""
+        entry = self._shapes.get(plan["shape"])
+        if entry is None:
+            if len(self._shapes) >= self.max_shapes:
+                return
+            entry = self._shapes[plan["shape"]] = {
+                "shape": query_shape(search_filter, sort),
+                "plan": plan,
+                "queries": 0,
+                "total_ms": 0.0,
+            }
+        entry["queries"] += 1
+        entry["total_ms"] += elapsed_ms
+    
+    def index_report(self, min_queries: int = 1) -> List[Dict[str, Any]]:
+        """
+        Recommend indexes for observed shapes that no index serves fully.
+        
+        Args:
+            min_queries: Ignore shapes seen fewer times
+        
+        Returns:
+            Shapes by query count, each with its current index and the index
+            that would serve it
+        """
+        report = []
+        for entry in self._shapes.values():
+            if entry["queries"] < min_queries:
+                continue
+            shape, plan = entry["shape"], entry["plan"]
+            indexable = [f for f, kind in shape["fields"].items() if kind in ("eq", "in", "range")]
+            if set(indexable) <= set(plan["fields_served"]) and (plan["sort_served"] or not shape["sort"]):
+                continue
+            
+            keys, partial = self._recommend(shape)
+            report.append({
+                "shape": plan["shape"],
+                "queries": entry["queries"],
+                "avg_ms": round(entry["total_ms"] / entry["queries"], 2),
+                "current_index": plan["index"],
+                "fields_served": plan["fields_served"],
+                "sort_served": plan["sort_served"],
+                "recommended_keys": keys,
+                "partial_filter": partial,
+            })
+        
+        report.sort(key=lambda item: (item["queries"], item["avg_ms"]), reverse=True)
+        return report
+    
+    @staticmethod
+    def _recommend(shape: Dict[str, Any]) -> Tuple[List[Tuple[str, int]], Optional[Dict[str, Any]]]:
+        """Index for a shape: equality fields, then the sort, then one range field."""
+        fields = shape["fields"]
+        partial = AVAILABLE_PRODUCTS if all(
+            fields.get(field) == _field_kind(condition) for field, condition in AVAILABLE_PRODUCTS.items()
+        ) else None
+        exclude = set(partial or {})
+        
+        keys = [(f, 1) for f, kind in sorted(fields.items()) if kind == "eq" and f not in exclude]
+        keys += [(f, 1) for f, kind in sorted(fields.items()) if kind == "in"]
+        if not any(kind == "in" for kind in fields.values()):
+            keys += [(f, d) for f, d in shape["sort"] if f not in dict(keys)]
+        ranges = [f for f, kind in sorted(fields.items()) if kind == "range" and f not in exclude and f not in dict(keys)]
+        keys += [(f, 1) for f in ranges[:1]]
+        return keys, partial
+    
+    def reset(self) -> None:
+        """Forget observed query shapes."""
+        self._shapes.clear()
+
+
+# Global search planner instance
+search_planner = SearchPlanner()
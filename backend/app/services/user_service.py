@@ -37,6 +37,7 @@ from app.models.user import (
     TransactionReference,
     BudgetRange
 )
+from app.services.user_summary_cache import user_summary_cache
 
 logger = logging.getLogger(__name__)
 
@@ -550,6 +551,7 @@ class UserService:
             
             if result.modified_count == 0:
                 raise ValidationException("No changes were made")
+            user_summary_cache.invalidate(user_id)
             
             # Get updated user
             updated_user = await db.users.find_one({"user_id": user_id})
@@ -912,7 +914,8 @@ class UserService:
             "is_active": user.get("is_active", True),
             "created_at": user.get("created_at", datetime.utcnow()),
             "updated_at": user.get("updated_at", datetime.utcnow()),
-            "last_login": user.get("last_login")
+            "last_login": user.get("last_login"),
+            "full_name": (user.get("profile") or {}).get("full_name") or user.get("full_name")
         }
         
         # Add role-specific fields
@@ -0,0 +1,83 @@
+"""
+Short-lived cache of user display details.
+
+Orders and conversations copy a user's name and email into their own
+documents. Those few fields change rarely, so they are cached per worker
+instead of reading the whole user document on every request.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from ..core.config import settings
+from ..core.database import get_database
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = {"_id": 0, "user_id": 1, "email": 1, "full_name": 1, "business_name": 1, "profile": 1}
+
+
+class UserSummaryCache:
+    """Per-worker LRU cache of user names and emails with a TTL."""
+    
+    def __init__(self, database=None, ttl: Optional[int] = None, max_size: Optional[int] = None):
+        self.database = database
+        self.ttl = ttl or settings.USER_SUMMARY_CACHE_TTL
+        self.max_size = max_size or settings.USER_SUMMARY_CACHE_SIZE
+        
+        # user_id -> (expires_at, summary), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's display details.
+        
+        Args:
+            user_id: User ID
+        
+        Returns:
+            Dict with full_name, business_name and email, or None if the user
+            does not exist
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1]
+        
+        self.stats["misses"] += 1
+        db = await self._get_database()
+        user = await db.users.find_one({"user_id": user_id}, SUMMARY_FIELDS)
+        summary = self._summarize(user) if user else None
+        
+        self._entries[user_id] = (time.monotonic() + self.ttl, summary)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return summary
+    
+    @staticmethod
+    def _summarize(user: Dict[str, Any]) -> Dict[str, Any]:
+        profile = user.get("profile") or {}
+        return {
+            "full_name": profile.get("full_name") or user.get("full_name"),
+            "business_name": profile.get("business_name") or user.get("business_name"),
+            "email": user.get("email", ""),
+        }
+    
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop cached details, for one user or all of them."""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+
+# Global user summary cache instance
+user_summary_cache = UserSummaryCache()
@@ -0,0 +1,181 @@
+"""
+Buffered product view counts.
+
+Every product page view used to $inc views_count in MongoDB before the
+product was returned, so popular listings became a write hotspot and views
+waited on writes. Views are now counted in Redis (HINCRBY on one hash shared
+by all workers) or, without Redis, in process, and a background flusher
+started with the application writes the totals to MongoDB with one unordered bulk_write per batch of
+products. Popularity sorts read the flushed views_count, which changes once
+per flush instead of once per view.
+
+To flush, the Redis hash is renamed to a per-flush key first, so views
+counted while a flush is running land in a fresh hash and are not lost or
+written twice.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+
+from ..core.config import settings
+from ..core.database import get_database
+from ..core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+VIEW_COUNTS_KEY = "product_views:pending"
+FLUSHING_KEY_PREFIX = "product_views:flushing:"
+
+
+class ViewCounter:
+    """Counts product views and flushes them to MongoDB in batches."""
+    
+    def __init__(
+        self,
+        database=None,
+        backend: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.database = database
+        self.backend = backend or settings.VIEW_COUNTER_BACKEND
+        self.batch_size = batch_size or settings.VIEW_COUNT_FLUSH_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.VIEW_COUNT_FLUSH_INTERVAL_SECONDS
+        
+        # product_id -> views not yet in MongoDB, counted in this process
+        self._counts: Counter = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._flusher_task: Optional[asyncio.Task] = None
+        self.stats = {"views": 0, "flushes": 0, "products_flushed": 0, "views_flushed": 0}
+    
+    async def _get_database(self):
+        return self.database if self.database is not None else await get_database()
+    
+    async def record_view(self, product_id: str) -> int:
+        """
+        Count a view of a product.
+        
+        Args:
+            product_id: Viewed product
+        
+        Returns:
+            Views of the product not yet written to MongoDB, including this one
+        """
+        self.stats["views"] += 1
+        if self.backend == "redis":
+            try:
+                client = await get_redis()
+                pending = await client.hincrby(VIEW_COUNTS_KEY, product_id, 1)
+                return pending + self._counts.get(product_id, 0)
+            except Exception as e:
+                logger.warning(f"Error counting product view in Redis, counting in process: {e}")
+        
+        self._counts[product_id] += 1
+        return self._counts[product_id]
+    
+    async def flush(self) -> Dict[str, int]:
+        """
+        Add all counted views to views_count in MongoDB.
+        
+        Counts that cannot be written are kept for the next flush.
+        
+        Returns:
+            Number of products and views written
+        """
+        async with self._flush_lock:
+            counts, self._counts = self._counts, Counter()
+            flushing_key = None
+            if self.backend == "redis":
+                flushing_key, shared = await self._take_shared_counts()
+                counts.update(shared)
+            
+            counts = {product_id: count for product_id, count in counts.items() if count > 0}
+            if not counts:
+                return {"products": 0, "views": 0}
+            
+            items = list(counts.items())
+            written = 0
+            try:
+                db = await self._get_database()
+                for start in range(0, len(items), self.batch_size):
+                    batch = items[start:start + self.batch_size]
+                    await db.products.bulk_write([
+                        UpdateOne({"product_id": product_id}, {"$inc": {"views_count": count}})
+                        for product_id, count in batch
+                    ], ordered=False)
+                    written += len(batch)
+            except Exception as e:
+                logger.error(f"Error flushing product view counts: {e}")
+                # Batches already written are not counted again
+                self._counts.update(dict(items[written:]))
+            
+            if flushing_key is not None:
+                await self._drop_shared_counts(flushing_key)
+            
+            views = sum(count for _, count in items[:written])
+            self.stats["flushes"] += 1
+            self.stats["products_flushed"] += written
+            self.stats["views_flushed"] += views
+            logger.debug(f"Flushed {views} product views for {written} products")
+            return {"products": written, "views": views}
+    
+    async def start(self) -> None:
+        """Start the background flusher."""
+        if self._flusher_task is None or self._flusher_task.done():
+            self._flusher_task = asyncio.create_task(self._run())
+            logger.info("View count flusher started")
+    
+    async def stop(self) -> None:
+        """Stop the background flusher and write the views still counted."""
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        
+        result = await self.flush()
+        logger.info(f"View count flusher stopped after writing {result['views']} buffered views")
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in view count flusher: {e}")
+    
+    async def _take_shared_counts(self):
+        """Move the shared Redis counts aside for this flush and read them."""
+        try:
+            client = await get_redis()
+            flushing_key = f"{FLUSHING_KEY_PREFIX}{uuid.uuid4().hex}"
+            try:
+                await client.rename(VIEW_COUNTS_KEY, flushing_key)
+            except Exception:
+                # No views counted since the last flush
+                if await client.exists(VIEW_COUNTS_KEY):
+                    raise
+                return None, {}
+            counts = await client.hgetall(flushing_key)
+            return flushing_key, {product_id: int(count) for product_id, count in counts.items()}
+        except Exception as e:
+            logger.warning(f"Error reading product view counts from Redis: {e}")
+            return None, {}
+    
+    async def _drop_shared_counts(self, flushing_key: str) -> None:
+        try:
+            client = await get_redis()
+            await client.delete(flushing_key)
+        except Exception as e:
+            logger.warning(f"Error deleting flushed product view counts from Redis: {e}")
+
+
+# Global view counter instance
+view_counter = ViewCounter()
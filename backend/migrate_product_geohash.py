@@ -0,0 +1,43 @@
+"""
+Migration: add geohash cells to existing products.
+
+Backfills location.geohash, which distance-sorted product search uses to
+find the products around a location, and creates its index. Safe to rerun.
+
+Usage:
+    python migrate_product_geohash.py
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.services.geo_search import GEOHASH_FIELD, backfill_geohash
+
+# Database configuration
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/mandi_marketplace")
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "mandi_marketplace")
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[DATABASE_NAME]
+    
+    try:
+        result = await backfill_geohash(db)
+        print(f"Updated {result['updated']} products, skipped {result['skipped']} without coordinates")
+        
+        await db.products.create_index([(GEOHASH_FIELD, 1)])
+        print("Geohash index ready")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Migration: add integer paise prices to existing products.
+
+Backfills price_info.base_price_paise, which product price filters and
+sorting now use, and creates the category/price indexes. Safe to rerun.
+
+Usage:
+    python migrate_product_prices.py
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.services.product_pricing import PRICE_PAISE_FIELD, backfill_price_paise
+
+# Database configuration
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/mandi_marketplace")
+DATABASE_NAME = os.getenv("MONGODB_DATABASE", "mandi_marketplace")
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[DATABASE_NAME]
+    
+    try:
+        result = await backfill_price_paise(db)
+        print(f"Updated {result['updated']} products, skipped {result['skipped']} with unparseable prices")
+        
+        await db.products.create_index([("status", 1), ("category", 1), (PRICE_PAISE_FIELD, 1)])
+        await db.products.create_index([("status", 1), (PRICE_PAISE_FIELD, 1)])
+        
+        # The old index was on a top-level field products never had
+        if "base_price_1" in await db.products.index_information():
+            await db.products.drop_index("base_price_1")
+        print("Price indexes ready")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
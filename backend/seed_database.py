@@ -18,6 +18,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
 from bson import ObjectId
 
+from app.services.geo_search import encode_geohash
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -440,6 +442,7 @@ async def create_products(db, vendors):
                     # Price info
                     "price_info": {
                         "base_price": str(price),
+                        "base_price_paise": int(round(price * 100)),
                         "currency": "INR",
                         "negotiable": random.choice([True, False]),
                         "bulk_discount": None,
@@ -465,6 +468,7 @@ async def create_products(db, vendors):
                         "pincode": vendor["location"]["pincode"],
                         "country": "India",
                         "coordinates": vendor["location"]["coordinates"],
+                        "geohash": encode_geohash(*vendor["location"]["coordinates"]),
                         "market_name": vendor["market_location"]
                     },
                     
@@ -530,6 +534,7 @@ async def create_indexes(db):
         await db.products.create_index("category")
         await db.products.create_index("status")
         await db.products.create_index([("location.coordinates", "2dsphere")])
+        await db.products.create_index([("location.geohash", 1)])
         await db.products.create_index([("created_at", -1)])
         
         # Create text search index for products
@@ -6,6 +6,7 @@ import os
 import asyncio
 import pytest
 import pytest_asyncio
+import mongomock
 from typing import AsyncGenerator, Generator
 from httpx import AsyncClient
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -261,6 +262,130 @@ def get_auth_headers(token: str) -> dict:
     return {"Authorization": f"Bearer {token}"}
 
 
+
+# Motor-like MongoDB over mongomock for service tests
+class AsyncCursor:
+    """Motor-like cursor over a mongomock cursor, read with to_list or async for."""
+    
+    def __init__(self, cursor, collection):
+        self._cursor = cursor
+        self._collection = collection
+        self.batch = None
+    
+    def hint(self, index):
+        self._collection.hints.append(index)
+        return self
+    
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+    
+    def skip(self, *args):
+        self._cursor = self._cursor.skip(*args)
+        return self
+    
+    def limit(self, *args):
+        self._cursor = self._cursor.limit(*args)
+        return self
+    
+    def batch_size(self, size):
+        self.batch = size
+        return self
+    
+    async def to_list(self, length=None):
+        await asyncio.sleep(self._collection.database.latency)
+        return list(self._cursor)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """
+    Motor-like collection over mongomock.
+    
+    Every operation except reading a cursor is one round-trip, which yields to
+    other tasks. Finds, hints and bulk write sizes are recorded, and
+    fail_writes makes that many bulk writes fail.
+    """
+    
+    def __init__(self, collection, database):
+        self._collection = collection
+        self.database = database
+        self.finds = []
+        self.hints = []
+        self.bulk_writes = []
+        self.fail_writes = 0
+    
+    def find(self, query=None, projection=None, *args, **kwargs):
+        self.finds.append((query, projection))
+        return AsyncCursor(self._collection.find(query, projection, *args, **kwargs), self)
+    
+    def aggregate(self, pipeline, **kwargs):
+        self.database.pipelines.append(pipeline)
+        if self.database.aggregate_result is not None:
+            # mongomock has no $geoNear; return the canned result instead
+            return AsyncCursor(iter(self.database.aggregate_result), self)
+        return AsyncCursor(self._collection.aggregate(pipeline, **kwargs), self)
+    
+    async def count_documents(self, query, hint=None, **kwargs):
+        self.hints.append(hint)
+        await self.database.round_trip()
+        return self._collection.count_documents(query, **kwargs)
+    
+    async def bulk_write(self, requests, ordered=True):
+        await self.database.round_trip()
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise RuntimeError("primary stepped down")
+        self.bulk_writes.append(len(requests))
+        # mongomock's bulk_write does not accept current pymongo UpdateOne objects
+        for request in requests:
+            self._collection.update_one(request._filter, request._doc, upsert=request._upsert)
+    
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        
+        async def call(*args, **kwargs):
+            await self.database.round_trip()
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    """
+    Motor-like database over mongomock that counts round-trips.
+    
+    Each round-trip waits latency seconds. Aggregations are recorded in
+    pipelines and answered with aggregate_result when it is set.
+    """
+    
+    def __init__(self, latency=0):
+        self._database = mongomock.MongoClient().db
+        self._collections = {}
+        self.latency = latency
+        self.round_trips = 0
+        self.pipelines = []
+        self.aggregate_result = None
+    
+    async def round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+    
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._collections:
+            self._collections[name] = AsyncCollection(self._database[name], self)
+        return self._collections[name]
+
+
 # Markers for different test types
 pytestmark = [
     pytest.mark.asyncio,
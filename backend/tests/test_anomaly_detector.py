@@ -0,0 +1,203 @@
+"""
+Unit tests for streaming price anomaly detection.
+
+Tests outlier flagging, drift handling, re-baselining and quarantine on store.
+"""
+
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.anomaly_detector import PriceAnomalyDetector, SeriesState
+from app.services.market_data_service import MarketDataService
+from app.models.market_data import MarketPrice, DataSource, DataQuality, PriceUnit
+
+
+KEY = "onion|azadpur"
+
+
+def _price(modal, days_ago):
+    """Build a validated market price for testing."""
+    modal_price = Decimal(str(modal))
+    return MarketPrice(
+        commodity="onion",
+        market="Azadpur",
+        state="Delhi",
+        min_price=modal_price * Decimal("0.9"),
+        max_price=modal_price * Decimal("1.1"),
+        modal_price=modal_price,
+        unit=PriceUnit.PER_QUINTAL,
+        price_date=date.today() - timedelta(days=days_ago),
+        source=DataSource.AGMARKNET,
+        data_quality=DataQuality.HIGH,
+        is_validated=True
+    )
+
+
+@pytest.fixture
+def detector():
+    """Create a detector with explicit settings."""
+    return PriceAnomalyDetector(
+        alpha=0.2, threshold=5.0, max_jump_ratio=3.0, warmup=5, reset_after=3
+    )
+
+
+def _warm_up(detector, prices=(2000, 2050, 1980, 2020, 2010, 2040)):
+    for price in prices:
+        assert detector.observe(KEY, price) is None
+
+
+class TestPriceAnomalyDetector:
+    """Test cases for PriceAnomalyDetector."""
+    
+    def test_nothing_flagged_during_warmup(self, detector):
+        """The first observations only build state."""
+        for price in (2000, 9000, 1500, 2000, 2100):
+            assert detector.observe(KEY, price) is None
+    
+    def test_five_times_jump_is_flagged(self, detector):
+        """A modal price 5x the previous one is flagged and does not move the state."""
+        _warm_up(detector)
+        mean_before = detector.get_state(KEY).mean
+        
+        reason = detector.observe(KEY, 10200)
+        
+        assert reason is not None and "5.0x" in reason
+        assert detector.get_state(KEY).mean == mean_before
+        assert detector.get_state(KEY).flagged == 1
+    
+    def test_gradual_drift_is_accepted(self, detector):
+        """Steady day-to-day moves are not outliers."""
+        _warm_up(detector)
+        
+        for price in range(2050, 3000, 50):
+            assert detector.observe(KEY, price) is None
+    
+    def test_sustained_level_change_rebaselines(self, detector):
+        """After repeated flags at a new level the detector accepts it."""
+        _warm_up(detector)
+        
+        assert detector.observe(KEY, 7000) is not None
+        assert detector.observe(KEY, 7100) is not None
+        assert detector.observe(KEY, 7050) is None
+        assert detector.observe(KEY, 7000) is None
+    
+    def test_state_roundtrip(self, detector):
+        """Series state serializes for sharing through Redis."""
+        _warm_up(detector)
+        state = detector.get_state(KEY)
+        
+        restored = SeriesState.from_json(state.to_json())
+        
+        assert restored.mean == state.mean
+        assert restored.observed == state.observed
+        assert restored.last_seen == state.last_seen
+    
+    def test_screen_processes_in_date_order(self, detector):
+        """Pages are screened oldest first regardless of input order."""
+        prices = [_price(2000 + i * 10, days_ago=10 - i) for i in range(8)]
+        spike = _price(9000, days_ago=0)
+        
+        accepted, flagged = detector.screen(list(reversed(prices)) + [spike])
+        
+        assert len(accepted) == 8
+        assert [p for p, _ in flagged] == [spike]
+    
+    def test_screen_skips_dates_already_observed(self, detector):
+        """Records from overlapping syncs are screened once."""
+        first_sync = [_price(2000 + i * 10, days_ago=10 - i) for i in range(8)]
+        detector.screen(first_sync)
+        mean_before = detector.get_state(KEY).mean
+        
+        second_sync = first_sync[-3:] + [_price(2090, days_ago=2)]
+        accepted, flagged = detector.screen(second_sync)
+        
+        assert accepted == second_sync[-1:]
+        assert flagged == []
+        assert detector.get_state(KEY).observed == 9
+        assert detector.get_state(KEY).mean != mean_before
+    
+    def test_screen_observes_every_record_on_a_new_date(self, detector):
+        """Several records for one series and date in a page are all observed."""
+        accepted, _ = detector.screen([_price(2000, days_ago=1), _price(2010, days_ago=1)])
+        
+        assert len(accepted) == 2
+        assert detector.get_state(KEY).observed == 2
+    
+    def test_outlier_replayed_across_syncs_screened_once(self, detector):
+        """An outlier repeated by overlapping syncs is flagged once and never re-baselines."""
+        history = [_price(100 + i, days_ago=10 - i) for i in range(8)]
+        detector.screen(history)
+        mean_before = detector.get_state(KEY).mean
+        outlier = _price(125 * 4, days_ago=1)
+        
+        results = [detector.screen(history[-2:] + [outlier]) for _ in range(3)]
+        
+        assert [[p for p, _ in flagged] for _, flagged in results] == [[outlier], [], []]
+        assert all(accepted == [] for accepted, _ in results)
+        state = detector.get_state(KEY)
+        assert state.flagged == 1
+        assert state.consecutive_flags == 1
+        assert state.mean == mean_before
+    
+    def test_level_change_counts_distinct_dates(self, detector):
+        """Several outlying records on one date count as one step towards a re-baseline."""
+        detector.screen([_price(100 + i, days_ago=10 - i) for i in range(8)])
+        
+        _, flagged = detector.screen([_price(500, days_ago=2), _price(510, days_ago=2), _price(505, days_ago=2)])
+        accepted, _ = detector.screen([_price(500, days_ago=1)])
+        assert len(flagged) == 3
+        assert accepted == []
+        
+        accepted, _ = detector.screen([_price(500, days_ago=0)])
+        assert len(accepted) == 1
+    
+    @pytest.mark.asyncio
+    async def test_load_refreshes_held_state(self, detector, monkeypatch):
+        """Loading replaces this worker's copy with state saved by other workers."""
+        _warm_up(detector)
+        other = PriceAnomalyDetector()
+        _warm_up(other, prices=(2000, 2050, 1980, 2020, 2010, 2040, 2060, 2080))
+        redis_client = MagicMock()
+        redis_client.hmget = AsyncMock(return_value=[other.get_state(KEY).to_json()])
+        monkeypatch.setattr("app.services.anomaly_detector.get_redis", AsyncMock(return_value=redis_client))
+        
+        await detector.load([KEY, KEY])
+        
+        redis_client.hmget.assert_awaited_once()
+        assert detector.get_state(KEY).observed == 8
+    
+    def test_report(self, detector):
+        """Reports summarize observations and flags from state."""
+        _warm_up(detector)
+        detector.observe(KEY, 10000)
+        
+        report = detector.report()
+        
+        assert report["series"] == 1
+        assert report["observed"] == 7
+        assert report["flagged"] == 1
+        assert report["most_flagged"] == [{"series": KEY, "flagged": 1}]
+    
+    @pytest.mark.asyncio
+    async def test_store_quarantines_flagged_rows(self, detector, monkeypatch):
+        """Flagged rows go to quarantine and are marked as not validated."""
+        monkeypatch.setattr("app.services.market_data_service.price_anomaly_detector", detector)
+        database = MagicMock()
+        database.market_prices.bulk_write = AsyncMock(
+            return_value=MagicMock(upserted_count=8, modified_count=0)
+        )
+        database.market_prices_quarantine.bulk_write = AsyncMock()
+        service = MarketDataService(database)
+        
+        prices = [_price(2000 + i * 10, days_ago=10 - i) for i in range(8)]
+        spike = _price(9000, days_ago=0)
+        
+        stored = await service.store_market_data(prices + [spike])
+        
+        assert stored == 8
+        assert len(database.market_prices.bulk_write.call_args[0][0]) == 8
+        assert len(database.market_prices_quarantine.bulk_write.call_args[0][0]) == 1
+        assert spike.is_validated is False
+        assert spike.validation_notes.startswith("Quarantined")
@@ -0,0 +1,362 @@
+"""
+Unit tests for the distributed chat broker.
+
+Tests cross-worker fan-out, presence, per-connection send queues and slow
+consumers, the single-worker fallback without Redis, WebSocket authentication
+and a load test with thousands of local sockets.
+"""
+
+import asyncio
+import json
+import time
+import pytest
+import fakeredis
+import pytest_asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from unittest.mock import MagicMock
+
+from app.api.v1.endpoints.chat import router
+from app.core.security import JWTManager
+from app.models.user import UserRole
+from app.services.chat_broker import ChatBroker, chat_broker
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a server-side WebSocket."""
+    
+    def __init__(self, fail=False, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+        self.accepted = False
+        self.close_code = None
+        self.received = []
+    
+    async def accept(self):
+        self.accepted = True
+    
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("socket closed")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append(json.loads(text))
+    
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for delivery")
+        await asyncio.sleep(0.01)
+
+
+def _chat(received):
+    return [message for message in received if message.get("type") == "text"]
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Share one in-memory Redis server between brokers."""
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    
+    async def get_redis():
+        return client
+    
+    monkeypatch.setattr("app.services.chat_broker.get_redis", get_redis)
+    return client
+
+
+@pytest_asyncio.fixture
+async def broker():
+    """Create a broker without Redis, as in a single-worker deployment."""
+    broker = ChatBroker()
+    yield broker
+    await broker.stop_listener()
+
+
+@pytest_asyncio.fixture
+async def workers(redis_client):
+    """Start two brokers that behave like separate uvicorn workers."""
+    brokers = [ChatBroker(presence_ttl=30), ChatBroker(presence_ttl=30)]
+    for broker in brokers:
+        await broker.start_listener()
+    yield brokers
+    for broker in brokers:
+        await broker.stop_listener()
+
+
+def _token(user_id):
+    return JWTManager.create_access_token(user_id, f"{user_id}@example.com", UserRole.BUYER)
+
+
+@pytest.fixture
+def chat_client(monkeypatch):
+    """Chat router with a conversation between buyer-1 and vendor-1."""
+    async def get_participants(conversation_id):
+        return ["buyer-1", "vendor-1"]
+    
+    message_log = MagicMock()
+    monkeypatch.setattr("app.api.v1.endpoints.chat._get_participants", get_participants)
+    monkeypatch.setattr("app.api.v1.endpoints.chat.message_log", message_log)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app), message_log
+
+
+async def _join(broker, conversation_id, user_id=None, websocket=None, language=None):
+    websocket = websocket or FakeWebSocket()
+    await broker.connect(websocket, conversation_id, user_id, language)
+    await _wait_for(lambda: broker._pubsub is not None and broker._pubsub.subscribed)
+    return websocket
+
+
+class TestChatBroker:
+    """Test cases for ChatBroker."""
+    
+    @pytest.mark.asyncio
+    async def test_message_reaches_socket_on_other_worker(self, workers):
+        """A buyer and a vendor on different workers see each other's messages."""
+        buyer = await _join(workers[0], "conv-1")
+        vendor = await _join(workers[1], "conv-1")
+        
+        await workers[0].publish("conv-1", {"type": "text", "content": "Is 25 per kg ok?"})
+        await _wait_for(lambda: _chat(vendor.received))
+        
+        assert _chat(vendor.received)[0]["content"] == "Is 25 per kg ok?"
+        await asyncio.sleep(0.05)
+        assert len(_chat(buyer.received)) == 1
+    
+    @pytest.mark.asyncio
+    async def test_language_filter_across_workers(self, workers):
+        """Language-targeted messages only reach sockets in that language."""
+        hindi = await _join(workers[1], "conv-1", language="hi")
+        tamil = await _join(workers[1], "conv-1", language="ta")
+        
+        await workers[0].publish("conv-1", {"type": "translation", "language": "ta"}, language="ta")
+        await _wait_for(lambda: tamil.received)
+        await asyncio.sleep(0.05)
+        
+        assert hindi.received == []
+    
+    @pytest.mark.asyncio
+    async def test_worker_only_receives_its_conversations(self, workers):
+        """Workers do not receive conversations they hold no sockets for."""
+        sender = await _join(workers[0], "conv-1")
+        other = await _join(workers[1], "conv-2")
+        
+        await workers[0].publish("conv-1", {"type": "text", "content": "hello"})
+        await asyncio.sleep(0.1)
+        
+        assert _chat(sender.received)
+        assert other.received == []
+    
+    @pytest.mark.asyncio
+    async def test_presence_across_workers(self, workers):
+        """Presence includes users connected to any worker."""
+        buyer = await _join(workers[0], "conv-1", "buyer-1")
+        vendor = await _join(workers[1], "conv-1", "vendor-1")
+        
+        assert await workers[0].get_presence("conv-1") == ["buyer-1", "vendor-1"]
+        await _wait_for(lambda: any(
+            m.get("type") == "presence" and m["user_id"] == "vendor-1" for m in buyer.received
+        ))
+        
+        await workers[1].disconnect(vendor, "conv-1", "vendor-1")
+        
+        assert await workers[0].get_presence("conv-1") == ["buyer-1"]
+        await _wait_for(lambda: any(m.get("status") == "offline" for m in buyer.received))
+    
+    @pytest.mark.asyncio
+    async def test_stale_presence_expires(self, workers, redis_client):
+        """Entries from a worker that stopped heartbeating are dropped."""
+        key = workers[0].presence_key("conv-1")
+        await redis_client.hset(key, "dead-worker:buyer-1", time.time() - 120)
+        
+        assert await workers[0].get_presence("conv-1") == []
+        assert await redis_client.hgetall(key) == {}
+    
+    @pytest.mark.asyncio
+    async def test_failed_socket_is_dropped(self, workers):
+        """Sockets that fail to send are removed instead of breaking fan-out."""
+        healthy = await _join(workers[0], "conv-1")
+        await _join(workers[0], "conv-1", websocket=FakeWebSocket(fail=True))
+        
+        await workers[0].publish("conv-1", {"type": "text", "content": "hi"})
+        await _wait_for(lambda: workers[0].local_connection_count() == 1)
+        
+        assert _chat(healthy.received)
+        assert workers[0].stats()["send_failures"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_slow_socket_does_not_delay_others(self, broker):
+        """Publishing returns without waiting on a slow client."""
+        fast = FakeWebSocket()
+        slow = FakeWebSocket(delay=1.0)
+        await broker.connect(fast, "conv-1")
+        await broker.connect(slow, "conv-1")
+        
+        started = time.perf_counter()
+        await broker.publish("conv-1", {"type": "text", "content": "hi"})
+        await _wait_for(lambda: _chat(fast.received))
+        
+        assert time.perf_counter() - started < 0.5
+        assert slow.received == []
+    
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_disconnected(self, broker):
+        """A full queue disconnects the slow client under the default policy."""
+        broker.queue_size = 3
+        broker.slow_consumer_policy = "disconnect"
+        fast = FakeWebSocket()
+        slow = FakeWebSocket(delay=10.0)
+        await broker.connect(fast, "conv-1")
+        await broker.connect(slow, "conv-1")
+        
+        for i in range(5):
+            await broker.publish("conv-1", {"type": "text", "content": str(i)})
+            await asyncio.sleep(0)
+        await _wait_for(lambda: len(_chat(fast.received)) == 5)
+        await _wait_for(lambda: slow.close_code is not None)
+        
+        assert slow.close_code == 1013
+        assert broker.local_connection_count() == 1
+        assert broker.stats()["slow_consumer_disconnects"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_slow_consumer_drops_oldest(self, broker):
+        """Under the drop policy a full queue keeps the newest messages."""
+        broker.queue_size = 2
+        broker.slow_consumer_policy = "drop"
+        slow = FakeWebSocket(delay=0.2)
+        await broker.connect(slow, "conv-1")
+        
+        for i in range(5):
+            await broker.publish("conv-1", {"type": "text", "content": str(i)})
+            await asyncio.sleep(0)
+        await _wait_for(lambda: not broker.stats()["queued_messages"])
+        await asyncio.sleep(0.3)
+        
+        assert [m["content"] for m in _chat(slow.received)] == ["0", "3", "4"]
+        assert broker.stats()["dropped"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_stats(self, broker):
+        """Stats report connections, queue depth and send latency."""
+        websocket = FakeWebSocket()
+        await broker.connect(websocket, "conv-1")
+        
+        await broker.publish("conv-1", {"type": "text", "content": "hi"})
+        await _wait_for(lambda: broker.stats()["sent"] == 1)
+        
+        stats = broker.stats()
+        assert stats["connections"] == 1
+        assert stats["max_queue_depth"] == 0
+        assert stats["avg_send_latency_ms"] >= 0
+        assert stats["max_send_latency_ms"] >= stats["avg_send_latency_ms"]
+    
+    @pytest.mark.asyncio
+    async def test_local_delivery_without_redis(self, broker):
+        """Without Redis the broker behaves like the single-worker manager."""
+        first = FakeWebSocket()
+        second = FakeWebSocket()
+        await broker.connect(first, "conv-1", "buyer-1")
+        await broker.connect(second, "conv-1", "vendor-1")
+        
+        await broker.publish("conv-1", {"type": "text", "content": "hi"})
+        await _wait_for(lambda: _chat(second.received))
+        
+        assert _chat(second.received)[0]["content"] == "hi"
+        assert await broker.get_presence("conv-1") == ["buyer-1", "vendor-1"]
+    
+    def test_websocket_endpoint(self, chat_client):
+        """Messages sent on the chat WebSocket reach the other participant as the authenticated sender."""
+        client, message_log = chat_client
+        
+        with client.websocket_connect(f"/ws/conv-1?token={_token('buyer-1')}") as buyer:
+            with client.websocket_connect(f"/ws/conv-1?token={_token('vendor-1')}") as vendor:
+                buyer.send_json({"sender_id": "vendor-1", "content": "namaste"})
+                
+                message = vendor.receive_json()
+                while message["type"] != "text":
+                    message = vendor.receive_json()
+                
+                assert message["content"] == "namaste"
+                assert message["sender_id"] == "buyer-1"
+        
+        document, recipient_id = message_log.append.call_args[0]
+        assert document["sender_id"] == "buyer-1"
+        assert recipient_id == "vendor-1"
+    
+    @pytest.mark.parametrize("query", ["", "?token=not-a-jwt", "?user_id=buyer-1", f"?token={_token('intruder')}"])
+    def test_websocket_rejects_unauthenticated_and_non_participants(self, chat_client, query):
+        """Sockets without a valid token for a participant are closed before any message is stored."""
+        client, message_log = chat_client
+        
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(f"/ws/conv-1{query}") as websocket:
+                websocket.send_json({"sender_id": "buyer-1", "content": "spoofed"})
+        
+        assert exc_info.value.code == 1008
+        message_log.append.assert_not_called()
+    
+    def test_websocket_error_releases_connection(self, chat_client):
+        """A socket that fails with an error other than a disconnect is still cleaned up."""
+        client, message_log = chat_client
+        
+        with pytest.raises(json.JSONDecodeError):
+            with client.websocket_connect(f"/ws/conv-error?token={_token('buyer-1')}") as buyer:
+                buyer.send_text("not json")
+                buyer.receive_json()
+        
+        assert "conv-error" not in chat_broker.active_connections
+        assert "conv-error" not in chat_broker._presence
+        message_log.append.assert_not_called()
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_fan_out_load(self, redis_client):
+        """Thousands of sockets across four workers all receive their messages."""
+        brokers = [ChatBroker(presence_ttl=30) for _ in range(4)]
+        for broker in brokers:
+            await broker.start_listener()
+        
+        try:
+            conversations = 2000
+            pairs = []
+            for i in range(conversations):
+                conversation_id = f"conv-{i}"
+                buyer = FakeWebSocket()
+                vendor = FakeWebSocket()
+                await brokers[i % 4].connect(buyer, conversation_id, f"buyer-{i}")
+                await brokers[(i + 1) % 4].connect(vendor, conversation_id, f"vendor-{i}")
+                pairs.append((conversation_id, buyer, vendor))
+            await _wait_for(lambda: all(b._pubsub is not None for b in brokers))
+            await asyncio.sleep(0.2)
+            
+            # Bound in-flight publishes to what a worker's Redis pool would serve
+            semaphore = asyncio.Semaphore(50)
+            
+            async def send(i, conversation_id):
+                async with semaphore:
+                    await brokers[i % 4].publish(conversation_id, {"type": "text", "content": conversation_id})
+            
+            started = time.perf_counter()
+            await asyncio.gather(*(send(i, conversation_id) for i, (conversation_id, _, _) in enumerate(pairs)))
+            await _wait_for(lambda: all(_chat(vendor.received) for _, _, vendor in pairs), timeout=60)
+            elapsed = time.perf_counter() - started
+            
+            sockets = sum(broker.local_connection_count() for broker in brokers)
+            print(f"\n{sockets} sockets, {conversations} messages fanned out in {elapsed:.2f}s")
+            
+            assert sockets == 2 * conversations
+            for conversation_id, buyer, vendor in pairs:
+                assert [m["content"] for m in _chat(vendor.received)] == [conversation_id]
+                assert [m["content"] for m in _chat(buyer.received)] == [conversation_id]
+        finally:
+            for broker in brokers:
+                await broker.stop_listener()
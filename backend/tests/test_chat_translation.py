@@ -0,0 +1,197 @@
+"""
+Unit tests for the chat translation pipeline.
+
+Tests translate-once fan-out per conversation language, storage keyed by
+message and language, per-language delivery and background processing.
+"""
+
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.chat_broker import ChatBroker
+from app.services.chat_translation import ChatTranslationPipeline
+from app.services.translation_service import TranslationResult
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a server-side WebSocket."""
+    
+    def __init__(self):
+        self.received = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text):
+        self.received.append(json.loads(text))
+
+
+def _message(i=1, content="Is 25 per kg ok?"):
+    """Build a stored chat message document."""
+    return {
+        "_id": f"msg-{i}",
+        "conversation_id": "conv-1",
+        "sender_id": "buyer-1",
+        "content": content,
+        "type": "text",
+        "created_at": datetime(2024, 1, 15, 10, 0, i)
+    }
+
+
+async def _fake_translate(text, source_language, target_language):
+    return TranslationResult(
+        original_text=text,
+        translated_text=f"[{target_language}] {text}",
+        source_language=source_language,
+        target_language=target_language,
+        confidence_score=0.9
+    )
+
+
+@pytest.fixture
+def database():
+    """Create a mock database with a Hindi buyer and a Tamil vendor."""
+    database = MagicMock()
+    database.conversations.find_one = AsyncMock(
+        return_value={"_id": "conv-1", "participant_1": "buyer-1", "participant_2": "vendor-1"}
+    )
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[
+        {"user_id": "buyer-1", "preferred_languages": ["hi", "en"]},
+        {"user_id": "vendor-1", "preferred_languages": ["ta"]},
+    ])
+    database.users.find = MagicMock(return_value=cursor)
+    database.message_translations.insert_many = AsyncMock()
+    return database
+
+
+@pytest.fixture
+def translate(monkeypatch):
+    """Replace the translation backend with a deterministic fake."""
+    translate = AsyncMock(side_effect=_fake_translate)
+    monkeypatch.setattr(
+        "app.services.chat_translation.translation_service.translate_text", translate
+    )
+    return translate
+
+
+@pytest_asyncio.fixture
+async def broker(monkeypatch):
+    """Route translation events through a local broker."""
+    broker = ChatBroker()
+    monkeypatch.setattr("app.services.chat_translation.chat_broker", broker)
+    yield broker
+    await broker.stop_listener()
+
+
+class TestChatTranslationPipeline:
+    """Test cases for ChatTranslationPipeline."""
+    
+    @pytest.mark.asyncio
+    async def test_translates_once_per_conversation_language(self, database, translate, broker):
+        """Each participant language is translated once and stored by message and language."""
+        pipeline = ChatTranslationPipeline(database)
+        
+        translations = await pipeline.translate_message(_message(), "en")
+        
+        assert translations == {"hi": "[hi] Is 25 per kg ok?", "ta": "[ta] Is 25 per kg ok?"}
+        assert sorted(call.args[2] for call in translate.await_args_list) == ["hi", "ta"]
+        
+        documents = database.message_translations.insert_many.call_args[0][0]
+        assert sorted(doc["_id"] for doc in documents) == ["msg-1:hi", "msg-1:ta"]
+    
+    @pytest.mark.asyncio
+    async def test_source_language_not_translated(self, database, translate, broker):
+        """A message already in a participant's language is not translated for them."""
+        pipeline = ChatTranslationPipeline(database)
+        
+        translations = await pipeline.translate_message(_message(), "hi", {"en"})
+        
+        assert set(translations) == {"en", "ta"}
+    
+    @pytest.mark.asyncio
+    async def test_delivered_only_in_socket_language(self, database, translate, broker):
+        """Sockets receive the translation in their own language only."""
+        hindi = FakeWebSocket()
+        tamil = FakeWebSocket()
+        await broker.connect(hindi, "conv-1", language="hi")
+        await broker.connect(tamil, "conv-1", language="ta")
+        pipeline = ChatTranslationPipeline(database)
+        
+        await pipeline.translate_message(_message(), "en")
+        for _ in range(50):
+            if hindi.received and tamil.received:
+                break
+            await asyncio.sleep(0.01)
+        
+        assert [m["language"] for m in hindi.received] == ["hi"]
+        assert [m["translated_content"] for m in tamil.received] == ["[ta] Is 25 per kg ok?"]
+    
+    @pytest.mark.asyncio
+    async def test_untranslated_fallback_is_not_stored(self, database, translate, broker):
+        """Fallback results that return the original text are skipped."""
+        async def fallback(text, source_language, target_language):
+            return TranslationResult(
+                original_text=text,
+                translated_text=text,
+                source_language=source_language,
+                target_language=target_language,
+                confidence_score=0.0
+            )
+        translate.side_effect = fallback
+        pipeline = ChatTranslationPipeline(database)
+        
+        assert await pipeline.translate_message(_message(), "en") == {}
+        database.message_translations.insert_many.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_languages_are_cached(self, database, translate, broker):
+        """Participant languages are looked up once per conversation."""
+        pipeline = ChatTranslationPipeline(database)
+        
+        await pipeline.translate_message(_message(1), "en")
+        await pipeline.translate_message(_message(2), "en")
+        
+        assert database.users.find.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_submit_translates_in_background(self, database, translate, broker):
+        """Submitting returns immediately and workers translate afterwards."""
+        pipeline = ChatTranslationPipeline(database, workers=2)
+        await pipeline.start()
+        try:
+            assert pipeline.submit(_message(), "en")
+            assert translate.await_count == 0
+            
+            await asyncio.wait_for(pipeline.queue.join(), timeout=5)
+            
+            assert database.message_translations.insert_many.await_count == 1
+        finally:
+            await pipeline.stop()
+    
+    def test_submit_when_queue_full(self, database):
+        """Messages are sent untranslated rather than blocking when the queue is full."""
+        pipeline = ChatTranslationPipeline(database, queue_size=1)
+        
+        assert pipeline.submit(_message(1), "en")
+        assert not pipeline.submit(_message(2), "en")
+    
+    @pytest.mark.asyncio
+    async def test_get_translations(self, database):
+        """Stored translations are looked up by message and language."""
+        cursor = MagicMock()
+        cursor.to_list = AsyncMock(return_value=[
+            {"message_id": "msg-1", "translated_content": "[hi] one"},
+        ])
+        database.message_translations.find = MagicMock(return_value=cursor)
+        pipeline = ChatTranslationPipeline(database)
+        
+        translations = await pipeline.get_translations(["msg-1", "msg-2"], "hi")
+        
+        assert translations == {"msg-1": "[hi] one"}
+        query = database.message_translations.find.call_args[0][0]
+        assert query == {"_id": {"$in": ["msg-1:hi", "msg-2:hi"]}}
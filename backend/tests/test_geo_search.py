@@ -0,0 +1,250 @@
+"""
+Unit tests for distance-sorted product search.
+
+Tests geohash encoding and cell coverage, nearest-first results with totals,
+the per-cell candidate cache, the $geoNear fallback, the geohash backfill and
+routing distance searches past the text search.
+"""
+
+import random
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.models.product import ProductResponse, ProductSearchQuery
+from app.services.geo_search import (
+    GeoSearch,
+    backfill_geohash,
+    covering_cells,
+    distance_km,
+    encode_geohash,
+    geo_search,
+    location_for_db,
+)
+from app.services.product_service import ProductService
+from tests.conftest import AsyncDatabase
+
+
+# Azadpur mandi, Delhi
+MANDI = [77.1770, 28.7070]
+
+
+def _product(product_id, coordinates, category="VEGETABLES"):
+    return {
+        "_id": product_id,
+        "status": "active",
+        "category": category,
+        "location": location_for_db({"city": "Delhi", "coordinates": coordinates}),
+    }
+
+
+def _offset(point, east_km, north_km):
+    """Point a given distance east and north of another."""
+    longitude, latitude = point
+    return [longitude + east_km / (111.195 * 0.8768), latitude + north_km / 111.195]
+
+
+@pytest.fixture
+def database():
+    """Create a database with products 1 to 12 km north of the mandi and one far away."""
+    database = AsyncDatabase()
+    database._database.products.insert_many(
+        [_product(f"p-{km:02d}", _offset(MANDI, 0, km)) for km in range(12, 0, -1)]
+        + [_product("p-fruit", _offset(MANDI, 2.5, 0), "FRUITS")]
+        + [_product("p-mumbai", [72.8777, 19.0760])]
+    )
+    return database
+
+
+ACTIVE_VEGETABLES = {"status": {"$in": ["active"]}, "category": "VEGETABLES"}
+
+
+class TestGeohash:
+    """Test cases for geohash helpers."""
+    
+    def test_encode(self):
+        """Points encode to the standard geohash."""
+        assert encode_geohash(-5.6, 42.6, 5) == "ezs42"
+        assert encode_geohash(*MANDI).startswith("ttng")
+    
+    def test_cells_cover_radius(self):
+        """Every point within the radius falls in one of the covering cells."""
+        rng = random.Random(3)
+        for radius in (0.5, 5, 25, 100):
+            cells = covering_cells(*MANDI, radius)
+            
+            assert len(cells) == 9
+            for _ in range(500):
+                point = _offset(MANDI, rng.uniform(-radius, radius), rng.uniform(-radius, radius))
+                if distance_km(MANDI, point) <= radius:
+                    assert any(encode_geohash(*point).startswith(cell) for cell in cells)
+
+
+class TestGeoSearch:
+    """Test cases for GeoSearch."""
+    
+    @pytest.mark.asyncio
+    async def test_nearest_first_with_total(self, database):
+        """Results are sorted by distance, paged and counted within the radius."""
+        search = GeoSearch(database)
+        
+        products, total = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10.5, skip=2, limit=3)
+        
+        assert total == 10
+        assert [p["_id"] for p in products] == ["p-03", "p-04", "p-05"]
+        assert products[0]["distance_km"] == pytest.approx(3, abs=0.05)
+    
+    @pytest.mark.asyncio
+    async def test_radius_condition_replaced(self, database):
+        """A radius condition in the filter is replaced by the search radius."""
+        search = GeoSearch(database)
+        search_filter = {**ACTIVE_VEGETABLES, "location.coordinates": {"$geoWithin": {}}}
+        
+        products, total = await search.search(search_filter, MANDI, radius_km=2.5)
+        
+        assert [p["_id"] for p in products] == ["p-01", "p-02"]
+        assert total == 2
+    
+    @pytest.mark.asyncio
+    async def test_cache_shared_near_the_same_mandi(self, database):
+        """Searches from nearby points share cached candidates but get their own distances."""
+        search = GeoSearch(database)
+        await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10)
+        database.products.finds.clear()
+        
+        products, _ = await search.search(ACTIVE_VEGETABLES, _offset(MANDI, 0, 0.2), radius_km=10)
+        
+        assert search.stats["hits"] == 1
+        assert len(database.products.finds) == 1  # the page only
+        assert products[0]["_id"] == "p-01"
+        assert products[0]["distance_km"] == pytest.approx(0.8, abs=0.05)
+    
+    @pytest.mark.asyncio
+    async def test_invalidate_new_product(self, database):
+        """Invalidating a product's cell makes it visible to cached searches."""
+        search = GeoSearch(database)
+        await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10)
+        product = _product("p-new", _offset(MANDI, 0.1, 0))
+        database._database.products.insert_one(product)
+        
+        search.invalidate(encode_geohash(*_offset(MANDI, 300, 300)))
+        stale, _ = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10)
+        search.invalidate(product["location"]["geohash"])
+        fresh, _ = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10)
+        
+        assert stale[0]["_id"] == "p-01"
+        assert fresh[0]["_id"] == "p-new"
+    
+    @pytest.mark.asyncio
+    async def test_products_changed_since_caching_leave_page_and_total(self, database):
+        """Cached products that no longer match are dropped, the page refilled and the total reduced."""
+        search = GeoSearch(database)
+        await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10.5)
+        database._database.products.update_many(
+            {"_id": {"$in": ["p-02", "p-03"]}}, {"$set": {"status": "sold_out"}}
+        )
+        
+        products, total = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10.5, limit=3)
+        
+        assert [p["_id"] for p in products] == ["p-01", "p-04", "p-05"]
+        assert total == 8
+        
+        database.products.finds.clear()
+        products, total = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10.5, limit=3)
+        
+        assert [p["_id"] for p in products] == ["p-01", "p-04", "p-05"]
+        assert total == 8
+        assert len(database.products.finds) == 1
+    
+    @pytest.mark.asyncio
+    async def test_dense_cells_use_geo_near(self, database):
+        """Cell blocks with too many candidates are searched with one $geoNear aggregation."""
+        search = GeoSearch(database, max_candidates=5)
+        database.aggregate_result = [
+            {"products": [{"_id": "p-01", "distance_km": 1.0}], "total": [{"count": 10}]}
+        ]
+        
+        products, total = await search.search(ACTIVE_VEGETABLES, MANDI, radius_km=10, limit=1)
+        
+        pipeline, = database.pipelines
+        assert pipeline[0]["$geoNear"]["maxDistance"] == 10000
+        assert pipeline[0]["$geoNear"]["query"] == ACTIVE_VEGETABLES
+        assert "$facet" in pipeline[1]
+        assert (products, total) == ([{"_id": "p-01", "distance_km": 1.0}], 10)
+        assert search.stats["geo_near"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_backfill(self):
+        """Old products get geohashes, products without coordinates are skipped."""
+        database = AsyncDatabase()
+        database._database.products.insert_many(
+            [{"_id": f"p-{i:02d}", "location": {"coordinates": _offset(MANDI, i, 0)}} for i in range(15)]
+            + [{"_id": "p-none", "location": {"city": "Delhi"}}]
+        )
+        
+        result = await backfill_geohash(database, batch_size=4)
+        
+        assert result == {"updated": 15, "skipped": 1}
+        stored = database._database.products.find_one({"_id": "p-00"})["location"]["geohash"]
+        assert stored == encode_geohash(*MANDI)
+        assert await backfill_geohash(database, batch_size=4) == {"updated": 0, "skipped": 1}
+
+
+class TestProductSearchFilter:
+    """Test cases for the product search radius filter."""
+    
+    @pytest.mark.asyncio
+    async def test_radius_uses_geo_within(self):
+        """Radius searches use $geoWithin, which count_documents accepts."""
+        query = ProductSearchQuery(coordinates=MANDI, radius_km=10)
+        
+        search_filter = await ProductService()._build_search_filter(query)
+        
+        assert search_filter["location.coordinates"] == {
+            "$geoWithin": {"$centerSphere": [MANDI, 10 / 6371.0088]}
+        }
+
+
+class TestDistanceSearchRouting:
+    """Test cases for distance searches in ProductService."""
+    
+    @pytest.mark.asyncio
+    async def test_distance_sort_skips_text_search(self, database):
+        """Distance sorts are answered nearest first by geo_search while the text search is up."""
+        query = ProductSearchQuery(
+            coordinates=MANDI, radius_km=10, sort_by="distance", available_only=False, limit=3
+        )
+        text_search = AsyncMock()
+        
+        async def get_database():
+            return database
+        
+        async def convert(product, language):
+            return ProductResponse.model_construct(product_id=product["_id"], distance_km=product["distance_km"])
+        
+        geo_search.invalidate()
+        with patch.object(ProductService, "_search_elasticsearch", text_search), \
+             patch.object(ProductService, "_convert_product_to_response", side_effect=convert), \
+             patch("app.services.product_service.get_database", get_database), \
+             patch("app.services.geo_search.get_database", get_database):
+            result = await ProductService().search_products(query)
+        geo_search.invalidate()
+        
+        text_search.assert_not_called()
+        assert [p.product_id for p in result.products] == ["p-01", "p-02", "p-fruit"]
+        assert result.products[0].distance_km == pytest.approx(1, abs=0.05)
+        assert result.total_count == 10
+        assert result.search_metadata["query_plan"]["strategy"] == "geo_search"
+        assert result.search_metadata["fallback_used"] is False
+    
+    @pytest.mark.asyncio
+    async def test_update_invalidates_new_cells(self):
+        """Moving a product drops cached cells around its old and new locations."""
+        product = _product("p-01", _offset(MANDI, 0, 1))
+        moved = location_for_db({"city": "Mumbai", "coordinates": [72.8777, 19.0760]})
+        
+        with patch.object(geo_search, "invalidate") as invalidate:
+            ProductService._invalidate_geo_cells(product, {"location": moved})
+        
+        assert sorted(call.args[0] for call in invalidate.call_args_list) == sorted(
+            [product["location"]["geohash"], moved["geohash"]]
+        )
@@ -0,0 +1,390 @@
+"""
+Unit tests for the product image pipeline.
+
+Tests renditions from one decode, admission limits, 429 responses for full
+queues, rendering in worker processes, content-addressed storage of
+responsive renditions, spooled uploads and a benchmark of event loop latency during
+concurrent uploads.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import pytest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from app.api.v1.endpoints import products
+from app.core.exceptions import RateLimitException, ValidationException
+from app.services.image_pipeline import ImagePipeline, render_image
+from app.services.image_service import ImageService
+from app.services.image_storage import LocalImageStorage
+from tests.conftest import AsyncDatabase
+
+
+def _photo(width, height, format="JPEG", mode="RGB"):
+    """Encode a noisy gradient, which compresses about like a photo."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    image.convert(mode).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class ManualExecutor:
+    """Executor whose futures finish when the test says so."""
+    
+    def __init__(self):
+        self.futures = []
+    
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+
+def _manual_pipeline(workers=1, queue_size=1):
+    pipeline = ImagePipeline(workers=workers, queue_size=queue_size, retry_after=3)
+    executor = ManualExecutor()
+    pipeline._get_executor = lambda: executor
+    return pipeline, executor
+
+
+class TestRenderImage:
+    """Test cases for rendering renditions."""
+    
+    def test_large_jpeg(self):
+        """Large JPEGs are scaled to 1200px on the longest side with a 300px thumbnail."""
+        rendered = render_image(_photo(4000, 3000))
+        
+        assert rendered["dimensions"] == {"width": 1200, "height": 900}
+        assert Image.open(io.BytesIO(rendered["image"])).size == (1200, 900)
+        assert Image.open(io.BytesIO(rendered["thumbnail"])).size == (300, 225)
+    
+    def test_portrait_png_with_alpha(self):
+        """PNGs with transparency are converted to JPEG renditions."""
+        rendered = render_image(_photo(900, 1500, format="PNG", mode="RGBA"))
+        
+        assert rendered["dimensions"] == {"width": 720, "height": 1200}
+        assert Image.open(io.BytesIO(rendered["image"])).format == "JPEG"
+        assert Image.open(io.BytesIO(rendered["thumbnail"])).size == (180, 300)
+    
+    def test_small_image_not_enlarged(self):
+        """Images within the limit keep their size."""
+        rendered = render_image(_photo(640, 480))
+        
+        assert rendered["dimensions"] == {"width": 640, "height": 480}
+    
+    
+    def test_renditions_in_each_width_and_format(self):
+        """Renditions are made in each width up to the main image, in each format."""
+        rendered = render_image(_photo(1000, 750), widths=[320, 640, 1200], formats=["webp", "jpeg"])
+        
+        sizes = [(r["format"], r["width"], r["height"]) for r in rendered["renditions"]]
+        assert sizes == [
+            ("webp", 320, 240), ("jpeg", 320, 240), ("webp", 640, 480), ("jpeg", 640, 480),
+            ("webp", 1000, 750), ("jpeg", 1000, 750),
+        ]
+        assert Image.open(io.BytesIO(rendered["renditions"][0]["data"])).format == "WEBP"
+        assert rendered["renditions"][-1]["data"] is rendered["image"]
+        assert len(rendered["renditions"][4]["data"]) < len(rendered["image"])
+
+
+class TestImagePipeline:
+    """Test cases for admission to the process pool."""
+    
+    @pytest.mark.asyncio
+    async def test_full_queue_rejected(self):
+        """Uploads beyond the workers and queue are refused with a retry delay."""
+        pipeline, executor = _manual_pipeline(workers=1, queue_size=1)
+        tasks = [asyncio.create_task(pipeline.render(b"image")) for _ in range(2)]
+        await asyncio.sleep(0)
+        
+        with pytest.raises(RateLimitException) as exc_info:
+            await pipeline.render(b"image")
+        assert exc_info.value.retry_after == 3
+        
+        for future in executor.futures:
+            future.set_result({"image": b"main", "thumbnail": b"thumb", "dimensions": {}, "renditions": []})
+        await asyncio.gather(*tasks)
+        await asyncio.sleep(0)
+        
+        assert pipeline.in_flight == 0
+        assert pipeline.stats == {"processed": 2, "rejected": 1, "failed": 0}
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_upload_holds_slot_until_worker_finishes(self):
+        """An image keeps its slot while a worker renders it, even if the upload is gone."""
+        pipeline, executor = _manual_pipeline(workers=1, queue_size=0)
+        task = asyncio.create_task(pipeline.render(b"image"))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        
+        with pytest.raises(RateLimitException):
+            await pipeline.render(b"image")
+        
+        executor.futures[0].set_exception(OSError("truncated image"))
+        await asyncio.sleep(0)
+        assert pipeline.in_flight == 0
+        assert pipeline.stats["failed"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_broken_pool_replaced(self):
+        """A pool whose worker died is dropped so the next upload gets a new one."""
+        pipeline = ImagePipeline(workers=1, queue_size=1)
+        broken = pipeline._executor = ManualExecutor()
+        task = asyncio.create_task(pipeline.render(b"image"))
+        await asyncio.sleep(0)
+        
+        broken.futures[0].set_exception(BrokenProcessPool("worker killed"))
+        with pytest.raises(BrokenProcessPool):
+            await task
+        
+        assert pipeline._executor is None
+        assert pipeline.in_flight == 0
+    
+    @pytest.mark.asyncio
+    async def test_renders_in_worker_process(self):
+        """Images are rendered by the process pool."""
+        pipeline = ImagePipeline(workers=1, queue_size=1)
+        try:
+            await pipeline.start()
+            rendered = await pipeline.render(_photo(1600, 1200), widths=[640], formats=["webp"])
+        finally:
+            await pipeline.stop()
+        
+        assert rendered["dimensions"] == {"width": 1200, "height": 900}
+        assert [r["width"] for r in rendered["renditions"]] == [640, 1200]
+        assert pipeline.stats["processed"] == 1
+
+
+class CountingPipeline:
+    """Renders in the test process and counts renders."""
+    
+    def __init__(self):
+        self.renders = 0
+    
+    async def render(self, image_data, widths=(), formats=("jpeg",)):
+        self.renders += 1
+        return render_image(image_data, widths, formats)
+
+
+@pytest.fixture
+def local_image_service(tmp_path, monkeypatch):
+    """Image service storing files under a temporary uploads directory."""
+    monkeypatch.chdir(tmp_path)
+    pipeline = CountingPipeline()
+    monkeypatch.setattr("app.services.image_service.image_pipeline", pipeline)
+    service = ImageService()
+    service.s3_client = None
+    service.storage = LocalImageStorage()
+    return service, pipeline
+
+
+class TestContentAddressedStore:
+    """Test cases for storing renditions by content hash."""
+    
+    @pytest.mark.asyncio
+    async def test_renditions_stored_with_srcset(self, local_image_service, tmp_path):
+        """Uploads store each rendition under the image hash and expose a srcset."""
+        service, _ = local_image_service
+        image_data = _photo(1600, 1200)
+        
+        image_ref = await service.upload_product_image(image_data, "mangoes.jpg", "product-1")
+        
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        prefix = f"/uploads/images/{content_hash[:2]}/{content_hash}"
+        assert image_ref.content_hash == content_hash
+        assert image_ref.image_url == f"{prefix}/image.jpg"
+        assert image_ref.thumbnail_url == f"{prefix}/thumbnail.jpg"
+        assert image_ref.srcset("webp") == f"{prefix}/320w.webp 320w, {prefix}/640w.webp 640w, {prefix}/1200w.webp 1200w"
+        assert image_ref.srcset("jpeg").endswith(f"{prefix}/image.jpg 1200w")
+        for rendition in image_ref.renditions:
+            assert (tmp_path / rendition.url.lstrip("/")).stat().st_size == rendition.file_size
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_upload_reuses_renditions(self, local_image_service):
+        """The same image uploaded again, to any product, is not rendered or stored again."""
+        service, pipeline = local_image_service
+        image_data = _photo(800, 600)
+        
+        first = await service.upload_product_image(image_data, "onions.jpg", "product-1")
+        second = await service.upload_product_image(image_data, "onions-copy.jpg", "product-2")
+        
+        assert pipeline.renders == 1
+        assert second.image_id != first.image_id
+        assert second.renditions == first.renditions
+        assert second.dimensions == first.dimensions == {"width": 800, "height": 600}
+    
+    @pytest.mark.asyncio
+    async def test_incomplete_upload_rendered_again(self, local_image_service, tmp_path):
+        """An image without a manifest was not completely stored and is rendered again."""
+        service, pipeline = local_image_service
+        image_data = _photo(800, 600)
+        image_ref = await service.upload_product_image(image_data, "okra.jpg", "product-1")
+        manifest = tmp_path / "uploads" / "images" / image_ref.content_hash[:2] / image_ref.content_hash / "manifest.json"
+        manifest.unlink()
+        
+        await service.upload_product_image(image_data, "okra.jpg", "product-1")
+        
+        assert pipeline.renders == 2
+        assert manifest.exists()
+    
+    @pytest.mark.asyncio
+    async def test_delete_keeps_renditions_still_referenced(self, local_image_service, tmp_path, monkeypatch):
+        """Renditions are deleted with the last image referring to their hash."""
+        service, _ = local_image_service
+        image_data = _photo(800, 600)
+        first = await service.upload_product_image(image_data, "onions.jpg", "product-1")
+        second = await service.upload_product_image(image_data, "onions-copy.jpg", "product-2")
+        
+        database = AsyncDatabase()
+        await database.products.insert_many([
+            {"_id": "product-1", "images": [first.model_dump()]},
+            {"_id": "product-2", "images": [second.model_dump()]},
+        ])
+        
+        async def get_database():
+            return database
+        monkeypatch.setattr("app.services.image_service.get_database", get_database)
+        directory = tmp_path / "uploads" / "images" / first.content_hash[:2] / first.content_hash
+        
+        assert await service.delete_product_image(first.image_id, first.content_hash)
+        assert (directory / "manifest.json").exists()
+        assert (directory / "image.jpg").exists()
+        
+        await database.products.update_one({"_id": "product-1"}, {"$set": {"images": []}})
+        assert await service.delete_product_image(second.image_id, second.content_hash)
+        assert sorted(directory.iterdir()) == []
+
+
+class TestSpoolUpload:
+    """Test cases for spooling uploads to temporary files."""
+    
+    @pytest.mark.asyncio
+    async def test_spooled_upload_stored_like_bytes(self, local_image_service):
+        """A spooled upload is hashed while copied and its file removed afterwards."""
+        service, _ = local_image_service
+        image_data = _photo(1000, 800)
+        
+        async with service.spool_upload(UploadFile(io.BytesIO(image_data), filename="chillies.png")) as spooled:
+            assert spooled.size == len(image_data)
+            assert spooled.path.endswith(".png")
+            image_ref = await service.upload_product_image(spooled, spooled.filename, "product-1")
+        
+        assert image_ref.content_hash == hashlib.sha256(image_data).hexdigest()
+        assert image_ref.dimensions == {"width": 1000, "height": 800}
+        assert not os.path.exists(spooled.path)
+    
+    @pytest.mark.asyncio
+    async def test_known_size_rejected_without_reading(self):
+        """Uploads known to be too large are rejected before any of them is read."""
+        upload = UploadFile(MagicMock(), filename="huge.jpg", size=11 * 1024 * 1024)
+        upload.read = AsyncMock()
+        
+        with pytest.raises(ValidationException, match="cannot exceed 10MB"):
+            async with ImageService().spool_upload(upload):
+                pass
+        upload.read.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_oversized_stream_rejected(self):
+        """Uploads of unknown size are rejected once they pass the limit."""
+        upload = UploadFile(io.BytesIO(b"\xff\xd8\xff" + bytes(12 * 1024 * 1024)), filename="huge.jpg")
+        
+        with patch("app.services.image_service.os.remove", wraps=os.remove) as remove:
+            with pytest.raises(ValidationException, match="cannot exceed 10MB"):
+                async with ImageService().spool_upload(upload):
+                    pass
+        
+        assert upload.file.tell() == 11 * 1024 * 1024
+        assert not os.path.exists(remove.call_args.args[0])
+    
+    @pytest.mark.asyncio
+    async def test_non_image_rejected_on_first_chunk(self):
+        """Files without an image signature are rejected after the first chunk."""
+        upload = UploadFile(io.BytesIO(b"%PDF-1.7" + bytes(3 * 1024 * 1024)), filename="invoice.jpg")
+        
+        with pytest.raises(ValidationException, match="not a JPEG, PNG or WebP"):
+            async with ImageService().spool_upload(upload):
+                pass
+        
+        assert upload.file.tell() == 1024 * 1024
+
+
+class TestUploadEndpoint:
+    """Test cases for image uploads when the pipeline is full."""
+    
+    @pytest.mark.asyncio
+    async def test_full_pipeline_returns_429(self):
+        """A full pipeline answers uploads with 429 and Retry-After."""
+        pipeline, _ = _manual_pipeline(workers=1, queue_size=0)
+        pipeline._in_flight = 1
+        upload = UploadFile(io.BytesIO(_photo(800, 600)), filename="tomatoes.jpg")
+        product = SimpleNamespace(vendor_id="vendor-1")
+        
+        with patch.object(products.product_service, "get_product_by_id", AsyncMock(return_value=product)), \
+             patch("app.services.image_service.image_pipeline", pipeline):
+            with pytest.raises(HTTPException) as exc_info:
+                await products.upload_product_image(
+                    "product-1", file=upload, alt_text=None, is_primary=False,
+                    current_user=SimpleNamespace(user_id="vendor-1")
+                )
+        
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers == {"Retry-After": "3"}
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_event_loop_latency(self):
+        """Benchmark event loop latency while 8 uploads render inline and in the pool."""
+        import statistics
+        import time
+        
+        image_data = _photo(4000, 3000)
+        
+        async def inline_render(data):
+            return render_image(data)
+        
+        async def measure(render):
+            delays = []
+            done = asyncio.Event()
+            
+            async def probe():
+                # Stands in for a cheap API request sharing the event loop
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    delays.append(time.perf_counter() - start - 0.005)
+            
+            probe_task = asyncio.create_task(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*[render(image_data) for _ in range(8)])
+            elapsed = time.perf_counter() - start
+            done.set()
+            await probe_task
+            delays.sort()
+            return elapsed, statistics.median(delays), delays[-1]
+        
+        pipeline = ImagePipeline(workers=2, queue_size=8)
+        try:
+            await pipeline.start()
+            inline = await measure(inline_render)
+            pooled = await measure(pipeline.render)
+        finally:
+            await pipeline.stop()
+        
+        for label, (elapsed, median, worst) in (("inline", inline), ("process pool", pooled)):
+            print(
+                f"\n8 x 4000x3000 JPEG uploads {label}: {elapsed * 1000:.0f} ms total, "
+                f"loop delay median {median * 1000:.1f} ms, max {worst * 1000:.1f} ms"
+            )
+        assert pooled[2] < inline[2]
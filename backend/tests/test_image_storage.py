@@ -0,0 +1,198 @@
+"""
+Unit tests for product image storage.
+
+Tests the local and S3 storage backends, S3-compatible endpoints, and
+serving stored images with immutable caching, ETags, ranges and pathsend.
+An S3 round trip runs against a local MinIO when one is available.
+"""
+
+import io
+import pytest
+import boto3
+from botocore.stub import Stubber
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+from unittest.mock import MagicMock
+
+from app.services.image_storage import (
+    IMMUTABLE_CACHE_CONTROL,
+    ImageFiles,
+    LocalImageStorage,
+    S3ImageStorage,
+)
+
+
+def _s3_client(endpoint_url=None):
+    return boto3.client(
+        "s3", aws_access_key_id="test", aws_secret_access_key="test",
+        region_name="ap-south-1", endpoint_url=endpoint_url
+    )
+
+
+class TestLocalImageStorage:
+    """Test cases for LocalImageStorage."""
+    
+    @pytest.mark.asyncio
+    async def test_round_trip(self, tmp_path):
+        """Objects are written from bytes or files, read back and deleted."""
+        storage = LocalImageStorage(str(tmp_path / "uploads"))
+        source = tmp_path / "spooled.jpg"
+        source.write_bytes(b"from a file")
+        
+        await storage.put("images/ab/abc/image.jpg", b"from bytes", "image/jpeg")
+        await storage.put("images/ab/abc/thumbnail.jpg", str(source), "image/jpeg")
+        
+        assert await storage.get("images/ab/abc/image.jpg") == b"from bytes"
+        assert await storage.get("images/ab/abc/thumbnail.jpg") == b"from a file"
+        assert sorted(p.name for p in (tmp_path / "uploads/images/ab/abc").iterdir()) == ["image.jpg", "thumbnail.jpg"]
+        
+        await storage.delete("images/ab/abc/image.jpg")
+        await storage.delete("images/ab/abc/image.jpg")
+        assert await storage.get("images/ab/abc/image.jpg") is None
+        assert storage.url("images/ab/abc/thumbnail.jpg") == "/uploads/images/ab/abc/thumbnail.jpg"
+    
+    @pytest.mark.asyncio
+    async def test_key_outside_root_rejected(self, tmp_path):
+        """Keys cannot reach outside the uploads directory."""
+        storage = LocalImageStorage(str(tmp_path / "uploads"))
+        
+        with pytest.raises(ValueError):
+            await storage.delete("products/../../secrets.txt")
+
+
+class TestS3ImageStorage:
+    """Test cases for S3ImageStorage."""
+    
+    @pytest.mark.asyncio
+    async def test_put_streams_with_immutable_caching(self, tmp_path):
+        """Objects are streamed from their file through the multipart transfer manager."""
+        path = tmp_path / "image.jpg"
+        path.write_bytes(b"jpeg")
+        bodies = []
+        client = MagicMock()
+        client.upload_fileobj.side_effect = lambda body, *args, **kwargs: bodies.append(body.read())
+        storage = S3ImageStorage(client, "images-bucket", multipart_threshold=5 * 1024 * 1024)
+        
+        await storage.put("images/ab/abc/image.jpg", str(path), "image/jpeg")
+        
+        args = client.upload_fileobj.call_args
+        assert bodies == [b"jpeg"]
+        assert args.args[1:] == ("images-bucket", "images/ab/abc/image.jpg")
+        assert args.kwargs["Config"].multipart_threshold == 5 * 1024 * 1024
+        assert args.kwargs["ExtraArgs"]["CacheControl"] == IMMUTABLE_CACHE_CONTROL
+        assert args.kwargs["ExtraArgs"]["ContentType"] == "image/jpeg"
+    
+    @pytest.mark.asyncio
+    async def test_get_and_delete(self):
+        """Missing objects read as None and deletes go to the bucket."""
+        client = _s3_client()
+        storage = S3ImageStorage(client, "images-bucket")
+        
+        with Stubber(client) as stubber:
+            stubber.add_client_error("get_object", "NoSuchKey", http_status_code=404)
+            stubber.add_response(
+                "get_object", {"Body": io.BytesIO(b"{}")}, {"Bucket": "images-bucket", "Key": "a/manifest.json"}
+            )
+            stubber.add_response("delete_object", {}, {"Bucket": "images-bucket", "Key": "a/image.jpg"})
+            
+            assert await storage.get("a/missing.json") is None
+            assert await storage.get("a/manifest.json") == b"{}"
+            await storage.delete("a/image.jpg")
+            stubber.assert_no_pending_responses()
+    
+    def test_urls(self):
+        """URLs follow AWS, S3-compatible endpoints or a configured public URL."""
+        client = _s3_client()
+        
+        assert S3ImageStorage(client, "b").url("k.jpg") == "https://b.s3.ap-south-1.amazonaws.com/k.jpg"
+        assert S3ImageStorage(client, "b", endpoint_url="http://localhost:9000/").url("k.jpg") == \
+            "http://localhost:9000/b/k.jpg"
+        assert S3ImageStorage(client, "b", public_url="https://cdn.example.com/").url("k.jpg") == \
+            "https://cdn.example.com/k.jpg"
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_minio_round_trip(self):
+        """Store, read and delete an object in parts on a local MinIO."""
+        import os
+        import uuid
+        
+        endpoint_url = os.getenv("S3_TEST_ENDPOINT_URL", "http://localhost:9000")
+        client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name="us-east-1",
+            aws_access_key_id=os.getenv("S3_TEST_ACCESS_KEY", "minioadmin"),
+            aws_secret_access_key=os.getenv("S3_TEST_SECRET_KEY", "minioadmin123"),
+        )
+        bucket = f"images-test-{uuid.uuid4().hex[:8]}"
+        try:
+            client.create_bucket(Bucket=bucket)
+        except Exception:
+            pytest.skip("MinIO is not available")
+        
+        storage = S3ImageStorage(client, bucket, endpoint_url=endpoint_url, multipart_threshold=5 * 1024 * 1024)
+        data = os.urandom(11 * 1024 * 1024)
+        try:
+            await storage.put("images/big.jpg", data, "image/jpeg")
+            head = client.head_object(Bucket=bucket, Key="images/big.jpg")
+            assert await storage.get("images/big.jpg") == data
+            await storage.delete("images/big.jpg")
+            assert await storage.get("images/big.jpg") is None
+        finally:
+            client.delete_bucket(Bucket=bucket)
+        
+        assert head["CacheControl"] == IMMUTABLE_CACHE_CONTROL
+        # Multipart uploads have an ETag of the part hashes and the part count
+        assert head["ETag"].endswith('-3"')
+
+
+class TestImageFiles:
+    """Test cases for serving locally stored images."""
+    
+    @pytest.fixture
+    def client(self, tmp_path):
+        (tmp_path / "images").mkdir()
+        (tmp_path / "images" / "image.jpg").write_bytes(bytes(range(256)) * 4)
+        app = Starlette()
+        app.mount("/uploads", ImageFiles(directory=str(tmp_path)))
+        return TestClient(app)
+    
+    def test_immutable_with_etag(self, client):
+        """Images are served as immutable and revalidate with their ETag."""
+        response = client.get("/uploads/images/image.jpg")
+        
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["content-type"] == "image/jpeg"
+        
+        revalidated = client.get("/uploads/images/image.jpg", headers={"If-None-Match": response.headers["etag"]})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    
+    def test_range(self, client):
+        """Byte ranges are served."""
+        response = client.get("/uploads/images/image.jpg", headers={"Range": "bytes=0-9"})
+        
+        assert response.status_code == 206
+        assert response.content == bytes(range(10))
+    
+    @pytest.mark.asyncio
+    async def test_pathsend(self, tmp_path):
+        """Servers with the pathsend extension are handed the file path to send."""
+        (tmp_path / "image.webp").write_bytes(b"RIFF")
+        app = ImageFiles(directory=str(tmp_path))
+        scope = {
+            "type": "http", "method": "GET", "path": "/image.webp", "root_path": "", "headers": [],
+            "query_string": b"", "extensions": {"http.response.pathsend": {}},
+        }
+        messages = []
+        
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        async def send(message):
+            messages.append(message)
+        
+        await app(scope, receive, send)
+        
+        assert [message["type"] for message in messages] == ["http.response.start", "http.response.pathsend"]
+        assert messages[1]["path"] == str(tmp_path / "image.webp")
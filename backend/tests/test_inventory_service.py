@@ -0,0 +1,235 @@
+"""
+Unit tests for inventory reservations.
+
+Tests conditional reservation, release on cancellation and expiry, hot
+product sharding and a concurrency stress test against an in-memory
+MongoDB whose operations interleave like network round-trips.
+"""
+
+import asyncio
+import random
+import pytest
+from datetime import datetime, timedelta
+
+from app.core.exceptions import InsufficientInventoryException, ValidationException
+from app.services.inventory_service import InventoryService
+from tests.conftest import AsyncDatabase
+
+
+def _available(database, product_id="p-1"):
+    """Sellable stock held in the product or its shards."""
+    product = database._database.products.find_one({"product_id": product_id})
+    if product["availability"].get("inventory_shards"):
+        return sum(s["quantity"] for s in database._database.inventory_shards.find({"product_id": product_id}))
+    return product["availability"]["quantity_available"]
+
+
+@pytest.fixture
+def database():
+    """Create a database with one product of 100 units."""
+    database = AsyncDatabase()
+    database._database.products.insert_one({
+        "product_id": "p-1",
+        "vendor_id": "vendor-1",
+        "availability": {"quantity_available": 100, "unit": "kg"},
+    })
+    return database
+
+
+@pytest.fixture
+def inventory(database):
+    return InventoryService(database, reservation_ttl_minutes=30, hot_key_threshold=10_000, shard_count=4)
+
+
+class TestInventoryService:
+    """Test cases for InventoryService."""
+    
+    @pytest.mark.asyncio
+    async def test_reserve_decrements_stock(self, inventory, database):
+        """A reservation takes stock and records an expiry."""
+        reservation = await inventory.reserve("p-1", 30, "order-1")
+        
+        assert _available(database) == 70
+        assert reservation["status"] == "held"
+        assert reservation["expires_at"] - reservation["created_at"] == timedelta(minutes=30)
+    
+    @pytest.mark.asyncio
+    async def test_insufficient_stock(self, inventory, database):
+        """A reservation larger than the stock fails and leaves it untouched."""
+        with pytest.raises(InsufficientInventoryException) as error:
+            await inventory.reserve("p-1", 101, "order-1")
+        
+        assert error.value.details == {"requested": 101, "available": 100}
+        assert _available(database) == 100
+        assert database._database.inventory_reservations.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_release_returns_stock_once(self, inventory, database):
+        """Releasing a cancelled order's reservation returns its stock exactly once."""
+        await inventory.reserve("p-1", 30, "order-1")
+        
+        assert await inventory.release("order-1")
+        assert not await inventory.release("order-1")
+        assert _available(database) == 100
+    
+    @pytest.mark.asyncio
+    async def test_committed_reservation_does_not_expire(self, inventory, database):
+        """Confirmed orders keep their stock past the reservation expiry."""
+        await inventory.reserve("p-1", 30, "order-1")
+        assert await inventory.commit("order-1")
+        
+        released = await inventory.release_expired(datetime.utcnow() + timedelta(hours=1))
+        
+        assert released == []
+        assert _available(database) == 70
+    
+    @pytest.mark.asyncio
+    async def test_release_expired_cancels_pending_orders(self, inventory, database):
+        """Expired reservations return stock and cancel their pending orders."""
+        database._database.orders.insert_many([
+            {"_id": "order-1", "status": "pending"},
+            {"_id": "order-2", "status": "pending"},
+        ])
+        await inventory.reserve("p-1", 10, "order-1")
+        await inventory.reserve("p-1", 20, "order-2")
+        await inventory.commit("order-2")
+        
+        released = await inventory.release_expired(datetime.utcnow() + timedelta(hours=1))
+        
+        assert released == ["order-1"]
+        assert _available(database) == 80
+        order = database._database.orders.find_one({"_id": "order-1"})
+        assert order["status"] == "cancelled"
+        assert order["cancellation_reason"] == "reservation_expired"
+    
+    @pytest.mark.asyncio
+    async def test_shard_product_moves_stock(self, inventory, database):
+        """Sharding spreads the product's stock over shard documents."""
+        assert await inventory.shard_product("p-1") == 4
+        
+        shards = sorted(s["quantity"] for s in database._database.inventory_shards.find())
+        assert shards == [25, 25, 25, 25]
+        
+        await inventory.reserve("p-1", 10, "order-1")
+        assert _available(database) == 90
+    
+    @pytest.mark.asyncio
+    async def test_reservation_gathers_from_several_shards(self, inventory, database):
+        """Requests larger than any single shard are taken from several."""
+        await inventory.shard_product("p-1")
+        
+        reservation = await inventory.reserve("p-1", 60, "order-1")
+        assert len(reservation["allocations"]) >= 3
+        
+        with pytest.raises(InsufficientInventoryException):
+            await inventory.reserve("p-1", 41, "order-2")
+        assert _available(database) == 40
+        
+        await inventory.release("order-1")
+        assert _available(database) == 100
+    
+    @pytest.mark.asyncio
+    async def test_other_worker_discovers_sharding(self, inventory, database):
+        """A worker that has not seen the product sharded falls back to its shards."""
+        await inventory.shard_product("p-1")
+        other = InventoryService(database, hot_key_threshold=10_000)
+        
+        await other.reserve("p-1", 10, "order-1")
+        
+        assert _available(database) == 90
+    
+    @pytest.mark.asyncio
+    async def test_set_available_redistributes_shards(self, inventory, database):
+        """Overwriting a sharded product's stock rewrites its shards."""
+        await inventory.shard_product("p-1")
+        
+        assert await inventory.set_available("p-1", 10)
+        
+        shards = sorted(s["quantity"] for s in database._database.inventory_shards.find())
+        assert shards == [2, 2, 3, 3]
+        assert not await inventory.set_available("missing", 10)
+    
+    @pytest.mark.asyncio
+    async def test_set_available_keeps_held_stock(self, inventory, database):
+        """Setting stock leaves held units out, so releasing them does not double-count."""
+        await inventory.reserve("p-1", 30, "order-1")
+        await inventory.reserve("p-1", 20, "order-2")
+        await inventory.commit("order-2")
+        
+        assert await inventory.set_available("p-1", 80)
+        assert _available(database) == 50
+        
+        await inventory.release_expired(now=datetime.utcnow() + timedelta(minutes=31))
+        assert _available(database) == 80
+    
+    @pytest.mark.asyncio
+    async def test_set_available_below_held_refused(self, inventory, database):
+        """Stock cannot be set below the units held by pending orders."""
+        await inventory.reserve("p-1", 30, "order-1")
+        
+        with pytest.raises(ValidationException):
+            await inventory.set_available("p-1", 20)
+        
+        assert _available(database) == 70
+    
+    @pytest.mark.asyncio
+    async def test_stress_concurrent_orders_never_oversell(self, inventory, database):
+        """500 concurrent orders for 100 units reserve exactly 100."""
+        async def order(i):
+            try:
+                await inventory.reserve("p-1", 1, f"order-{i}")
+                return True
+            except InsufficientInventoryException:
+                return False
+        
+        results = await asyncio.gather(*(order(i) for i in range(500)))
+        
+        assert sum(results) == 100
+        assert _available(database) == 0
+    
+    @pytest.mark.asyncio
+    async def test_stress_read_then_write_oversells(self, database):
+        """The previous read-check-write pattern oversells under the same load."""
+        products = database.products
+        
+        async def order():
+            product = await products.find_one({"product_id": "p-1"})
+            if product["availability"]["quantity_available"] >= 1:
+                await products.update_one(
+                    {"product_id": "p-1"},
+                    {"$set": {"availability.quantity_available": product["availability"]["quantity_available"] - 1}}
+                )
+                return True
+            return False
+        
+        results = await asyncio.gather(*(order() for _ in range(500)))
+        
+        assert sum(results) > 100
+    
+    @pytest.mark.asyncio
+    async def test_stress_hot_product_shards_under_load(self, database):
+        """A product that turns hot mid-sale is sharded without losing or overselling stock."""
+        inventory = InventoryService(database, hot_key_threshold=50, shard_count=8)
+        await inventory.set_available("p-1", 1000)
+        rng = random.Random(3)
+        
+        async def order(i, quantity):
+            try:
+                await inventory.reserve("p-1", quantity, f"order-{i}")
+                return quantity
+            except InsufficientInventoryException:
+                return 0
+        
+        # Waves of concurrent orders; sharding kicks in during the second
+        reserved = []
+        for wave in range(6):
+            reserved += await asyncio.gather(*(
+                order(wave * 100 + i, rng.randint(1, 3)) for i in range(100)
+            ))
+        
+        assert "p-1" in inventory._sharded
+        assert sum(reserved) + _available(database) == 1000
+        assert sum(reserved) >= 990
+        
+        await asyncio.gather(*(inventory.release(f"order-{i}") for i, q in enumerate(reserved) if q))
+        assert _available(database) == 1000
@@ -0,0 +1,140 @@
+"""
+Unit tests for incremental JSON parsing and streamed Agmarknet ingestion.
+
+Tests chunk-boundary handling, string escapes, bounded buffering and batched writes.
+"""
+
+import json
+import pytest
+import httpx
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.json_stream import JsonArrayItemParser
+from app.services.market_data_service import MarketDataService
+
+
+def _record(i):
+    """Build a raw Agmarknet record."""
+    return {
+        "commodity": "Onion",
+        "market": f"Market {i % 7}",
+        "state": "Maharashtra",
+        "district": "Nashik",
+        "variety": "Red",
+        "grade": "FAQ",
+        "min_price": str(1800 + i % 50),
+        "max_price": str(2200 + i % 50),
+        "modal_price": str(2000 + i % 50),
+        "date": (date.today() - timedelta(days=i % 28)).isoformat(),
+    }
+
+
+def _payload(count):
+    return json.dumps({
+        "status": "ok",
+        "total": count,
+        "count": count,
+        "records": [_record(i) for i in range(count)],
+    }).encode()
+
+
+def _parse(payload, chunk_size):
+    parser = JsonArrayItemParser("records")
+    items = []
+    for start in range(0, len(payload), chunk_size):
+        items.extend(parser.feed(payload[start:start + chunk_size]))
+    return parser, items
+
+
+class TestJsonArrayItemParser:
+    """Test cases for JsonArrayItemParser."""
+    
+    def test_byte_by_byte_matches_json_loads(self):
+        """Feeding one byte at a time yields the same records as json.loads."""
+        payload = _payload(20)
+        
+        parser, items = _parse(payload, 1)
+        
+        assert items == json.loads(payload)["records"]
+        assert parser.done
+    
+    def test_structural_characters_inside_strings(self):
+        """Braces, brackets and escaped quotes in strings do not affect nesting."""
+        records = [
+            {"market": 'Azad"pur {main} [yard]', "note": "\\"},
+            {"market": "Lasal\\\"gaon", "nested": {"values": [1, {"a": "}"}]}},
+        ]
+        payload = json.dumps({"title": "records [x]", "records": records}).encode()
+        
+        for chunk_size in (1, 3, 7, len(payload)):
+            assert _parse(payload, chunk_size)[1] == records
+    
+    def test_other_fields_are_ignored(self):
+        """Arrays under other keys and keys before the target field are skipped."""
+        payload = json.dumps({
+            "field": [{"name": "records"}],
+            "records": [{"id": 1}],
+            "after": [{"id": 2}],
+        }).encode()
+        
+        assert _parse(payload, 5)[1] == [{"id": 1}]
+    
+    def test_buffer_stays_bounded(self):
+        """Only the current partial record is buffered for a large response."""
+        payload = _payload(20000)
+        parser = JsonArrayItemParser("records")
+        chunk_size = 64 * 1024
+        max_buffered = 0
+        parsed = 0
+        
+        for start in range(0, len(payload), chunk_size):
+            parsed += len(parser.feed(payload[start:start + chunk_size]))
+            max_buffered = max(max_buffered, parser.buffered_bytes)
+        
+        assert parsed == 20000
+        assert max_buffered < 2 * chunk_size
+        assert max_buffered < len(payload) / 10
+
+
+class TestStreamedIngestion:
+    """Test cases for streamed Agmarknet ingestion."""
+    
+    @pytest.fixture
+    def service(self, monkeypatch):
+        """Create a service whose HTTP client serves a large Agmarknet payload."""
+        payload = _payload(1200)
+        
+        def handler(request):
+            return httpx.Response(200, content=payload)
+        
+        database = MagicMock()
+        database.market_prices.bulk_write = AsyncMock(
+            side_effect=lambda ops: MagicMock(upserted_count=len(ops), modified_count=0)
+        )
+        service = MarketDataService(database)
+        service.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        
+        async def screen(market_prices):
+            return market_prices
+        
+        monkeypatch.setattr(service, "screen_market_data", screen)
+        return service
+    
+    @pytest.mark.asyncio
+    async def test_ingest_writes_in_batches(self, service):
+        """Each parsed batch is written with its own bulk_write."""
+        stored = await service.ingest_agmarknet_data("onion", batch_size=500)
+        
+        assert stored == 1200
+        sizes = [len(call[0][0]) for call in service.market_prices_collection.bulk_write.call_args_list]
+        assert sizes == [500, 500, 200]
+    
+    @pytest.mark.asyncio
+    async def test_fetch_collects_all_batches(self, service):
+        """fetch_agmarknet_data still returns every validated record."""
+        prices = await service.fetch_agmarknet_data("onion")
+        
+        assert len(prices) == 1200
+        assert all(price.is_validated for price in prices)
+        assert prices[0].modal_price == 2000
@@ -5,20 +5,22 @@ Tests the market data integration, validation, and caching functionality.
 """
 
 import pytest
+import pytest_asyncio
 import asyncio
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from unittest.mock import AsyncMock, MagicMock, patch
 import httpx
 
+from app.services.background_tasks import BackgroundTaskService
 from app.services.market_data_service import MarketDataService
 from app.models.market_data import (
     MarketPrice, MarketPriceRequest, DataSource, DataQuality, PriceUnit,
-    AgmarknetApiResponse, DataValidationResult
+    AgmarknetApiResponse, DataValidationResult, ForecastKey
 )
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def mock_database():
     """Mock database for testing."""
     database = MagicMock()
@@ -28,7 +30,7 @@ async def mock_database():
     return database
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def market_data_service(mock_database):
     """Create market data service for testing."""
     service = MarketDataService(mock_database)
@@ -175,4 +177,254 @@ class TestMarketDataService:
         result = await market_data_service.validate_market_data(future_price)
         
         assert result is not None
-        assert hasattr(result, 'is_valid')
\ No newline at end of file
+        assert hasattr(result, 'is_valid')
+
+class _AsyncCursor:
+    """Minimal async cursor over a list of documents."""
+    
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def sort(self, *args, **kwargs):
+        return self
+    
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+    
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _forecast_doc(forecast_key, version, days=8):
+    """Build a stored forecast document for testing."""
+    commodity, state, market = forecast_key.split("|")
+    return {
+        "_id": f"{forecast_key}:{version}",
+        "forecast_key": forecast_key,
+        "commodity": commodity,
+        "state": state,
+        "market": market,
+        "version": version,
+        "days_ahead": days,
+        "generated_at": datetime.utcnow(),
+        "forecast": {
+            "predictions": [
+                {"date": (date.today() + timedelta(days=d)).isoformat(), "predicted_price": 25.0}
+                for d in range(1, days + 1)
+            ],
+            "model_type": "mathematical_forecast",
+        },
+    }
+
+
+class TestPriceForecasts:
+    """Test cases for precomputed and batch price forecasts."""
+    
+    def test_forecast_key_normalization(self):
+        """Forecast keys are lowercase and default missing parts to 'all'."""
+        assert MarketDataService._forecast_key(" Onion ", None, "Azadpur") == "onion|all|azadpur"
+    
+    @pytest.mark.asyncio
+    async def test_batch_serves_latest_precomputed_version(self, market_data_service, mock_database):
+        """Only the newest version per key is returned and no prediction is computed."""
+        mock_database.price_forecasts.find = MagicMock(return_value=_AsyncCursor([
+            _forecast_doc("onion|all|all", 200),
+            _forecast_doc("onion|all|all", 100),
+        ]))
+        market_data_service.predict_price = AsyncMock()
+        
+        forecasts = await market_data_service.get_price_forecasts_batch(
+            [ForecastKey(commodity="onion"), ForecastKey(commodity="ONION")], days_ahead=7
+        )
+        
+        assert [f["forecast_version"] for f in forecasts] == [200, 200]
+        assert all(f["forecast_source"] == "precomputed" for f in forecasts)
+        assert len(forecasts[0]["predictions"]) == 7
+        market_data_service.predict_price.assert_not_called()
+        mock_database.price_forecasts.find.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_batch_computes_and_stores_missing_keys(self, market_data_service, mock_database):
+        """Missing keys are computed once each and written back."""
+        mock_database.price_forecasts.find = MagicMock(return_value=_AsyncCursor([
+            _forecast_doc("onion|all|all", 100),
+        ]))
+        mock_database.price_forecasts.bulk_write = AsyncMock()
+        market_data_service.predict_price = AsyncMock(side_effect=lambda **kwargs: {
+            "predictions": [], "model_type": "mathematical_forecast", "commodity": kwargs["commodity"]
+        })
+        
+        forecasts = await market_data_service.get_price_forecasts_batch([
+            ForecastKey(commodity="onion"),
+            ForecastKey(commodity="potato", state="Punjab"),
+            ForecastKey(commodity="potato", state="punjab"),
+        ], days_ahead=7)
+        
+        assert forecasts[0]["forecast_source"] == "precomputed"
+        assert forecasts[1]["forecast_source"] == "on_demand"
+        assert market_data_service.predict_price.await_count == 1
+        operations = mock_database.price_forecasts.bulk_write.call_args[0][0]
+        assert len(operations) == 1
+    
+    @pytest.mark.asyncio
+    async def test_precompute_skips_mock_forecasts(self, market_data_service, mock_database):
+        """Mock fallbacks are not persisted as precomputed forecasts."""
+        mock_database.price_forecasts.bulk_write = AsyncMock()
+        market_data_service.predict_price = AsyncMock(return_value={
+            "predictions": [], "model_type": "mock_forecast"
+        })
+        
+        with patch("app.services.market_data_service.asyncio.sleep", new=AsyncMock()):
+            result = await market_data_service.precompute_forecasts(["onion"], days_ahead=7)
+        
+        assert result["stored"] == 0
+        assert result["skipped"] == ["onion|all|all"]
+        mock_database.price_forecasts.bulk_write.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_requested_market_keys_precomputed(self, market_data_service, mock_database):
+        """Requested (commodity, market) keys are recorded and precomputed with the commodities."""
+        mock_database.forecast_requests.bulk_write = AsyncMock()
+        mock_database.price_forecasts.find = MagicMock(return_value=_AsyncCursor([]))
+        mock_database.price_forecasts.bulk_write = AsyncMock()
+        market_data_service.predict_price = AsyncMock(side_effect=lambda **kwargs: {
+            "predictions": [], "model_type": "mathematical_forecast", "commodity": kwargs["commodity"]
+        })
+        requested = ForecastKey(commodity="onion", market="Azadpur")
+        
+        with patch.dict("app.services.market_data_service._recorded_forecast_requests", clear=True):
+            await market_data_service.get_price_forecasts_batch([requested, requested])
+            await market_data_service.get_price_forecasts_batch([requested])
+        
+        # Recorded once per process and interval, not on every request
+        mock_database.forecast_requests.bulk_write.assert_awaited_once()
+        operations = mock_database.forecast_requests.bulk_write.call_args[0][0]
+        assert [op._filter for op in operations] == [{"_id": "onion|all|azadpur"}]
+        
+        mock_database.forecast_requests.find = MagicMock(return_value=_AsyncCursor([
+            {"_id": "onion|all|azadpur", "commodity": "onion", "state": None, "market": "Azadpur"}
+        ]))
+        keys = await market_data_service.get_requested_forecast_keys()
+        with patch("app.services.market_data_service.asyncio.sleep", new=AsyncMock()):
+            await market_data_service.precompute_forecasts(["onion"], days_ahead=7, keys=keys)
+        
+        stored = mock_database.price_forecasts.bulk_write.call_args[0][0]
+        assert sorted(op._doc["forecast_key"] for op in stored) == ["onion|all|all", "onion|all|azadpur"]
+    
+    @pytest.mark.asyncio
+    async def test_precompute_task_runs_at_startup(self):
+        """The precompute task runs before its first nightly wait and stops when cancelled."""
+        service = BackgroundTaskService()
+        service.market_data_service = MagicMock()
+        ran = asyncio.Event()
+        service.precompute_forecasts = AsyncMock(side_effect=lambda: ran.set())
+        
+        await service.start_forecast_precompute()
+        await asyncio.wait_for(ran.wait(), timeout=1)
+        await service.stop_forecast_precompute()
+        
+        service.precompute_forecasts.assert_awaited_once()
+        assert service._forecast_task is None
+
+
+def _constructed_price(**overrides):
+    """Build a MarketPrice without model validation so invalid values can be tested."""
+    values = dict(
+        price_id=None, commodity="onion", variety=None, market="Delhi", state="Delhi",
+        district=None, min_price=Decimal("20.00"), max_price=Decimal("30.00"),
+        modal_price=Decimal("25.00"), unit=PriceUnit.PER_QUINTAL, currency="INR",
+        arrivals=100, arrivals_unit="quintal", price_date=date.today(),
+        source=DataSource.AGMARKNET, data_quality=DataQuality.MEDIUM,
+        last_updated=datetime.utcnow(), is_validated=False, validation_notes=None
+    )
+    values.update(overrides)
+    return MarketPrice.model_construct(**values)
+
+
+class TestBatchValidation:
+    """Test cases for single-pass batch validation."""
+    
+    @pytest.mark.asyncio
+    async def test_batch_matches_per_record_validation(self, market_data_service):
+        """Batch flags, scores and qualities match validate_market_data."""
+        prices = [
+            _constructed_price(),
+            _constructed_price(commodity=" "),
+            _constructed_price(market="", state=""),
+            _constructed_price(min_price=Decimal("30.00"), max_price=Decimal("20.00")),
+            _constructed_price(min_price=Decimal("1.00"), max_price=Decimal("100.00"),
+                               modal_price=Decimal("50.00")),
+            _constructed_price(price_date=date.today() + timedelta(days=1)),
+            _constructed_price(price_date=date.today() - timedelta(days=400)),
+            _constructed_price(arrivals=-5),
+            _constructed_price(min_price=Decimal("0"), max_price=Decimal("0"),
+                               modal_price=Decimal("0")),
+        ]
+        
+        batch = market_data_service.validate_market_data_batch(prices)
+        
+        assert batch.total_records == len(prices)
+        for index, price in enumerate(prices):
+            single = await market_data_service.validate_market_data(price)
+            failed = sorted(name for name, passed in single.validation_checks.items() if not passed)
+            assert batch.valid_flags[index] == single.is_valid
+            assert batch.quality_scores[index] == pytest.approx(single.quality_score)
+            assert batch.data_qualities[index] == market_data_service._determine_data_quality(single)
+            assert sorted(batch.failed_checks(index)) == failed
+    
+    def test_batch_aggregate_statistics(self, market_data_service):
+        """Aggregate counts summarize per-record flags."""
+        prices = [
+            _constructed_price(),
+            _constructed_price(),
+            _constructed_price(arrivals=-1),
+        ]
+        
+        batch = market_data_service.validate_market_data_batch(prices)
+        
+        assert batch.valid_records == 2
+        assert batch.invalid_records == 1
+        assert batch.check_failures["valid_arrivals"] == 1
+        assert batch.quality_distribution["high"] == 2
+        assert batch.quality_distribution["medium"] == 1
+    
+    def test_empty_batch(self, market_data_service):
+        """An empty page validates to zero counts."""
+        batch = market_data_service.validate_market_data_batch([])
+        
+        assert batch.total_records == 0
+        assert batch.average_quality_score == 0.0
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_batch_vs_per_record_100k(self, market_data_service):
+        """Benchmark batch validation against the per-record path at 100k records."""
+        import time
+        
+        prices = [
+            _constructed_price(
+                modal_price=Decimal(20 + i % 10),
+                arrivals=-1 if i % 50 == 0 else i % 1000,
+                price_date=date.today() - timedelta(days=i % 30)
+            )
+            for i in range(100_000)
+        ]
+        
+        start = time.perf_counter()
+        per_record = [await market_data_service.validate_market_data(p) for p in prices]
+        per_record_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        batch = market_data_service.validate_market_data_batch(prices)
+        batch_seconds = time.perf_counter() - start
+        
+        print(
+            f"\n100k records: per-record {per_record_seconds:.2f}s, "
+            f"batch {batch_seconds:.2f}s ({per_record_seconds / batch_seconds:.1f}x)"
+        )
+        assert batch.valid_records == sum(1 for r in per_record if r.is_valid)
+        assert batch_seconds < per_record_seconds
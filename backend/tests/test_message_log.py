@@ -0,0 +1,194 @@
+"""
+Unit tests for the write-behind chat message log.
+
+Tests batching, merged conversation updates, ordering across failed flushes
+and flushing on shutdown.
+"""
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from pymongo.errors import BulkWriteError
+
+from app.services.message_log import MessageLog
+
+
+START = datetime(2024, 1, 15, 10, 0, 0)
+
+
+def _message(i, conversation_id="conv-1", sender_id="buyer-1"):
+    """Build a stored chat message document."""
+    return {
+        "_id": f"msg-{i}",
+        "conversation_id": conversation_id,
+        "sender_id": sender_id,
+        "content": f"message {i}",
+        "type": "text",
+        "created_at": START + timedelta(seconds=i)
+    }
+
+
+def _inserted_ids(database):
+    return [
+        message["_id"]
+        for call in database.messages.insert_many.call_args_list
+        for message in call[0][0]
+    ]
+
+
+@pytest.fixture
+def database():
+    """Create a mock database."""
+    database = MagicMock()
+    database.messages.insert_many = AsyncMock()
+    database.conversations.bulk_write = AsyncMock()
+    return database
+
+
+class TestMessageLog:
+    """Test cases for MessageLog."""
+    
+    @pytest.mark.asyncio
+    async def test_flush_batches_messages_and_merges_updates(self, database):
+        """One insert_many and one merged update per conversation per flush."""
+        log = MessageLog(database, flush_interval_ms=1000, batch_size=100)
+        log.append(_message(1), "vendor-1")
+        log.append(_message(2, "conv-2"), "vendor-2")
+        log.append(_message(3), "vendor-1")
+        log.append(_message(4, sender_id="vendor-1"), "buyer-1")
+        
+        written = await log.flush()
+        
+        assert written == 4
+        assert database.messages.insert_many.await_count == 1
+        assert _inserted_ids(database) == ["msg-1", "msg-2", "msg-3", "msg-4"]
+        
+        operations = database.conversations.bulk_write.call_args[0][0]
+        updates = {op._filter["_id"]: op._doc for op in operations}
+        assert updates["conv-1"] == {
+            "$set": {"updated_at": START + timedelta(seconds=4)},
+            "$inc": {"unread_count.vendor-1": 2, "unread_count.buyer-1": 1},
+        }
+        assert updates["conv-2"]["$inc"] == {"unread_count.vendor-2": 1}
+        assert log.pending == 0
+    
+    @pytest.mark.asyncio
+    async def test_batch_size_triggers_flush(self, database):
+        """A full batch is written without waiting for the interval."""
+        log = MessageLog(database, flush_interval_ms=60000, batch_size=5)
+        await log.start()
+        try:
+            for i in range(5):
+                log.append(_message(i))
+            
+            for _ in range(100):
+                if database.messages.insert_many.await_count:
+                    break
+                await asyncio.sleep(0.01)
+            
+            assert _inserted_ids(database) == [f"msg-{i}" for i in range(5)]
+        finally:
+            await log.stop()
+    
+    @pytest.mark.asyncio
+    async def test_interval_triggers_flush(self, database):
+        """Messages below the batch size are written after the interval."""
+        log = MessageLog(database, flush_interval_ms=50, batch_size=500)
+        await log.start()
+        try:
+            log.append(_message(1))
+            await asyncio.sleep(0.2)
+            
+            assert _inserted_ids(database) == ["msg-1"]
+        finally:
+            await log.stop()
+    
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_order(self, database):
+        """A failed batch is retried ahead of messages appended after it."""
+        database.messages.insert_many.side_effect = [Exception("primary stepped down"), None, None]
+        log = MessageLog(database, flush_interval_ms=1000, batch_size=100)
+        log.append(_message(1), "vendor-1")
+        log.append(_message(2), "vendor-1")
+        
+        assert await log.flush() == 0
+        assert log.has_pending("conv-1")
+        
+        log.append(_message(3), "vendor-1")
+        assert await log.flush() == 3
+        
+        retried = database.messages.insert_many.call_args_list[1][0][0]
+        assert [m["_id"] for m in retried] == ["msg-1", "msg-2", "msg-3"]
+        operations = database.conversations.bulk_write.call_args[0][0]
+        assert operations[0]._doc["$inc"] == {"unread_count.vendor-1": 3}
+    
+    @pytest.mark.asyncio
+    async def test_in_flight_batch_counts_as_pending(self, database):
+        """Readers see a batch as pending until its write has finished."""
+        write_started = asyncio.Event()
+        release_write = asyncio.Event()
+        
+        async def slow_insert(messages, ordered):
+            write_started.set()
+            await release_write.wait()
+        
+        database.messages.insert_many.side_effect = slow_insert
+        log = MessageLog(database, flush_interval_ms=1000, batch_size=100)
+        log.append(_message(1), "vendor-1")
+        
+        flushing = asyncio.create_task(log.flush())
+        await write_started.wait()
+        
+        assert log.pending == 0
+        assert log.has_pending()
+        assert log.has_pending("conv-1")
+        assert not log.has_pending("conv-2")
+        
+        # A reader flushing now waits for the in-flight write
+        reader = asyncio.create_task(log.flush())
+        await asyncio.sleep(0.01)
+        assert not reader.done()
+        
+        release_write.set()
+        assert await flushing == 1
+        assert await reader == 0
+        assert not log.has_pending()
+        assert not log.has_pending("conv-1")
+    
+    @pytest.mark.asyncio
+    async def test_retry_skips_already_written_messages(self, database):
+        """Messages written before a failure are skipped as duplicates on retry."""
+        duplicate = BulkWriteError({
+            "nInserted": 1,
+            "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}],
+        })
+        database.messages.insert_many.side_effect = [duplicate, None]
+        log = MessageLog(database, flush_interval_ms=1000, batch_size=100)
+        for i in range(4):
+            log.append(_message(i))
+        
+        assert await log.flush() == 3
+        remainder = database.messages.insert_many.call_args_list[1][0][0]
+        assert [m["_id"] for m in remainder] == ["msg-2", "msg-3"]
+    
+    @pytest.mark.asyncio
+    async def test_stop_flushes_buffer(self, database):
+        """Buffered messages are written on shutdown."""
+        log = MessageLog(database, flush_interval_ms=60000, batch_size=500)
+        await log.start()
+        log.append(_message(1))
+        
+        await log.stop()
+        
+        assert _inserted_ids(database) == ["msg-1"]
+    
+    def test_buffer_is_bounded(self, database):
+        """The oldest messages are dropped once the buffer is full."""
+        log = MessageLog(database, batch_size=100, max_buffer=3)
+        for i in range(5):
+            log.append(_message(i))
+        
+        assert log.pending == 3
+        assert [m["_id"] for m in log._messages] == ["msg-2", "msg-3", "msg-4"]
@@ -0,0 +1,233 @@
+"""
+Unit tests for the compiled moderation engine.
+
+Tests word-boundary matching, Indic-script and transliterated keywords,
+single-pass results, the batch API, the AIService integration and a
+throughput benchmark against per-keyword substring search.
+"""
+
+import pytest
+
+from app.services.ai_service import AIService
+from app.services.moderation_engine import ModerationEngine, ModerationRule, normalize_text
+
+
+KEYWORDS = ["spam", "scam", "fraud", "धोखा", "ठगी", "dhokha", "மோசடி"]
+
+COMMUNITY_RULES = {
+    "personal_info": ["phone number", "email", "address"],
+    "commercial_spam": ["buy now", "limited offer"],
+}
+
+
+@pytest.fixture
+def engine():
+    """Create an engine with English, Indic and transliterated keywords."""
+    return ModerationEngine.from_keywords(KEYWORDS, COMMUNITY_RULES)
+
+
+class TestModerationEngine:
+    """Test cases for ModerationEngine."""
+    
+    def test_keyword_match(self, engine):
+        """Keywords are matched case-insensitively."""
+        issues, confidences = engine.scan("This vendor is a SCAM")
+        
+        assert issues == [{"type": "inappropriate_content", "keyword": "scam", "severity": "high"}]
+        assert confidences == [0.8]
+    
+    def test_word_boundaries(self, engine):
+        """Keywords inside longer words are not flagged."""
+        issues, _ = engine.scan("Spammy? No, just badminton rackets and scampi")
+        
+        assert issues == []
+    
+    def test_phrase_indicator(self, engine):
+        """Multi-word community indicators are matched as phrases."""
+        issues, confidences = engine.scan("Send me your phone number, buy now!")
+        
+        assert [issue.get("indicator") for issue in issues] == ["phone number", "buy now"]
+        assert confidences == [0.6, 0.6]
+    
+    def test_devanagari_keyword(self, engine):
+        """Devanagari keywords match as whole words, including vowel signs."""
+        issues, _ = engine.scan("यह व्यापारी धोखा देता है")
+        
+        assert [issue["keyword"] for issue in issues] == ["धोखा"]
+        assert engine.scan("धोखाधड़ी")[0] == []
+    
+    def test_devanagari_keyword_before_danda(self, engine):
+        """Sentence-ending danda and double danda end a word."""
+        assert [issue["keyword"] for issue in engine.scan("यह धोखा।")[0]] == ["धोखा"]
+        assert [issue["keyword"] for issue in engine.scan("ये तो धोखा॥")[0]] == ["धोखा"]
+        assert [issue["keyword"] for issue in engine.scan("।ठगी। बचें")[0]] == ["ठगी"]
+    
+    def test_devanagari_normalization(self):
+        """Precomposed and combining nukta spellings match the same keyword."""
+        precomposed = "\u095c"
+        combining = "\u0921\u093c"
+        engine = ModerationEngine.from_keywords([precomposed + "\u0940"], {})
+        
+        issues, _ = engine.scan("\u0917\u093e" + combining + "\u0940")
+        
+        assert engine.scan(combining + "\u0940")[0][0]["type"] == "inappropriate_content"
+        assert issues == []
+        assert normalize_text(precomposed) == normalize_text(combining)
+    
+    def test_other_scripts_and_transliterations(self, engine):
+        """Tamil and transliterated keywords are matched."""
+        assert engine.scan("இது மோசடி")[0][0]["keyword"] == "மோசடி"
+        assert engine.scan("Pura dhokha hai")[0][0]["keyword"] == "dhokha"
+    
+    def test_issues_reported_once_in_rule_order(self, engine):
+        """Repeated terms are reported once, in rule order."""
+        issues, _ = engine.scan("fraud fraud email scam")
+        
+        assert [issue.get("keyword") or issue.get("indicator") for issue in issues] == [
+            "scam", "fraud", "email"
+        ]
+    
+    def test_term_with_several_rules(self):
+        """One matched term raises every rule that lists it."""
+        engine = ModerationEngine([
+            ModerationRule("hate", "harassment", "medium", 0.6),
+            ModerationRule("hate", "inappropriate_content", "high", 0.8, "keyword"),
+        ])
+        
+        issues, _ = engine.scan("I hate this")
+        
+        assert [issue["type"] for issue in issues] == ["harassment", "inappropriate_content"]
+    
+    def test_nested_and_overlapping_terms(self):
+        """Terms inside or overlapping a longer matched term are all found."""
+        engine = ModerationEngine([
+            ModerationRule("buy now", "commercial_spam", "medium", 0.6),
+            ModerationRule("buy", "commercial_spam", "medium", 0.6),
+            ModerationRule("now pay", "payment_pressure", "medium", 0.6),
+            ModerationRule("pay later scam", "inappropriate_content", "high", 0.8, "keyword"),
+            ModerationRule("scam", "inappropriate_content", "high", 0.8, "keyword"),
+        ])
+        
+        issues, _ = engine.scan("Buy now pay later scam")
+        
+        assert [issue.get("keyword") or issue.get("indicator") for issue in issues] == [
+            "buy now", "buy", "now pay", "pay later scam", "scam"
+        ]
+        assert engine.scan("buyer nowhere")[0] == []
+    
+    def test_excessive_caps(self, engine):
+        """Mostly capital text is flagged as shouting."""
+        issues, confidences = engine.scan("FRESH TOMATOES AVAILABLE")
+        
+        assert issues == [{"type": "excessive_caps", "indicator": "shouting", "severity": "low"}]
+        assert confidences == [0.5]
+    
+    def test_empty_rules(self):
+        """An engine without rules still checks capitals."""
+        engine = ModerationEngine([])
+        
+        assert engine.rule_count == 0
+        assert engine.scan("fresh onions") == ([], [])
+    
+    def test_scan_batch_matches_scan(self, engine):
+        """Batch results equal individual scans, in input order."""
+        contents = ["fresh onions", "total scam", "धोखा", "call my phone number"]
+        
+        assert engine.scan_batch(contents) == [engine.scan(content) for content in contents]
+
+
+class TestAIServiceModeration:
+    """Test cases for AIService moderation with the compiled engine."""
+    
+    @pytest.mark.asyncio
+    async def test_moderate_content_result(self):
+        """Moderation results keep their status, issues and confidence format."""
+        service = AIService()
+        
+        result = await service.moderate_content("This is fraud, share your email", "review")
+        
+        assert result["status"] == "rejected"
+        assert result["content_type"] == "review"
+        assert [issue["type"] for issue in result["issues_found"]] == [
+            "inappropriate_content", "personal_info"
+        ]
+        assert result["confidence"] == 0.7
+        assert result["recommendations"]
+    
+    @pytest.mark.asyncio
+    async def test_moderate_content_approved(self):
+        """Clean content is approved."""
+        service = AIService()
+        
+        result = await service.moderate_content("Fresh tomatoes, 25 per kg")
+        
+        assert result["status"] == "approved"
+        assert result["issues_found"] == []
+    
+    @pytest.mark.asyncio
+    async def test_moderate_content_regional_keywords(self):
+        """Hindi and Hinglish keywords are moderated."""
+        service = AIService()
+        
+        hindi = await service.moderate_content("यह माल नकली है")
+        hinglish = await service.moderate_content("bilkul farzi maal")
+        
+        assert hindi["status"] == "rejected"
+        assert hinglish["status"] == "rejected"
+    
+    @pytest.mark.asyncio
+    async def test_moderate_content_batch(self):
+        """Bulk listings are moderated in input order."""
+        service = AIService()
+        
+        results = await service.moderate_content_batch(["Fresh onions", "Call my phone for a deal"])
+        
+        assert [result["status"] for result in results] == ["approved", "flagged"]
+        assert all(result["content_type"] == "listing" for result in results)
+    
+    @pytest.mark.slow
+    def test_benchmark_compiled_vs_substring_100k(self):
+        """Benchmark the compiled engine against per-keyword substring search as rules grow."""
+        import random
+        import time
+        
+        service = AIService()
+        random.seed(7)
+        generated = sorted({
+            "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(random.randint(5, 9)))
+            for _ in range(1000)
+        })
+        contents = [
+            f"Listing {i}: fresh produce from the mandi, contact for bulk orders"
+            + (" scam" if i % 20 == 0 else "")
+            for i in range(100_000)
+        ]
+        
+        def legacy_scan(keywords, content):
+            # Per-keyword substring search, as moderate_content did before
+            content_lower = content.lower()
+            issues = [k for k in keywords if k in content_lower]
+            if len(content) > 10 and sum(1 for c in content if c.isupper()) / len(content) > 0.5:
+                issues.append("shouting")
+            return issues
+        
+        for keywords in (service.inappropriate_keywords + service.regional_keywords, ["scam"] + generated):
+            engine = ModerationEngine.from_keywords(keywords, {})
+            
+            start = time.perf_counter()
+            legacy = [legacy_scan(keywords, content) for content in contents]
+            substring_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            results = engine.scan_batch(contents)
+            engine_seconds = time.perf_counter() - start
+            
+            print(
+                f"\n100k messages, {len(keywords)} keywords: "
+                f"substring {len(contents) / substring_seconds:,.0f} msgs/s, "
+                f"compiled {len(contents) / engine_seconds:,.0f} msgs/s"
+            )
+            assert sum(1 for issues, _ in results if issues) == sum(1 for issues in legacy if issues) == 5000
+        
+        # Substring search grows with every keyword; the compiled pattern does not
+        assert engine_seconds < substring_seconds
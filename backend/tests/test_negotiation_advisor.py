@@ -0,0 +1,263 @@
+"""
+Unit tests for the negotiation advisor.
+
+Tests the shared market summary cache, single-flight fetches, batch
+suggestions for pending offers and memoization per price snapshot.
+"""
+
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import HTTPException
+
+from app.api.v1.endpoints.chat import get_negotiation_suggestion
+from app.services.negotiation_advisor import NegotiationAdvisor
+from tests.conftest import AsyncDatabase
+
+
+ONION_SUMMARY = {"count": 12, "avg_price": 20.0, "min_price": 18.0, "max_price": 23.0, "price_trend": "stable"}
+TOMATO_SUMMARY = {"count": 8, "avg_price": 40.0, "min_price": 35.0, "max_price": 44.0, "price_trend": "increasing"}
+
+
+def _product(product_id, name, category="vegetables", subcategory=None, state="Delhi", market="Azadpur"):
+    """Build a stored product document."""
+    return {
+        "product_id": product_id,
+        "name": {"original_language": "en", "original_text": name, "translations": {}},
+        "category": category,
+        "subcategory": subcategory,
+        "location": {"state": state, "market_name": market},
+    }
+
+
+def _offer(offer_id, product_id, price):
+    """Build a pending offer document."""
+    return {"_id": offer_id, "product_id": product_id, "price": price, "status": "pending"}
+
+
+def _cursor(documents):
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=documents)
+    cursor.sort = MagicMock(return_value=cursor)
+    return cursor
+
+
+@pytest.fixture
+def market_service():
+    """Create a market service returning fixed summaries."""
+    async def get_market_summary(commodity, state=None, market=None):
+        return {"onion": ONION_SUMMARY, "tomato": TOMATO_SUMMARY}.get(commodity.lower(), {"count": 0})
+    
+    service = MagicMock()
+    service.get_market_summary = AsyncMock(side_effect=get_market_summary)
+    return service
+
+
+@pytest.fixture
+def database():
+    """Create a mock database with onion and tomato products."""
+    database = MagicMock()
+    database.products.find = MagicMock(return_value=_cursor([
+        _product("p-onion", "Pyaaz Nashik red", subcategory="Onion"),
+        _product("p-tomato", "Tamatar", subcategory="tomatoes"),
+    ]))
+    return database
+
+
+@pytest.fixture
+def advisor(database, market_service):
+    return NegotiationAdvisor(database, market_service, summary_ttl=300)
+
+
+class TestNegotiationAdvisor:
+    """Test cases for NegotiationAdvisor."""
+    
+    @pytest.mark.asyncio
+    async def test_suggestion_uses_market_summary(self, advisor):
+        """Offers are compared to the stored market average."""
+        suggestion = await advisor.suggest(30.0, "Onion", "Delhi", "Azadpur")
+        
+        assert suggestion["market_average"] == 20.0
+        assert suggestion["suggestion_type"] == "reject"
+        assert suggestion["market_data_points"] == 12
+    
+    @pytest.mark.asyncio
+    async def test_fallback_average_without_market_data(self, advisor):
+        """A caller-supplied average is used only when there is no market data."""
+        suggestion = await advisor.suggest(30.0, "Okra", fallback_average=29.0)
+        
+        assert suggestion["market_average"] == 29.0
+        assert suggestion["suggestion_type"] == "accept"
+    
+    @pytest.mark.asyncio
+    async def test_summary_cached_across_requests(self, advisor, market_service):
+        """The market summary is fetched once and shared by later lookups."""
+        await advisor.suggest(30.0, "Onion")
+        await advisor.suggest(21.0, "onion ")
+        
+        assert market_service.get_market_summary.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_share_one_fetch(self, advisor, market_service):
+        """Concurrent lookups of the same commodity wait on a single fetch."""
+        async def slow_summary(commodity, state=None, market=None):
+            await asyncio.sleep(0.05)
+            return ONION_SUMMARY
+        market_service.get_market_summary.side_effect = slow_summary
+        
+        snapshots = await asyncio.gather(*(advisor.get_snapshot("onion") for _ in range(10)))
+        
+        assert market_service.get_market_summary.await_count == 1
+        assert len({snapshot.version for snapshot in snapshots}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_price_store_change_refreshes_snapshot(self, advisor, market_service, monkeypatch):
+        """New rows in the price store refetch the summary under a new version."""
+        store_version = {"onion": 1}
+        monkeypatch.setattr(
+            "app.services.negotiation_advisor.price_store.version",
+            lambda commodity: store_version.get(commodity, 0)
+        )
+        first = await advisor.get_snapshot("onion")
+        
+        store_version["onion"] = 2
+        second = await advisor.get_snapshot("onion")
+        
+        assert market_service.get_market_summary.await_count == 2
+        assert second.version != first.version
+    
+    @pytest.mark.asyncio
+    async def test_expired_unchanged_summary_keeps_version(self, database, market_service):
+        """Refetching an unchanged summary keeps the snapshot version."""
+        advisor = NegotiationAdvisor(database, market_service, summary_ttl=300)
+        first = await advisor.get_snapshot("onion")
+        first.expires_at = 0
+        
+        second = await advisor.get_snapshot("onion")
+        
+        assert market_service.get_market_summary.await_count == 2
+        assert second.version == first.version
+    
+    @pytest.mark.asyncio
+    async def test_failed_fetch_is_not_cached(self, advisor, market_service):
+        """A failed summary fetch is retried on the next lookup."""
+        market_service.get_market_summary.side_effect = [Exception("redis down"), ONION_SUMMARY]
+        
+        failed = await advisor.get_snapshot("onion")
+        recovered = await advisor.get_snapshot("onion")
+        
+        assert failed.market_average is None
+        assert recovered.market_average == 20.0
+    
+    @pytest.mark.asyncio
+    async def test_suggest_for_offers_batch(self, advisor, database, market_service):
+        """Products load in one query and each commodity is summarized once."""
+        offers = [
+            _offer("o-1", "p-onion", 30.0),
+            _offer("o-2", "p-tomato", 40.0),
+            _offer("o-3", "p-onion", 20.5),
+            _offer("o-4", "p-missing", 10.0),
+        ]
+        
+        suggestions = await advisor.suggest_for_offers(offers)
+        
+        assert [s["offer_id"] for s in suggestions] == ["o-1", "o-2", "o-3", "o-4"]
+        assert [s["suggestion_type"] for s in suggestions] == ["reject", "accept", "accept", "error"]
+        assert database.products.find.call_count == 1
+        assert market_service.get_market_summary.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_unmapped_product_skips_market_fetch(self, advisor, database, market_service):
+        """Products without a market commodity are suggested without a fetch."""
+        database.products.find = MagicMock(return_value=_cursor([
+            _product("p-onion", "Pyaaz", subcategory="onion"),
+            _product("p-pickle", "Mango pickle", category="spices", subcategory="pickle"),
+        ]))
+        
+        suggestions = await advisor.suggest_for_offers([
+            _offer("o-1", "p-pickle", 150.0),
+            _offer("o-2", "p-onion", 20.0),
+        ])
+        
+        assert [s["offer_id"] for s in suggestions] == ["o-1", "o-2"]
+        assert suggestions[0]["market_data_points"] == 0
+        assert suggestions[0]["price_trend"] == "no_data"
+        assert suggestions[1]["market_data_points"] == ONION_SUMMARY["count"]
+        market_service.get_market_summary.assert_awaited_once_with("onion", state="Delhi", market="Azadpur")
+        projection = database.products.find.call_args[0][1]
+        assert projection["category"] == projection["subcategory"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_suggestions_memoized_per_snapshot(self, advisor, monkeypatch):
+        """Suggestions are reused until the price snapshot changes."""
+        offers = [_offer("o-1", "p-onion", 30.0), _offer("o-2", "p-tomato", 40.0)]
+        
+        first = await advisor.suggest_for_offers(offers)
+        second = await advisor.suggest_for_offers(offers)
+        
+        assert second == first
+        assert advisor.stats["memo_hits"] == 2
+        
+        monkeypatch.setattr("app.services.negotiation_advisor.price_store.version", lambda commodity: 7)
+        await advisor.suggest_for_offers(offers)
+        
+        assert advisor.stats["computed"] == 4
+    
+    @pytest.mark.asyncio
+    async def test_memo_is_bounded(self, database, market_service):
+        """The oldest memoized suggestions are dropped past the memo size."""
+        advisor = NegotiationAdvisor(database, market_service, memo_size=2)
+        
+        await advisor.suggest_for_offers([_offer(f"o-{i}", "p-onion", 20.0) for i in range(5)])
+        
+        assert [key[0] for key in advisor._memo] == ["o-3", "o-4"]
+    
+    @pytest.mark.asyncio
+    async def test_suggest_for_vendor(self, advisor, database):
+        """All of a vendor's pending offers are suggested in one batch."""
+        database.offers.find = MagicMock(return_value=_cursor([
+            _offer("o-1", "p-onion", 30.0),
+            _offer("o-2", "p-tomato", 40.0),
+        ]))
+        
+        suggestions = await advisor.suggest_for_vendor("vendor-1")
+        
+        assert database.offers.find.call_args[0][0] == {"seller_id": "vendor-1", "status": "pending"}
+        assert [s["offer_id"] for s in suggestions] == ["o-1", "o-2"]
+
+
+class TestNegotiationSuggestionEndpoint:
+    """Test cases for offer suggestions in a conversation."""
+    
+    @pytest.mark.asyncio
+    async def test_offer_suggestion_requires_participant(self, monkeypatch):
+        """Only the offer's buyer or seller gets a suggestion for it."""
+        db = AsyncDatabase()
+        await db.offers.insert_one({
+            "_id": "o-1", "conversation_id": "conv-1", "product_id": "p-onion",
+            "buyer_id": "buyer-1", "seller_id": "vendor-1", "price": 30.0,
+        })
+        suggest_for_offers = AsyncMock(return_value=[{"offer_id": "o-1"}])
+        monkeypatch.setattr(
+            "app.api.v1.endpoints.chat.negotiation_advisor.suggest_for_offers", suggest_for_offers
+        )
+        
+        with pytest.raises(HTTPException) as error:
+            await get_negotiation_suggestion(
+                "conv-1", {"offer_id": "o-1"}, SimpleNamespace(user_id="intruder"), db
+            )
+        assert error.value.status_code == 403
+        
+        with pytest.raises(HTTPException) as error:
+            await get_negotiation_suggestion(
+                "conv-2", {"offer_id": "o-1"}, SimpleNamespace(user_id="vendor-1"), db
+            )
+        assert error.value.status_code == 404
+        suggest_for_offers.assert_not_awaited()
+        
+        result = await get_negotiation_suggestion(
+            "conv-1", {"offer_id": "o-1"}, SimpleNamespace(user_id="vendor-1"), db
+        )
+        assert result == {"offer_id": "o-1"}
@@ -0,0 +1,213 @@
+"""
+Unit tests for order creation.
+
+Tests the denormalized order snapshot, stock handling on failed orders, the
+vendor summary cache and a latency benchmark against the previous
+sequential lookups, using an in-memory MongoDB with simulated round-trips.
+"""
+
+import pytest
+from fastapi import HTTPException
+from unittest.mock import MagicMock
+
+from app.api.v1.endpoints import orders
+from app.services.inventory_service import InventoryService
+from app.services.user_summary_cache import UserSummaryCache
+from tests.conftest import AsyncDatabase
+
+
+def _seed(database):
+    database._database.products.insert_one({
+        "product_id": "p-1",
+        "vendor_id": "vendor-1",
+        "name": {"original_language": "en", "original_text": "Onion", "translations": {}},
+        "images": [{"image_url": "https://cdn.example.com/onion.jpg"}],
+        "availability": {"quantity_available": 100, "unit": "kg"},
+        "price_info": {"base_price": 22.0},
+    })
+    database._database.users.insert_many([
+        {"user_id": "buyer-1", "email": "asha@example.com", "profile": {"full_name": "Asha Rao"}},
+        {"user_id": "vendor-1", "email": "ravi@example.com", "business_name": "Ravi Traders"},
+    ])
+
+
+def _current_user():
+    return MagicMock(user_id="buyer-1", email="asha@example.com", full_name="Asha Rao")
+
+
+def _order_data(**overrides):
+    return {"product_id": "p-1", "vendor_id": "vendor-1", "quantity": 10, "offered_price": 20.0, **overrides}
+
+
+def _stock(database):
+    return database._database.products.find_one({"product_id": "p-1"})["availability"]["quantity_available"]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Create a seeded database and point the order services at it."""
+    database = AsyncDatabase()
+    _seed(database)
+    monkeypatch.setattr(orders, "inventory_service", InventoryService(database, hot_key_threshold=10_000))
+    monkeypatch.setattr(orders, "user_summary_cache", UserSummaryCache(database, ttl=300))
+    return database
+
+
+class TestCreateOrder:
+    """Test cases for the create_order endpoint."""
+    
+    @pytest.mark.asyncio
+    async def test_order_snapshot(self, database):
+        """The order copies buyer, vendor and product details and holds the stock."""
+        response = await orders.create_order(_order_data(), _current_user(), database)
+        
+        order = database._database.orders.find_one({"_id": response["id"]})
+        assert order["buyer_name"] == "Asha Rao"
+        assert order["buyer_email"] == "asha@example.com"
+        assert order["vendor_name"] == "Ravi Traders"
+        assert order["product_name"] == "Onion"
+        assert order["product_image"] == "https://cdn.example.com/onion.jpg"
+        assert order["unit"] == "kg"
+        assert order["original_price"] == 22.0
+        assert order["total_amount"] == 200.0
+        
+        reservation = database._database.inventory_reservations.find_one({"_id": response["id"]})
+        assert reservation["status"] == "held"
+        assert "product" not in reservation
+        assert _stock(database) == 90
+    
+    @pytest.mark.asyncio
+    async def test_buyer_not_read_from_database(self, database):
+        """The authenticated user supplies the buyer details."""
+        await orders.create_order(_order_data(), _current_user(), database)
+        
+        # take stock and look up the vendor, insert order, insert reservation
+        assert database.round_trips == 4
+        assert orders.user_summary_cache.stats["misses"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_vendor_summary_cached(self, database):
+        """Repeat orders to a vendor use the cached summary."""
+        await orders.create_order(_order_data(), _current_user(), database)
+        database.round_trips = 0
+        
+        await orders.create_order(_order_data(), _current_user(), database)
+        
+        # take stock, insert order, insert reservation
+        assert database.round_trips == 3
+        assert orders.user_summary_cache.stats == {"hits": 1, "misses": 1}
+    
+    @pytest.mark.asyncio
+    async def test_vendor_mismatch_returns_stock(self, database):
+        """An order to the wrong vendor fails and hands back the stock it took."""
+        database._database.users.insert_one({"user_id": "vendor-2", "email": "x@example.com"})
+        
+        with pytest.raises(HTTPException) as error:
+            await orders.create_order(_order_data(vendor_id="vendor-2"), _current_user(), database)
+        
+        assert error.value.status_code == 400
+        assert _stock(database) == 100
+        assert database._database.inventory_reservations.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_missing_product(self, database):
+        """Orders for unknown products are rejected with 404."""
+        with pytest.raises(HTTPException) as error:
+            await orders.create_order(_order_data(product_id="p-missing"), _current_user(), database)
+        
+        assert error.value.status_code == 404
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("quantity", [0, -5, "10", True])
+    async def test_invalid_quantity_rejected(self, database, quantity):
+        """Non-positive or non-numeric quantities are rejected before reserving stock."""
+        with pytest.raises(HTTPException) as error:
+            await orders.create_order(_order_data(quantity=quantity), _current_user(), database)
+        
+        assert error.value.status_code == 400
+        assert _stock(database) == 100
+        assert database.round_trips == 0
+    
+    @pytest.mark.asyncio
+    async def test_insufficient_stock(self, database):
+        """Orders for more than the stock are rejected with 409."""
+        with pytest.raises(HTTPException) as error:
+            await orders.create_order(_order_data(quantity=101), _current_user(), database)
+        
+        assert error.value.status_code == 409
+        assert database._database.orders.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_failed_insert_releases_stock(self, database):
+        """If the order cannot be stored its reservation is released."""
+        async def failing_insert(document):
+            raise RuntimeError("write failed")
+        database.orders = MagicMock(insert_one=failing_insert)
+        
+        with pytest.raises(HTTPException) as error:
+            await orders.create_order(_order_data(), _current_user(), database)
+        
+        assert error.value.status_code == 500
+        assert _stock(database) == 100
+        assert database._database.inventory_reservations.find_one()["status"] == "released"
+    
+    @pytest.mark.asyncio
+    async def test_sharded_product_snapshot(self, database):
+        """Orders for sharded products read the product alongside the shards."""
+        await orders.inventory_service.shard_product("p-1")
+        
+        response = await orders.create_order(_order_data(), _current_user(), database)
+        
+        assert response["order"]["product_name"] == "Onion"
+        assert response["order"]["vendor_name"] == "Ravi Traders"
+    
+    @pytest.mark.asyncio
+    async def test_vendor_summary_invalidated(self, database):
+        """A vendor renamed after invalidation gets the new name on later orders."""
+        await orders.create_order(_order_data(), _current_user(), database)
+        database._database.users.update_one({"user_id": "vendor-1"}, {"$set": {"business_name": "Ravi & Sons"}})
+        orders.user_summary_cache.invalidate("vendor-1")
+        
+        response = await orders.create_order(_order_data(), _current_user(), database)
+        
+        assert response["order"]["vendor_name"] == "Ravi & Sons"
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_order_latency(self, monkeypatch):
+        """Benchmark p50 order latency against the previous sequential lookups."""
+        import statistics
+        import time
+        import uuid
+        
+        database = AsyncDatabase(latency=0.002)
+        _seed(database)
+        database._database.products.update_one(
+            {"product_id": "p-1"}, {"$set": {"availability.quantity_available": 10_000}}
+        )
+        inventory = InventoryService(database, hot_key_threshold=10_000)
+        monkeypatch.setattr(orders, "inventory_service", inventory)
+        monkeypatch.setattr(orders, "user_summary_cache", UserSummaryCache(database, ttl=300))
+        
+        async def legacy_create_order(order_data):
+            # Product, buyer and vendor read one after another, then the reservation and order
+            product = await database.products.find_one({"product_id": order_data["product_id"]})
+            await database.users.find_one({"user_id": "buyer-1"})
+            await database.users.find_one({"user_id": order_data["vendor_id"]})
+            order_id = str(uuid.uuid4())
+            await inventory.reserve(product["product_id"], order_data["quantity"], order_id)
+            await database.orders.insert_one({"_id": order_id, **order_data})
+        
+        async def p50(create, runs=50):
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                await create()
+                timings.append(time.perf_counter() - start)
+            return statistics.median(timings)
+        
+        legacy = await p50(lambda: legacy_create_order(_order_data(quantity=1)))
+        pipelined = await p50(lambda: orders.create_order(_order_data(quantity=1), _current_user(), database))
+        
+        print(f"\np50 order latency at 2 ms per round-trip: legacy {legacy * 1000:.1f} ms, pipelined {pipelined * 1000:.1f} ms")
+        assert pipelined < legacy / 2
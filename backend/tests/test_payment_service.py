@@ -0,0 +1,263 @@
+"""
+Unit tests for payment confirmation.
+
+Tests claiming intents before the gateway is called, idempotency keys with
+the Redis fast path, recovery of a confirmation interrupted before its transaction was
+written and concurrent retries against an in-memory MongoDB.
+"""
+
+import asyncio
+import pytest
+import fakeredis
+import mongomock
+from datetime import datetime, timedelta
+
+from app.core.exceptions import ConflictException, NotFoundException, ValidationException
+from app.services.payment_service import PaymentService
+from tests.conftest import AsyncDatabase
+
+
+@pytest.fixture
+def database():
+    """Create a database with one pending payment intent."""
+    database = AsyncDatabase()
+    database._database.payment_intents.insert_one({
+        "_id": "PI_1",
+        "user_id": "buyer-1",
+        "amount": 500.0,
+        "currency": "INR",
+        "payment_method": "upi",
+        "description": "Onion 20 kg",
+        "status": "pending",
+        "created_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(minutes=30),
+    })
+    return database
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Point the payment service at an in-memory Redis."""
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    
+    async def get_redis():
+        return client
+    monkeypatch.setattr("app.services.payment_service.get_redis", get_redis)
+    return client
+
+
+@pytest.fixture
+def payments(database, redis_client):
+    return PaymentService(database, approve=lambda intent: True)
+
+
+class TestPaymentService:
+    """Test cases for PaymentService."""
+    
+    @pytest.mark.asyncio
+    async def test_confirm_creates_one_transaction(self, payments, database):
+        """A confirmation stores the transaction and closes the intent."""
+        outcome = await payments.confirm("PI_1", "buyer-1", {"upi_id": "asha@upi"})
+        
+        assert outcome["status"] == "succeeded"
+        intent = database._database.payment_intents.find_one({"_id": "PI_1"})
+        assert intent["status"] == "succeeded"
+        assert intent["outcome"] == outcome
+        transaction = database._database.transactions.find_one({"_id": outcome["transaction_id"]})
+        assert transaction["intent_id"] == "PI_1"
+        assert transaction["metadata"] == {"upi_id": "asha@upi"}
+    
+    @pytest.mark.asyncio
+    async def test_retry_without_key_returns_stored_result(self, payments, database):
+        """Confirming an already confirmed intent answers with its result."""
+        first = await payments.confirm("PI_1", "buyer-1")
+        second = await payments.confirm("PI_1", "buyer-1")
+        
+        assert second == first
+        assert database._database.transactions.count_documents({}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_retry_with_key_uses_redis(self, payments, database):
+        """Retries with the same key are answered from Redis without the database."""
+        first = await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        database.round_trips = 0
+        
+        second = await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        
+        assert second == first
+        assert database.round_trips == 0
+    
+    @pytest.mark.asyncio
+    async def test_retry_with_key_without_redis(self, payments, database, redis_client):
+        """The stored key answers retries when Redis has lost the result."""
+        first = await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        await redis_client.flushall()
+        
+        second = await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        
+        assert second == first
+        assert database._database.transactions.count_documents({}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_key_reused_for_other_intent(self, payments, database, redis_client):
+        """A key cannot be reused for a different payment intent."""
+        await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        await redis_client.flushall()
+        
+        with pytest.raises(ConflictException):
+            await payments.confirm("PI_2", "buyer-1", idempotency_key="key-1")
+    
+    @pytest.mark.asyncio
+    async def test_key_reused_for_other_intent_from_redis(self, payments, database):
+        """A cached key is not answered for a different payment intent."""
+        await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        database.round_trips = 0
+        
+        with pytest.raises(ConflictException):
+            await payments.confirm("PI_2", "buyer-1", idempotency_key="key-1")
+        assert database.round_trips == 0
+    
+    @pytest.mark.asyncio
+    async def test_declined_payment_is_stored(self, database, redis_client):
+        """A declined payment is answered with the same decline on retry."""
+        payments = PaymentService(database, approve=lambda intent: False)
+        
+        first = await payments.confirm("PI_1", "buyer-1")
+        second = await payments.confirm("PI_1", "buyer-1")
+        
+        assert first["status"] == second["status"] == "failed"
+        assert database._database.transactions.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_expired_intent(self, payments, database):
+        """Expired intents are closed and rejected, and the key can be retried."""
+        database._database.payment_intents.update_one(
+            {"_id": "PI_1"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(minutes=1)}}
+        )
+        
+        with pytest.raises(ValidationException):
+            await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1")
+        
+        assert database._database.payment_intents.find_one({"_id": "PI_1"})["status"] == "expired"
+        assert database._database.payment_idempotency.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_missing_intent(self, payments):
+        """Unknown intents are reported as not found."""
+        with pytest.raises(NotFoundException):
+            await payments.confirm("PI_missing", "buyer-1")
+    
+    @pytest.mark.asyncio
+    async def test_interrupted_confirmation_writes_transaction_on_retry(self, payments, database):
+        """A retry writes the transaction of a confirmation that stopped after closing the intent."""
+        outcome = await payments.confirm("PI_1", "buyer-1")
+        database._database.transactions.delete_many({})
+        
+        assert await payments.confirm("PI_1", "buyer-1") == outcome
+        assert database._database.transactions.count_documents({"intent_id": "PI_1"}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_retries_charge_once(self, payments, database):
+        """Concurrent retries, with and without keys, create a single transaction."""
+        async def confirm(i):
+            try:
+                return await payments.confirm("PI_1", "buyer-1", idempotency_key="key-1" if i % 2 else None)
+            except ConflictException:
+                return None
+        
+        outcomes = [o for o in await asyncio.gather(*(confirm(i) for i in range(50))) if o]
+        
+        assert len({o["transaction_id"] for o in outcomes}) == 1
+        assert database._database.transactions.count_documents({}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_confirmations_call_gateway_once(self, database, redis_client):
+        """Only the confirmation that claims the intent reaches the gateway."""
+        calls = []
+        payments = PaymentService(database, approve=lambda intent: calls.append(intent["_id"]) or True)
+        
+        async def confirm():
+            try:
+                return await payments.confirm("PI_1", "buyer-1")
+            except ConflictException:
+                return None
+        
+        outcomes = [o for o in await asyncio.gather(*(confirm() for _ in range(20))) if o]
+        
+        assert calls == ["PI_1"]
+        assert len({o["transaction_id"] for o in outcomes}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_gateway_error_releases_claim(self, database, redis_client):
+        """An intent whose gateway call raised can be confirmed again."""
+        def unavailable(intent):
+            raise ConnectionError("gateway unavailable")
+        
+        with pytest.raises(ConnectionError):
+            await PaymentService(database, approve=unavailable).confirm("PI_1", "buyer-1")
+        assert database._database.payment_intents.find_one({"_id": "PI_1"})["status"] == "pending"
+        
+        outcome = await PaymentService(database, approve=lambda intent: True).confirm("PI_1", "buyer-1")
+        assert outcome["status"] == "succeeded"
+    
+    @pytest.mark.asyncio
+    async def test_other_users_intent_not_found(self, payments, database):
+        """An intent can only be confirmed by the user it was created for."""
+        with pytest.raises(NotFoundException):
+            await payments.confirm("PI_1", "intruder")
+        with pytest.raises(NotFoundException):
+            await payments.confirm("PI_1", "intruder", idempotency_key="key-1")
+        
+        intent = database._database.payment_intents.find_one({"_id": "PI_1"})
+        assert intent["status"] == "pending"
+        assert database._database.transactions.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_stale_claim_taken_over(self, database, redis_client):
+        """A processing claim older than the timeout is taken over; a recent one is not."""
+        database._database.payment_intents.update_one(
+            {"_id": "PI_1"},
+            {"$set": {"status": "processing", "processing_at": datetime.utcnow() - timedelta(seconds=30)}}
+        )
+        payments = PaymentService(database, processing_timeout_seconds=60, approve=lambda intent: True)
+        
+        with pytest.raises(ConflictException):
+            await payments.confirm("PI_1", "buyer-1")
+        
+        database._database.payment_intents.update_one(
+            {"_id": "PI_1"},
+            {"$set": {"processing_at": datetime.utcnow() - timedelta(seconds=90)}}
+        )
+        outcome = await payments.confirm("PI_1", "buyer-1")
+        
+        assert outcome["status"] == "succeeded"
+        assert database._database.transactions.count_documents({"intent_id": "PI_1"}) == 1
+    
+    @pytest.mark.asyncio
+    async def test_superseded_claim_does_not_store_result(self, database, redis_client):
+        """A confirmation whose claim was taken over does not store its result."""
+        def slow_gateway(intent):
+            # Another worker takes the claim over while this gateway call runs
+            database._database.payment_intents.update_one(
+                {"_id": "PI_1"},
+                {"$set": {"processing_at": datetime.utcnow(), "claim_id": "other-worker"}}
+            )
+            return True
+        
+        payments = PaymentService(database, approve=slow_gateway)
+        
+        with pytest.raises(ConflictException):
+            await payments.confirm("PI_1", "buyer-1")
+        
+        intent = database._database.payment_intents.find_one({"_id": "PI_1"})
+        assert intent["status"] == "processing"
+        assert database._database.transactions.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_initialize_creates_unique_index(self, payments, database):
+        """The transactions collection rejects a second transaction for an intent."""
+        await payments.initialize()
+        await payments.confirm("PI_1", "buyer-1")
+        
+        with pytest.raises(mongomock.DuplicateKeyError):
+            database._database.transactions.insert_one({"_id": "TXN_dup", "intent_id": "PI_1"})
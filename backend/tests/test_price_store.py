@@ -0,0 +1,236 @@
+"""
+Unit tests for the columnar in-memory price store.
+
+Tests ingestion, backfill, summaries, data quality counts, eviction and
+pub/sub updates.
+"""
+
+import bson
+import json
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.market_data_service import MarketDataService, _market_price_doc, _market_price_from_doc
+from app.services.price_store import ColumnarPriceStore
+from app.models.market_data import MarketPrice, DataSource, DataQuality, PriceUnit
+
+
+def _price(commodity="onion", market="Azadpur", state="Delhi", days_ago=0,
+           modal="25.00", quality=DataQuality.HIGH):
+    """Build a validated market price for testing."""
+    modal_price = Decimal(modal)
+    return MarketPrice(
+        commodity=commodity,
+        market=market,
+        state=state,
+        min_price=modal_price - 5,
+        max_price=modal_price + 5,
+        modal_price=modal_price,
+        unit=PriceUnit.PER_QUINTAL,
+        arrivals=100,
+        price_date=date.today() - timedelta(days=days_ago),
+        source=DataSource.AGMARKNET,
+        data_quality=quality,
+        is_validated=True
+    )
+
+
+def _cover(store, commodity="onion", days=365):
+    """Mark a commodity's history as loaded, as a backfill with no older rows would."""
+    store.backfill(commodity, [], date.today() - timedelta(days=days))
+
+
+@pytest.fixture
+def store():
+    """Create an empty price store for testing."""
+    return ColumnarPriceStore(max_commodities=2, retention_days=365)
+
+
+class TestColumnarPriceStore:
+    """Test cases for ColumnarPriceStore."""
+    
+    def test_summary_matches_model_based_summary(self, store):
+        """Store summaries match MarketDataService._calculate_price_summary."""
+        prices = [
+            _price(days_ago=3, modal="20.00"),
+            _price(days_ago=1, modal="30.00"),
+            _price(market="Lasalgaon", state="Maharashtra", days_ago=2, modal="22.00"),
+        ]
+        store.ingest(prices)
+        _cover(store)
+        
+        service = MarketDataService(MagicMock())
+        expected = service._calculate_price_summary(prices)
+        
+        assert store.summarize("Onion") == expected
+    
+    def test_summary_filters_by_state_and_market(self, store):
+        """State and market filters select matching series only."""
+        store.ingest([
+            _price(modal="20.00"),
+            _price(market="Lasalgaon", state="Maharashtra", modal="40.00"),
+        ])
+        _cover(store)
+        
+        assert store.summarize("onion", state="maharashtra")["avg_price"] == 40.0
+        assert store.summarize("onion", market="AZADPUR")["avg_price"] == 20.0
+    
+    def test_unknown_commodity_returns_none(self, store):
+        """Commodities not held in the store fall through to the database."""
+        assert store.summarize("wheat") is None
+        assert store.quality_counts("wheat") is None
+    
+    def test_same_date_replaces_row(self, store):
+        """Re-ingesting a date replaces the existing row."""
+        store.ingest([_price(modal="20.00")])
+        store.ingest([_price(modal="26.00")])
+        _cover(store)
+        
+        summary = store.summarize("onion")
+        assert summary["count"] == 1
+        assert summary["avg_price"] == 26.0
+    
+    def test_quality_counts(self, store):
+        """Quality distribution and validated counts come from the columns."""
+        store.ingest([
+            _price(days_ago=1, quality=DataQuality.HIGH),
+            _price(days_ago=2, quality=DataQuality.MEDIUM),
+            _price(days_ago=3, quality=DataQuality.MEDIUM),
+        ])
+        _cover(store)
+        
+        counts = store.quality_counts("onion")
+        assert counts["total_records"] == 3
+        assert counts["validated_records"] == 3
+        assert counts["quality_distribution"] == {"high": 1, "medium": 2}
+    
+    def test_window_not_backfilled_returns_none(self, store):
+        """Synced rows alone do not answer for a window until it is backfilled."""
+        store.ingest([_price(days_ago=1, modal="30.00")])
+        
+        assert store.summarize("onion") is None
+        assert store.quality_counts("onion") is None
+        
+        store.backfill("onion", [_price(days_ago=20, modal="20.00"), _price(days_ago=1, modal="30.00")],
+                       date.today() - timedelta(days=30))
+        
+        assert store.covers("onion", 30)
+        assert not store.covers("onion", 60)
+        assert store.summarize("onion")["count"] == 2
+        assert store.summarize("onion", days=60) is None
+    
+    def test_backfill_ignores_commodities_not_held(self, store):
+        """Backfills only fill commodities the store has admitted."""
+        assert store.backfill("wheat", [_price(commodity="wheat")], date.today()) == 0
+        assert not store.has_commodity("wheat")
+    
+    def test_hot_commodity_evicts_coldest(self, store):
+        """A frequently requested commodity replaces the coldest one when full."""
+        store.ingest([_price(commodity="onion"), _price(commodity="potato")])
+        store.record_hit("onion")
+        store.record_hit("tomato")
+        store.record_hit("tomato")
+        
+        store.ingest([_price(commodity="tomato")])
+        
+        assert store.has_commodity("tomato")
+        assert store.has_commodity("onion")
+        assert not store.has_commodity("potato")
+    
+    def test_cold_commodity_not_admitted_when_full(self, store):
+        """A commodity nobody asked for does not displace a hot one."""
+        store.ingest([_price(commodity="onion"), _price(commodity="potato")])
+        store.record_hit("onion")
+        store.record_hit("potato")
+        
+        store.ingest([_price(commodity="tomato")])
+        
+        assert not store.has_commodity("tomato")
+    
+    def test_version_increases_on_change(self, store):
+        """Ingesting and evicting rows bump the commodity version."""
+        assert store.version("onion") == 0
+        
+        store.ingest([_price(commodity="onion")])
+        version = store.version("Onion")
+        store.ingest([_price(commodity="potato")])
+        
+        assert version > 0
+        assert store.version("onion") == version
+        
+        store.record_hit("potato")
+        store.record_hit("tomato")
+        store.record_hit("tomato")
+        store.ingest([_price(commodity="tomato")])
+        
+        assert store.version("onion") > version
+    
+    def test_apply_message_from_other_worker(self, store):
+        """Updates published by another worker are applied; own updates are skipped."""
+        other = ColumnarPriceStore(max_commodities=2)
+        updates = other.ingest([_price(modal="24.00")])
+        
+        assert store.apply_message(json.dumps({"origin": store.worker_id, "series": updates})) == 0
+        assert store.apply_message(json.dumps({"origin": other.worker_id, "series": updates})) == 1
+        _cover(store)
+        assert store.summarize("onion")["avg_price"] == 24.0
+    
+    def test_memory_usage_per_million_rows(self, store):
+        """Memory is reported per row and per million rows."""
+        store.ingest([_price(days_ago=d) for d in range(10)])
+        
+        usage = store.memory_usage()
+        assert usage["rows"] == 10
+        assert usage["bytes_per_row"] == 38
+        assert usage["bytes_per_million_rows"] == 38_000_000
+        assert usage["bytes"] == 380
+
+
+class TestPriceStoreBackfill:
+    """Test cases for backfilling the price store from MongoDB."""
+    
+    @pytest.mark.asyncio
+    async def test_summary_backfills_once_from_database(self, store, monkeypatch):
+        """The first summary of a held commodity loads its stored history."""
+        monkeypatch.setattr("app.services.market_data_service.price_store", store)
+        database = MagicMock()
+        stored = bson.decode(bson.encode(_market_price_doc(_price(days_ago=20, modal="20.00"))))
+        database.market_prices.find.return_value.to_list = AsyncMock(return_value=[stored])
+        service = MarketDataService(database)
+        service.get_market_price = AsyncMock()
+        store.ingest([_price(days_ago=1, modal="30.00")])
+        
+        summary = await service.get_market_summary("Onion")
+        await service.get_market_summary("onion")
+        
+        assert summary["count"] == 2
+        assert summary["price_trend"] == "increasing"
+        database.market_prices.find.assert_called_once()
+        service.get_market_price.assert_not_called()
+        # The query must be encodable by a real MongoDB driver, which mocks do not check
+        bson.encode(database.market_prices.find.call_args[0][0])
+    
+    def test_stored_prices_round_trip_through_bson(self):
+        """Stored price documents encode to BSON and read back as the same price."""
+        price = _price(days_ago=3, modal="25.50")
+        
+        record = bson.decode(bson.encode(_market_price_doc(price)))
+        
+        assert record["price_date"].time().isoformat() == "00:00:00"
+        restored = _market_price_from_doc(record)
+        assert (restored.price_date, restored.modal_price) == (price.price_date, price.modal_price)
+    
+    @pytest.mark.asyncio
+    async def test_failed_backfill_falls_back_to_database_query(self, store, monkeypatch):
+        """If the backfill fails the summary comes from the database query."""
+        monkeypatch.setattr("app.services.market_data_service.price_store", store)
+        database = MagicMock()
+        database.market_prices.find.return_value.to_list = AsyncMock(side_effect=RuntimeError("down"))
+        service = MarketDataService(database)
+        service.get_market_price = AsyncMock(return_value=MagicMock(summary={"count": 7}))
+        store.ingest([_price(days_ago=1)])
+        
+        assert await service.get_market_summary("onion") == {"count": 7}
+        assert not store.covers("onion", 30)
@@ -0,0 +1,185 @@
+"""
+Unit tests for integer paise product prices.
+
+Tests conversions, the search filter and sort, the backfill migration and a
+benchmark of indexed category + price range queries on MongoDB.
+"""
+
+import random
+import pytest
+import mongomock
+from decimal import Decimal
+
+from app.models.product import ProductCategory, ProductSearchQuery
+from app.services.product_pricing import (
+    PRICE_PAISE_FIELD,
+    backfill_price_paise,
+    from_paise,
+    price_info_for_db,
+    price_range_filter,
+    to_paise,
+)
+from app.services.elasticsearch_service import elasticsearch_service
+from app.services.product_service import ProductService
+from tests.conftest import AsyncDatabase
+
+
+def _product(product_id, price, category="VEGETABLES"):
+    return {
+        "_id": product_id,
+        "status": "active",
+        "category": category,
+        "price_info": price_info_for_db({"base_price": Decimal(price), "currency": "INR"}),
+        "availability": {"quantity_available": 10, "unit": "kg"},
+    }
+
+
+class TestPaiseConversion:
+    """Test cases for paise conversion helpers."""
+    
+    def test_to_paise(self):
+        """Rupee amounts convert exactly, rounding half a paisa up."""
+        assert to_paise(Decimal("25.50")) == 2550
+        assert to_paise("100") == 10000
+        assert to_paise(0.1 + 0.2) == 30
+        assert to_paise("19.995") == 2000
+        assert from_paise(2550) == Decimal("25.50")
+    
+    def test_invalid_price(self):
+        """Non-numeric prices are rejected."""
+        for value in (None, "abc", "NaN"):
+            with pytest.raises(ValueError):
+                to_paise(value)
+    
+    def test_range_rounds_inwards(self):
+        """Range bounds only admit prices inside the range."""
+        assert price_range_filter(Decimal("10.005"), Decimal("20.009")) == {"$gte": 1001, "$lte": 2000}
+        assert price_range_filter(max_price=Decimal("80")) == {"$lte": 8000}
+    
+    def test_price_info_for_db(self):
+        """Stored price info keeps the exact string alongside paise."""
+        stored = price_info_for_db({"base_price": Decimal("42.75")})
+        
+        assert stored == {"base_price": "42.75", "base_price_paise": 4275}
+
+
+class TestPriceSearch:
+    """Test cases for price filters and sorting in product search."""
+    
+    @pytest.mark.asyncio
+    async def test_filter_uses_paise(self):
+        """Price ranges filter on integer paise."""
+        query = ProductSearchQuery(category=ProductCategory.VEGETABLES, min_price=Decimal("20"), max_price=Decimal("80"))
+        
+        search_filter = await ProductService()._build_search_filter(query)
+        
+        assert search_filter[PRICE_PAISE_FIELD] == {"$gte": 2000, "$lte": 8000}
+        assert "price_info.base_price" not in search_filter
+    
+    def test_sort_uses_paise(self):
+        """Price sorting uses integer paise."""
+        assert ProductService()._build_sort_criteria("price", "asc") == [(PRICE_PAISE_FIELD, 1)]
+    
+    def test_text_search_filter_and_sort_use_paise(self):
+        """The text search path filters and sorts on integer paise too."""
+        query = ProductSearchQuery(
+            query="onion", min_price=Decimal("20"), max_price=Decimal("80"), sort_by="price", sort_order="desc"
+        )
+        
+        search_filter = elasticsearch_service._build_mongo_filter(query)
+        
+        assert search_filter[PRICE_PAISE_FIELD] == {"$gte": 2000, "$lte": 8000}
+        assert "price_info.base_price" not in search_filter
+        assert elasticsearch_service._build_mongo_sort(query) == [(PRICE_PAISE_FIELD, -1)]
+    
+    @pytest.mark.asyncio
+    async def test_numeric_range_and_sort(self):
+        """Prices compare numerically, unlike the string field."""
+        collection = mongomock.MongoClient().db.products
+        collection.insert_many([
+            _product("p-1", "25"), _product("p-2", "250"), _product("p-3", "1000"), _product("p-4", "100.50"),
+        ])
+        query = ProductSearchQuery(min_price=Decimal("100"), max_price=Decimal("500"), sort_by="price", sort_order="asc")
+        service = ProductService()
+        
+        search_filter = await service._build_search_filter(query)
+        found = [p["_id"] for p in collection.find(search_filter).sort(service._build_sort_criteria("price", "asc"))]
+        lexicographic = [p["_id"] for p in collection.find({"price_info.base_price": {"$gte": "100", "$lte": "500"}})]
+        
+        assert found == ["p-4", "p-2"]
+        assert sorted(lexicographic) == ["p-1", "p-2", "p-3", "p-4"]
+
+
+class TestPriceBackfill:
+    """Test cases for the paise backfill migration."""
+    
+    @pytest.mark.asyncio
+    async def test_backfill(self):
+        """Old products get paise prices, unparseable ones are skipped, reruns do nothing."""
+        database = AsyncDatabase()
+        database._database.products.insert_many(
+            [{"_id": f"p-{i:02d}", "price_info": {"base_price": f"{i}.25"}} for i in range(25)]
+            + [{"_id": "p-bad", "price_info": {"base_price": "n/a"}}, {"_id": "p-none"}]
+        )
+        
+        result = await backfill_price_paise(database, batch_size=10)
+        
+        assert result == {"updated": 25, "skipped": 2}
+        assert database._database.products.find_one({"_id": "p-07"})["price_info"]["base_price_paise"] == 725
+        assert await backfill_price_paise(database, batch_size=10) == {"updated": 0, "skipped": 2}
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_indexed_price_range(self):
+        """Benchmark category + price range + price sort with and without the paise index."""
+        import os
+        import time
+        from motor.motor_asyncio import AsyncIOMotorClient
+        
+        client = AsyncIOMotorClient(
+            os.getenv("MONGODB_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000
+        )
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            client.close()
+            pytest.skip("MongoDB is not available")
+        
+        collection = client.benchmark_mandi.products_price_benchmark
+        await collection.drop()
+        rng = random.Random(11)
+        categories = ["VEGETABLES", "FRUITS", "GRAINS", "SPICES", "DAIRY"]
+        await collection.insert_many([
+            _product(f"p-{i}", f"{rng.uniform(5, 500):.2f}", rng.choice(categories))
+            for i in range(50_000)
+        ])
+        query = ProductSearchQuery(
+            category=ProductCategory.VEGETABLES, min_price=Decimal("20"), max_price=Decimal("80"),
+            sort_by="price", sort_order="asc", limit=20
+        )
+        service = ProductService()
+        search_filter = await service._build_search_filter(query)
+        sort = service._build_sort_criteria("price", "asc")
+        
+        async def run():
+            start = time.perf_counter()
+            for _ in range(50):
+                await collection.find(search_filter).sort(sort).limit(20).to_list(length=20)
+            elapsed = (time.perf_counter() - start) / 50
+            plan = await collection.find(search_filter).sort(sort).limit(20).explain()
+            return elapsed, plan["executionStats"]["totalDocsExamined"]
+        
+        try:
+            unindexed, unindexed_examined = await run()
+            await collection.create_index([("status", 1), ("category", 1), (PRICE_PAISE_FIELD, 1)])
+            indexed, indexed_examined = await run()
+        finally:
+            await collection.drop()
+            client.close()
+        
+        print(
+            f"\n50k products, category + price range + sort: "
+            f"collection scan {unindexed * 1000:.2f} ms ({unindexed_examined} docs), "
+            f"paise index {indexed * 1000:.2f} ms ({indexed_examined} docs)"
+        )
+        assert indexed_examined <= 20 < unindexed_examined
@@ -0,0 +1,348 @@
+"""
+Unit tests for the fast product search serializer.
+
+Tests that search pages encoded from raw documents are byte-identical to the
+serialized response models, the fallback for documents that do not fit the
+schema, the projected product read and batched vendor lookup, a
+throughput benchmark per 100 products and responses projected to one
+language.
+"""
+
+import pytest
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import patch
+
+from bson import ObjectId
+
+from app.models.product import ProductSearchQuery, ProductSearchResponse
+from app.models.user import SupportedLanguage
+from app.services.elasticsearch_service import elasticsearch_service
+from app.services.product_serializer import (
+    PRODUCT_RESPONSE_FIELDS,
+    SchemaMismatch,
+    dump_search_response,
+    product_to_json_value,
+    search_response_json,
+    vendor_summary,
+)
+from app.services.product_service import ProductService
+from tests.conftest import AsyncDatabase
+
+
+def _text(text, language="en", **translations):
+    return {
+        "original_language": language,
+        "original_text": text,
+        "translations": translations,
+        "auto_translated": bool(translations),
+        "last_updated": datetime(2026, 1, 2, 3, 4, 5, 123000),
+    }
+
+
+def _product(index, vendor_id="vendor-1", **overrides):
+    product = {
+        "product_id": f"product-{index:03d}",
+        "vendor_id": vendor_id,
+        "name": _text(f"Tomato {index}", hi="टमाटर"),
+        "description": _text("Fresh \"desi\" tomatoes\nfrom the farm\t☃"),
+        "category": "vegetables",
+        "subcategory": "tomatoes",
+        "tags": ["fresh", "local"],
+        "images": [{
+            "image_id": f"image-{index}",
+            "image_url": f"https://cdn.example.com/{index}.jpg",
+            "is_primary": True,
+            "uploaded_at": datetime(2026, 1, 2, 3, 4, 5),
+            "dimensions": {"width": 640, "height": 480},
+        }],
+        "price_info": {
+            "base_price": "25.50",
+            "base_price_paise": 2550,
+            "currency": "INR",
+            "negotiable": True,
+            "bulk_discount": {"min_quantity": 50, "percent": 7.5, "tiers": [{"kg": 100, "off": 0.1}]},
+        },
+        "availability": {
+            "quantity_available": 120 + index,
+            "unit": "kg",
+            "minimum_order": 5,
+            "available_from": "2026-01-02T00:00:00",
+            "restocking_date": "2026-02-01",
+        },
+        "location": {
+            "address": "Shop 12, Azadpur Mandi",
+            "city": "Delhi",
+            "state": "Delhi",
+            "pincode": "110033",
+            "coordinates": [77, 28.707],
+            "geohash": "ttng1x2",
+        },
+        "quality_grade": "grade_a",
+        "metadata": {"harvest_date": "2026-01-01T00:00:00", "certifications": ["fssai"]},
+        "status": "active",
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, 678000),
+        "updated_at": datetime(2026, 1, 3),
+        "views_count": index,
+        "favorites_count": 2,
+        "featured": index % 2 == 0,
+        "search_keywords": ["tomato"] * 20,
+    }
+    product.update(overrides)
+    return product
+
+
+@pytest.fixture
+def database():
+    """Create a database with vendors, a buyer and varied products."""
+    database = AsyncDatabase()
+    vendor_object_id = ObjectId()
+    database.users._collection.insert_many([
+        {"user_id": "vendor-1", "email": "v1@example.com", "role": "vendor",
+         "business_name": "Sharma Sabzi", "market_location": "Azadpur", "rating": 4.5},
+        {"user_id": "vendor-2", "email": "v2@example.com", "role": "vendor", "business_name": "Gupta Fruits"},
+        {"user_id": "buyer-1", "email": "b1@example.com", "role": "buyer", "business_name": "Not shown"},
+        {"_id": vendor_object_id, "user_id": "legacy-vendor", "email": "v3@example.com", "role": "vendor",
+         "business_name": "Old Mandi Stall", "rating": 3.0},
+    ])
+    database.products._collection.insert_many(
+        [_product(index) for index in range(5)]
+        + [
+            _product(5, "vendor-2", subcategory=None, metadata={}),
+            _product(6, "buyer-1", tags=[], images=[]),
+            _product(7, "missing-vendor", price_info={"base_price": 18}),
+            _product(8, str(vendor_object_id)),
+        ]
+    )
+    for product in database.products._collection.find({"product_id": "product-005"}):
+        database.products._collection.update_one(
+            {"_id": product["_id"]}, {"$unset": {"featured": "", "views_count": ""}}
+        )
+    return database
+
+
+@contextmanager
+def _patched(database):
+    async def get_database():
+        return database
+    
+    with patch.object(elasticsearch_service, "search_products") as text_search, \
+         patch("app.services.product_service.get_database", get_database), \
+         patch("app.services.user_service.get_database", get_database), \
+         patch("app.services.product_service.time.perf_counter", return_value=1.0):
+        yield text_search
+
+
+def _query(**kwargs):
+    return ProductSearchQuery(available_only=False, sort_by="date", sort_order="asc", **kwargs)
+
+
+class TestFastSearchPage:
+    """Test cases for ProductService.search_products_json."""
+    
+    @pytest.mark.asyncio
+    async def test_bytes_match_response_model(self, database):
+        """The fast page is byte-identical to the serialized model response."""
+        service = ProductService()
+        query = _query(limit=20)
+        
+        with _patched(database):
+            expected = dump_search_response(await service.search_products(query))
+            fast = await service.search_products_json(query)
+        
+        assert b'"products":[{' in fast
+        assert fast == expected
+    
+    @pytest.mark.asyncio
+    async def test_vendor_fields(self, database):
+        """Vendor fields come from one batched lookup and match UserService rules."""
+        service = ProductService()
+        
+        with _patched(database):
+            vendors = await service._get_vendor_summaries(
+                {"vendor-1", "vendor-2", "buyer-1", "missing-vendor"}
+            )
+        
+        assert len(database.users.finds) == 1
+        assert vendors["vendor-1"] == {"business_name": "Sharma Sabzi", "rating": 4.5, "market_location": "Azadpur"}
+        assert vendors["vendor-2"]["rating"] == 0.0
+        assert vendors["buyer-1"] == {"business_name": None, "rating": None, "market_location": None}
+        assert "missing-vendor" not in vendors
+    
+    @pytest.mark.asyncio
+    async def test_reads_only_response_fields(self, database):
+        """Searches without text are read from MongoDB with the response projection."""
+        with _patched(database) as text_search:
+            await ProductService().search_products_json(_query(limit=3))
+        
+        text_search.assert_not_called()
+        (_, projection), = database.products.finds
+        assert projection == PRODUCT_RESPONSE_FIELDS
+        assert "search_keywords" not in projection and "vendor_name" not in projection
+    
+    @pytest.mark.asyncio
+    async def test_mismatch_uses_response_models(self, database):
+        """Pages the serializer cannot encode exactly are serialized through the models."""
+        database.products._collection.update_many(
+            {"product_id": "product-003"}, {"$set": {"views_count": 7.0}}
+        )
+        service = ProductService()
+        query = _query(limit=20)
+        
+        with _patched(database):
+            expected = dump_search_response(await service.search_products(query))
+            fast = await service.search_products_json(query)
+        
+        assert b'"views_count":7,' in fast
+        assert fast == expected
+    
+    @pytest.mark.asyncio
+    async def test_error_response(self, database):
+        """Search failures return the serialized empty response."""
+        with _patched(database), \
+             patch.object(ProductService, "_search_mongodb", side_effect=RuntimeError("boom")):
+            content = await ProductService().search_products_json(_query())
+        
+        response = ProductSearchResponse.model_validate_json(content)
+        assert response.products == []
+        assert response.search_metadata["error"] == "boom"
+
+
+class TestSerializer:
+    """Test cases for the compiled converters."""
+    
+    def test_schema_mismatches(self):
+        """Documents the models would coerce or reject are refused."""
+        vendor = vendor_summary({"role": "vendor"})
+        bad_documents = [
+            _product(1, quality_grade="grade_z"),
+            _product(1, views_count="7"),
+            _product(1, price_info={"base_price": "-1"}),
+            _product(1, location={**_product(1)["location"], "coordinates": [77.1]}),
+            _product(1, description={"original_text": "missing language"}),
+            _product(1, created_at="not a date"),
+            _product(1, distance_km=float("nan")),
+        ]
+        
+        for document in bad_documents:
+            with pytest.raises(SchemaMismatch):
+                product_to_json_value(document, vendor)
+    
+    def test_large_floats_refused(self):
+        """Floats pydantic and orjson format differently are left to the model path."""
+        with pytest.raises(SchemaMismatch):
+            search_response_json([], {}, 0, {}, {"search_time_ms": 1e16})
+        
+        assert search_response_json([], {}, 0, {}, {"search_time_ms": 1e-7}) == dump_search_response(
+            ProductSearchResponse(products=[], total_count=0, page_info={}, search_metadata={"search_time_ms": 1e-7})
+        )
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_per_100_products(self, database):
+        """Benchmark 100-product search pages through the response models and the fast path."""
+        from time import perf_counter
+        
+        database.products._collection.insert_many(
+            [_product(index, f"vendor-{index % 3}") for index in range(100, 200)]
+        )
+        service = ProductService()
+        query = _query(limit=100)
+        rounds = 10
+        
+        with _patched(database):
+            start = perf_counter()
+            for _ in range(rounds):
+                model = dump_search_response(await service.search_products(query))
+            model_ms = (perf_counter() - start) / rounds * 1000
+            
+            start = perf_counter()
+            for _ in range(rounds):
+                fast = await service.search_products_json(query)
+            fast_ms = (perf_counter() - start) / rounds * 1000
+        
+        products = [_product(index, f"vendor-{index % 3}") for index in range(100)]
+        vendors = {f"vendor-{i}": vendor_summary({"role": "vendor"}) for i in range(3)}
+        start = perf_counter()
+        for _ in range(rounds):
+            search_response_json(products, vendors, 100, {}, {})
+        encode_ms = (perf_counter() - start) / rounds * 1000
+        
+        print(
+            f"\n100 products: response models {model_ms:.2f} ms, fast path {fast_ms:.2f} ms "
+            f"({encode_ms:.2f} ms encoding)"
+        )
+        assert fast == model
+        assert fast_ms < model_ms
+
+
+TRANSLATIONS = {
+    "hi": "ताज़े देसी टमाटर, सीधे खेत से", "ta": "புதிய நாட்டு தக்காளி, பண்ணையிலிருந்து நேரடியாக",
+    "te": "తాజా దేశీ టమాటాలు, నేరుగా పొలం నుండి", "kn": "ತಾಜಾ ದೇಸಿ ಟೊಮೆಟೊ, ನೇರವಾಗಿ ಹೊಲದಿಂದ",
+    "ml": "പുതിയ നാടൻ തക്കാളി, നേരിട്ട് കൃഷിയിടത്തിൽ നിന്ന്", "gu": "તાજા દેશી ટામેટાં, સીધા ખેતરમાંથી",
+    "pa": "ਤਾਜ਼ੇ ਦੇਸੀ ਟਮਾਟਰ, ਸਿੱਧੇ ਖੇਤ ਤੋਂ", "bn": "তাজা দেশি টমেটো, সরাসরি খামার থেকে",
+    "mr": "ताजे देशी टोमॅटो, थेट शेतातून",
+}
+
+
+@pytest.fixture
+def translated_database(database):
+    """Give every product name and description all nine translations."""
+    database.products._collection.update_many({}, {"$set": {
+        "name.translations": TRANSLATIONS, "description.translations": TRANSLATIONS,
+    }})
+    return database
+
+
+class TestLanguageProjection:
+    """Test cases for responses with only the requested language."""
+    
+    @pytest.mark.asyncio
+    async def test_search_page(self, translated_database):
+        """Search pages read and return only the search language's translations."""
+        service = ProductService()
+        
+        with _patched(translated_database):
+            full = await service.search_products_json(_query(language="ta"))
+            projected = await service.search_products_json(_query(language="ta", language_only=True))
+            model = dump_search_response(await service.search_products(_query(language="ta", language_only=True)))
+        
+        products = ProductSearchResponse.model_validate_json(projected).products
+        assert {p.name.translations == {"ta": TRANSLATIONS["ta"]} for p in products} == {True}
+        assert {p.description.original_text for p in products} == {"Fresh \"desi\" tomatoes\nfrom the farm\t☃"}
+        assert projected == model
+        
+        (_, projection), = translated_database.products.finds[1:2]
+        assert projection["name.translations.ta"] == 1
+        assert "name" not in projection and "name.translations" not in projection
+        
+        print(
+            f"\n{len(products)} products: all translations {len(full)} bytes, "
+            f"one language {len(projected)} bytes, {len(full) - len(projected)} bytes saved per page"
+        )
+        assert len(projected) < len(full) * 0.6
+    
+    @pytest.mark.asyncio
+    async def test_product_detail(self, translated_database):
+        """Product detail leaves other languages' translations in the database."""
+        with _patched(translated_database):
+            product = await ProductService().get_product_by_id(
+                "product-001", language=SupportedLanguage.HINDI, increment_views=False, language_only=True
+            )
+        
+        assert product.name.translations == {"hi": TRANSLATIONS["hi"]}
+        assert product.description.translations == {"hi": TRANSLATIONS["hi"]}
+    
+    @pytest.mark.asyncio
+    async def test_vendor_listing(self, translated_database):
+        """Vendor listings with the original language return no translations."""
+        with _patched(translated_database):
+            products = await ProductService().get_vendor_products(
+                "vendor-1", language=SupportedLanguage.ENGLISH, language_only=True
+            )
+        
+        (_, projection), = translated_database.products.finds
+        assert projection["name.translations.hi"] == 0 and "name.translations.en" not in projection
+        assert len(products) == 5
+        assert {product.name.translations.get("en") for product in products} == {None}
+        assert {len(product.name.translations) for product in products} == {0}
@@ -0,0 +1,186 @@
+"""
+Unit tests for streaming order and transaction exports.
+
+Tests NDJSON and CSV output, date ranges, resuming from a row cursor,
+batch-sized chunks and the order export endpoints.
+"""
+
+import csv
+import io
+import json
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app.api.v1.endpoints import orders, payments
+from app.core.exceptions import ValidationException
+from app.services.record_export import build_export_query, decode_cursor, encode_cursor, stream_export
+from tests.conftest import AsyncDatabase
+
+
+START = datetime(2026, 1, 1)
+
+
+def _row(document):
+    return {"id": document["_id"], "vendor_id": document["vendor_id"], "total_amount": document["total_amount"]}
+
+
+COLUMNS = ["id", "vendor_id", "total_amount"]
+
+
+@pytest.fixture
+def database():
+    """Create a database with 30 orders over 10 days, three per day."""
+    database = AsyncDatabase()
+    database._database.orders.insert_many([
+        {
+            "_id": f"order-{i:03d}",
+            "vendor_id": "vendor-1" if i % 3 else "vendor-2",
+            "buyer_id": "buyer-1",
+            "total_amount": float(i),
+            "created_at": START + timedelta(days=i // 3),
+            "updated_at": START + timedelta(days=i // 3),
+        }
+        for i in range(30)
+    ])
+    return database
+
+
+async def _collect(chunks):
+    return b"".join([chunk async for chunk in chunks]).decode()
+
+
+def _ndjson(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+class TestRecordExport:
+    """Test cases for streaming exports."""
+    
+    @pytest.mark.asyncio
+    async def test_ndjson_oldest_first(self, database):
+        """NDJSON rows come oldest first, each with a resume cursor."""
+        query = build_export_query({}, "created_at")
+        
+        rows = _ndjson(await _collect(stream_export(database.orders, query, "created_at", _row, COLUMNS)))
+        
+        assert [row["id"] for row in rows] == [f"order-{i:03d}" for i in range(30)]
+        assert decode_cursor(rows[4]["cursor"]) == (START + timedelta(days=1), "order-004")
+    
+    @pytest.mark.asyncio
+    async def test_csv(self, database):
+        """CSV output has a header and one line per row."""
+        query = build_export_query({"vendor_id": "vendor-2"}, "created_at")
+        
+        text = await _collect(stream_export(database.orders, query, "created_at", _row, COLUMNS, "csv"))
+        lines = list(csv.reader(io.StringIO(text)))
+        
+        assert lines[0] == COLUMNS + ["cursor"]
+        assert [line[0] for line in lines[1:]] == [f"order-{i:03d}" for i in range(0, 30, 3)]
+    
+    @pytest.mark.asyncio
+    async def test_date_range(self, database):
+        """Only rows inside the date range are exported."""
+        query = build_export_query({}, "created_at", START + timedelta(days=2), START + timedelta(days=3))
+        
+        rows = _ndjson(await _collect(stream_export(database.orders, query, "created_at", _row, COLUMNS)))
+        
+        assert [row["id"] for row in rows] == [f"order-{i:03d}" for i in range(6, 12)]
+    
+    @pytest.mark.asyncio
+    async def test_resume_after_cursor(self, database):
+        """Resuming from a cursor continues at the next row, including rows with the same date."""
+        query = build_export_query({}, "created_at")
+        rows = _ndjson(await _collect(stream_export(database.orders, query, "created_at", _row, COLUMNS)))
+        
+        resumed_query = build_export_query({}, "created_at", after=rows[10]["cursor"])
+        resumed = _ndjson(await _collect(stream_export(database.orders, resumed_query, "created_at", _row, COLUMNS)))
+        
+        assert resumed == rows[11:]
+    
+    @pytest.mark.asyncio
+    async def test_chunks_hold_one_batch(self, database):
+        """Each streamed chunk holds at most one batch of rows."""
+        query = build_export_query({}, "created_at")
+        
+        chunks = [
+            chunk async for chunk in
+            stream_export(database.orders, query, "created_at", _row, COLUMNS, batch_size=8)
+        ]
+        
+        assert [chunk.count(b"\n") for chunk in chunks] == [8, 8, 8, 6]
+    
+    def test_invalid_query(self):
+        """Malformed cursors and reversed date ranges are rejected."""
+        with pytest.raises(ValidationException):
+            build_export_query({}, "created_at", after="not-a-cursor")
+        with pytest.raises(ValidationException):
+            build_export_query({}, "created_at", START, START - timedelta(days=1))
+    
+    def test_cursor_round_trip(self):
+        """Cursors decode to the position they were made from."""
+        cursor = encode_cursor(START, "order-001")
+        
+        assert decode_cursor(cursor) == (START, "order-001")
+
+
+class TestOrderExportEndpoints:
+    """Test cases for the order export endpoints."""
+    
+    @pytest.mark.asyncio
+    async def test_vendor_export(self, database):
+        """Vendors export only their own orders."""
+        user = MagicMock(user_id="vendor-2")
+        
+        response = await orders.export_vendor_orders(
+            user, database, export_format="csv", start=None, end=None, status=None, after=None
+        )
+        lines = list(csv.reader(io.StringIO(await _collect(response.body_iterator))))
+        
+        assert response.media_type == "text/csv"
+        assert lines[0] == orders.VENDOR_ORDER_COLUMNS + ["cursor"]
+        assert len(lines) == 11
+    
+    @pytest.mark.asyncio
+    async def test_invalid_cursor_is_bad_request(self, database):
+        """A malformed resume cursor is a 400 before streaming starts."""
+        user = MagicMock(user_id="buyer-1")
+        
+        with pytest.raises(HTTPException) as error:
+            await orders.export_buyer_orders(
+                user, database, export_format="ndjson", start=None, end=None, status=None, after="bad"
+            )
+        
+        assert error.value.status_code == 400
+
+
+class TestTransactionExportEndpoint:
+    """Test cases for the transaction export endpoint."""
+    
+    @pytest.mark.asyncio
+    async def test_exports_own_transactions(self, database):
+        """Users export only their own transactions, oldest first."""
+        database._database.transactions.insert_many([
+            {
+                "_id": f"TXN{i}",
+                "user_id": "buyer-1" if i % 2 else "buyer-2",
+                "amount": 100.0 * i,
+                "currency": "INR",
+                "payment_method": "upi",
+                "status": "completed",
+                "completed_at": START + timedelta(days=10 - i),
+            }
+            for i in range(6)
+        ])
+        # UserResponse has user_id and no id
+        user = SimpleNamespace(user_id="buyer-1")
+        
+        response = await payments.export_transactions(
+            export_format="ndjson", start=None, end=None, after=None, current_user=user, db=database
+        )
+        rows = _ndjson(await _collect(response.body_iterator))
+        
+        assert [row["transaction_id"] for row in rows] == ["TXN5", "TXN3", "TXN1"]
+        assert response.headers["content-disposition"] == 'attachment; filename="transactions.ndjson"'
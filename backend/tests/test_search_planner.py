@@ -0,0 +1,241 @@
+"""
+Unit tests for the product search planner.
+
+Tests index choice for common filter combinations, partial index
+eligibility, plans in search metadata, the index recommendation report and
+a benchmark of planned searches on MongoDB.
+"""
+
+import pytest
+from decimal import Decimal
+from unittest.mock import patch
+
+from app.core.database import AVAILABLE_PRODUCTS, PRODUCT_SEARCH_INDEXES
+from app.models.product import ProductCategory, ProductSearchQuery, QualityGrade
+from app.services.elasticsearch_service import elasticsearch_service
+from app.services.product_service import ProductService
+from app.services.search_planner import SearchPlanner, search_planner
+from tests.conftest import AsyncDatabase
+
+
+async def _plan(query, planner=None):
+    service = ProductService()
+    search_filter = await service._build_search_filter(query)
+    sort = service._build_sort_criteria(query.sort_by, query.sort_order)
+    return (planner or search_planner).plan(search_filter, sort), search_filter, sort
+
+
+@pytest.fixture(autouse=True)
+def reset_planner():
+    search_planner.reset()
+    yield
+    search_planner.reset()
+
+
+class TestSearchPlanner:
+    """Test cases for index choice."""
+    
+    @pytest.mark.asyncio
+    async def test_category_price_range_uses_partial_index(self):
+        """Available products by category and price use the partial category/price index."""
+        query = ProductSearchQuery(
+            category=ProductCategory.VEGETABLES, min_price=Decimal("20"), max_price=Decimal("80"),
+            sort_by="price", sort_order="asc"
+        )
+        
+        plan, _, _ = await _plan(query)
+        
+        assert plan["index"] == "available_category_price"
+        assert plan["strategy"] == "partial_index"
+        assert plan["sort_served"] is True
+        assert set(plan["fields_served"]) == {
+            "status", "availability.quantity_available", "category", "price_info.base_price_paise"
+        }
+    
+    @pytest.mark.asyncio
+    async def test_unavailable_included_uses_compound_index(self):
+        """Searches that include sold-out products cannot use the partial indexes."""
+        query = ProductSearchQuery(
+            category=ProductCategory.FRUITS, available_only=False, sort_by="date", sort_order="desc"
+        )
+        
+        plan, _, _ = await _plan(query)
+        
+        assert plan["index"] == "status_1_category_1_created_at_-1"
+        assert plan["sort_served"] is True
+    
+    @pytest.mark.asyncio
+    async def test_newest_available(self):
+        """Newest available listings read the partial created_at index in order."""
+        plan, _, _ = await _plan(ProductSearchQuery(sort_by="date", sort_order="desc"))
+        
+        assert plan["index"] == "available_created"
+        assert plan["sort_served"] is True
+    
+    def test_partial_index_needs_implied_filter(self):
+        """A partial index is only chosen when the filter guarantees its condition."""
+        planner = SearchPlanner()
+        sort = [("created_at", -1)]
+        
+        as_in = planner.plan({"status": {"$in": ["active"]}, "availability.quantity_available": {"$gt": 0}}, sort)
+        any_stock = planner.plan({"status": "active", "availability.quantity_available": {"$gte": 0}}, sort)
+        
+        assert as_in["index"] == any_stock["index"] == "status_1_price_info.base_price_paise_1"
+        assert as_in["strategy"] == any_stock["strategy"] == "compound_index"
+    
+    def test_unserved_filter_left_to_mongodb(self):
+        """Filters no catalog index serves are not hinted."""
+        plan = SearchPlanner().plan({"vendor_id": "vendor-1"}, [("views_count", -1)])
+        
+        assert plan == {
+            "index": None, "strategy": "auto", "shape": "vendor_id:eq,sort:views_count:-1",
+            "fields_served": [], "sort_served": False,
+        }
+
+
+class TestIndexReport:
+    """Test cases for index recommendations from observed shapes."""
+    
+    @pytest.mark.asyncio
+    async def test_recommends_index_for_unserved_shape(self):
+        """Frequent shapes with unserved fields get a recommended index."""
+        planner = SearchPlanner()
+        quality = ProductSearchQuery(
+            category=ProductCategory.VEGETABLES, quality_grades=[QualityGrade.GRADE_A, QualityGrade.ORGANIC],
+            sort_by="price", sort_order="asc"
+        )
+        served = ProductSearchQuery(category=ProductCategory.VEGETABLES, sort_by="price", sort_order="asc")
+        for query, runs in ((quality, 3), (served, 5)):
+            plan, search_filter, sort = await _plan(query, planner)
+            for _ in range(runs):
+                planner.observe(search_filter, sort, plan, 12.0)
+        
+        report = planner.index_report()
+        
+        assert len(report) == 1
+        assert report[0]["queries"] == 3
+        assert report[0]["avg_ms"] == 12.0
+        assert report[0]["current_index"] == "available_category_price"
+        assert report[0]["recommended_keys"] == [("category", 1), ("quality_grade", 1)]
+        assert report[0]["partial_filter"] == AVAILABLE_PRODUCTS
+        assert planner.index_report(min_queries=4) == []
+    
+    def test_shape_limit(self):
+        """Only a bounded number of shapes is tracked."""
+        planner = SearchPlanner(max_shapes=2)
+        for field in ("a", "b", "c"):
+            search_filter = {field: 1}
+            planner.observe(search_filter, [], planner.plan(search_filter, []), 1.0)
+        
+        assert len(planner.index_report()) == 2
+
+
+class TestSearchProducts:
+    """Test cases for planned searches in ProductService."""
+    
+    @pytest.mark.asyncio
+    async def test_plan_hinted_and_reported(self):
+        """The chosen index is hinted to find and count and reported in the metadata."""
+        database = AsyncDatabase()
+        query = ProductSearchQuery(category=ProductCategory.VEGETABLES, sort_by="price", sort_order="asc")
+        
+        async def get_database():
+            return database
+        
+        with patch.object(elasticsearch_service, "search_products") as text_search, \
+             patch("app.services.product_service.get_database", get_database):
+            result = await ProductService().search_products(query)
+        
+        # Searches without text are served by the planned path, not the text search
+        text_search.assert_not_called()
+        assert result.search_metadata["fallback_used"] is False
+        plan = result.search_metadata["query_plan"]
+        assert plan["index"] == "available_category_price"
+        assert database.products.hints == ["available_category_price", "available_category_price"]
+        assert result.search_metadata["search_time_ms"] >= 0
+        assert search_planner._shapes[plan["shape"]]["queries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_text_search_first(self):
+        """Searches with text try the text search and fall back to the planned path."""
+        database = AsyncDatabase()
+        query = ProductSearchQuery(query="tomato", category=ProductCategory.VEGETABLES)
+        
+        async def get_database():
+            return database
+        
+        with patch.object(elasticsearch_service, "search_products", side_effect=RuntimeError("down")) as text_search, \
+             patch("app.services.product_service.get_database", get_database):
+            result = await ProductService().search_products(query)
+        
+        text_search.assert_called_once()
+        assert result.search_metadata["fallback_used"] is True
+        assert result.search_metadata["query_plan"]["index"] == "available_category_price"
+    
+    @pytest.mark.slow
+    @pytest.mark.asyncio
+    async def test_benchmark_planned_indexes(self):
+        """Benchmark category + quality + price searches with single-field and planned indexes."""
+        import os
+        import random
+        import time
+        from motor.motor_asyncio import AsyncIOMotorClient
+        
+        client = AsyncIOMotorClient(
+            os.getenv("MONGODB_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000
+        )
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            client.close()
+            pytest.skip("MongoDB is not available")
+        
+        collection = client.benchmark_mandi.products_planner_benchmark
+        await collection.drop()
+        rng = random.Random(5)
+        categories = [category.value for category in ProductCategory]
+        await collection.insert_many([
+            {
+                "status": rng.choice(["active"] * 9 + ["inactive"]),
+                "category": rng.choice(categories),
+                "quality_grade": rng.choice(["premium", "grade_a", "grade_b", "organic"]),
+                "availability": {"quantity_available": rng.choice([0, rng.randint(1, 500)])},
+                "price_info": {"base_price_paise": rng.randint(500, 50000)},
+                "created_at": rng.random(),
+            }
+            for _ in range(50_000)
+        ])
+        query = ProductSearchQuery(
+            category=ProductCategory.VEGETABLES, min_price=Decimal("20"), max_price=Decimal("80"),
+            sort_by="price", sort_order="asc", limit=20
+        )
+        plan, search_filter, sort = await _plan(query)
+        
+        async def run(hint=None):
+            options = {"hint": hint} if hint else {}
+            start = time.perf_counter()
+            for _ in range(50):
+                await collection.find(search_filter, **options).sort(sort).limit(20).to_list(length=20)
+                await collection.count_documents(search_filter, **options)
+            elapsed = (time.perf_counter() - start) / 50
+            explain = await collection.find(search_filter, **options).sort(sort).limit(20).explain()
+            return elapsed, explain["executionStats"]["totalDocsExamined"]
+        
+        try:
+            await collection.create_index("category")
+            await collection.create_index("status")
+            single, single_examined = await run()
+            for spec in PRODUCT_SEARCH_INDEXES:
+                options = {"partialFilterExpression": spec.partial} if spec.partial else {}
+                await collection.create_index(spec.keys, name=spec.name, **options)
+            planned, planned_examined = await run(plan["index"])
+        finally:
+            await collection.drop()
+            client.close()
+        
+        print(
+            f"\n50k products, category + price range + sort + count: "
+            f"single-field indexes {single * 1000:.2f} ms ({single_examined} docs), "
+            f"{plan['index']} {planned * 1000:.2f} ms ({planned_examined} docs)"
+        )
+        assert planned_examined <= 20 < single_examined
@@ -0,0 +1,198 @@
+"""
+Unit tests for buffered product view counts.
+
+Tests in-process and Redis counting, batched flushes to MongoDB, counts kept
+across failed flushes, the background flusher, product views without a write
+per view and the popularity index.
+"""
+
+import asyncio
+import pytest
+import fakeredis
+from unittest.mock import patch
+
+from app.models.product import ProductSearchQuery
+from app.services.background_tasks import BackgroundTaskService
+from app.services.product_service import ProductService
+from app.services.search_planner import SearchPlanner
+from app.services.view_counter import VIEW_COUNTS_KEY, ViewCounter
+from tests.conftest import AsyncDatabase
+
+
+def _views(database, product_id):
+    return database.products._collection.find_one({"product_id": product_id}).get("views_count", 0)
+
+
+@pytest.fixture
+def database():
+    """Create a database with three products, one already viewed."""
+    database = AsyncDatabase()
+    database.products._collection.insert_many([
+        {"product_id": "p-1", "views_count": 10},
+        {"product_id": "p-2"},
+        {"product_id": "p-3"},
+    ])
+    
+    async def update_one(*args, **kwargs):
+        raise AssertionError("views must not be written one at a time")
+    
+    database.products.update_one = update_one
+    return database
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Share one in-memory Redis server between counters."""
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    
+    async def get_redis():
+        return client
+    
+    monkeypatch.setattr("app.services.view_counter.get_redis", get_redis)
+    return client
+
+
+class TestViewCounter:
+    """Test cases for ViewCounter."""
+    
+    @pytest.mark.asyncio
+    async def test_views_flushed_in_batches(self, database):
+        """Views are summed per product and written in bulk batches."""
+        counter = ViewCounter(database, backend="memory", batch_size=2)
+        pending = [await counter.record_view(product_id) for product_id in ["p-1", "p-2", "p-1", "p-3", "p-1"]]
+        
+        assert pending == [1, 1, 2, 1, 3]
+        assert database.products.bulk_writes == []
+        
+        result = await counter.flush()
+        
+        assert result == {"products": 3, "views": 5}
+        assert database.products.bulk_writes == [2, 1]
+        assert [_views(database, p) for p in ("p-1", "p-2", "p-3")] == [13, 1, 1]
+        assert await counter.flush() == {"products": 0, "views": 0}
+    
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_counts(self, database):
+        """Counts from a failed flush are written by the next one, once."""
+        counter = ViewCounter(database, backend="memory")
+        await counter.record_view("p-2")
+        database.products.fail_writes = 1
+        
+        assert await counter.flush() == {"products": 0, "views": 0}
+        await counter.record_view("p-2")
+        await counter.flush()
+        
+        assert _views(database, "p-2") == 2
+    
+    @pytest.mark.asyncio
+    async def test_redis_counts_shared_between_workers(self, database, redis_client):
+        """Workers count in one Redis hash and any of them flushes the total."""
+        workers = [ViewCounter(database, backend="redis"), ViewCounter(database, backend="redis")]
+        await workers[0].record_view("p-1")
+        pending = await workers[1].record_view("p-1")
+        
+        assert pending == 2
+        assert await redis_client.hgetall(VIEW_COUNTS_KEY) == {"p-1": "2"}
+        
+        assert await workers[1].flush() == {"products": 1, "views": 2}
+        assert await workers[0].flush() == {"products": 0, "views": 0}
+        assert _views(database, "p-1") == 12
+        assert await redis_client.keys("product_views:*") == []
+    
+    @pytest.mark.asyncio
+    async def test_views_during_flush_not_lost(self, database, redis_client):
+        """Views counted while a flush writes go to the next flush."""
+        counter = ViewCounter(database, backend="redis")
+        await counter.record_view("p-3")
+        original_bulk_write = database.products.bulk_write
+        
+        async def bulk_write_with_view(requests, ordered=True):
+            await counter.record_view("p-3")
+            await original_bulk_write(requests, ordered)
+        
+        with patch.object(database.products, "bulk_write", bulk_write_with_view):
+            await counter.flush()
+        await counter.flush()
+        
+        assert _views(database, "p-3") == 2
+    
+    @pytest.mark.asyncio
+    async def test_without_redis_counts_in_process(self, database, monkeypatch):
+        """Views are still counted when Redis is down."""
+        async def get_redis():
+            raise RuntimeError("Redis is not connected")
+        
+        monkeypatch.setattr("app.services.view_counter.get_redis", get_redis)
+        counter = ViewCounter(database, backend="redis")
+        await counter.record_view("p-2")
+        
+        assert await counter.flush() == {"products": 1, "views": 1}
+    
+    @pytest.mark.asyncio
+    async def test_flusher_writes_periodically_and_on_stop(self, database):
+        """The started flusher writes views every interval and the rest when stopped."""
+        counter = ViewCounter(database, backend="memory", flush_interval=0.01)
+        await counter.start()
+        await counter.record_view("p-2")
+        for _ in range(100):
+            if _views(database, "p-2"):
+                break
+            await asyncio.sleep(0.01)
+        
+        await counter.record_view("p-3")
+        await counter.stop()
+        
+        assert _views(database, "p-2") == 1
+        assert _views(database, "p-3") == 1
+        assert counter._flusher_task is None
+
+
+class TestProductViews:
+    """Test cases for counting views of product pages."""
+    
+    @pytest.mark.asyncio
+    async def test_product_view_not_written(self, database):
+        """A product view is counted without a MongoDB write and shown in views_count."""
+        counter = ViewCounter(database, backend="memory")
+        
+        async def get_database():
+            return database
+        
+        async def convert(product, language):
+            return product
+        
+        service = ProductService()
+        with patch("app.services.product_service.get_database", get_database), \
+             patch("app.services.product_service.view_counter", counter), \
+             patch.object(service, "_convert_product_to_response", convert):
+            await service.get_product_by_id("p-1")
+            product = await service.get_product_by_id("p-1")
+        
+        assert product["views_count"] == 12
+        assert _views(database, "p-1") == 10
+    
+    @pytest.mark.asyncio
+    async def test_background_task_flushes(self, database):
+        """The background task service writes buffered views, also on cleanup."""
+        counter = ViewCounter(database, backend="memory")
+        await counter.record_view("p-2")
+        service = BackgroundTaskService()
+        
+        with patch("app.services.background_tasks.view_counter", counter):
+            assert await service.flush_view_counts() == {"products": 1, "views": 1}
+            await counter.record_view("p-3")
+            await service.cleanup()
+        
+        assert _views(database, "p-3") == 1
+    
+    @pytest.mark.asyncio
+    async def test_popularity_sort_uses_index(self):
+        """Popular available products are read from the views_count index in order."""
+        service = ProductService()
+        query = ProductSearchQuery(sort_by="popularity", sort_order="desc")
+        search_filter = await service._build_search_filter(query)
+        
+        plan = SearchPlanner().plan(search_filter, service._build_sort_criteria(query.sort_by, query.sort_order))
+        
+        assert plan["index"] == "available_popularity"
+        assert plan["sort_served"] is True
@@ -206,7 +206,8 @@ export const chatService = {
      */
     createWebSocketConnection(conversationId: string): WebSocket {
         const wsUrl = API_BASE_URL.replace('http', 'ws').replace('/api/v1', '');
-        return new WebSocket(`${wsUrl}/api/v1/chat/ws/${conversationId}`);
+        const token = encodeURIComponent(localStorage.getItem('accessToken') || '');
+        return new WebSocket(`${wsUrl}/api/v1/chat/ws/${conversationId}?token=${token}`);
     },
 };
 